@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class AuthenticationConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'authentication'
+
+    def ready(self):
+        from gpa_backend.metrics import register_collector
+        from . import signals  # noqa: F401
+        from .tokencache import render_token_cache_metrics
+
+        register_collector(render_token_cache_metrics)
@@ -0,0 +1,22 @@
+"""
+Session authentication that async views can await.
+
+DRF's ``SessionAuthentication`` reads ``request.user``, the lazy user that
+``AuthenticationMiddleware`` loads with a blocking query. ``aauthenticate``
+awaits ``request.auser()`` instead.
+"""
+from rest_framework import authentication
+
+
+class SessionAuthentication(authentication.SessionAuthentication):
+    async def aauthenticate(self, request):
+        """``authenticate`` for async views"""
+        auser = getattr(request._request, 'auser', None)
+        if auser is None:
+            return None
+        user = await auser()
+        if not user or not user.is_active:
+            return None
+
+        self.enforce_csrf(request)
+        return (user, None)
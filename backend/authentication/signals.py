@@ -0,0 +1,22 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .tokencache import invalidate_tokens
+
+User = get_user_model()
+
+
+@receiver(post_delete, sender=Token)
+def forget_deleted_token(sender, instance, **kwargs):
+    """Logout and password changes delete the token; stop accepting it everywhere"""
+    invalidate_tokens(keys=[instance.key])
+
+
+@receiver(post_save, sender=User)
+def forget_saved_user(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """Cached tokens carry the user, so drop them when it changes (including deactivation)"""
+    if created or raw or (update_fields and set(update_fields) == {'last_login'}):
+        return
+    invalidate_tokens(user_id=instance.pk)
@@ -1,3 +1,148 @@
-from django.test import TestCase
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.test import AsyncRequestFactory, TestCase, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from gpa_backend.testing import METRICS_SETTINGS, TEST_SETTINGS, QueryBudgetMixin, create_document, create_user
+
+from .tokencache import EPOCH_KEY, token_cache
+from .views import ProfileView
+
+
+@override_settings(**TEST_SETTINGS)
+class AuthenticationQueryBudgetTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.user = create_user('owner')
+        self.authenticate(self.user)
+
+    def add_documents(self, count):
+        for i in range(count):
+            create_document(self.user, title=f'Document {i}', is_public=i % 2 == 0)
+
+    def test_profile(self):
+        self.assertQueryBudget('/api/auth/profile/', self.add_documents, budget=0)
+
+    def test_dashboard(self):
+        self.assertQueryBudget('/api/auth/dashboard/', self.add_documents, budget=1)
+
+
+@override_settings(**TEST_SETTINGS)
+class AuthenticationApiTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_register_login_logout(self):
+        response = self.client.post('/api/auth/register/', {
+            'username': 'student', 'email': 'student@example.com', 'password': 'a-Strong-pass-123',
+            'password_confirm': 'a-Strong-pass-123', 'first_name': 'Stu', 'last_name': 'Dent',
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+
+        response = self.client.post('/api/auth/login/', {
+            'email': 'student@example.com', 'password': 'a-Strong-pass-123',
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        token = response.json()['token']
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+        self.assertEqual(self.client.get('/api/auth/profile/').json()['email'], 'student@example.com')
+        self.assertEqual(self.client.post('/api/auth/logout/').status_code, 200)
+
+        self.client.logout()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+        # The revoked token is rejected (403: session auth is the first scheme)
+        self.assertEqual(self.client.get('/api/auth/profile/').status_code, 403)
+
+    def test_dashboard_counts(self):
+        user = create_user('owner')
+        create_document(user, title='A', document_type='PDF', is_public=True)
+        create_document(user, title='B', document_type='TEXT')
+        self.client.force_authenticate(user)
+        stats = self.client.get('/api/auth/dashboard/').json()['stats']
+        self.assertEqual(stats['total_documents'], 2)
+        self.assertEqual(stats['pdf_documents'], 1)
+        self.assertEqual(stats['public_documents'], 1)
+        self.assertEqual(stats['private_documents'], 1)
+
+
+@override_settings(**{**TEST_SETTINGS, 'CACHES': {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+}})
+class TokenCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        token_cache.clear()
+        self.user = create_user('owner')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_repeat_requests_skip_the_token_query(self):
+        hits, misses = token_cache.hits, token_cache.misses
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get('/api/auth/profile/').status_code, 200)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/auth/profile/').status_code, 200)
+        self.assertEqual((token_cache.hits - hits, token_cache.misses - misses), (1, 1))
+
+    def test_rotated_token_is_rejected(self):
+        self.client.get('/api/auth/profile/')
+        response = self.client.post('/api/auth/change-password/', {
+            'old_password': 'test-password', 'new_password': 'a-New-pass-456', 'new_password_confirm': 'a-New-pass-456',
+        }, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self.client.get('/api/auth/profile/').status_code, 403)
+
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {response.json()['token']}")
+        self.assertEqual(self.client.get('/api/auth/profile/').status_code, 200)
+
+    def test_deactivated_user_is_rejected(self):
+        self.client.get('/api/auth/profile/')
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/api/auth/profile/').status_code, 403)
+
+    def test_profile_changes_are_seen(self):
+        self.client.get('/api/auth/profile/')
+        self.client.put('/api/auth/profile/update/', {'first_name': 'Renamed'}, format='json')
+        self.assertEqual(self.client.get('/api/auth/profile/').json()['first_name'], 'Renamed')
+
+    def test_async_views_share_the_cache(self):
+        view = ProfileView.as_async_view()
+
+        def get_profile():
+            request = AsyncRequestFactory().get('/api/auth/profile/', headers={
+                'authorization': f'Token {self.token.key}',
+            })
+            return async_to_sync(view)(request)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(get_profile().status_code, 200)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/auth/profile/').status_code, 200)
+            self.assertEqual(get_profile().status_code, 200)
+
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(get_profile().status_code, 403)
+
+    @override_settings(TOKEN_AUTH_CACHE={'EPOCH_CHECK_INTERVAL': 0})
+    def test_other_process_invalidation_clears_the_cache(self):
+        self.client.get('/api/auth/profile/')
+        # Another worker revoking any token bumps the shared epoch
+        cache.set(EPOCH_KEY, cache.get(EPOCH_KEY, 0) + 1)
+        with self.assertNumQueries(1):
+            self.client.get('/api/auth/profile/')
+
+    @override_settings(TOKEN_AUTH_CACHE={'MAX_SIZE': 2}, METRICS=METRICS_SETTINGS)
+    def test_lru_is_bounded_and_reported(self):
+        for name in ('first', 'second', 'third'):
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=create_user(name)).key}')
+            client.get('/api/auth/profile/')
+        self.assertEqual(len(token_cache), 2)
+
+        body = APIClient().get('/internal/metrics/', HTTP_AUTHORIZATION='Bearer scrape-token').content.decode()
+        self.assertIn('auth_token_cache_entries 2', body)
+        self.assertIn('auth_token_cache_evictions_total', body)
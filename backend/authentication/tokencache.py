@@ -0,0 +1,247 @@
+"""
+Token authentication with an in-process cache of token key to user.
+
+``TokenAuthentication`` joins ``Token`` and ``User`` on every API request.
+``CachedTokenAuthentication`` keeps the result in a bounded LRU cache whose
+entries also expire after ``TTL`` seconds, so only the first request with a
+token in each process (and one per TTL) reaches the database.
+
+Entries are dropped when a token is deleted (logout, password change) and
+when its user is saved, which covers deactivation. Other processes hear
+about it through an epoch counter in the shared Django cache: every
+invalidation bumps it, and a process that sees a new epoch clears its whole
+cache. The epoch is read at most once per ``EPOCH_CHECK_INTERVAL`` seconds,
+which bounds how long another process may still accept a revoked token.
+That bound only holds when ``CACHE`` names a backend shared by all
+processes; with the local-memory default it is ``TTL``.
+
+Async views authenticate through ``aauthenticate``, which reads the epoch
+and loads tokens with the async cache and ORM APIs.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication, get_authorization_header
+
+EPOCH_KEY = 'authentication:token-cache-epoch'
+
+
+def get_token_cache_settings():
+    defaults = {
+        'ENABLED': True,
+        'MAX_SIZE': 10000,
+        'TTL': 60,
+        'EPOCH_CHECK_INTERVAL': 1.0,
+        'CACHE': 'default',
+    }
+    defaults.update(getattr(settings, 'TOKEN_AUTH_CACHE', {}))
+    return defaults
+
+
+class TokenCache:
+    """Thread-safe LRU cache of token key to ``(token, expires_at)``, with the user loaded"""
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped by every invalidation so a lookup racing one does not store a stale user
+        self._generation = 0
+        self._epoch = None
+        self._epoch_checked_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        """Return ``(token, generation)``; ``token`` is None on a miss"""
+        if self._epoch_due():
+            self._apply_epoch(self._shared_cache().get(EPOCH_KEY, 0))
+        return self._lookup(key)
+
+    async def aget(self, key):
+        """``get`` that reads the shared epoch without blocking the event loop"""
+        if self._epoch_due():
+            self._apply_epoch(await self._shared_cache().aget(EPOCH_KEY, 0))
+        return self._lookup(key)
+
+    def _lookup(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0], self._generation
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None, self._generation
+
+    def put(self, key, token, generation):
+        """Store a token loaded from the database, unless an invalidation ran meanwhile"""
+        cache_settings = get_token_cache_settings()
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._entries[key] = (token, time.monotonic() + cache_settings['TTL'])
+            self._entries.move_to_end(key)
+            while len(self._entries) > cache_settings['MAX_SIZE']:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, keys=None, user_id=None):
+        """
+        Drop the given token keys, or every token of ``user_id``, here and
+        (through the shared epoch) in every other process.
+        """
+        with self._lock:
+            self._generation += 1
+            if user_id is not None:
+                keys = [key for key, (token, _) in self._entries.items() if token.user_id == user_id]
+            for key in keys or ():
+                if self._entries.pop(key, None) is not None:
+                    self.invalidations += 1
+        self._bump_epoch()
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            # Read the shared epoch afresh on the next lookup rather than comparing with an old one
+            self._epoch = None
+            self._epoch_checked_at = 0.0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _shared_cache(self):
+        return caches[get_token_cache_settings()['CACHE']]
+
+    def _bump_epoch(self):
+        cache = self._shared_cache()
+        try:
+            epoch = cache.incr(EPOCH_KEY)
+        except ValueError:
+            epoch = 1
+            cache.set(EPOCH_KEY, epoch, timeout=None)
+        with self._lock:
+            # Our own bump needs no flush here
+            if self._epoch is not None and epoch == self._epoch + 1:
+                self._epoch = epoch
+
+    def _epoch_due(self):
+        now = time.monotonic()
+        if now - self._epoch_checked_at < get_token_cache_settings()['EPOCH_CHECK_INTERVAL']:
+            return False
+        self._epoch_checked_at = now
+        return True
+
+    def _apply_epoch(self, epoch):
+        with self._lock:
+            if epoch != self._epoch:
+                if self._epoch is not None:
+                    # Another process revoked something; we cannot tell what
+                    self._generation += 1
+                    self.invalidations += len(self._entries)
+                    self._entries.clear()
+                self._epoch = epoch
+
+
+token_cache = TokenCache()
+
+
+def invalidate_tokens(keys=None, user_id=None):
+    """
+    Forget tokens now and again once the current transaction commits, so a
+    request that reloads one before the commit cannot cache it again.
+    """
+    token_cache.invalidate(keys, user_id)
+    transaction.on_commit(lambda: token_cache.invalidate(keys, user_id))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """``TokenAuthentication`` that answers repeat tokens from ``token_cache``"""
+
+    def authenticate_credentials(self, key):
+        if not get_token_cache_settings()['ENABLED']:
+            return super().authenticate_credentials(key)
+
+        token, generation = token_cache.get(key)
+        if token is None:
+            model = self.get_model()
+            try:
+                token = model.objects.select_related('user').get(key=key)
+            except model.DoesNotExist:
+                raise exceptions.AuthenticationFailed('Invalid token.')
+            self.check_user(token)
+            token_cache.put(key, token, generation)
+        # Views may modify request.user, so each request gets its own instance
+        return copy.copy(token.user), token
+
+    async def aauthenticate(self, request):
+        """``authenticate`` for async views"""
+        key = self.get_key(request)
+        if key is None:
+            return None
+        return await self.aauthenticate_credentials(key)
+
+    async def aauthenticate_credentials(self, key):
+        enabled = get_token_cache_settings()['ENABLED']
+        token, generation = await token_cache.aget(key) if enabled else (None, None)
+        if token is None:
+            model = self.get_model()
+            try:
+                token = await model.objects.select_related('user').aget(key=key)
+            except model.DoesNotExist:
+                raise exceptions.AuthenticationFailed('Invalid token.')
+            self.check_user(token)
+            if enabled:
+                token_cache.put(key, token, generation)
+        return copy.copy(token.user), token
+
+    def get_key(self, request):
+        """The token key in the ``Authorization`` header, as ``authenticate`` parses it"""
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) == 1:
+            raise exceptions.AuthenticationFailed('Invalid token header. No credentials provided.')
+        if len(auth) > 2:
+            raise exceptions.AuthenticationFailed('Invalid token header. Token string should not contain spaces.')
+        try:
+            return auth[1].decode()
+        except UnicodeError:
+            raise exceptions.AuthenticationFailed(
+                'Invalid token header. Token string should not contain invalid characters.'
+            )
+
+    def check_user(self, token):
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed('User inactive or deleted.')
+
+
+def render_token_cache_metrics():
+    """Prometheus exposition lines for the token cache counters"""
+    counters = (
+        ('auth_token_cache_hits_total', 'counter', 'Token lookups answered from the cache.', token_cache.hits),
+        ('auth_token_cache_misses_total', 'counter', 'Token lookups that queried the database.',
+         token_cache.misses),
+        ('auth_token_cache_evictions_total', 'counter', 'Entries evicted to stay within MAX_SIZE.',
+         token_cache.evictions),
+        ('auth_token_cache_invalidations_total', 'counter', 'Entries dropped by token or user changes.',
+         token_cache.invalidations),
+        ('auth_token_cache_entries', 'gauge', 'Tokens currently cached.', len(token_cache)),
+    )
+    lines = []
+    for name, kind, help_text, value in counters:
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        lines.append(f'{name} {value}')
+    return '\n'.join(lines) + '\n'
@@ -4,6 +4,8 @@ from rest_framework.response import Response
 from rest_framework.authtoken.models import Token
 from django.contrib.auth import login, logout
 from django.contrib.auth import get_user_model
+from gpa_backend.asyncviews import AsyncReadMixin
+from gpa_backend.db import ReplicaReadMixin
 from .serializers import (
     UserRegistrationSerializer, UserLoginSerializer, 
     UserProfileSerializer, UserUpdateSerializer, ChangePasswordSerializer
@@ -68,7 +70,7 @@ class LogoutView(APIView):
             return Response({'message': 'Logout successful'}, status=status.HTTP_200_OK)
 
 
-class ProfileView(APIView):
+class ProfileView(AsyncReadMixin, APIView):
     """
     Get user profile
     """
@@ -77,6 +79,10 @@ class ProfileView(APIView):
     def get(self, request):
         serializer = UserProfileSerializer(request.user)
         return Response(serializer.data, status=status.HTTP_200_OK)
+    
+    async def aget(self, request):
+        # Authentication loaded the user; serializing it runs no queries
+        return self.get(request)
 
 
 class UpdateProfileView(APIView):
@@ -128,7 +134,7 @@ class ChangePasswordView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class UserDashboardView(APIView):
+class UserDashboardView(ReplicaReadMixin, APIView):
     """
     Get user dashboard data
     """
@@ -138,26 +144,11 @@ class UserDashboardView(APIView):
         user = request.user
         
         # Get user's basic stats
-        from documents.models import Document
-        
-        total_documents = Document.objects.filter(user=user).count()
-        pdf_documents = Document.objects.filter(user=user, document_type='PDF').count()
-        image_documents = Document.objects.filter(user=user, document_type='IMAGE').count()
-        text_documents = Document.objects.filter(user=user, document_type='TEXT').count()
-        
-        # Calculate total file size
-        documents = Document.objects.filter(user=user)
-        total_size_mb = sum(doc.file_size_mb or 0 for doc in documents)
-        
+        from documents.models import DocumentStats
+
+        document_stats = DocumentStats.objects.filter(user=user).first() or DocumentStats(user=user)
+
         return Response({
             'user': UserProfileSerializer(user).data,
-            'stats': {
-                'total_documents': total_documents,
-                'pdf_documents': pdf_documents,
-                'image_documents': image_documents,
-                'text_documents': text_documents,
-                'total_size_mb': round(total_size_mb, 2),
-                'public_documents': Document.objects.filter(user=user, is_public=True).count(),
-                'private_documents': Document.objects.filter(user=user, is_public=False).count(),
-            }
+            'stats': document_stats.as_dict(),
         }, status=status.HTTP_200_OK)
@@ -0,0 +1,174 @@
+"""
+Load-test AI generation offline with the fake provider.
+
+Builds a throwaway SQLite database with a few documents (some sharing the
+same text), then has many threads request summaries, flashcards and
+quizzes for random documents through ``POST /api/documents/<id>/generate/``.
+The fake provider sleeps ``--delay`` seconds per call to stand in for the
+model. Reports how many provider calls were made for how many requests,
+and latency percentiles for requests that generated and those served from
+the cache or by waiting on an identical request. Requests that get a
+``202`` because an identical one is still generating sleep for its
+``Retry-After`` and try again; the retries are counted and timed as part of
+the request.
+
+Usage:
+    python benchmarks/ai_generation.py
+    python benchmarks/ai_generation.py --threads 32 --requests 2000 --documents 50 --delay 0.5 --json results.json
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TASKS = ('summary', 'flashcards', 'quiz')
+
+
+def setup_django(workdir, delay):
+    sys.path.insert(0, BACKEND_DIR)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'gpa_backend.settings')
+    import django
+    from django.conf import settings
+
+    settings.DATABASES['default']['NAME'] = os.path.join(workdir, 'bench.sqlite3')
+    settings.DATABASES['default'].setdefault('OPTIONS', {})['timeout'] = 30
+    settings.AI_GENERATION = {'PROVIDER': 'documents.providers.FakeProvider', 'FAKE_DELAY': delay}
+    settings.ALLOWED_HOSTS = ['*']
+    django.setup()
+
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+
+
+def seed(count):
+    from django.contrib.auth import get_user_model
+    from documents.models import Document, DocumentContent
+
+    user = get_user_model().objects.create_user(email='bench@example.com', username='bench', password='x')
+    # Every text appears twice so content addressing is exercised too
+    documents = Document.objects.bulk_create([
+        Document(
+            user=user, title=f'Notes {i}', file=f'blobs/bench/{i}.txt', document_type='TEXT', file_size=1024,
+            status='COMPLETED', extracted_text=f'Lecture {i // 2} covers topic {i // 2} in depth. ' * 50,
+        )
+        for i in range(count)
+    ])
+    DocumentContent.objects.bulk_store(documents)
+    return user, list(Document.objects.values_list('pk', flat=True))
+
+
+def percentiles(samples):
+    if not samples:
+        return None
+    samples = sorted(samples)
+    return {
+        'p50_ms': round(statistics.median(samples), 2),
+        'p95_ms': round(samples[max(int(len(samples) * 0.95) - 1, 0)], 2),
+        'p99_ms': round(samples[max(int(len(samples) * 0.99) - 1, 0)], 2),
+        'requests': len(samples),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=600, help='Requests in total')
+    parser.add_argument('--documents', type=int, default=20)
+    parser.add_argument('--delay', type=float, default=0.2, help='Seconds each fake provider call takes')
+    parser.add_argument('--json', help='Write results to this file')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='ai-generation-bench-')
+    try:
+        setup_django(workdir, args.delay)
+        from django.db import connection
+        from documents.providers import FakeProvider
+        from rest_framework.test import APIClient
+
+        user, document_ids = seed(args.documents)
+        rng = random.Random(42)
+        work = [(rng.choice(document_ids), rng.choice(TASKS)) for _ in range(args.requests)]
+        provider_calls = []
+        generate = FakeProvider.generate
+
+        def counting_generate(self, request):
+            provider_calls.append(request.task)
+            return generate(self, request)
+
+        FakeProvider.generate = counting_generate
+        generated, cached, errors, pending = [], [], [], []
+        lock = threading.Lock()
+
+        def worker(items):
+            client = APIClient()
+            client.force_authenticate(user)
+            for document_id, task in items:
+                started = time.perf_counter()
+                response = client.post(f'/api/documents/{document_id}/generate/{task}/', {}, format='json')
+                while response.status_code == 202:
+                    with lock:
+                        pending.append(task)
+                    time.sleep(float(response['Retry-After']))
+                    response = client.post(f'/api/documents/{document_id}/generate/{task}/', {}, format='json')
+                elapsed = (time.perf_counter() - started) * 1000
+                with lock:
+                    if response.status_code != 200:
+                        errors.append(response.status_code)
+                    elif response.json()['cached']:
+                        cached.append(elapsed)
+                    else:
+                        generated.append(elapsed)
+            connection.close()
+
+        threads = [threading.Thread(target=worker, args=(work[i::args.threads],)) for i in range(args.threads)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    # Documents come in pairs sharing their text, so this many distinct results exist at most
+    text_of = {document_id: i // 2 for i, document_id in enumerate(document_ids)}
+    distinct = len({(text_of[document_id], task) for document_id, task in work})
+    results = {
+        'threads': args.threads,
+        'requests': args.requests,
+        'provider_calls': len(provider_calls),
+        'distinct_results_at_most': distinct,
+        'errors': len(errors),
+        'pending_responses': len(pending),
+        'seconds': round(elapsed, 2),
+        'requests_per_second': round(args.requests / elapsed, 1),
+        'generated': percentiles(generated),
+        'cached': percentiles(cached),
+    }
+    print(
+        f'{args.requests} requests from {args.threads} threads in {results["seconds"]}s '
+        f'({results["requests_per_second"]}/s): {results["provider_calls"]} provider calls, '
+        f'{results["errors"]} errors, {results["pending_responses"]} retried 202s'
+    )
+    for kind in ('generated', 'cached'):
+        if results[kind]:
+            result = results[kind]
+            print(
+                f'{kind:>9}: p50 {result["p50_ms"]:>8.2f}ms  p95 {result["p95_ms"]:>8.2f}ms  '
+                f'p99 {result["p99_ms"]:>8.2f}ms  ({result["requests"]} requests)'
+            )
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
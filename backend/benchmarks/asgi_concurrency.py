@@ -0,0 +1,333 @@
+"""
+Concurrency benchmark of the hot read endpoints: WSGI worker threads against
+the async views on an ASGI event loop.
+
+Seeds a throwaway database once. Then, in a fresh process per mode, it
+drives ``--clients`` concurrent clients (1000 by default). Each client is a
+seeded user that sends ``--requests`` requests one after another, drawn from
+the document list, a search, a document, the public catalog, the profile, a
+download link and the file itself.
+
+* ``wsgi``: ``--workers`` threads call Django's WSGI handler, as the threads
+  of a WSGI server would. Clients without a free worker wait in the queue.
+* ``asgi``: every client is a task on one event loop calling Django's ASGI
+  handler with ``ASYNC_VIEWS`` on, as under uvicorn.
+
+The handlers are called in-process, so no HTTP server or sockets are
+involved and both modes see the same middleware, views and database.
+Latency runs from when a client sends a request, so it includes time spent
+waiting for a worker.
+
+Usage:
+    python benchmarks/asgi_concurrency.py
+    python benchmarks/asgi_concurrency.py --clients 1000 --requests 5 --workers 16 --json results.json
+    python benchmarks/asgi_concurrency.py --mode asgi --response-cache
+"""
+import argparse
+import asyncio
+import io
+import json
+import logging
+import os
+import queue
+import random
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict, namedtuple
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODES = ('wsgi', 'asgi')
+
+Call = namedtuple('Call', 'endpoint path token')
+
+
+def setup_django(workdir, asynchronous, response_cache):
+    sys.path.insert(0, BACKEND_DIR)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'gpa_backend.settings')
+    import django
+    from django.conf import settings
+
+    settings.DATABASES['default']['NAME'] = os.path.join(workdir, 'concurrency.sqlite3')
+    settings.MEDIA_ROOT = os.path.join(workdir, 'media')
+    settings.ALLOWED_HOSTS = ['*']
+    settings.DEBUG = False
+    settings.ASYNC_VIEWS = asynchronous
+    settings.RESPONSE_CACHE = {**settings.RESPONSE_CACHE, 'ENABLED': response_cache}
+    django.setup()
+
+
+def seed(args):
+    from django.core.management import call_command
+
+    call_command('migrate', verbosity=0)
+    call_command(
+        'seed_dataset', users=args.users, documents=args.documents, words=150, files=True, images=0,
+        flashcards=0, quizzes=0, stdout=open(os.devnull, 'w'),
+    )
+
+
+def plan_calls(args):
+    """The requests each client sends, the same in every mode"""
+    from documents.models import Document
+    from rest_framework.authtoken.models import Token
+
+    tokens = dict(Token.objects.values_list('user_id', 'key'))
+    owned = defaultdict(list)
+    for pk, user_id, title in Document.objects.values_list('pk', 'user_id', 'title'):
+        owned[user_id].append((pk, title))
+
+    rng = random.Random(args.seed)
+    user_ids = sorted(owned)
+    plans = []
+    for _ in range(args.clients + args.warmup):
+        user_id = rng.choice(user_ids)
+        calls = []
+        for _ in range(args.requests):
+            pk, title = rng.choice(owned[user_id])
+            endpoint, path = rng.choice([
+                ('document_list', '/api/documents/'),
+                ('document_search', f'/api/documents/?search={title.split()[0]}'),
+                ('document_detail', f'/api/documents/{pk}/'),
+                ('public_document_list', '/api/public-documents/'),
+                ('profile', '/api/auth/profile/'),
+                ('document_download', f'/api/documents/{pk}/download/'),
+                ('document_file', f'/api/documents/{pk}/file/'),
+            ])
+            calls.append(Call(endpoint, path, tokens[user_id]))
+        plans.append(calls)
+    return plans[:args.warmup], plans[args.warmup:]
+
+
+def wsgi_environ(call):
+    path, _, query = call.path.partition('?')
+    return {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query, 'SCRIPT_NAME': '',
+        'SERVER_NAME': 'testserver', 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+        'REMOTE_ADDR': '127.0.0.1', 'HTTP_HOST': 'testserver', 'HTTP_AUTHORIZATION': f'Token {call.token}',
+        'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr, 'wsgi.url_scheme': 'http',
+        'wsgi.version': (1, 0), 'wsgi.multithread': True, 'wsgi.multiprocess': False, 'wsgi.run_once': False,
+    }
+
+
+def wsgi_call(handler, call):
+    statuses = []
+
+    def start_response(status, headers, exc_info=None):
+        statuses.append(int(status.split()[0]))
+
+    body = handler(wsgi_environ(call), start_response)
+    try:
+        for _ in body:
+            pass
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
+    return statuses[0]
+
+
+def run_wsgi(warmup, plans, workers):
+    from django.core.handlers.wsgi import WSGIHandler
+
+    handler = WSGIHandler()
+    for plan in warmup:
+        for call in plan:
+            wsgi_call(handler, call)
+
+    pending = queue.Queue()
+    results = []
+    lock = threading.Lock()
+    remaining = [len(plans)]
+
+    def worker():
+        while True:
+            item = pending.get()
+            if item is None:
+                return
+            client, index, sent = item
+            call = plans[client][index]
+            status = wsgi_call(handler, call)
+            finished = time.perf_counter()
+            with lock:
+                results.append((call.endpoint, status, finished - sent))
+            if index + 1 < len(plans[client]):
+                pending.put((client, index + 1, finished))
+                continue
+            with lock:
+                remaining[0] -= 1
+                done = remaining[0] == 0
+            if done:
+                for _ in range(workers):
+                    pending.put(None)
+
+    started = time.perf_counter()
+    for client in range(len(plans)):
+        pending.put((client, 0, started))
+    pool = [threading.Thread(target=worker) for _ in range(workers)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return results, time.perf_counter() - started
+
+
+async def asgi_call(application, call):
+    path, _, query = call.path.partition('?')
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'query_string': query.encode(), 'root_path': '',
+        'headers': [(b'host', b'testserver'), (b'authorization', f'Token {call.token}'.encode())],
+        'client': ('127.0.0.1', 0), 'server': ('testserver', 80),
+    }
+    received = []
+    disconnected = asyncio.Event()
+    statuses = []
+
+    async def receive():
+        if not received:
+            received.append(True)
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        # Django listens for a disconnect while the view runs
+        await disconnected.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            statuses.append(message['status'])
+
+    try:
+        await application(scope, receive, send)
+    finally:
+        disconnected.set()
+    return statuses[0]
+
+
+def run_asgi(warmup, plans):
+    from django.core.handlers.asgi import ASGIHandler
+
+    application = ASGIHandler()
+    results = []
+
+    async def client(plan, sent):
+        for call in plan:
+            status = await asgi_call(application, call)
+            finished = time.perf_counter()
+            results.append((call.endpoint, status, finished - sent))
+            sent = finished
+
+    async def main():
+        for plan in warmup:
+            for call in plan:
+                await asgi_call(application, call)
+        results.clear()
+        started = time.perf_counter()
+        await asyncio.gather(*(client(plan, started) for plan in plans))
+        return time.perf_counter() - started
+
+    elapsed = asyncio.run(main())
+    return results, elapsed
+
+
+def percentile(values, fraction):
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def summarize(results, elapsed):
+    latencies = sorted(latency * 1000 for _, _, latency in results)
+    by_endpoint = defaultdict(list)
+    for endpoint, _, latency in results:
+        by_endpoint[endpoint].append(latency * 1000)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        'requests': len(results),
+        'errors': sum(1 for _, status, _ in results if status not in (200, 206)),
+        'statuses': dict(Counter(str(status) for _, status, _ in results)),
+        'seconds': round(elapsed, 2),
+        'throughput_rps': round(len(results) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.50), 1),
+        'p95_ms': round(percentile(latencies, 0.95), 1),
+        'p99_ms': round(percentile(latencies, 0.99), 1),
+        'mean_ms': round(statistics.fmean(latencies), 1),
+        'endpoints': {
+            endpoint: {'p50_ms': round(statistics.median(values), 1), 'requests': len(values)}
+            for endpoint, values in sorted(by_endpoint.items())
+        },
+        'peak_rss_mb': round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1),
+    }
+
+
+def run_mode(args):
+    """Body of the child process for one mode; prints its summary as JSON"""
+    setup_django(args.workdir, args.run_mode == 'asgi', args.response_cache)
+    # Server errors are counted instead of logged with tracebacks
+    logging.getLogger('django.request').setLevel(logging.CRITICAL)
+
+    warmup, plans = plan_calls(args)
+    if args.run_mode == 'asgi':
+        results, elapsed = run_asgi(warmup, plans)
+    else:
+        results, elapsed = run_wsgi(warmup, plans, args.workers)
+    print(json.dumps(summarize(results, elapsed)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', choices=MODES + ('both',), default='both')
+    parser.add_argument('--clients', type=int, default=1000, help='Concurrent clients')
+    parser.add_argument('--requests', type=int, default=3, help='Requests each client sends in turn')
+    parser.add_argument('--workers', type=int, default=8, help='WSGI worker threads')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--documents', type=int, default=10, help='Documents per user')
+    parser.add_argument('--warmup', type=int, default=20, help='Untimed clients run first, one at a time')
+    parser.add_argument('--response-cache', action='store_true', help='Serve repeat reads from the response cache')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', help='Write results to this file')
+    parser.add_argument('--run-mode', choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument('--workdir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_mode:
+        run_mode(args)
+        return
+
+    workdir = tempfile.mkdtemp(prefix='asgi-concurrency-bench-')
+    try:
+        setup_django(workdir, False, args.response_cache)
+        seed(args)
+        results = {}
+        for mode in MODES if args.mode == 'both' else (args.mode,):
+            # A fresh process per mode: URL patterns pick sync or async views once, at import
+            command = [sys.executable, os.path.abspath(__file__), '--run-mode', mode, '--workdir', workdir]
+            for name in ('clients', 'requests', 'workers', 'warmup', 'seed'):
+                command += [f'--{name}', str(getattr(args, name))]
+            if args.response_cache:
+                command.append('--response-cache')
+            output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+            results[mode] = json.loads(output.strip().splitlines()[-1])
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f'{args.clients} clients x {args.requests} requests, {args.workers} WSGI workers, '
+          f'response cache {"on" if args.response_cache else "off"}')
+    for mode, summary in results.items():
+        print(f'{mode}: {summary["throughput_rps"]:>8} req/s  p50 {summary["p50_ms"]:>8}ms  '
+              f'p95 {summary["p95_ms"]:>8}ms  p99 {summary["p99_ms"]:>8}ms  {summary["errors"]} errors  '
+              f'peak RSS {summary["peak_rss_mb"]}MB')
+        for endpoint, stats in summary['endpoints'].items():
+            print(f'    {endpoint:<22} p50 {stats["p50_ms"]:>8}ms  ({stats["requests"]} requests)')
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                'clients': args.clients, 'requests': args.requests, 'workers': args.workers,
+                'response_cache': args.response_cache, 'results': results,
+            }, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""
+Compare uploading N files one request at a time with the bulk endpoint.
+
+Runs the whole request path (middleware, token auth, multipart parsing,
+ingest, database writes, processing in eager mode) through the Django test
+client against a throwaway SQLite file database, and reports files per
+second and queries per file for ``POST /api/documents/`` repeated N times
+versus ``POST /api/documents/bulk/`` in batches.
+
+Usage:
+    python benchmarks/bulk_upload.py
+    python benchmarks/bulk_upload.py --files 200 --batch 100 --size-kb 64 --json results.json
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def setup_django(workdir):
+    sys.path.insert(0, BACKEND_DIR)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'gpa_backend.settings')
+    import django
+    from django.conf import settings
+
+    settings.DATABASES['default']['NAME'] = os.path.join(workdir, 'bench.sqlite3')
+    settings.MEDIA_ROOT = os.path.join(workdir, 'media')
+    settings.DOCUMENT_PROCESSING = {'EAGER': True}
+    settings.PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+    settings.ALLOWED_HOSTS = ['*']
+    django.setup()
+
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+
+
+def make_files(count, size, prefix):
+    from django.core.files.uploadedfile import SimpleUploadedFile
+
+    # Distinct contents so every file becomes its own blob
+    return [
+        SimpleUploadedFile(f'{prefix}-{i}.txt', (f'{prefix} {i} '.encode() * size)[:size])
+        for i in range(count)
+    ]
+
+
+def make_client(name):
+    from django.contrib.auth import get_user_model
+    from rest_framework.authtoken.models import Token
+    from rest_framework.test import APIClient
+
+    user = get_user_model().objects.create_user(email=f'{name}@example.com', username=name, password='x')
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=user).key}')
+    return client
+
+
+def run_single(files, size):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    client = make_client('single')
+    uploads = make_files(files, size, 'single')
+    with CaptureQueriesContext(connection) as queries:
+        started = time.perf_counter()
+        for upload in uploads:
+            response = client.post('/api/documents/', {'title': upload.name, 'file': upload}, format='multipart')
+            assert response.status_code == 201, response.content
+        elapsed = time.perf_counter() - started
+    return elapsed, len(queries)
+
+
+def run_bulk(files, size, batch):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    client = make_client('bulk')
+    uploads = make_files(files, size, 'bulk')
+    with CaptureQueriesContext(connection) as queries:
+        started = time.perf_counter()
+        for start in range(0, files, batch):
+            response = client.post(
+                '/api/documents/bulk/', {'files': uploads[start:start + batch]}, format='multipart',
+            )
+            assert response.status_code == 201, response.content
+        elapsed = time.perf_counter() - started
+    return elapsed, len(queries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', type=int, default=100, help='Files uploaded by each mode')
+    parser.add_argument('--batch', type=int, default=50, help='Files per bulk request (at most 100)')
+    parser.add_argument('--size-kb', type=int, default=16, help='Size of each file')
+    parser.add_argument('--json', help='Write results to this file')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bulk-upload-bench-')
+    try:
+        setup_django(workdir)
+        size = args.size_kb * 1024
+        results = {'files': args.files, 'batch': args.batch, 'size_kb': args.size_kb, 'modes': {}}
+        for mode, (elapsed, queries) in (
+            ('single', run_single(args.files, size)),
+            ('bulk', run_bulk(args.files, size, args.batch)),
+        ):
+            results['modes'][mode] = {
+                'seconds': round(elapsed, 3),
+                'files_per_second': round(args.files / elapsed, 1),
+                'queries_per_file': round(queries / args.files, 2),
+            }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    for mode, result in results['modes'].items():
+        print(
+            f'{mode:>6}: {result["seconds"]:>7.3f}s  {result["files_per_second"]:>8.1f} files/s  '
+            f'{result["queries_per_file"]:>6.2f} queries/file'
+        )
+    speedup = results['modes']['single']['seconds'] / results['modes']['bulk']['seconds']
+    results['speedup'] = round(speedup, 2)
+    print(f'bulk is {speedup:.1f}x faster for {args.files} files of {args.size_kb} KB')
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
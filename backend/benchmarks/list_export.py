@@ -0,0 +1,151 @@
+"""
+Memory and time to first byte of a full document list export.
+
+Seeds one user with ``--documents`` documents in a throwaway database, then
+fetches all of them from ``/api/documents/`` in four ways:
+
+* ``one-page``: a single page holding every row, built the way a page is
+  normally built (``max_page_size`` is lifted for this run). This is what
+  returning the whole list in one response costs without streaming.
+* ``pages``: follow ``next`` through pages of ``--page-size`` rows.
+* ``stream``: one ``?stream=true`` response.
+* ``ndjson``: one ``?format=ndjson`` response.
+
+For each it reports the time until the first byte and the first row, the
+total time, and the peak memory allocated (``tracemalloc``) while the
+response was built and read.
+
+Usage:
+    python benchmarks/list_export.py
+    python benchmarks/list_export.py --documents 50000 --chunk-size 1000 --json results.json
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def setup_django(workdir, chunk_size):
+    sys.path.insert(0, BACKEND_DIR)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'gpa_backend.settings')
+    import django
+    from django.conf import settings
+
+    settings.DATABASES['default']['NAME'] = os.path.join(workdir, 'export.sqlite3')
+    settings.MEDIA_ROOT = os.path.join(workdir, 'media')
+    settings.RESPONSE_CACHE = {'ENABLED': False}
+    settings.LIST_EXPORT = {'CHUNK_SIZE': chunk_size}
+    settings.ALLOWED_HOSTS = ['*']
+    django.setup()
+
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+
+
+def measure(fetch):
+    """Run ``fetch(mark)``, which calls ``mark(name)`` at milestones, and time it"""
+    marks = {}
+    tracemalloc.start()
+    started = time.perf_counter()
+
+    def mark(name):
+        marks.setdefault(name, round((time.perf_counter() - started) * 1000, 1))
+
+    rows, size = fetch(mark)
+    mark('total_ms')
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {**marks, 'rows': rows, 'bytes': size, 'peak_memory_mb': round(peak / 2 ** 20, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--documents', type=int, default=20000)
+    parser.add_argument('--chunk-size', type=int, default=500, help='Rows serialized per streamed chunk')
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--json', help='Write results to this file')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='list-export-bench-')
+    try:
+        setup_django(workdir, args.chunk_size)
+        from django.contrib.auth import get_user_model
+        from django.core.management import call_command
+        from documents.pagination import KeysetPagination
+        from rest_framework.test import APIClient
+
+        call_command(
+            'seed_dataset', users=1, documents=args.documents, words=20, shares=0, flashcards=0, quizzes=0,
+            stdout=open(os.devnull, 'w'),
+        )
+        client = APIClient()
+        client.force_authenticate(get_user_model().objects.get())
+
+        def one_page(mark):
+            KeysetPagination.max_page_size = args.documents
+            try:
+                response = client.get(f'/api/documents/?page_size={args.documents}')
+            finally:
+                KeysetPagination.max_page_size = 100
+            mark('first_byte_ms')
+            mark('first_row_ms')
+            return len(response.data['results']), len(response.content)
+
+        def pages(mark):
+            url, rows, size = f'/api/documents/?page_size={args.page_size}', 0, 0
+            while url:
+                response = client.get(url)
+                mark('first_byte_ms')
+                mark('first_row_ms')
+                rows += len(response.data['results'])
+                size += len(response.content)
+                url = response.data['next']
+            return rows, size
+
+        def streamed(query):
+            def fetch(mark):
+                response = client.get(f'/api/documents/?{query}')
+                rows = size = 0
+                # Chunks are dropped as they arrive, as a client writing them out would
+                for index, chunk in enumerate(response.streaming_content):
+                    if chunk:
+                        mark('first_byte_ms')
+                    if index and chunk:
+                        # The first chunk is the JSON header, or empty for NDJSON
+                        mark('first_row_ms')
+                    rows += chunk.count(b'{"id":')
+                    size += len(chunk)
+                return rows, size
+            return fetch
+
+        strategies = {
+            'one-page': one_page,
+            'pages': pages,
+            'stream': streamed('stream=true'),
+            'ndjson': streamed('format=ndjson'),
+        }
+        # Warm up SQLite's page cache so the first strategy is not penalised
+        client.get(f'/api/documents/?page_size={args.page_size}')
+        results = {name: measure(fetch) for name, fetch in strategies.items()}
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f'{args.documents} documents, chunks of {args.chunk_size} rows')
+    for name, result in results.items():
+        print(f'{name:>9}: first byte {result["first_byte_ms"]:>8}ms  first row {result["first_row_ms"]:>8}ms  '
+              f'total {result["total_ms"]:>8}ms  peak {result["peak_memory_mb"]:>6} MB  '
+              f'{result["rows"]} rows, {result["bytes"]} bytes')
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'documents': args.documents, 'chunk_size': args.chunk_size, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+"""
+Serialization throughput of the document list: model instances against the
+``values()`` fast path.
+
+Seeds ``--documents`` documents for one user in a throwaway database. A
+share of them (``--images``) are images with a generated thumbnail, whose
+rows carry a signed thumbnail URL. Then it serializes the user's whole list
+with ``DocumentListSerializer`` in three ways:
+
+* ``instances``: the default path. Each row becomes a ``Document`` with its
+  blob, and every field goes through DRF's ``get_attribute()``.
+* ``values``: the fast path the list endpoints use. Only the needed columns
+  are selected, ``is_image``/``is_pdf`` are computed in SQL, and each row
+  becomes a dict directly.
+* ``values`` with ``?fields=`` (``--fields``): a sparse fieldset, so fewer
+  columns are read.
+
+Both paths must produce the same output; the benchmark checks this before
+timing. It reports rows per second for serialization alone and for fetching
+plus serialization, each the best of ``--repeat`` runs.
+
+With the defaults, ``values`` serializes about 5-6x faster than
+``instances`` but fetches and serializes only about 4-4.8x faster, because
+Django's per-row datetime and decimal conversion on fetch is shared by both
+paths. The sparse fieldset reaches about 7.5-12x and 6.5-10x respectively.
+
+Usage:
+    python benchmarks/list_serialization.py
+    python benchmarks/list_serialization.py --documents 20000 --images 0 --fields id,title,created_at --json results.json
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def setup_django(workdir):
+    sys.path.insert(0, BACKEND_DIR)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'gpa_backend.settings')
+    import django
+    from django.conf import settings
+
+    settings.DATABASES['default']['NAME'] = os.path.join(workdir, 'serialization.sqlite3')
+    settings.MEDIA_ROOT = os.path.join(workdir, 'media')
+    settings.ALLOWED_HOSTS = ['*']
+    django.setup()
+
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+
+
+def best_of(repeat, run):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--documents', type=int, default=10000)
+    parser.add_argument('--images', type=float, default=0.1, help='Fraction of documents with a thumbnail')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--fields', default='id,title,status,created_at', help='Sparse fieldset to time as well')
+    parser.add_argument('--json', help='Write results to this file')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='list-serialization-bench-')
+    try:
+        setup_django(workdir)
+        from django.contrib.auth import get_user_model
+        from django.core.management import call_command
+        from documents.derivatives import DERIVATIVE_VERSION
+        from documents.models import Document, DocumentBlob
+        from documents.serializers import DocumentListSerializer
+        from rest_framework.request import Request
+        from rest_framework.test import APIRequestFactory, force_authenticate
+
+        call_command(
+            'seed_dataset', users=1, documents=args.documents, words=20, shares=0, flashcards=0, quizzes=0,
+            stdout=open(os.devnull, 'w'),
+        )
+        blob = DocumentBlob.objects.create(
+            sha256='0' * 64, file='blobs/00/00/image.png', size=1024, ref_count=0,
+            derivatives=['thumbnail'], derivatives_version=DERIVATIVE_VERSION,
+        )
+        ids = list(Document.objects.order_by('?').values_list('pk', flat=True))
+        images = round(len(ids) * args.images)
+        Document.objects.filter(pk__in=ids[:images]).update(document_type='IMAGE', blob=blob, file=blob.file.name)
+        Document.objects.filter(pk__in=ids[images:images * 2]).update(document_type='PDF')
+        user = get_user_model().objects.get()
+
+        def context(query=''):
+            request = APIRequestFactory().get(f'/api/documents/{query}')
+            force_authenticate(request, user)
+            request = Request(request)
+            request.user = user
+            return {'request': request}
+
+        queryset = Document.objects.filter(user=user).select_related('blob').order_by('-created_at', '-id')
+
+        def instances(rows, serializer_context):
+            serializer = DocumentListSerializer(**serializer_context)
+            return [serializer.to_representation(row) for row in rows]
+
+        def values(serializer_context):
+            serializer = DocumentListSerializer(**serializer_context)
+            rows = list(serializer.values_queryset(queryset))
+            return serializer, rows
+
+        instance_rows = list(queryset.all())
+        expected = instances(instance_rows, {'context': context()})
+        serializer, rows = values({'context': context()})
+        actual = [serializer.to_representation(row) for row in rows]
+        if actual != expected:
+            mismatch = next(index for index, (a, b) in enumerate(zip(actual, expected)) if a != b)
+            raise SystemExit(f'values() output differs at row {mismatch}:\n{actual[mismatch]}\n{expected[mismatch]}')
+
+        sparse_context = {'context': context(f'?fields={args.fields}')}
+        sparse_serializer, sparse_rows = values(sparse_context)
+
+        timings = {
+            'instances': {
+                'serialize': best_of(args.repeat, lambda: instances(instance_rows, {'context': context()})),
+                'fetch_and_serialize': best_of(
+                    args.repeat, lambda: instances(list(queryset.all()), {'context': context()}),
+                ),
+            },
+            'values': {
+                'serialize': best_of(args.repeat, lambda: [serializer.to_representation(row) for row in rows]),
+                'fetch_and_serialize': best_of(args.repeat, lambda: [
+                    serializer.to_representation(row) for row in values({'context': context()})[1]
+                ]),
+            },
+            f'values ?fields={args.fields}': {
+                'serialize': best_of(
+                    args.repeat, lambda: [sparse_serializer.to_representation(row) for row in sparse_rows],
+                ),
+                'fetch_and_serialize': best_of(args.repeat, lambda: [
+                    sparse_serializer.to_representation(row) for row in values(sparse_context)[1]
+                ]),
+            },
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    results = {}
+    for name, timing in timings.items():
+        results[name] = {
+            stage: {'seconds': round(seconds, 4), 'rows_per_second': round(args.documents / seconds)}
+            for stage, seconds in timing.items()
+        }
+    baseline = results['instances']
+    print(f'{args.documents} documents, best of {args.repeat}')
+    for name, result in results.items():
+        print(f'{name}:')
+        for stage, stats in result.items():
+            speedup = stats['rows_per_second'] / baseline[stage]['rows_per_second']
+            print(f'  {stage:>20}: {stats["rows_per_second"]:>9} rows/s  {speedup:5.1f}x')
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'documents': args.documents, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
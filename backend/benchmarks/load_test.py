@@ -0,0 +1,666 @@
+"""
+Reproducible load test of the whole REST API.
+
+Builds a throwaway SQLite database and media directory, fills them with
+``manage.py seed_dataset`` and then drives every endpoint in
+``documents/urls.py`` and ``authentication/urls.py`` from ``--concurrency``
+threads through the Django test client: a shuffled mix of ``--requests``
+calls per scenario, after an untimed warm-up. The run fails if a URL has
+no scenario, so new endpoints have to be added here.
+
+Each scenario picks its user and objects from the seeded data with a
+seeded random generator. Setup a call needs but should not be measured
+(creating the document a DELETE removes, issuing the token a logout
+revokes) happens before the clock starts. Processing runs eagerly and AI
+generation uses the fake provider, so no worker pool or network is
+involved.
+
+The JSON artifact has sorted keys and holds, per scenario, latency
+percentiles, status codes and SQL queries per request, plus overall
+throughput and peak RSS, so two runs can be diffed; ``--compare`` prints
+the change against an earlier artifact.
+
+Usage:
+    python benchmarks/load_test.py
+    python benchmarks/load_test.py --users 1000 --documents 50 --concurrency 16 --requests 200 \\
+        --json after.json --compare before.json
+    python benchmarks/load_test.py --scenario document_list --scenario document_search --requests 1000
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import platform
+import queue
+import random
+import resource
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, namedtuple
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PASSWORD = 'synthetic-password'
+
+Call = namedtuple('Call', 'method path data format')
+Scenario = namedtuple('Scenario', 'name url_name expect prepare')
+SCENARIOS = {}
+
+
+def scenario(name, url_name, expect=(200,)):
+    """Register ``prepare(ctx, worker)``, which returns the :class:`Call` to time"""
+    def register(prepare):
+        SCENARIOS[name] = Scenario(name, url_name, expect, prepare)
+        return prepare
+    return register
+
+
+def setup_django(workdir):
+    sys.path.insert(0, BACKEND_DIR)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'gpa_backend.settings')
+    import django
+    from django.conf import settings
+
+    settings.DATABASES['default']['NAME'] = os.path.join(workdir, 'load.sqlite3')
+    settings.DATABASES['default'].setdefault('OPTIONS', {})['timeout'] = 30
+    settings.MEDIA_ROOT = os.path.join(workdir, 'media')
+    settings.DOCUMENT_PROCESSING = {**settings.DOCUMENT_PROCESSING, 'EAGER': True}
+    settings.AI_GENERATION = {'PROVIDER': 'documents.providers.FakeProvider', 'FAKE_DELAY': 0}
+    settings.ALLOWED_HOSTS = ['*']
+    django.setup()
+    # Server errors are counted per scenario instead of logged with tracebacks
+    logging.getLogger('django.request').setLevel(logging.CRITICAL)
+
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Context:
+    """The seeded data scenarios pick from, plus counters for unique names"""
+
+    def __init__(self):
+        from django.contrib.auth import get_user_model
+        from documents.models import Document, DocumentShare, DocumentTag, Flashcard, Quiz
+        from rest_framework.authtoken.models import Token
+
+        self.users = list(get_user_model().objects.order_by('pk').values_list('pk', 'email'))
+        self.tokens = dict(Token.objects.values_list('user_id', 'key'))
+        self.documents = {}
+        self.text_documents = {}
+        for pk, user_id, document_type in Document.objects.values_list('pk', 'user_id', 'document_type'):
+            self.documents.setdefault(user_id, []).append(pk)
+            if document_type == 'TEXT':
+                self.text_documents.setdefault(user_id, []).append(pk)
+        self.images = list(
+            Document.objects.filter(document_type='IMAGE').exclude(blob__derivatives=[]).values_list('pk', 'user_id')
+        )
+        self.tags = list(DocumentTag.objects.values_list('pk', flat=True))
+        self.search_terms = [
+            word for title in Document.objects.values_list('title', flat=True)[:200] for word in title.split()
+        ]
+        self.flashcards = self.by_user(Flashcard)
+        self.quizzes = self.by_user(Quiz)
+        self.shared = set(DocumentShare.objects.values_list('document_id', 'shared_with_id'))
+        self.counter = itertools.count()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def by_user(model):
+        items = {}
+        for pk, user_id in model.objects.values_list('pk', 'user_id'):
+            items.setdefault(user_id, []).append(pk)
+        return items
+
+    def unique(self):
+        with self.lock:
+            return next(self.counter)
+
+
+class Worker:
+    def __init__(self, ctx, index, seed):
+        from django.contrib.auth import get_user_model
+
+        self.rng = random.Random(seed)
+        self.user_id = None
+        # Logout and password changes revoke tokens, so they use an account of their own
+        self.account = get_user_model().objects.create_user(
+            username=f'loadtest{index}', email=f'loadtest{index}@synthetic.test', password=PASSWORD,
+        )
+        self.ctx = ctx
+
+    def act_as(self, user_id):
+        self.user_id = user_id
+
+    def own_token(self):
+        from rest_framework.authtoken.models import Token
+
+        token, created = Token.objects.get_or_create(user=self.account)
+        self.ctx.tokens[self.account.pk] = token.key
+        self.user_id = self.account.pk
+
+    def pick_document(self, documents=None):
+        documents = documents or self.ctx.documents
+        user_id = self.rng.choice(list(documents))
+        self.act_as(user_id)
+        return self.rng.choice(documents[user_id])
+
+    def disposable_documents(self, count):
+        """Create documents for a random user that a timed call may delete"""
+        from documents.models import Document
+
+        user_id = self.rng.choice(list(self.ctx.documents))
+        self.act_as(user_id)
+        return [
+            Document.objects.create(
+                user_id=user_id, title='Disposable', file=f'blobs/loadtest/{self.ctx.unique()}.txt',
+                document_type='TEXT', file_size=64, status='COMPLETED', extracted_text='Disposable text ' * 4,
+            ).pk
+            for _ in range(count)
+        ]
+
+
+def upload(name, words=200):
+    from django.core.files.uploadedfile import SimpleUploadedFile
+
+    return SimpleUploadedFile(name, ('Lecture notes about load testing. ' * (words // 5)).encode(), 'text/plain')
+
+
+# Authentication
+
+@scenario('register', 'register', expect=(201,))
+def register(ctx, worker):
+    n = ctx.unique()
+    worker.act_as(None)
+    return Call('post', '/api/auth/register/', {
+        'username': f'registered{n}', 'email': f'registered{n}@synthetic.test',
+        'password': 'Load-test-passw0rd', 'password_confirm': 'Load-test-passw0rd',
+        'first_name': 'Load', 'last_name': 'Test',
+    }, 'json')
+
+
+@scenario('login', 'login')
+def login(ctx, worker):
+    worker.act_as(None)
+    return Call('post', '/api/auth/login/', {'email': worker.rng.choice(ctx.users)[1], 'password': PASSWORD}, 'json')
+
+
+@scenario('logout', 'logout')
+def logout(ctx, worker):
+    worker.own_token()
+    return Call('post', '/api/auth/logout/', {}, 'json')
+
+
+@scenario('profile', 'profile')
+def profile(ctx, worker):
+    worker.act_as(worker.rng.choice(ctx.users)[0])
+    return Call('get', '/api/auth/profile/', None, None)
+
+
+@scenario('update_profile', 'update_profile')
+def update_profile(ctx, worker):
+    worker.act_as(worker.rng.choice(ctx.users)[0])
+    return Call('patch', '/api/auth/profile/update/', {'first_name': f'Name {ctx.unique()}'}, 'json')
+
+
+@scenario('change_password', 'change_password')
+def change_password(ctx, worker):
+    worker.own_token()
+    return Call('post', '/api/auth/change-password/', {
+        'old_password': PASSWORD, 'new_password': PASSWORD, 'new_password_confirm': PASSWORD,
+    }, 'json')
+
+
+@scenario('dashboard', 'user_dashboard')
+def dashboard(ctx, worker):
+    worker.act_as(worker.rng.choice(ctx.users)[0])
+    return Call('get', '/api/auth/dashboard/', None, None)
+
+
+# Documents
+
+@scenario('document_list', 'document_list')
+def document_list(ctx, worker):
+    worker.act_as(worker.rng.choice(list(ctx.documents)))
+    return Call('get', '/api/documents/', None, None)
+
+
+@scenario('document_search', 'document_list')
+def document_search(ctx, worker):
+    worker.act_as(worker.rng.choice(list(ctx.documents)))
+    return Call('get', '/api/documents/', {'search': worker.rng.choice(ctx.search_terms)}, None)
+
+
+@scenario('document_upload', 'document_list', expect=(201,))
+def document_upload(ctx, worker):
+    worker.act_as(worker.rng.choice(list(ctx.documents)))
+    n = ctx.unique()
+    return Call('post', '/api/documents/', {'title': f'Upload {n}', 'file': upload(f'upload-{n}.txt')}, 'multipart')
+
+
+@scenario('document_bulk_upload', 'document_bulk_upload', expect=(201,))
+def document_bulk_upload(ctx, worker):
+    worker.act_as(worker.rng.choice(list(ctx.documents)))
+    n = ctx.unique()
+    return Call('post', '/api/documents/bulk/', {
+        'files': [upload(f'bulk-{n}-{i}.txt') for i in range(3)], 'tags': 'bulk,loadtest',
+    }, 'multipart')
+
+
+@scenario('document_bulk_delete', 'document_bulk_delete')
+def document_bulk_delete(ctx, worker):
+    return Call('post', '/api/documents/bulk/delete/', {'ids': worker.disposable_documents(5)}, 'json')
+
+
+@scenario('document_bulk_update', 'document_bulk_update')
+def document_bulk_update(ctx, worker):
+    user_id = worker.rng.choice(list(ctx.documents))
+    worker.act_as(user_id)
+    ids = worker.rng.sample(ctx.documents[user_id], min(10, len(ctx.documents[user_id])))
+    return Call('post', '/api/documents/bulk/update/', {'ids': ids, 'add_tags': ['loadtest']}, 'json')
+
+
+@scenario('document_detail', 'document_detail')
+def document_detail(ctx, worker):
+    return Call('get', f'/api/documents/{worker.pick_document()}/', None, None)
+
+
+@scenario('document_update', 'document_detail')
+def document_update(ctx, worker):
+    document_id = worker.pick_document()
+    return Call('patch', f'/api/documents/{document_id}/', {'description': f'Edited {ctx.unique()}'}, 'json')
+
+
+@scenario('document_delete', 'document_detail', expect=(204,))
+def document_delete(ctx, worker):
+    return Call('delete', f'/api/documents/{worker.disposable_documents(1)[0]}/', None, None)
+
+
+@scenario('document_download', 'document_download')
+def document_download(ctx, worker):
+    return Call('get', f'/api/documents/{worker.pick_document()}/download/', None, None)
+
+
+@scenario('document_file', 'document_file')
+def document_file(ctx, worker):
+    return Call('get', f'/api/documents/{worker.pick_document()}/file/', None, None)
+
+
+@scenario('document_generate', 'document_generate')
+def document_generate(ctx, worker):
+    document_id = worker.pick_document(ctx.text_documents)
+    task = worker.rng.choice(('summary', 'flashcards', 'quiz'))
+    return Call('post', f'/api/documents/{document_id}/generate/{task}/', {}, 'json')
+
+
+@scenario('document_related', 'document_related')
+def document_related(ctx, worker):
+    return Call('get', f'/api/documents/{worker.pick_document(ctx.text_documents)}/related/', None, None)
+
+
+@scenario('document_derivative', 'document_derivative')
+def document_derivative(ctx, worker):
+    document_id, user_id = worker.rng.choice(ctx.images)
+    worker.act_as(user_id)
+    return Call('get', f'/api/documents/{document_id}/derivatives/thumbnail/', None, None)
+
+
+@scenario('document_stats', 'document_stats')
+def document_stats(ctx, worker):
+    worker.act_as(worker.rng.choice(ctx.users)[0])
+    return Call('get', '/api/documents/stats/', None, None)
+
+
+@scenario('document_logs', 'document_processing_log')
+def document_logs(ctx, worker):
+    return Call('get', f'/api/documents/{worker.pick_document()}/logs/', None, None)
+
+
+@scenario('public_document_list', 'public_document_list')
+def public_document_list(ctx, worker):
+    worker.act_as(worker.rng.choice(ctx.users)[0])
+    return Call('get', '/api/public-documents/', None, None)
+
+
+# Tags
+
+@scenario('tag_list', 'document_tag_list')
+def tag_list(ctx, worker):
+    worker.act_as(worker.rng.choice(ctx.users)[0])
+    return Call('get', '/api/tags/', None, None)
+
+
+@scenario('tag_create', 'document_tag_list', expect=(201,))
+def tag_create(ctx, worker):
+    worker.act_as(worker.rng.choice(ctx.users)[0])
+    return Call('post', '/api/tags/', {'name': f'created-{ctx.unique()}'}, 'json')
+
+
+@scenario('tag_facets', 'document_tag_facets')
+def tag_facets(ctx, worker):
+    worker.act_as(worker.rng.choice(list(ctx.documents)))
+    return Call('get', '/api/tags/facets/', None, None)
+
+
+@scenario('tag_detail', 'document_tag_detail')
+def tag_detail(ctx, worker):
+    worker.act_as(worker.rng.choice(ctx.users)[0])
+    return Call('get', f'/api/tags/{worker.rng.choice(ctx.tags)}/', None, None)
+
+
+@scenario('tag_update', 'document_tag_detail')
+def tag_update(ctx, worker):
+    from documents.models import DocumentTag
+
+    worker.act_as(worker.rng.choice(ctx.users)[0])
+    n = ctx.unique()
+    tag = DocumentTag.objects.create(name=f'renamed-{n}')
+    return Call('put', f'/api/tags/{tag.pk}/', {'name': f'renamed-{n}-done'}, 'json')
+
+
+@scenario('tag_delete', 'document_tag_detail', expect=(204,))
+def tag_delete(ctx, worker):
+    from documents.models import DocumentTag
+
+    worker.act_as(worker.rng.choice(ctx.users)[0])
+    tag = DocumentTag.objects.create(name=f'deleted-{ctx.unique()}')
+    return Call('delete', f'/api/tags/{tag.pk}/', None, None)
+
+
+# Sharing
+
+@scenario('document_share', 'document_share', expect=(201,))
+def document_share(ctx, worker):
+    while True:
+        document_id = worker.pick_document()
+        recipient_id, email = worker.rng.choice(ctx.users)
+        with ctx.lock:
+            # Each document can be shared with a user once
+            if recipient_id != worker.user_id and (document_id, recipient_id) not in ctx.shared:
+                ctx.shared.add((document_id, recipient_id))
+                break
+    return Call('post', f'/api/documents/{document_id}/share/', {
+        'shared_with': recipient_id, 'shared_with_email': email, 'message': 'Have a look',
+    }, 'json')
+
+
+@scenario('share_list', 'document_share_list')
+def share_list(ctx, worker):
+    worker.act_as(worker.rng.choice(ctx.users)[0])
+    return Call('get', '/api/shares/', {'type': worker.rng.choice(('received', 'sent'))}, None)
+
+
+# Flashcards and quizzes
+
+def study_scenarios(prefix, url_prefix, items_of, model_name, review):
+    @scenario(f'{prefix}_list', f'{prefix}_list')
+    def item_list(ctx, worker):
+        worker.act_as(worker.rng.choice(list(items_of(ctx))))
+        return Call('get', f'/api/{url_prefix}/', None, None)
+
+    @scenario(f'{prefix}_due', f'{prefix}_due')
+    def item_due(ctx, worker):
+        worker.act_as(worker.rng.choice(list(items_of(ctx))))
+        return Call('get', f'/api/{url_prefix}/due/', None, None)
+
+    @scenario(f'{prefix}_reviews', f'{prefix}_reviews')
+    def item_reviews(ctx, worker):
+        items = items_of(ctx)
+        user_id = worker.rng.choice(list(items))
+        worker.act_as(user_id)
+        ids = worker.rng.sample(items[user_id], min(10, len(items[user_id])))
+        return Call('post', f'/api/{url_prefix}/reviews/', {
+            'reviews': [{'id': pk, **review(worker.rng)} for pk in ids],
+        }, 'json')
+
+    @scenario(f'{prefix}_detail', f'{prefix}_detail')
+    def item_detail(ctx, worker):
+        items = items_of(ctx)
+        user_id = worker.rng.choice(list(items))
+        worker.act_as(user_id)
+        return Call('get', f'/api/{url_prefix}/{worker.rng.choice(items[user_id])}/', None, None)
+
+    @scenario(f'{prefix}_delete', f'{prefix}_detail', expect=(204,))
+    def item_delete(ctx, worker):
+        from documents import models
+
+        user_id = worker.rng.choice(list(items_of(ctx)))
+        worker.act_as(user_id)
+        fields = {'options': ['A', 'B', 'C', 'D'], 'correct_answer': 0} if model_name == 'Quiz' else {'answer': 'A'}
+        item = getattr(models, model_name).objects.create(user_id=user_id, question='Disposable?', **fields)
+        return Call('delete', f'/api/{url_prefix}/{item.pk}/', None, None)
+
+
+study_scenarios('flashcard', 'flashcards', lambda ctx: ctx.flashcards, 'Flashcard',
+                lambda rng: {'grade': rng.randint(0, 5)})
+study_scenarios('quiz', 'quizzes', lambda ctx: ctx.quizzes, 'Quiz', lambda rng: {'answer': rng.randrange(4)})
+
+
+def check_coverage():
+    from authentication.urls import urlpatterns as auth_patterns
+    from documents.urls import urlpatterns as document_patterns
+
+    names = {pattern.name for pattern in (*auth_patterns, *document_patterns)}
+    missing = names - {scenario.url_name for scenario in SCENARIOS.values()}
+    if missing:
+        raise SystemExit(f'No load-test scenario for: {", ".join(sorted(missing))}')
+
+
+def perform(ctx, worker, scenario):
+    """Run one scenario; returns ``(status, milliseconds, queries, exception)``"""
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from rest_framework.test import APIClient
+
+    call = scenario.prepare(ctx, worker)
+    # A fresh client keeps the session cookie from a login out of later calls
+    client = APIClient(raise_request_exception=False)
+    if worker.user_id is not None:
+        client.credentials(HTTP_AUTHORIZATION=f'Token {ctx.tokens[worker.user_id]}')
+    kwargs = {'format': call.format} if call.format else {}
+    # The query log is capped, so counting from a full one would see nothing
+    connection.queries_log.clear()
+    with CaptureQueriesContext(connection) as queries:
+        started = time.perf_counter()
+        response = getattr(client, call.method)(call.path, call.data, **kwargs)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        elapsed = (time.perf_counter() - started) * 1000
+    response.close()
+    if scenario.name == 'change_password' and response.status_code == 200:
+        ctx.tokens[worker.account.pk] = response.json()['token']
+    # The test client hears about exceptions raised in every thread, so only trust it on a 500
+    exception = repr(response.exc_info[1]) if response.status_code == 500 and response.exc_info else None
+    return response.status_code, elapsed, len(queries), exception
+
+
+def percentile(samples, fraction):
+    return samples[max(int(len(samples) * fraction + 0.5) - 1, 0)]
+
+
+def summarize(scenario, outcomes):
+    latencies = sorted(elapsed for _, elapsed, _, _ in outcomes)
+    queries = [count for _, _, count, _ in outcomes]
+    statuses = Counter(str(status) for status, _, _, _ in outcomes)
+    return {
+        'url_name': scenario.url_name,
+        'requests': len(outcomes),
+        'errors': sum(count for status, count in statuses.items() if int(status) not in scenario.expect),
+        'status_codes': dict(statuses),
+        'mean_ms': round(sum(latencies) / len(latencies), 2),
+        'p50_ms': round(percentile(latencies, 0.50), 2),
+        'p95_ms': round(percentile(latencies, 0.95), 2),
+        'p99_ms': round(percentile(latencies, 0.99), 2),
+        'max_ms': round(latencies[-1], 2),
+        'queries_mean': round(sum(queries) / len(queries), 2),
+        'queries_max': max(queries),
+    }
+
+
+def run(ctx, names, requests, concurrency, warmup, seed):
+    from django.db import connection
+
+    workers = [Worker(ctx, i, seed + i) for i in range(concurrency)]
+    # Imports, caches and prepared statements are warm before anything is timed
+    for name in names:
+        for _ in range(warmup):
+            perform(ctx, workers[0], SCENARIOS[name])
+
+    work = [name for name in names for _ in range(requests)]
+    random.Random(seed).shuffle(work)
+    pending = queue.SimpleQueue()
+    for name in work:
+        pending.put(name)
+    outcomes = {name: [] for name in names}
+
+    def worker_loop(worker):
+        try:
+            while True:
+                try:
+                    name = pending.get_nowait()
+                except queue.Empty:
+                    return
+                outcomes[name].append(perform(ctx, worker, SCENARIOS[name]))
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=worker_loop, args=(worker,)) for worker in workers]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return outcomes, elapsed
+
+
+def compare(results, previous):
+    print(f'\nChange against {previous["meta"].get("git_commit") or "previous run"}:')
+    print(f'{"scenario":<24} {"p50 ms":>20} {"p95 ms":>20} {"queries":>14}')
+    for name, result in results['scenarios'].items():
+        old = previous['scenarios'].get(name)
+        if old is None:
+            print(f'{name:<24} (new)')
+            continue
+
+        def delta(key, width):
+            change = (result[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+            return f'{old[key]:>7} -> {result[key]:<7} {change:+5.0f}%'.rjust(width)
+        print(f'{name:<24} {delta("p50_ms", 20)} {delta("p95_ms", 20)} '
+              f'{old["queries_mean"]:>5} -> {result["queries_mean"]:<5}')
+    old_rps = previous['summary']['requests_per_second']
+    print(f'Throughput: {old_rps} -> {results["summary"]["requests_per_second"]} requests/s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--documents', type=int, default=20, help='Documents per user')
+    parser.add_argument('--words', type=int, default=300, help='Average words per document')
+    parser.add_argument('--concurrency', type=int, default=8, help='Client threads')
+    parser.add_argument('--requests', type=int, default=50, help='Timed requests per scenario')
+    parser.add_argument('--warmup', type=int, default=2, help='Untimed requests per scenario first')
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS), help='Only run these')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', help='Write results to this file')
+    parser.add_argument('--compare', help='Print the change against results written by an earlier run')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='load-test-')
+    try:
+        setup_django(workdir)
+        check_coverage()
+        import django
+        from django.core.management import call_command
+
+        started = time.perf_counter()
+        call_command(
+            'seed_dataset', users=args.users, documents=args.documents, words=args.words, files=True,
+            password=PASSWORD, seed=args.seed, verbosity=0, stdout=open(os.devnull, 'w'),
+        )
+        seed_seconds = time.perf_counter() - started
+        seed_rss = peak_rss_mb()
+
+        ctx = Context()
+        names = args.scenario or sorted(SCENARIOS)
+        outcomes, elapsed = run(ctx, names, args.requests, args.concurrency, args.warmup, args.seed)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    scenarios = {name: summarize(SCENARIOS[name], outcomes[name]) for name in names}
+    total = sum(result['requests'] for result in scenarios.values())
+    results = {
+        'meta': {
+            'git_commit': git_commit(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'users': args.users,
+            'documents_per_user': args.documents,
+            'words': args.words,
+            'concurrency': args.concurrency,
+            'requests_per_scenario': args.requests,
+            'warmup': args.warmup,
+            'seed': args.seed,
+        },
+        'summary': {
+            'requests': total,
+            'errors': sum(result['errors'] for result in scenarios.values()),
+            'seconds': round(elapsed, 2),
+            'requests_per_second': round(total / elapsed, 1),
+            'seed_seconds': round(seed_seconds, 1),
+            'peak_rss_mb_after_seed': seed_rss,
+            'peak_rss_mb': peak_rss_mb(),
+        },
+        'scenarios': scenarios,
+    }
+
+    print(f'{"scenario":<24} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"max ms":>8} {"queries":>8} {"errors":>7}')
+    for name, result in scenarios.items():
+        print(
+            f'{name:<24} {result["p50_ms"]:>8.2f} {result["p95_ms"]:>8.2f} {result["p99_ms"]:>8.2f} '
+            f'{result["max_ms"]:>8.2f} {result["queries_mean"]:>8.1f} {result["errors"]:>7}'
+        )
+    summary = results['summary']
+    print(
+        f'{summary["requests"]} requests from {args.concurrency} threads in {summary["seconds"]}s '
+        f'({summary["requests_per_second"]}/s), {summary["errors"]} errors, peak RSS {summary["peak_rss_mb"]} MB'
+    )
+    exceptions = Counter(
+        f'{name}: {exception}' for name in names for *_, exception in outcomes[name] if exception
+    )
+    for failure, count in exceptions.most_common(10):
+        print(f'  {count} x {failure}')
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write('\n')
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""
+Microbenchmark the request metrics middleware.
+
+Times a trivial view called directly and through ``MetricsMiddleware`` and
+reports the difference per request, with and without database queries (the
+execute wrapper adds a little to every query). Also times rendering a scrape.
+Exits non-zero when the per-request overhead exceeds ``--budget-us``.
+
+Usage:
+    python benchmarks/metrics_overhead.py
+    python benchmarks/metrics_overhead.py --requests 100000 --queries 0 10 --json results.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def setup_django():
+    sys.path.insert(0, BACKEND_DIR)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'gpa_backend.settings')
+    import django
+    from django.conf import settings
+
+    settings.DATABASES['default']['NAME'] = ':memory:'
+    settings.METRICS = {'ENABLED': True}
+    django.setup()
+
+
+def make_view(queries):
+    from django.db import connection
+    from django.http import HttpResponse
+    from django.urls import resolve
+
+    match = resolve('/api/documents/')
+    body = b'{"next":null,"results":[]}'
+
+    def view(request):
+        request.resolver_match = match
+        if queries:
+            with connection.cursor() as cursor:
+                for _ in range(queries):
+                    cursor.execute('SELECT 1')
+        return HttpResponse(body, content_type='application/json')
+    return view
+
+
+def time_calls(handler, request, count):
+    started = time.perf_counter()
+    for _ in range(count):
+        handler(request)
+    return time.perf_counter() - started
+
+
+def measure(queries, count, rounds):
+    from django.test import RequestFactory
+    from gpa_backend.metrics import MetricsMiddleware, registry
+
+    view = make_view(queries)
+    middleware = MetricsMiddleware(view)
+    request = RequestFactory().get('/api/documents/')
+    time_calls(middleware, request, 1000)  # warm up
+
+    # Interleave the runs and keep the fastest of each so noise does not count as overhead
+    bare = min(time_calls(view, request, count) for _ in range(rounds))
+    metered = min(time_calls(middleware, request, count) for _ in range(rounds))
+    registry.reset()
+    return {
+        'queries_per_request': queries,
+        'bare_us': round(bare / count * 1e6, 3),
+        'with_metrics_us': round(metered / count * 1e6, 3),
+        'overhead_us': round((metered - bare) / count * 1e6, 3),
+    }
+
+
+def measure_scrape(endpoints, rounds):
+    from gpa_backend.metrics import registry, render_metrics
+
+    for i in range(endpoints):
+        for status_code in (200, 404):
+            registry.observe(f'endpoint_{i}', 'GET', status_code, 0.01, 3, 0.001, 2048)
+    samples = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        render_metrics(registry.snapshot())
+        samples.append(time.perf_counter() - started)
+    registry.reset()
+    return {'endpoints': endpoints, 'render_ms': round(min(samples) * 1000, 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=50000, help='Requests per timed round')
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--queries', nargs='+', type=int, default=[0, 10], help='Queries run by the view')
+    parser.add_argument('--budget-us', type=float, default=50.0, help='Maximum allowed overhead per request')
+    parser.add_argument('--json', help='Write results to this file')
+    args = parser.parse_args()
+
+    setup_django()
+    results = {
+        'requests': [measure(queries, args.requests, args.rounds) for queries in args.queries],
+        'scrape': measure_scrape(50, args.rounds),
+    }
+    for result in results['requests']:
+        print(
+            f'{result["queries_per_request"]:>4} queries  bare {result["bare_us"]:>8.2f}us  '
+            f'metered {result["with_metrics_us"]:>8.2f}us  overhead {result["overhead_us"]:>7.2f}us'
+        )
+    print(f'scrape of {results["scrape"]["endpoints"]} endpoints: {results["scrape"]["render_ms"]:.2f}ms')
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    worst = max(result['overhead_us'] for result in results['requests'])
+    if worst > args.budget_us:
+        print(f'FAIL: overhead {worst:.2f}us exceeds the {args.budget_us:.0f}us budget')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
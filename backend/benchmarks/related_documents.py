@@ -0,0 +1,191 @@
+"""
+Benchmark related-document lookups.
+
+Builds a throwaway SQLite database with N synthetic documents drawn from a
+set of topics, stores their vectors, then reports how long the in-process
+index takes to load and the latency percentiles of:
+
+* ``index``: the matrix product, access mask and top-k selection alone;
+* ``related``: the full lookup including the database check of candidates;
+* ``endpoint``: ``GET /api/documents/<id>/related/`` through the test client.
+
+Usage:
+    python benchmarks/related_documents.py
+    python benchmarks/related_documents.py --documents 100000 --lookups 500 --json results.json
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+USERS = 100
+TOPICS = 200
+LIMIT = 10
+
+
+def setup_django(workdir):
+    sys.path.insert(0, BACKEND_DIR)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'gpa_backend.settings')
+    import django
+    from django.conf import settings
+
+    settings.DATABASES['default']['NAME'] = os.path.join(workdir, 'bench.sqlite3')
+    settings.ALLOWED_HOSTS = ['*']
+    settings.RELATED_DOCUMENTS = {**settings.RELATED_DOCUMENTS, 'ENABLED': True}
+    django.setup()
+
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+
+
+def make_vocabulary(size, rng):
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choice(letters) for _ in range(rng.randint(4, 10))))
+    return sorted(words)
+
+
+def seed(count, words_per_document, rng):
+    from django.contrib.auth import get_user_model
+    from documents.models import Document, DocumentContent, DocumentVector
+    from documents.vectors import VECTOR_VERSION, to_bytes, vectorize
+
+    User = get_user_model()
+    users = User.objects.bulk_create([
+        User(username=f'bench{i}', email=f'bench{i}@example.com') for i in range(USERS)
+    ])
+    vocabulary = make_vocabulary(20000, rng)
+    # Each topic favours its own few hundred words, mixed with words from anywhere
+    topics = [rng.sample(vocabulary, 300) for _ in range(TOPICS)]
+
+    def flush(batch):
+        documents = Document.objects.bulk_create([document for document, _ in batch])
+        DocumentContent.objects.bulk_store(documents)
+        DocumentVector.objects.bulk_create([
+            DocumentVector(document=document, vector=to_bytes(vectorize(text)), version=VECTOR_VERSION)
+            for document, (_, text) in zip(documents, batch)
+        ])
+
+    batch = []
+    for i in range(count):
+        topic = topics[i % TOPICS]
+        body = rng.choices(topic, k=words_per_document * 3 // 4) + rng.choices(vocabulary, k=words_per_document // 4)
+        text = ' '.join(body)
+        batch.append((Document(
+            user=users[i % USERS],
+            title=' '.join(body[:4]).title(),
+            file=f'blobs/bench/{i}.txt',
+            document_type='TEXT',
+            file_size=len(text),
+            status='COMPLETED',
+            is_public=i % 3 == 0,
+            extracted_text=text,
+        ), text))
+        if len(batch) >= 5000:
+            flush(batch)
+            batch = []
+    flush(batch)
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return {
+        'p50_ms': round(statistics.median(samples), 3),
+        'p95_ms': round(samples[int(len(samples) * 0.95) - 1], 3),
+        'p99_ms': round(samples[int(len(samples) * 0.99) - 1], 3),
+        'max_ms': round(samples[-1], 3),
+        'lookups': len(samples),
+    }
+
+
+def time_calls(call, arguments):
+    samples = []
+    for argument in arguments:
+        started = time.perf_counter()
+        call(argument)
+        samples.append((time.perf_counter() - started) * 1000)
+    return percentiles(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--documents', type=int, default=100000)
+    parser.add_argument('--words', type=int, default=120, help='Words of extracted text per document')
+    parser.add_argument('--lookups', type=int, default=300, help='Lookups timed per mode')
+    parser.add_argument('--json', help='Write results to this file')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='related-bench-')
+    try:
+        setup_django(workdir)
+        from django.contrib.auth import get_user_model
+        from documents.models import Document
+        from documents.related import related_index
+        from rest_framework.authtoken.models import Token
+        from rest_framework.test import APIClient
+
+        rng = random.Random(42)
+        started = time.perf_counter()
+        seed(args.documents, args.words, rng)
+        seed_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        related_index.refresh(force=True)
+        load_seconds = time.perf_counter() - started
+
+        user = get_user_model().objects.order_by('pk').first()
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=user).key}')
+        # Sources the user can read: their own documents and public ones
+        sources = list(
+            Document.objects.filter(user=user).values_list('pk', flat=True)[:args.lookups // 2]
+        ) + list(Document.objects.filter(is_public=True).values_list('pk', flat=True)[:args.lookups // 2])
+        documents = {document.pk: document for document in Document.objects.filter(pk__in=sources)}
+
+        def index_lookup(pk):
+            related_index.candidates(related_index.vector_of(pk), user.pk, [], pk, LIMIT)
+
+        def related_lookup(pk):
+            related_index.related(documents[pk], user.pk, LIMIT)
+
+        def endpoint_lookup(pk):
+            response = client.get(f'/api/documents/{pk}/related/', {'limit': LIMIT})
+            assert response.status_code == 200, response.content
+
+        results = {
+            'documents': args.documents,
+            'seed_seconds': round(seed_seconds, 2),
+            'index_load_seconds': round(load_seconds, 3),
+            'index_memory_mb': round(related_index.matrix.nbytes / 2 ** 20, 1),
+            'index': time_calls(index_lookup, sources),
+            'related': time_calls(related_lookup, sources),
+            'endpoint': time_calls(endpoint_lookup, sources),
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(
+        f'{args.documents} documents: index loaded in {results["index_load_seconds"]:.2f}s '
+        f'({results["index_memory_mb"]} MB)'
+    )
+    for mode in ('index', 'related', 'endpoint'):
+        result = results[mode]
+        print(
+            f'{mode:>8}: p50 {result["p50_ms"]:>7.2f}ms  p95 {result["p95_ms"]:>7.2f}ms  '
+            f'p99 {result["p99_ms"]:>7.2f}ms  max {result["max_ms"]:>7.2f}ms'
+        )
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
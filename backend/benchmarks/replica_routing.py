@@ -0,0 +1,198 @@
+"""
+Check read-replica routing against real SQLite files.
+
+Seeds a primary database, copies it to ``--replicas`` files standing in for
+replicas and never updates them, so a replica read after a write is always
+stale. Then, from several threads:
+
+* ``reads``: list, detail, stats and public catalog requests. The spread of
+  routed reads over the primary and the replicas is reported.
+* ``read-your-writes``: each user renames one of their documents and
+  immediately reads it back. Every read-back must show the new title.
+* ``after-expiry``: the same read-backs once ``--sticky`` seconds have
+  passed. These go to the frozen replicas again and should be stale, which
+  shows the replicas were really used.
+
+Usage:
+    python benchmarks/replica_routing.py
+    python benchmarks/replica_routing.py --replicas 3 --users 200 --threads 16 --json results.json
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def setup_django(workdir, replicas, sticky):
+    sys.path.insert(0, BACKEND_DIR)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'gpa_backend.settings')
+    import django
+    from django.conf import settings
+
+    default = settings.DATABASES['default']
+    default['NAME'] = os.path.join(workdir, 'primary.sqlite3')
+    # Replica files are copied from the primary once it is seeded; connections open lazily
+    for index in range(1, replicas + 1):
+        settings.DATABASES[f'replica{index}'] = {**default, 'NAME': os.path.join(workdir, f'replica{index}.sqlite3')}
+    settings.DATABASE_REPLICAS = {
+        'ALIASES': [f'replica{index}' for index in range(1, replicas + 1)], 'STICKY_SECONDS': sticky,
+    }
+    settings.RESPONSE_CACHE = {'ENABLED': False}
+    settings.MEDIA_ROOT = os.path.join(workdir, 'media')
+    settings.ALLOWED_HOSTS = ['*']
+    django.setup()
+
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+
+
+def seed(workdir, users, documents, replicas):
+    from django.core.management import call_command
+    from django.db import connection
+
+    call_command('seed_dataset', users=users, documents=documents, words=100, stdout=open(os.devnull, 'w'))
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    connection.close()
+    for index in range(1, replicas + 1):
+        shutil.copyfile(os.path.join(workdir, 'primary.sqlite3'), os.path.join(workdir, f'replica{index}.sqlite3'))
+
+
+def run_threads(threads, work, target):
+    results = []
+    lock = threading.Lock()
+
+    def worker(items):
+        from django.db import connections
+
+        for item in items:
+            result = target(item)
+            with lock:
+                results.append(result)
+        connections.close_all()
+
+    pool = [threading.Thread(target=worker, args=(work[i::threads],)) for i in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--replicas', type=int, default=2)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--documents', type=int, default=20, help='Documents per user')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=800, help='Read requests')
+    parser.add_argument('--sticky', type=float, default=2.0, help='Seconds written data stays on the primary')
+    parser.add_argument('--json', help='Write results to this file')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='replica-routing-bench-')
+    try:
+        setup_django(workdir, args.replicas, args.sticky)
+        from django.contrib.auth import get_user_model
+        from documents.models import Document
+        from gpa_backend.db import ReplicaRouter
+        from rest_framework.test import APIClient
+
+        seed(workdir, args.users, args.documents, args.replicas)
+        users = list(get_user_model().objects.all())
+        owned = {}
+        for pk, user_id in Document.objects.values_list('pk', 'user_id'):
+            owned.setdefault(user_id, []).append(pk)
+
+        routed = Counter()
+        routed_lock = threading.Lock()
+        route = ReplicaRouter.db_for_read
+
+        def counting_route(router, model, **hints):
+            alias = route(router, model, **hints)
+            with routed_lock:
+                routed[alias] += 1
+            return alias
+
+        ReplicaRouter.db_for_read = counting_route
+
+        rng = random.Random(42)
+        reads = []
+        for _ in range(args.requests):
+            user = rng.choice(users)
+            path = rng.choice([
+                '/api/documents/', '/api/documents/stats/', '/api/public-documents/',
+                f'/api/documents/{rng.choice(owned[user.pk])}/',
+            ])
+            reads.append((user, path))
+
+        def read(item):
+            user, path = item
+            client = APIClient()
+            client.force_authenticate(user)
+            started = time.perf_counter()
+            response = client.get(path)
+            return response.status_code, (time.perf_counter() - started) * 1000
+
+        responses = run_threads(args.threads, reads, read)
+        latencies = sorted(elapsed for _, elapsed in responses)
+        read_routes = dict(routed)
+
+        targets = [(user, owned[user.pk][0]) for user in users]
+
+        def rename(item):
+            user, document_id = item
+            client = APIClient()
+            client.force_authenticate(user)
+            title = f'Renamed by {user.pk}'
+            response = client.patch(f'/api/documents/{document_id}/', {'title': title}, format='json')
+            assert response.status_code == 200, response.content
+            return client.get(f'/api/documents/{document_id}/').json()['title'] == title
+
+        fresh = run_threads(args.threads, targets, rename)
+        time.sleep(args.sticky + 0.5)
+
+        def read_back(item):
+            user, document_id = item
+            client = APIClient()
+            client.force_authenticate(user)
+            return client.get(f'/api/documents/{document_id}/').json()['title'] == f'Renamed by {user.pk}'
+
+        after_expiry = run_threads(args.threads, targets, read_back)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    results = {
+        'replicas': args.replicas,
+        'reads': {
+            'requests': len(latencies),
+            'errors': sum(1 for status, _ in responses if status != 200),
+            'routed_reads': read_routes,
+            'p50_ms': round(statistics.median(latencies), 2),
+            'p95_ms': round(latencies[max(int(len(latencies) * 0.95) - 1, 0)], 2),
+        },
+        'read_your_writes': {'writes': len(fresh), 'stale_reads': fresh.count(False)},
+        'after_expiry': {'reads': len(after_expiry), 'stale_reads': after_expiry.count(False)},
+    }
+    print(f'{len(latencies)} reads: p50 {results["reads"]["p50_ms"]}ms  p95 {results["reads"]["p95_ms"]}ms, '
+          f'{results["reads"]["errors"]} errors; routed: {read_routes}')
+    print(f'read-your-writes: {results["read_your_writes"]["stale_reads"]} stale of {len(fresh)} read-backs')
+    print(f'after {args.sticky}s: {results["after_expiry"]["stale_reads"]} stale of {len(after_expiry)} '
+          f'(replicas are never updated, so these should all be stale)')
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+"""
+Benchmark the spaced-repetition review queue.
+
+Builds a throwaway SQLite database with N flashcards spread over many users,
+with due dates a month either side of now, then times:
+
+* ``due``: the first page of ``GET /api/flashcards/due/`` for random users;
+* ``review``: ``POST /api/flashcards/reviews/`` with a batch of due cards.
+
+It also prints the query plan of the due query, which should be a range
+scan of ``flashcard_due_idx`` with no temporary sort.
+
+Usage:
+    python benchmarks/review_queue.py
+    python benchmarks/review_queue.py --cards 5000000 --users 5000 --batch 100 --json results.json
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+INSERT_CHUNK = 10000
+
+
+def setup_django(workdir):
+    sys.path.insert(0, BACKEND_DIR)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'gpa_backend.settings')
+    import django
+    from django.conf import settings
+
+    settings.DATABASES['default']['NAME'] = os.path.join(workdir, 'bench.sqlite3')
+    settings.ALLOWED_HOSTS = ['*']
+    django.setup()
+
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+
+
+def seed(cards, users, rng):
+    from django.contrib.auth import get_user_model
+    from django.utils import timezone
+    from documents.models import Flashcard
+
+    User = get_user_model()
+    users = User.objects.bulk_create([
+        User(username=f'bench{i}', email=f'bench{i}@example.com') for i in range(users)
+    ])
+    now = timezone.now()
+    for start in range(0, cards, INSERT_CHUNK):
+        Flashcard.objects.bulk_create([
+            Flashcard(
+                user=users[rng.randrange(len(users))], question=f'Question {i}', answer=f'Answer {i}',
+                due_at=now + timedelta(minutes=rng.randint(-30 * 24 * 60, 30 * 24 * 60)),
+                interval=rng.randint(0, 60), repetitions=rng.randint(0, 6),
+            )
+            for i in range(start, min(start + INSERT_CHUNK, cards))
+        ])
+    return users
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return {
+        'p50_ms': round(statistics.median(samples), 3),
+        'p95_ms': round(samples[int(len(samples) * 0.95) - 1], 3),
+        'p99_ms': round(samples[int(len(samples) * 0.99) - 1], 3),
+        'requests': len(samples),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cards', type=int, default=1000000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--batch', type=int, default=50, help='Reviews per submitted batch')
+    parser.add_argument('--requests', type=int, default=200, help='Requests timed per endpoint')
+    parser.add_argument('--json', help='Write results to this file')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='review-queue-bench-')
+    try:
+        setup_django(workdir)
+        from django.db import connection
+        from django.utils import timezone
+        from documents.models import Flashcard
+        from rest_framework.test import APIClient
+
+        rng = random.Random(42)
+        started = time.perf_counter()
+        users = seed(args.cards, args.users, rng)
+        seed_seconds = time.perf_counter() - started
+
+        due = Flashcard.objects.filter(user=users[0], due_at__lte=timezone.now()).order_by('due_at', 'id')[:20]
+        sql, params = due.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            plan = [row[-1] for row in cursor.fetchall()]
+
+        client = APIClient()
+        due_samples, review_samples = [], []
+        for _ in range(args.requests):
+            client.force_authenticate(users[rng.randrange(len(users))])
+            started = time.perf_counter()
+            response = client.get('/api/flashcards/due/', {'page_size': args.batch})
+            due_samples.append((time.perf_counter() - started) * 1000)
+            assert response.status_code == 200, response.content
+
+            reviews = [{'id': row['id'], 'grade': rng.randint(0, 5)} for row in response.json()['results']]
+            if not reviews:
+                continue
+            started = time.perf_counter()
+            response = client.post('/api/flashcards/reviews/', {'reviews': reviews}, format='json')
+            review_samples.append((time.perf_counter() - started) * 1000)
+            assert response.status_code == 200, response.content
+
+        results = {
+            'cards': args.cards,
+            'users': args.users,
+            'batch': args.batch,
+            'seed_seconds': round(seed_seconds, 1),
+            'due_query_plan': plan,
+            'due': percentiles(due_samples),
+            'review': percentiles(review_samples),
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f'{args.cards} cards over {args.users} users; due query plan: {"; ".join(results["due_query_plan"])}')
+    for mode in ('due', 'review'):
+        result = results[mode]
+        print(
+            f'{mode:>6}: p50 {result["p50_ms"]:>7.2f}ms  p95 {result["p95_ms"]:>7.2f}ms  '
+            f'p99 {result["p99_ms"]:>7.2f}ms  ({result["requests"]} requests of {args.batch})'
+        )
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
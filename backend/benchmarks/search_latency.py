@@ -0,0 +1,209 @@
+"""
+Benchmark document search latency.
+
+Builds a throwaway SQLite database with synthetic documents, then times the
+queries behind ``GET /api/documents/?search=`` through the configured search
+backend (FTS5 on SQLite) and, for comparison, the old ``icontains`` filters.
+
+Usage:
+    python benchmarks/search_latency.py
+    python benchmarks/search_latency.py --sizes 10000 100000 1000000 --json results.json
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+USERS = 100
+PAGE_SIZE = 20
+
+
+def setup_django(database_path):
+    sys.path.insert(0, BACKEND_DIR)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'gpa_backend.settings')
+    import django
+    from django.conf import settings
+
+    settings.DATABASES['default']['NAME'] = database_path
+    django.setup()
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+
+
+def make_vocabulary(size, rng):
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choice(letters) for _ in range(rng.randint(4, 10))))
+    return sorted(words)
+
+
+def seed(count, words_per_document, rng):
+    from django.contrib.auth import get_user_model
+    from documents.models import Document, DocumentContent, DocumentTag, DocumentTagging
+    from documents.search import get_search_backend
+
+    User = get_user_model()
+    users = User.objects.bulk_create([
+        User(username=f'bench{i}', email=f'bench{i}@example.com', first_name='Bench', last_name=str(i))
+        for i in range(USERS)
+    ])
+    vocabulary = make_vocabulary(20000, rng)
+    # Zipf-like weights so some terms are common and most are rare
+    weights = [1.0 / (rank + 1) for rank in range(len(vocabulary))]
+
+    tag_names = vocabulary[:500]
+    tags = {tag.name: tag for tag in DocumentTag.objects.bulk_create([DocumentTag(name=name) for name in tag_names])}
+
+    def flush(batch):
+        documents = Document.objects.bulk_create([document for document, _ in batch])
+        DocumentContent.objects.bulk_store(documents)
+        DocumentTagging.objects.bulk_create(
+            [DocumentTagging(document=document, tag=tags[name])
+             for document, (_, names) in zip(documents, batch) for name in names],
+            ignore_conflicts=True,
+        )
+
+    batch = []
+    for i in range(count):
+        body = rng.choices(vocabulary, weights, k=words_per_document)
+        batch.append((Document(
+            user=users[i % USERS],
+            title=' '.join(body[:4]).title(),
+            description=' '.join(body[4:16]),
+            file=f'blobs/bench/{i}.txt',
+            document_type='TEXT',
+            file_size=len(body) * 8,
+            status='COMPLETED',
+            is_public=i % 3 == 0,
+            extracted_text=' '.join(body),
+        ), rng.sample(tag_names, 3)))
+        if len(batch) >= 5000:
+            flush(batch)
+            batch = []
+    flush(batch)
+
+    started = time.perf_counter()
+    get_search_backend().rebuild(
+        Document.objects.select_related('content').prefetch_related('tags').order_by('pk')
+    )
+    return vocabulary, time.perf_counter() - started
+
+
+def time_queries(build_queryset, queries, repeat):
+    samples = []
+    for _ in range(repeat):
+        for query in queries:
+            started = time.perf_counter()
+            list(build_queryset(query)[:PAGE_SIZE])
+            samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {
+        'p50_ms': round(statistics.median(samples), 3),
+        'p95_ms': round(samples[int(len(samples) * 0.95) - 1], 3),
+        'max_ms': round(samples[-1], 3),
+        'queries': len(samples),
+    }
+
+
+def run_single(count, words_per_document, repeat, legacy_max):
+    database_path = os.path.join(tempfile.mkdtemp(prefix='search-bench-'), 'bench.sqlite3')
+    setup_django(database_path)
+
+    from django.db.models import Q
+    from documents.models import Document, DocumentTagging
+    from documents.search import get_search_backend
+
+    rng = random.Random(42)
+    vocabulary, index_seconds = seed(count, words_per_document, rng)
+    user_id = Document.objects.values_list('user_id', flat=True).first()
+    queries = [
+        vocabulary[0],                      # very common term
+        vocabulary[50],                     # common term
+        vocabulary[5000],                   # rare term
+        vocabulary[200][:3],                # prefix typed so far
+        f'{vocabulary[10]} {vocabulary[300]}',
+    ]
+    backend = get_search_backend()
+
+    def legacy_match(q):
+        tagged = DocumentTagging.objects.filter(tag__name__icontains=q).values('document_id')
+        return Q(title__icontains=q) | Q(description__icontains=q) | Q(pk__in=tagged)
+
+    result = {
+        'documents': count,
+        'backend': backend.__class__.__name__,
+        'index_build_seconds': round(index_seconds, 2),
+        'user_search': time_queries(
+            lambda q: backend.search(Document.objects.filter(user_id=user_id), q), queries, repeat
+        ),
+        'public_search': time_queries(
+            lambda q: backend.search(Document.objects.filter(is_public=True, status='COMPLETED'), q),
+            queries, repeat,
+        ),
+    }
+    if count <= legacy_max:
+        result['legacy_icontains_user_search'] = time_queries(
+            lambda q: Document.objects.filter(user_id=user_id).filter(
+                legacy_match(q)
+            ),
+            queries, max(1, repeat // 5),
+        )
+        result['legacy_icontains_public_search'] = time_queries(
+            lambda q: Document.objects.filter(is_public=True, status='COMPLETED').filter(
+                legacy_match(q)
+            ),
+            queries, max(1, repeat // 5),
+        )
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', nargs='+', type=int, default=[10000, 100000, 1000000])
+    parser.add_argument('--words', type=int, default=80, help='Words of extracted text per document')
+    parser.add_argument('--repeat', type=int, default=20, help='Times each query is run')
+    parser.add_argument('--legacy-max', type=int, default=100000,
+                        help='Largest size at which the icontains baseline is also timed')
+    parser.add_argument('--json', help='Write results to this file')
+    parser.add_argument('--run', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_single(args.run, args.words, args.repeat, args.legacy_max)
+        return
+
+    results = []
+    for size in args.sizes:
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--run', str(size), '--words', str(args.words),
+             '--repeat', str(args.repeat), '--legacy-max', str(args.legacy_max)],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        results.append(result)
+        line = (
+            f'{size:>8} docs  index {result["index_build_seconds"]:>7.1f}s  '
+            f'user p50 {result["user_search"]["p50_ms"]:>8.2f}ms p95 {result["user_search"]["p95_ms"]:>8.2f}ms  '
+            f'public p50 {result["public_search"]["p50_ms"]:>8.2f}ms p95 {result["public_search"]["p95_ms"]:>8.2f}ms'
+        )
+        if 'legacy_icontains_user_search' in result:
+            line += (
+                f'  icontains user p50 {result["legacy_icontains_user_search"]["p50_ms"]:>8.2f}ms'
+                f' public p50 {result["legacy_icontains_public_search"]["p50_ms"]:>8.2f}ms'
+            )
+        print(line)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
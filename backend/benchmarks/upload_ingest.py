@@ -0,0 +1,164 @@
+"""
+Benchmark the upload ingest path.
+
+Compares the streaming ingest handler (size, SHA-256 and type computed in one
+pass, temp file renamed into storage) against Django's stock upload handlers
+with the old seek/tell size calculation, both as-is (``legacy``) and with the
+second read that hashing would need on that path (``legacy+hash``). Each
+measurement runs in a fresh subprocess so peak RSS is not polluted by earlier
+runs.
+
+Usage:
+    python benchmarks/upload_ingest.py
+    python benchmarks/upload_ingest.py --sizes 1 50 500 --json results.json
+"""
+import argparse
+import hashlib
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BOUNDARY = 'ingestbenchmarkboundary'
+MODES = ['legacy', 'legacy+hash', 'streaming']
+
+
+class MultipartStream:
+    """File-like request body that generates a multipart upload on the fly"""
+
+    def __init__(self, size):
+        self.preamble = (
+            f'--{BOUNDARY}\r\n'
+            'Content-Disposition: form-data; name="title"\r\n\r\n'
+            'benchmark\r\n'
+            f'--{BOUNDARY}\r\n'
+            'Content-Disposition: form-data; name="file"; filename="bench.pdf"\r\n'
+            'Content-Type: application/pdf\r\n\r\n'
+        ).encode()
+        self.epilogue = f'\r\n--{BOUNDARY}--\r\n'.encode()
+        self.block = b'%PDF-1.4\n' + os.urandom(64 * 1024 - 9)
+        self.payload_size = size
+        self.length = len(self.preamble) + size + len(self.epilogue)
+        self.position = 0
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.length - self.position
+        parts = []
+        while size > 0 and self.position < self.length:
+            offset = self.position
+            if offset < len(self.preamble):
+                piece = self.preamble[offset:offset + size]
+            elif offset < len(self.preamble) + self.payload_size:
+                payload_offset = offset - len(self.preamble)
+                remaining = self.payload_size - payload_offset
+                start = payload_offset % len(self.block)
+                piece = self.block[start:start + min(size, remaining)]
+            else:
+                epilogue_offset = offset - len(self.preamble) - self.payload_size
+                piece = self.epilogue[epilogue_offset:epilogue_offset + size]
+            parts.append(piece)
+            self.position += len(piece)
+            size -= len(piece)
+        return b''.join(parts)
+
+
+def run_single(mode, size_mb):
+    """Parse and store one upload in this process, printing a JSON result"""
+    sys.path.insert(0, BACKEND_DIR)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'gpa_backend.settings')
+    import django
+    from django.conf import settings
+
+    media_root = tempfile.mkdtemp(prefix='ingest-bench-')
+    settings.MEDIA_ROOT = media_root
+    settings.DOCUMENT_UPLOAD = {'MAX_SIZE': size_mb * 1024 * 1024}
+    django.setup()
+
+    from django.core.files.storage import FileSystemStorage
+    from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+    from django.http.multipartparser import MultiPartParser
+    from documents.uploadhandlers import StreamingIngestUploadHandler, describe_upload, sniff_document_type
+
+    size = size_mb * 1024 * 1024
+    stream = MultipartStream(size)
+    meta = {
+        'CONTENT_TYPE': f'multipart/form-data; boundary={BOUNDARY}',
+        'CONTENT_LENGTH': str(stream.length),
+    }
+    if mode == 'streaming':
+        handlers = [StreamingIngestUploadHandler()]
+    else:
+        handlers = [MemoryFileUploadHandler(), TemporaryFileUploadHandler()]
+
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    _, files = MultiPartParser(meta, stream, handlers, 'utf-8').parse()
+    upload = files['file']
+    if mode == 'streaming':
+        file_size, _, _ = describe_upload(upload)
+    else:
+        upload.seek(0, 2)
+        file_size = upload.tell()
+        upload.seek(0)
+        if mode == 'legacy+hash':
+            hasher = hashlib.sha256()
+            for chunk in upload.chunks():
+                hasher.update(chunk)
+            upload.seek(0)
+            sniff_document_type(upload.read(16))
+            upload.seek(0)
+    FileSystemStorage(location=media_root).save('documents/bench.pdf', upload)
+    elapsed = time.perf_counter() - started
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    shutil.rmtree(media_root, ignore_errors=True)
+    assert file_size == size
+    print(json.dumps({
+        'mode': mode,
+        'size_mb': size_mb,
+        'seconds': round(elapsed, 4),
+        'throughput_mb_s': round(size_mb / elapsed, 1),
+        'peak_rss_mb': round(peak_rss / 1024, 1),
+        'rss_growth_mb': round((peak_rss - baseline_rss) / 1024, 1),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', nargs='+', type=int, default=[1, 50, 500], help='Upload sizes in MB')
+    parser.add_argument('--json', help='Write results to this file')
+    parser.add_argument('--run', nargs=2, metavar=('MODE', 'SIZE_MB'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_single(args.run[0], int(args.run[1]))
+        return
+
+    results = []
+    print(f'{"mode":<12} {"size":>7} {"seconds":>9} {"MB/s":>8} {"peak RSS":>10} {"RSS growth":>11}')
+    for size_mb in args.sizes:
+        for mode in MODES:
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--run', mode, str(size_mb)],
+                check=True, capture_output=True, text=True,
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            results.append(result)
+            print(
+                f'{mode:<12} {size_mb:>5}MB {result["seconds"]:>9.3f} {result["throughput_mb_s"]:>8.1f} '
+                f'{result["peak_rss_mb"]:>8.1f}MB {result["rss_growth_mb"]:>9.1f}MB'
+            )
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,26 +1,38 @@
 from django.contrib import admin
-from .models import Document, DocumentTag, DocumentShare, DocumentProcessingLog
+from .models import (
+    Document, DocumentBlob, DocumentStats, DocumentTag, DocumentTagging, DocumentShare, DocumentProcessingLog,
+    Flashcard, GeneratedContent, PendingFileDeletion, Quiz,
+)
+
+class DocumentTaggingInline(admin.TabularInline):
+    model = DocumentTagging
+    extra = 0
+    autocomplete_fields = ('tag',)
+
 
 @admin.register(Document)
 class DocumentAdmin(admin.ModelAdmin):
     list_display = ('title', 'user', 'document_type', 'file_size_mb', 'status', 'is_public', 'created_at')
     list_filter = ('document_type', 'status', 'is_public', 'created_at')
-    search_fields = ('title', 'description', 'tags', 'user__email', 'user__username')
+    search_fields = ('title', 'description', 'tags__name', 'user__email', 'user__username')
     ordering = ('-created_at',)
-    readonly_fields = ('file_size', 'file_size_mb', 'document_type', 'file_extension', 'created_at', 'updated_at')
+    readonly_fields = ('file_size', 'file_size_mb', 'document_type', 'file_extension', 'original_filename',
+                       'sha256', 'blob', 'extracted_text', 'created_at', 'updated_at')
+    inlines = [DocumentTaggingInline]
     
     fieldsets = (
         ('Basic Information', {
             'fields': ('user', 'title', 'description', 'file')
         }),
         ('File Information', {
-            'fields': ('document_type', 'file_size', 'file_size_mb', 'file_extension')
+            'fields': ('document_type', 'file_size', 'file_size_mb', 'file_extension',
+                       'original_filename', 'sha256', 'blob')
         }),
         ('Status & Visibility', {
             'fields': ('status', 'is_public')
         }),
         ('Metadata', {
-            'fields': ('tags', 'extracted_text', 'page_count')
+            'fields': ('extracted_text', 'page_count')
         }),
         ('Timestamps', {
             'fields': ('created_at', 'updated_at')
@@ -32,6 +44,22 @@ class DocumentAdmin(admin.ModelAdmin):
     file_extension.short_description = 'File Extension'
 
 
+@admin.register(DocumentBlob)
+class DocumentBlobAdmin(admin.ModelAdmin):
+    list_display = ('sha256', 'size', 'ref_count', 'created_at')
+    search_fields = ('sha256',)
+    ordering = ('-created_at',)
+    readonly_fields = ('sha256', 'file', 'size', 'ref_count', 'derivatives', 'derivatives_version', 'created_at')
+
+
+@admin.register(DocumentStats)
+class DocumentStatsAdmin(admin.ModelAdmin):
+    list_display = ('user', 'total_documents', 'public_documents', 'total_bytes', 'updated_at')
+    search_fields = ('user__email', 'user__username')
+    readonly_fields = ('user', 'total_documents', 'pdf_documents', 'image_documents', 'text_documents',
+                       'public_documents', 'total_bytes', 'updated_at')
+
+
 @admin.register(DocumentTag)
 class DocumentTagAdmin(admin.ModelAdmin):
     list_display = ('name', 'color', 'created_at')
@@ -92,6 +120,40 @@ class DocumentProcessingLogAdmin(admin.ModelAdmin):
     )
 
 
+@admin.register(PendingFileDeletion)
+class PendingFileDeletionAdmin(admin.ModelAdmin):
+    list_display = ('name', 'is_pattern', 'attempts', 'not_before', 'created_at')
+    list_filter = ('is_pattern',)
+    search_fields = ('name', 'last_error')
+    ordering = ('id',)
+    readonly_fields = ('name', 'is_pattern', 'attempts', 'last_error', 'created_at')
+
+
+@admin.register(Flashcard)
+class FlashcardAdmin(admin.ModelAdmin):
+    list_display = ('question', 'user', 'document', 'difficulty_level', 'due_at', 'interval', 'repetitions')
+    list_filter = ('difficulty_level',)
+    search_fields = ('question', 'answer', 'user__username')
+    raw_id_fields = ('user', 'document')
+
+
+@admin.register(Quiz)
+class QuizAdmin(admin.ModelAdmin):
+    list_display = ('question', 'user', 'document', 'difficulty_level', 'due_at', 'interval', 'repetitions')
+    list_filter = ('difficulty_level',)
+    search_fields = ('question', 'user__username')
+    raw_id_fields = ('user', 'document')
+
+
+@admin.register(GeneratedContent)
+class GeneratedContentAdmin(admin.ModelAdmin):
+    list_display = ('task', 'model', 'prompt_version', 'content_sha256', 'status', 'size', 'last_used_at')
+    list_filter = ('task', 'model', 'status')
+    search_fields = ('key', 'content_sha256')
+    ordering = ('-last_used_at',)
+    readonly_fields = ('key', 'task', 'model', 'prompt_version', 'content_sha256', 'size', 'created_at', 'last_used_at')
+
+
 # Customize the admin interface
 admin.site.site_header = 'GPA Document Management'
 admin.site.site_title = 'GPA Admin'
@@ -0,0 +1,214 @@
+"""
+Batch document operations.
+
+``create_documents`` stores many uploads for one user with a fixed number of
+queries: blobs are acquired in one batch, the documents are written with
+``bulk_create``, and the work ``Document.save`` and its signal handlers
+would do row by row (statistics, tags, search index, response cache,
+processing) is applied once for the whole batch.
+
+``delete_documents`` and ``update_documents`` do the same for deletes,
+visibility and tag changes on a queryset: a fixed number of statements per
+``BATCH_SIZE`` documents, whatever the number of documents.
+"""
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import stats
+from .cache import PUBLIC_SCOPE, document_scopes, invalidate_scopes
+from .models import (
+    Document, DocumentBlob, DocumentProcessingLog, DocumentTag, DocumentTagging, blob_storage_names,
+    discard_stored_on_error, parse_tag_names,
+)
+from .processing import schedule_documents_processing, schedule_file_removal
+from .search import get_search_backend
+from .signals import batch_operation
+from .uploadhandlers import describe_upload
+
+# Documents per statement, well below SQLite's limit on query parameters
+BATCH_SIZE = 500
+
+
+def batches(ids):
+    for start in range(0, len(ids), BATCH_SIZE):
+        yield ids[start:start + BATCH_SIZE]
+
+
+def create_documents(user, uploads, description='', is_public=False, tags=()):
+    """
+    Create one ``PROCESSING`` document per ``(title, file)`` pair in
+    ``uploads``, all owned by ``user`` and sharing the other attributes.
+    Returns the documents in upload order.
+    """
+    if not uploads:
+        return []
+    described = [(title, upload) + describe_upload(upload) for title, upload in uploads]
+
+    # Files written for new blobs are removed again if anything below fails
+    with discard_stored_on_error([]) as stored, transaction.atomic():
+        blobs = DocumentBlob.objects.acquire_many(
+            ((upload, sha256, file_size) for _, upload, file_size, sha256, _ in described), stored,
+        )
+        documents = []
+        for title, upload, file_size, sha256, document_type in described:
+            document = Document(
+                user=user, title=title, description=description, file=upload,
+                is_public=is_public, status='PROCESSING',
+            )
+            document.attach_blob(blobs[sha256], upload, file_size, document_type)
+            documents.append(document)
+        Document.objects.bulk_create(documents)
+        for document in documents:
+            document._loaded_state = document.tracked_state()
+
+        tag_objects = DocumentTag.objects.resolve(tags)
+        if tag_objects:
+            DocumentTagging.objects.bulk_create([
+                DocumentTagging(document=document, tag=tag) for document in documents for tag in tag_objects
+            ])
+        DocumentProcessingLog.objects.bulk_create([
+            DocumentProcessingLog(
+                document=document, operation='upload', status='COMPLETED',
+                message=f'Stored {document.file_size} bytes',
+            )
+            for document in documents
+        ])
+
+        # What the post_save handlers would have done for each row
+        stats.apply_documents_delta(
+            user.pk, [(document.document_type, document.is_public, document.file_size) for document in documents], 1,
+        )
+        get_search_backend().index(
+            Document.objects.filter(pk__in=[document.pk for document in documents])
+            .select_related('content').prefetch_related('tags')
+        )
+        invalidate_scopes(document_scopes(user.pk, is_public))
+        schedule_documents_processing(documents)
+    return documents
+
+
+def delete_documents(documents):
+    """
+    Delete every document in the ``documents`` queryset and return their ids.
+
+    Files no document refers to any more are queued for removal, which
+    happens after the commit in the processing pool rather than the request.
+    """
+    with transaction.atomic():
+        rows = list(documents.order_by().values_list(
+            'pk', 'user_id', 'is_public', 'document_type', 'file_size', 'blob_id', 'file',
+        ))
+        if not rows:
+            return []
+        ids = [row[0] for row in rows]
+        contributions = defaultdict(list)
+        blob_references = Counter()
+        names = []
+        scopes = set()
+        for _, user_id, is_public, document_type, file_size, blob_id, name in rows:
+            contributions[user_id].append((document_type, is_public, file_size))
+            scopes.update(document_scopes(user_id, is_public))
+            if blob_id:
+                blob_references[blob_id] += 1
+            elif name:
+                # Files stored before the blob store belong to this document alone
+                names.append(name)
+
+        for batch in batches(ids):
+            # Cascades to taggings, shares and logs; the handlers' work is done below
+            with batch_operation():
+                Document.objects.filter(pk__in=batch).delete()
+            get_search_backend().remove(batch)
+        for user_id, user_contributions in contributions.items():
+            stats.apply_documents_delta(user_id, user_contributions, -1, rebuild_missing=False)
+
+        patterns = []
+        for name, sha256 in DocumentBlob.objects.release_many(blob_references):
+            blob_names, blob_patterns = blob_storage_names(sha256, name)
+            names.extend(blob_names)
+            patterns.extend(blob_patterns)
+        schedule_file_removal(names, patterns)
+        invalidate_scopes(scopes)
+    return ids
+
+
+def update_documents(documents, is_public=None, tags=None, add_tags=(), remove_tags=()):
+    """
+    Change visibility and tags of every document in the ``documents``
+    queryset. ``tags`` replaces each document's tags; ``add_tags`` and
+    ``remove_tags`` edit them instead. Returns the ids of all matched
+    documents and of those that actually changed.
+    """
+    with transaction.atomic():
+        rows = list(documents.order_by().values_list('pk', 'user_id', 'is_public'))
+        ids = [row[0] for row in rows]
+        changed = set()
+        retagged = set()
+        scopes = set()
+
+        if is_public is not None:
+            flipped = [(pk, user_id) for pk, user_id, was_public in rows if was_public != is_public]
+            for batch in batches([pk for pk, _ in flipped]):
+                Document.objects.filter(pk__in=batch).update(is_public=is_public)
+            for user_id, count in Counter(user_id for _, user_id in flipped).items():
+                stats.apply_visibility_change(user_id, count if is_public else -count)
+            changed.update(pk for pk, _ in flipped)
+            if flipped:
+                scopes.add(PUBLIC_SCOPE)
+
+        if tags is not None:
+            wanted = DocumentTag.objects.resolve(tags)
+            for batch in batches(ids):
+                retagged |= _remove_taggings(
+                    DocumentTagging.objects.filter(document_id__in=batch).exclude(tag__in=wanted)
+                )
+                retagged |= _add_taggings(batch, wanted)
+        else:
+            remove_names = parse_tag_names(remove_tags)
+            add = DocumentTag.objects.resolve(add_tags)
+            for batch in batches(ids):
+                if remove_names:
+                    retagged |= _remove_taggings(
+                        DocumentTagging.objects.filter(document_id__in=batch, tag__name__in=remove_names)
+                    )
+                retagged |= _add_taggings(batch, add)
+        changed |= retagged
+
+        if changed:
+            # update() leaves the auto_now field alone
+            for batch in batches(sorted(changed)):
+                Document.objects.filter(pk__in=batch).update(updated_at=timezone.now())
+            for batch in batches(sorted(retagged)):
+                get_search_backend().index(
+                    Document.objects.filter(pk__in=batch).select_related('content').prefetch_related('tags')
+                )
+            for pk, user_id, was_public in rows:
+                if pk in changed:
+                    scopes.update(document_scopes(user_id, was_public))
+            invalidate_scopes(scopes)
+    return ids, sorted(changed)
+
+
+def _remove_taggings(taggings):
+    """Delete the taggings and return the ids of the documents that lost one"""
+    document_ids = set(taggings.values_list('document_id', flat=True))
+    if document_ids:
+        taggings.delete()
+    return document_ids
+
+
+def _add_taggings(document_ids, tags):
+    """Tag each document with every tag it lacks and return the ids of the documents that gained one"""
+    if not tags:
+        return set()
+    existing = set(
+        DocumentTagging.objects.filter(document_id__in=document_ids, tag__in=tags).values_list('document_id', 'tag_id')
+    )
+    new = [
+        DocumentTagging(document_id=document_id, tag=tag)
+        for document_id in document_ids for tag in tags if (document_id, tag.pk) not in existing
+    ]
+    DocumentTagging.objects.bulk_create(new, ignore_conflicts=True)
+    return {tagging.document_id for tagging in new}
@@ -0,0 +1,217 @@
+"""
+Versioned caching of document API responses.
+
+Cached responses are keyed on a generation counter for the data they depend
+on: one scope per user for their own documents and statistics, and a single
+``public`` scope for the public catalog. Writes never delete cached
+responses; they bump the counters of the scopes they touch, so every key
+built from an older generation becomes unreachable and simply ages out.
+
+The ``ETag`` of a response is derived from the same key, so a client that
+sends ``If-None-Match`` with a current tag gets a 304 after one cache lookup
+for the counter, without the database or the serializer.
+
+Counters and responses live in the Django cache named by
+``RESPONSE_CACHE['CACHE']``. With several server processes it must be a
+shared backend (Redis, Memcached or the database cache): the per-process
+local-memory cache would let one worker keep serving responses another
+worker's writes have invalidated, until ``TIMEOUT`` expires.
+"""
+import functools
+import hashlib
+import secrets
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from rest_framework.response import Response
+
+from gpa_backend.db import pin_to_primary, user_pin
+
+from .models import Document
+
+PUBLIC_SCOPE = 'public'
+
+
+def get_response_cache_settings():
+    defaults = {'ENABLED': True, 'CACHE': 'default', 'TIMEOUT': 300, 'KEY_PREFIX': 'documents'}
+    defaults.update(getattr(settings, 'RESPONSE_CACHE', {}))
+    return defaults
+
+
+def user_scope(user_id):
+    # The same key the replica router pins after the user's writes
+    return user_pin(user_id)
+
+
+def request_user_scope(request):
+    return user_scope(request.user.pk)
+
+
+def public_scope(request):
+    return PUBLIC_SCOPE
+
+
+def generation_key(scope):
+    return f"{get_response_cache_settings()['KEY_PREFIX']}:generation:{scope}"
+
+
+def get_generation(scope):
+    cache = caches[get_response_cache_settings()['CACHE']]
+    key = generation_key(scope)
+    generation = cache.get(key)
+    if generation is None:
+        # A random start means a counter lost to eviction never revisits old keys
+        cache.add(key, secrets.randbits(48), timeout=None)
+        generation = cache.get(key)
+    return generation
+
+
+async def aget_generation(scope):
+    """``get_generation`` for async views"""
+    cache = caches[get_response_cache_settings()['CACHE']]
+    key = generation_key(scope)
+    generation = await cache.aget(key)
+    if generation is None:
+        await cache.aadd(key, secrets.randbits(48), timeout=None)
+        generation = await cache.aget(key)
+    return generation
+
+
+def bump_generations(scopes):
+    cache = caches[get_response_cache_settings()['CACHE']]
+    for scope in scopes:
+        key = generation_key(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Not set (or evicted): any fresh value invalidates as well
+            cache.set(key, secrets.randbits(48), timeout=None)
+
+
+def invalidate_scopes(scopes):
+    """
+    Bump the generation of each scope now and again once the current
+    transaction commits. The first bump keeps this thread from reading its
+    own stale responses; the second discards responses other requests cached
+    from the data as it was before the commit.
+    """
+    scopes = set(scopes)
+    if not scopes:
+        return
+    # Reads of these scopes wait out the replication lag on the primary
+    transaction.on_commit(lambda: pin_to_primary(scopes))
+    if not get_response_cache_settings()['ENABLED']:
+        return
+    bump_generations(scopes)
+    transaction.on_commit(lambda: bump_generations(scopes))
+
+
+def document_scopes(user_id, is_public):
+    scopes = [user_scope(user_id)]
+    if is_public:
+        scopes.append(PUBLIC_SCOPE)
+    return scopes
+
+
+def invalidate_document_ids(document_ids):
+    """Invalidate the responses that may show any of these documents (ids or a pk subquery)"""
+    if document_ids is None:
+        return
+    rows = Document.objects.filter(pk__in=document_ids).values_list('user_id', 'is_public').distinct()
+    invalidate_scopes(scope for user_id, is_public in rows for scope in document_scopes(user_id, is_public))
+
+
+def response_digest(request, request_scope, generation):
+    variant = f'{request.accepted_media_type}\n{request.build_absolute_uri()}'
+    return hashlib.sha256(f'{request_scope}\n{generation}\n{variant}'.encode()).hexdigest()
+
+
+def response_headers(request_scope, digest):
+    return {
+        'ETag': quote_etag(digest[:32]),
+        # Clients may keep the response but must revalidate it on every use
+        'Cache-Control': 'public, no-cache' if request_scope == PUBLIC_SCOPE else 'private, no-cache',
+    }
+
+
+def not_modified_response(request, headers):
+    not_modified = get_conditional_response(request, etag=headers['ETag'])
+    if not_modified is not None:
+        for name, value in headers.items():
+            not_modified[name] = value
+    return not_modified
+
+
+def cache_response(scope):
+    """
+    Serve an ``APIView.get`` handler, or an async ``aget`` one, through the
+    response cache.
+
+    ``scope(request)`` names the generation counter the response depends on.
+    Only 200 responses are stored (streamed exports just get the ``ETag``),
+    and the view must return the same data for every request with the same
+    URL and accepted media type in a scope.
+    """
+    def decorator(method):
+        if iscoroutinefunction(method):
+            @functools.wraps(method)
+            async def async_wrapper(view, request, *args, **kwargs):
+                cache_settings = get_response_cache_settings()
+                if not cache_settings['ENABLED']:
+                    return await method(view, request, *args, **kwargs)
+
+                cache = caches[cache_settings['CACHE']]
+                request_scope = scope(request)
+                digest = response_digest(request, request_scope, await aget_generation(request_scope))
+                headers = response_headers(request_scope, digest)
+                not_modified = not_modified_response(request, headers)
+                if not_modified is not None:
+                    return not_modified
+
+                key = f"{cache_settings['KEY_PREFIX']}:response:{digest}"
+                data = await cache.aget(key)
+                if data is not None:
+                    return Response(data, headers=headers)
+
+                response = await method(view, request, *args, **kwargs)
+                if response.status_code == 200:
+                    if not response.streaming:
+                        await cache.aset(key, response.data, timeout=cache_settings['TIMEOUT'])
+                    for name, value in headers.items():
+                        response[name] = value
+                return response
+            return async_wrapper
+
+        @functools.wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            cache_settings = get_response_cache_settings()
+            if not cache_settings['ENABLED']:
+                return method(view, request, *args, **kwargs)
+
+            cache = caches[cache_settings['CACHE']]
+            request_scope = scope(request)
+            digest = response_digest(request, request_scope, get_generation(request_scope))
+            headers = response_headers(request_scope, digest)
+            not_modified = not_modified_response(request, headers)
+            if not_modified is not None:
+                return not_modified
+
+            key = f"{cache_settings['KEY_PREFIX']}:response:{digest}"
+            data = cache.get(key)
+            if data is not None:
+                return Response(data, headers=headers)
+
+            response = method(view, request, *args, **kwargs)
+            if response.status_code == 200:
+                # Streamed exports are only revalidated, never stored
+                if not response.streaming:
+                    cache.set(key, response.data, timeout=cache_settings['TIMEOUT'])
+                for name, value in headers.items():
+                    response[name] = value
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,33 @@
+"""
+Removal of stored files that no document refers to any more.
+
+Like :mod:`documents.extraction`, this module runs inside the processing
+worker processes and must stay free of Django imports: callers resolve
+storage names to absolute paths first.
+"""
+import glob
+import os
+import shutil
+
+
+def remove_stored_files(entries):
+    """
+    Remove each ``(path, is_pattern)`` entry: a file, or every directory
+    matching a glob together with its contents. Anything already gone counts
+    as removed. Returns one error message per entry, None where it succeeded.
+    """
+    errors = []
+    for path, is_pattern in entries:
+        try:
+            if is_pattern:
+                for directory in glob.glob(path):
+                    shutil.rmtree(directory)
+            else:
+                os.remove(path)
+        except FileNotFoundError:
+            errors.append(None)
+        except OSError as exc:
+            errors.append(str(exc) or exc.__class__.__name__)
+        else:
+            errors.append(None)
+    return errors
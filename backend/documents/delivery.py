@@ -0,0 +1,254 @@
+"""
+Authenticated delivery of document files.
+
+Views check access and then call :func:`serve_document_file`, which either
+hands the transfer to the front proxy (``X-Accel-Redirect`` for nginx,
+``X-Sendfile`` for Apache/lighttpd) or, in standalone mode, answers
+conditional and ``Range`` requests itself and streams the file with
+``FileResponse``. WSGI servers with a ``wsgi.file_wrapper`` (gunicorn, uWSGI)
+send such responses with ``sendfile(2)``, so the bytes never pass through
+Python. ASGI has no such hook, and Django reads a sync file iterator into
+memory before sending it, so ASGI requests get an async iterator that reads
+one block at a time in a worker thread.
+
+Browsers cannot attach the API token to a plain link, so the download
+endpoint also issues short-lived signed URLs that stand in for it.
+Derivative images (thumbnails, previews) are embedded in pages and cached
+for a year, so their URLs carry a stable signature instead: access is still
+checked on every request, and the URL changes with the source file.
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core import signing
+from django.core.files.storage import default_storage
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_etags, parse_http_date_safe, quote_etag
+
+MODE_STANDALONE = 'standalone'
+MODE_ACCEL_REDIRECT = 'x-accel-redirect'
+MODE_SENDFILE = 'x-sendfile'
+
+SIGNATURE_SALT = 'documents.delivery'
+DERIVATIVE_SIGNATURE_SALT = 'documents.derivatives'
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def get_delivery_settings():
+    defaults = {
+        'MODE': MODE_STANDALONE,
+        'ACCEL_REDIRECT_PREFIX': '/protected-media/',
+        'SIGNED_URL_MAX_AGE': 3600,
+        'DERIVATIVE_MAX_AGE': 365 * 24 * 3600,
+    }
+    defaults.update(getattr(settings, 'DOCUMENT_DELIVERY', {}))
+    return defaults
+
+
+def sign_file_access(document_id, user_id):
+    """Return a signature granting ``user_id`` access to one document's file"""
+    return signing.dumps([document_id, user_id], salt=SIGNATURE_SALT, compress=True)
+
+
+def read_file_access(signature, document_id):
+    """Return the user id a signature was issued to, or None if it is invalid or expired"""
+    if not signature:
+        return None
+    try:
+        signed_document_id, user_id = signing.loads(
+            signature, salt=SIGNATURE_SALT, max_age=get_delivery_settings()['SIGNED_URL_MAX_AGE'],
+        )
+    except (signing.BadSignature, TypeError, ValueError):
+        return None
+    return user_id if signed_document_id == document_id else None
+
+
+def derivative_signer():
+    return signing.Signer(salt=DERIVATIVE_SIGNATURE_SALT)
+
+
+def sign_derivative_access(document_id, user_id, signer=None):
+    """
+    Return a signature granting ``user_id`` access to one document's
+    derivatives. It never expires and is the same on every call, so the
+    browser cache can key on the URL. Pass ``signer`` to reuse one across rows.
+    """
+    return (signer or derivative_signer()).sign_object([document_id, user_id])
+
+
+def read_derivative_access(signature, document_id):
+    """Return the user id a derivative signature was issued to, or None if it is invalid"""
+    if not signature:
+        return None
+    try:
+        signed_document_id, user_id = derivative_signer().unsign_object(signature)
+    except (signing.BadSignature, TypeError, ValueError):
+        return None
+    return user_id if signed_document_id == document_id else None
+
+
+class FileRange:
+    """
+    File-like view of ``length`` bytes of an open file, starting at its
+    current position. ``fileno`` is passed through so ``sendfile`` still works.
+    """
+
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+async def aread_blocks(file, block_size=FileResponse.block_size):
+    """Yield ``file`` block by block, reading in worker threads so the event loop never waits on the disk"""
+    read = sync_to_async(file.read, thread_sensitive=False)
+    try:
+        while True:
+            data = await read(block_size)
+            if not data:
+                break
+            yield data
+    finally:
+        await sync_to_async(file.close, thread_sensitive=False)()
+
+
+def file_response(request, file, length, **kwargs):
+    """``FileResponse`` streaming ``length`` bytes from the current position of ``file``"""
+    content = FileRange(file, length)
+    if isinstance(getattr(request, '_request', request), ASGIRequest):
+        content = aread_blocks(content)
+    response = FileResponse(content, **kwargs)
+    response['Content-Length'] = length
+    return response
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header, size):
+    """
+    Return the inclusive ``(start, end)`` of a single byte range, or None when
+    the whole file should be sent. Multiple ranges are answered with the whole
+    file, as RFC 9110 allows.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the final N bytes
+        length = int(last)
+        if length == 0:
+            raise RangeNotSatisfiable
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable
+    return start, end
+
+
+def if_range_passes(request, etag, last_modified):
+    """A Range is only honoured if the If-Range validator still matches"""
+    value = request.META.get('HTTP_IF_RANGE')
+    if not value:
+        return True
+    if value.startswith(('"', 'W/')):
+        # Weak validators never match for ranges
+        return not etag.startswith('W/') and parse_etags(value) == [etag]
+    return parse_http_date_safe(value) == last_modified
+
+
+def file_etag(stat, digest=None):
+    if digest:
+        return quote_etag(digest)
+    return quote_etag(f'{stat.st_size:x}-{int(stat.st_mtime):x}')
+
+
+def serve_document_file(request, document, as_attachment=False):
+    """Return the response delivering ``document.file``; access must already be checked"""
+    filename = document.original_filename or os.path.basename(document.file.name)
+    return serve_file(request, document.file.name, filename, digest=document.sha256, as_attachment=as_attachment)
+
+
+def serve_file(request, name, filename, digest=None, cache_control='private, no-cache', as_attachment=False):
+    """
+    Return the response delivering the stored file ``name`` as ``filename``.
+    ``digest`` becomes the ETag when the content hash is known. By default
+    only the requesting user may reuse the response, after revalidating it.
+    """
+    delivery = get_delivery_settings()
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    headers = {
+        'Content-Disposition': content_disposition_header(as_attachment, filename),
+        'Cache-Control': cache_control,
+    }
+
+    if delivery['MODE'] == MODE_ACCEL_REDIRECT:
+        # nginx serves the internal location and handles Range and validators itself
+        headers['X-Accel-Redirect'] = delivery['ACCEL_REDIRECT_PREFIX'] + quote(name)
+        return HttpResponse(content_type=content_type, headers=headers)
+    try:
+        path = default_storage.path(name)
+        stat = os.stat(path)
+    except (FileNotFoundError, NotImplementedError, ValueError):
+        raise Http404('File not found')
+    if delivery['MODE'] == MODE_SENDFILE:
+        headers['X-Sendfile'] = path
+        return HttpResponse(content_type=content_type, headers=headers)
+
+    etag = file_etag(stat, digest)
+    last_modified = int(stat.st_mtime)
+    headers.update({
+        'ETag': etag,
+        'Last-Modified': http_date(last_modified),
+        'Accept-Ranges': 'bytes',
+    })
+    validators = HttpResponse(headers=headers)
+    conditional = get_conditional_response(request, etag=etag, last_modified=last_modified, response=validators)
+    if conditional is not validators:
+        return conditional
+
+    size = stat.st_size
+    try:
+        byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+    except RangeNotSatisfiable:
+        headers['Content-Range'] = f'bytes */{size}'
+        return HttpResponse(status=416, headers=headers)
+    if byte_range and not if_range_passes(request, etag, last_modified):
+        byte_range = None
+
+    file = open(path, 'rb')
+    if byte_range is None:
+        return file_response(request, file, size, content_type=content_type, headers=headers)
+
+    start, end = byte_range
+    file.seek(start)
+    response = file_response(request, file, end - start + 1, status=206, content_type=content_type, headers=headers)
+    response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return response
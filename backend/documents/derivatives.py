@@ -0,0 +1,184 @@
+"""
+Thumbnail, preview and AI-input images derived from uploaded documents.
+
+Like :mod:`documents.extraction`, this module runs inside the processing
+worker processes and must stay free of Django imports. Images are decoded
+with Pillow; the first page of a PDF is rendered with pypdfium2 or PyMuPDF
+when one is installed, or with poppler's ``pdftoppm`` when it is on the PATH.
+
+Derivatives are written into one directory per source file, which the
+caller keys by the file's SHA-256, so a changed source never reuses a stale
+derivative.
+"""
+import math
+import os
+import shutil
+import subprocess
+import tempfile
+
+from PIL import Image, ImageOps
+
+try:
+    import pypdfium2
+except ImportError:
+    pypdfium2 = None
+
+try:
+    import fitz
+except ImportError:
+    fitz = None
+
+
+# Bump when the specs change so existing derivatives are regenerated
+DERIVATIVE_VERSION = 1
+
+DERIVATIVE_SPECS = {
+    'thumbnail': {'max_size': 320, 'format': 'WEBP', 'extension': 'webp', 'quality': 80},
+    'preview': {'max_size': 1024, 'format': 'WEBP', 'extension': 'webp', 'quality': 82},
+    # Vision models downscale anything larger; JPEG is accepted everywhere
+    'ai': {'max_size': 1568, 'format': 'JPEG', 'extension': 'jpg', 'quality': 85},
+}
+
+DERIVATIVE_DOCUMENT_TYPES = ('IMAGE', 'PDF')
+
+# Render PDFs just large enough for the biggest derivative
+PDF_RENDER_SIZE = max(spec['max_size'] for spec in DERIVATIVE_SPECS.values())
+PDF_RENDER_TIMEOUT = 60
+
+
+class DerivativeError(Exception):
+    """Raised when a source file cannot be turned into images"""
+
+
+class DerivativeUnavailable(DerivativeError):
+    """Raised when no renderer for the source format is installed"""
+
+
+def derivative_filename(kind):
+    return f"{kind}.{DERIVATIVE_SPECS[kind]['extension']}"
+
+
+def generate_derivatives(path, document_type, output_dir):
+    """
+    Write every derivative of the file at ``path`` into ``output_dir``.
+
+    Returns a dict with the generated ``kinds`` and the ``width`` and
+    ``height`` of the decoded source, which is already reduced for large
+    JPEGs and PDF pages.
+    """
+    if document_type == 'IMAGE':
+        image = load_image(path, PDF_RENDER_SIZE)
+    elif document_type == 'PDF':
+        image = render_pdf_first_page(path, PDF_RENDER_SIZE)
+    else:
+        raise DerivativeUnavailable(f'No derivatives for {document_type} documents')
+
+    os.makedirs(output_dir, exist_ok=True)
+    width, height = image.size
+    # Largest first, so each step resamples an already reduced image
+    kinds = sorted(DERIVATIVE_SPECS, key=lambda kind: -DERIVATIVE_SPECS[kind]['max_size'])
+    for kind in kinds:
+        image = fit_within(image, DERIVATIVE_SPECS[kind]['max_size'])
+        save_atomically(image, DERIVATIVE_SPECS[kind], os.path.join(output_dir, derivative_filename(kind)))
+    return {'kinds': sorted(kinds), 'width': width, 'height': height}
+
+
+def load_image(path, max_size):
+    """Decode an image upright and in RGB(A), reducing it while decoding when the format allows"""
+    try:
+        image = Image.open(path)
+        scale = max_size / max(image.size)
+        if scale < 1:
+            # JPEG can decode at 1/2, 1/4 or 1/8 scale, far cheaper than a full decode
+            image.draft('RGB', (math.ceil(image.width * scale), math.ceil(image.height * scale)))
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    except (OSError, SyntaxError, Image.DecompressionBombError) as exc:
+        raise DerivativeError(f'Unreadable image: {exc}') from exc
+    return normalize_mode(image)
+
+
+def normalize_mode(image):
+    if image.mode in ('RGB', 'RGBA'):
+        return image
+    if image.mode in ('P', 'LA', 'PA') or 'transparency' in image.info:
+        return image.convert('RGBA')
+    return image.convert('RGB')
+
+
+def fit_within(image, max_size):
+    """Return ``image`` scaled down to fit a ``max_size`` square; smaller images are kept"""
+    if max(image.size) <= max_size:
+        return image
+    image = image.copy()
+    image.thumbnail((max_size, max_size), Image.Resampling.LANCZOS, reducing_gap=3.0)
+    return image
+
+
+def save_atomically(image, spec, destination):
+    """Encode to a temporary file and rename it, so readers never see a partial image"""
+    if spec['format'] == 'JPEG' and image.mode != 'RGB':
+        # JPEG has no alpha channel; flatten onto white like a page background
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A') if 'A' in image.getbands() else None)
+        image = background
+    fd, temporary = tempfile.mkstemp(dir=os.path.dirname(destination), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            image.save(f, spec['format'], quality=spec['quality'], optimize=spec['format'] == 'JPEG')
+        os.replace(temporary, destination)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+
+def render_pdf_first_page(path, max_size):
+    """Render page one of a PDF so its long edge is about ``max_size`` pixels"""
+    if pypdfium2 is not None:
+        return _render_with_pdfium(path, max_size)
+    if fitz is not None:
+        return _render_with_pymupdf(path, max_size)
+    if shutil.which('pdftoppm'):
+        return _render_with_pdftoppm(path, max_size)
+    raise DerivativeUnavailable('No PDF renderer installed (pypdfium2, PyMuPDF or pdftoppm)')
+
+
+def _render_with_pdfium(path, max_size):
+    try:
+        pdf = pypdfium2.PdfDocument(path)
+        try:
+            page = pdf[0]
+            width, height = page.get_size()
+            image = page.render(scale=max_size / max(width, height, 1)).to_pil()
+        finally:
+            pdf.close()
+    except Exception as exc:
+        raise DerivativeError(f'Could not render PDF: {exc}') from exc
+    return normalize_mode(image)
+
+
+def _render_with_pymupdf(path, max_size):
+    try:
+        with fitz.open(path) as pdf:
+            page = pdf[0]
+            scale = max_size / max(page.rect.width, page.rect.height, 1)
+            pixmap = page.get_pixmap(matrix=fitz.Matrix(scale, scale), alpha=False)
+            image = Image.frombytes('RGB', (pixmap.width, pixmap.height), pixmap.samples)
+    except Exception as exc:
+        raise DerivativeError(f'Could not render PDF: {exc}') from exc
+    return image
+
+
+def _render_with_pdftoppm(path, max_size):
+    with tempfile.TemporaryDirectory() as directory:
+        prefix = os.path.join(directory, 'page')
+        try:
+            subprocess.run(
+                ['pdftoppm', '-png', '-singlefile', '-f', '1', '-l', '1',
+                 '-scale-to', str(max_size), path, prefix],
+                check=True, capture_output=True, timeout=PDF_RENDER_TIMEOUT,
+            )
+        except (OSError, subprocess.SubprocessError) as exc:
+            raise DerivativeError(f'Could not render PDF: {exc}') from exc
+        return load_image(prefix + '.png', max_size)
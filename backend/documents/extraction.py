@@ -0,0 +1,149 @@
+"""
+Text extraction for uploaded documents.
+
+Everything in this module runs inside the processing worker processes, so it
+must stay free of Django imports: workers are spawned fresh and only need the
+standard library (plus pypdf when it is installed).
+"""
+import re
+import zipfile
+import zlib
+from xml.etree import ElementTree
+
+try:
+    import pypdf
+except ImportError:
+    pypdf = None
+
+
+WORD_NAMESPACE = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+APP_NAMESPACE = '{http://schemas.openxmlformats.org/officeDocument/2006/extended-properties}'
+
+PDF_PAGE_RE = re.compile(rb'/Type\s*/Page(?![a-zA-Z])')
+PDF_STREAM_RE = re.compile(rb'stream\r?\n')
+PDF_TEXT_RE = re.compile(rb'\(((?:[^()\\]|\\.)*)\)\s*(?:Tj|\'|")|\[((?:[^\[\]\\]|\\.)*)\]\s*TJ', re.S)
+PDF_TEXT_BLOCK_RE = re.compile(rb'\bBT\b(.*?)\bET\b', re.S)
+PDF_STRING_RE = re.compile(rb'\(((?:[^()\\]|\\.)*)\)', re.S)
+PDF_SKIPPED_STREAM_KEYS = (b'/Length1', b'/Length2', b'/Subtype', b'/ObjStm', b'/XRef')
+PDF_ESCAPES = {b'n': b'\n', b'r': b'\r', b't': b'\t', b'(': b'(', b')': b')', b'\\': b'\\'}
+
+
+class ExtractionError(Exception):
+    """Raised when a document cannot be parsed"""
+
+
+def extract_document(path, extension):
+    """
+    Extract text and page count from the file at ``path``.
+
+    Returns a dict with ``text`` and ``page_count`` keys. ``page_count`` is
+    ``None`` for formats without a notion of pages.
+    """
+    extension = (extension or '').lower()
+    if extension == 'pdf':
+        return extract_pdf(path)
+    if extension == 'docx':
+        return extract_docx(path)
+    if extension == 'txt':
+        return extract_plain_text(path)
+    # Images and legacy .doc files have no text layer we can read locally
+    return {'text': '', 'page_count': None}
+
+
+def extract_plain_text(path):
+    """Read a plain text file, replacing undecodable bytes"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    return {'text': data.decode('utf-8', errors='replace'), 'page_count': None}
+
+
+def extract_docx(path):
+    """Extract paragraph text from a .docx package"""
+    try:
+        with zipfile.ZipFile(path) as package:
+            root = ElementTree.fromstring(package.read('word/document.xml'))
+            page_count = None
+            if 'docProps/app.xml' in package.namelist():
+                app = ElementTree.fromstring(package.read('docProps/app.xml'))
+                pages = app.find(f'{APP_NAMESPACE}Pages')
+                if pages is not None and (pages.text or '').isdigit():
+                    page_count = int(pages.text)
+    except (zipfile.BadZipFile, KeyError, ElementTree.ParseError) as exc:
+        raise ExtractionError(f'Invalid DOCX file: {exc}')
+
+    paragraphs = []
+    for paragraph in root.iter(f'{WORD_NAMESPACE}p'):
+        runs = [node.text or '' for node in paragraph.iter(f'{WORD_NAMESPACE}t')]
+        if runs:
+            paragraphs.append(''.join(runs))
+    return {'text': '\n'.join(paragraphs), 'page_count': page_count}
+
+
+def extract_pdf(path):
+    """Extract text from a PDF, using pypdf when available"""
+    if pypdf is not None:
+        try:
+            reader = pypdf.PdfReader(path)
+            pages = [page.extract_text() or '' for page in reader.pages]
+        except Exception as exc:
+            raise ExtractionError(f'Invalid PDF file: {exc}')
+        return {'text': '\n'.join(pages).strip(), 'page_count': len(pages)}
+
+    with open(path, 'rb') as f:
+        data = f.read()
+    if not data.startswith(b'%PDF'):
+        raise ExtractionError('Invalid PDF file: missing header')
+
+    chunks = []
+    for header, body in _pdf_streams(data):
+        if b'/FlateDecode' in header:
+            try:
+                body = zlib.decompress(body)
+            except zlib.error:
+                continue
+        elif b'/Filter' in header:
+            # Other filters (DCT, LZW, ...) never carry text operators we can read
+            continue
+        if b'BT' not in body:
+            # Fonts, images and object streams have no text objects
+            continue
+        text = _pdf_stream_text(body)
+        if text:
+            chunks.append(text)
+    return {
+        'text': '\n'.join(chunks).strip(),
+        'page_count': len(PDF_PAGE_RE.findall(data)) or None,
+    }
+
+
+def _pdf_streams(data):
+    """Yield (dictionary, raw body) pairs for every stream object"""
+    for match in PDF_STREAM_RE.finditer(data):
+        if data[match.start() - 3:match.start()] == b'end':
+            continue
+        end = data.find(b'endstream', match.end())
+        if end == -1:
+            break
+        # The stream dictionary sits between the object header and the keyword
+        header_start = data.rfind(b' obj', 0, match.start())
+        header = data[max(header_start, 0):match.start()]
+        if any(key in header for key in PDF_SKIPPED_STREAM_KEYS):
+            continue
+        yield header, data[match.end():end].rstrip(b'\r\n')
+
+
+def _pdf_stream_text(content):
+    """Pull string operands out of Tj/TJ operators in a content stream"""
+    parts = []
+    for block in PDF_TEXT_BLOCK_RE.findall(content):
+        for single, array in PDF_TEXT_RE.findall(block):
+            if single:
+                parts.append(_pdf_unescape(single))
+            else:
+                parts.extend(_pdf_unescape(s) for s in PDF_STRING_RE.findall(array))
+        parts.append(b' ')
+    return ''.join(part.decode('latin-1') for part in parts).strip()
+
+
+def _pdf_unescape(value):
+    return re.sub(rb'\\([nrt()\\])', lambda m: PDF_ESCAPES[m.group(1)], value)
@@ -0,0 +1,430 @@
+"""
+Study summaries, flashcards and quizzes generated from documents.
+
+Results are content-addressed: the cache key is the SHA-256 of the input
+(the extracted text, or the ``ai`` derivative image of documents without
+text), the task and its item count, the model and the task's prompt
+version. Identical uploads, re-uploads and other users' copies all share
+one result, and changing a prompt only needs its version bumped.
+
+Identical requests that arrive while a result is being generated wait for
+it instead of calling the provider again: inside a process they share one
+:class:`~concurrent.futures.Future`, and across processes the first one
+claims a ``PENDING`` row that the others poll until it is ``READY``. They
+wait at most ``FOLLOWER_WAIT`` seconds, then raise :class:`GenerationPending`
+so the client retries later instead of holding a worker for the whole
+generation. A claim expires after the provider timeout, so a crashed worker
+does not block the key for good.
+
+Results live in the ``GeneratedContent`` table. Once their total size
+passes ``CACHE_MAX_BYTES`` the least recently used ones are deleted.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.db.models import Sum
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import GeneratedContent
+from .providers import GenerationError, GenerationRequest
+
+# last_used_at is only rewritten when older than this, so cache hits rarely write
+TOUCH_INTERVAL = timedelta(minutes=1)
+# Eviction frees space down to this fraction of CACHE_MAX_BYTES
+EVICTION_LOW_WATER = 0.9
+POLL_INTERVAL = 0.05
+MAX_POLL_INTERVAL = 1.0
+
+Task = namedtuple(
+    'Task', 'prompt_version schema_name schema result_key temperature max_tokens default_count max_count'
+)
+
+# Python types standing for each JSON schema type
+JSON_TYPES = {'object': dict, 'array': list, 'string': str, 'number': (int, float)}
+
+STRING = {'type': 'string'}
+STRINGS = {'type': 'array', 'items': STRING}
+DIFFICULTY = {'type': 'string', 'enum': ['easy', 'medium', 'hard']}
+
+SUMMARY_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'title': STRING,
+        'overview': STRING,
+        'main_sections': {
+            'type': 'array',
+            'items': {
+                'type': 'object',
+                'properties': {
+                    'heading': STRING,
+                    'bullet_points': STRINGS,
+                    'key_concepts': STRINGS,
+                    'subsections': {
+                        'type': 'array',
+                        'items': {
+                            'type': 'object',
+                            'properties': {'subheading': STRING, 'points': STRINGS},
+                            'required': ['subheading', 'points'],
+                        },
+                    },
+                },
+                'required': ['heading', 'bullet_points', 'key_concepts'],
+                'additionalProperties': False,
+            },
+        },
+        'key_takeaways': STRINGS,
+        'study_tips': STRINGS,
+        'difficulty_level': {'type': 'string', 'enum': ['beginner', 'intermediate', 'advanced']},
+        'estimated_study_time': STRING,
+        'related_topics': STRINGS,
+        'important_formulas': STRINGS,
+        'definitions': {
+            'type': 'array',
+            'items': {
+                'type': 'object',
+                'properties': {'term': STRING, 'definition': STRING},
+                'required': ['term', 'definition'],
+            },
+        },
+        'practice_questions': STRINGS,
+        'memory_aids': STRINGS,
+    },
+    'required': [
+        'title', 'overview', 'main_sections', 'key_takeaways', 'study_tips', 'difficulty_level',
+        'estimated_study_time', 'related_topics',
+    ],
+    'additionalProperties': False,
+}
+
+FLASHCARDS_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'flashcards': {
+            'type': 'array',
+            'items': {
+                'type': 'object',
+                'properties': {
+                    'question': STRING,
+                    'answer': STRING,
+                    'difficulty_level': DIFFICULTY,
+                    'category': STRING,
+                    'tags': STRINGS,
+                },
+                'required': ['question', 'answer', 'difficulty_level', 'category'],
+                'additionalProperties': False,
+            },
+        },
+    },
+    'required': ['flashcards'],
+    'additionalProperties': False,
+}
+
+QUIZ_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'quiz_questions': {
+            'type': 'array',
+            'items': {
+                'type': 'object',
+                'properties': {
+                    'question': STRING,
+                    'options': {'type': 'array', 'items': STRING, 'minItems': 4, 'maxItems': 4},
+                    'correct_answer': {'type': 'number', 'minimum': 0, 'maximum': 3},
+                    'difficulty_level': DIFFICULTY,
+                    'explanation': STRING,
+                    'category': STRING,
+                },
+                'required': ['question', 'options', 'correct_answer', 'difficulty_level', 'explanation'],
+                'additionalProperties': False,
+            },
+        },
+    },
+    'required': ['quiz_questions'],
+    'additionalProperties': False,
+}
+
+# Bump a prompt_version whenever its prompt or schema changes
+TASKS = {
+    'summary': Task(1, 'comprehensive_study_summary', SUMMARY_SCHEMA, None, 0.15, 4000, None, None),
+    'flashcards': Task(1, 'study_flashcards', FLASHCARDS_SCHEMA, 'flashcards', 0.4, 2000, 15, 50),
+    'quiz': Task(1, 'comprehensive_quiz', QUIZ_SCHEMA, 'quiz_questions', 0.3, 2500, 10, 30),
+}
+
+PROMPTS = {
+    'summary': """Please analyze this document and create a comprehensive study summary. I need you to:
+
+1. Extract the document structure: main headings, subheadings and how sections are organized.
+2. Create 5-8 concise bullet points per section, keeping the logical flow between them.
+3. Identify key concepts and terminology, formulas or procedures, definitions, and examples.
+4. Enhance learning with memory aids, practice questions and study strategies for this content.
+
+Make this material as digestible and study-friendly as possible. Use clear, concise language and organize
+information hierarchically for effective learning.""",
+    'flashcards': """Based on the following document content, generate {count} high-quality flashcards for studying.
+Create a strategic mix that covers:
+
+1. Basic recall (30% - definitions, facts)
+2. Comprehension (40% - understanding concepts)
+3. Application (30% - applying knowledge)
+
+Requirements:
+- Clear, specific questions that test understanding
+- Complete, accurate answers with context when needed
+- Good distribution across difficulty levels
+- Variety in question types (What is...?, How does...?, Why...?, When...?)
+- Focus on the most important concepts
+
+Make each flashcard educational and effective for spaced repetition learning.""",
+    'quiz': """Based on the following document content, generate {count} high-quality multiple-choice quiz questions.
+Create questions that:
+
+1. Test different levels of understanding: knowledge recall (25%), comprehension (40%), application/analysis (35%)
+2. Have a strategic difficulty distribution: easy 30%, medium 50%, hard 20%
+3. Include plausible distractors (wrong answers that seem reasonable)
+4. Provide comprehensive explanations for learning
+
+Focus on the most important concepts and ensure each question is educational and fair.""",
+}
+
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+class GenerationNotReady(Exception):
+    """Raised when a document has nothing to generate from yet"""
+
+
+class GenerationPending(Exception):
+    """Raised when another request is still generating the same result"""
+
+    def __init__(self, retry_after):
+        super().__init__('The result is still being generated')
+        self.retry_after = retry_after
+
+
+def get_generation_settings():
+    defaults = {
+        'PROVIDER': 'documents.providers.OpenRouterProvider',
+        'MODEL': 'openrouter/auto',
+        'API_KEY': '',
+        'API_URL': 'https://openrouter.ai/api/v1/chat/completions',
+        'TIMEOUT': 120,
+        'FOLLOWER_WAIT': 2,
+        'MAX_INPUT_CHARACTERS': 60000,
+        'CACHE_MAX_BYTES': 256 * 1024 * 1024,
+        'FAKE_DELAY': 0,
+    }
+    defaults.update(getattr(settings, 'AI_GENERATION', {}))
+    return defaults
+
+
+def get_provider():
+    generation_settings = get_generation_settings()
+    return import_string(generation_settings['PROVIDER'])(generation_settings)
+
+
+def document_input(document):
+    """Return ``(text, image, content_sha256)``; exactly one of text and image is set"""
+    if document.status != 'COMPLETED':
+        raise GenerationNotReady('Document is still being processed')
+    text = document.extracted_text.strip()[:get_generation_settings()['MAX_INPUT_CHARACTERS']]
+    if text:
+        return text, None, hashlib.sha256(text.encode()).hexdigest()
+    blob = document.blob
+    if blob is not None and blob.has_derivative('ai'):
+        with default_storage.open(blob.derivative_name('ai')) as f:
+            image = f.read()
+        return None, image, hashlib.sha256(image).hexdigest()
+    raise GenerationNotReady('Document has no text or image to generate from')
+
+
+def cache_key(content_sha256, task, count, model, prompt_version):
+    parts = json.dumps([content_sha256, task, count, model, prompt_version])
+    return hashlib.sha256(parts.encode()).hexdigest()
+
+
+def build_prompt(task, count, text):
+    prompt = PROMPTS[task].format(count=count)
+    if text is not None:
+        prompt += f'\n\nDocument content:\n{text}'
+    return prompt
+
+
+def matches_schema(value, schema):
+    """
+    Whether ``value`` has the types, required keys, enum values and bounds
+    that ``schema`` asks for, all the way down
+    """
+    expected = schema.get('type')
+    if expected is not None and (isinstance(value, bool) or not isinstance(value, JSON_TYPES[expected])):
+        return False
+    if 'enum' in schema and value not in schema['enum']:
+        return False
+    if expected == 'number':
+        return schema.get('minimum', value) <= value <= schema.get('maximum', value)
+    if expected == 'array':
+        if not schema.get('minItems', 0) <= len(value) <= schema.get('maxItems', len(value)):
+            return False
+        return all(matches_schema(item, schema.get('items', {})) for item in value)
+    if expected == 'object':
+        if any(name not in value for name in schema.get('required', ())):
+            return False
+        properties = schema.get('properties', {})
+        return all(matches_schema(item, properties[name]) for name, item in value.items() if name in properties)
+    return True
+
+
+def stored_schema(task):
+    """Schema of what is cached for ``task``: the whole result, or the list under its result key"""
+    spec = TASKS[task]
+    return spec.schema if spec.result_key is None else spec.schema['properties'][spec.result_key]
+
+
+def unwrap(task, result):
+    """Check a provider's result against the task's schema and return what is stored"""
+    spec = TASKS[task]
+    if not matches_schema(result, spec.schema):
+        raise GenerationError('Provider result does not match the schema')
+    return result if spec.result_key is None else result[spec.result_key]
+
+
+def generate(document, task, count=None):
+    """
+    Return ``(result, cached)`` for ``task`` on ``document``, where
+    ``cached`` is False only for the request that called the provider.
+    """
+    spec = TASKS[task]
+    count = min(count or spec.default_count, spec.max_count) if spec.max_count else None
+    provider = get_provider()
+    text, image, content_sha256 = document_input(document)
+    key = cache_key(content_sha256, task, count, provider.model, spec.prompt_version)
+
+    result = lookup(key, task)
+    if result is not None:
+        return result, True
+
+    with _inflight_lock:
+        future = _inflight.get(key)
+        leader = future is None
+        if leader:
+            future = _inflight[key] = Future()
+    if not leader:
+        wait = follower_wait()
+        try:
+            return future.result(timeout=wait), True
+        except FutureTimeoutError:
+            raise GenerationPending(wait)
+
+    try:
+        request = GenerationRequest(
+            task, provider.model, build_prompt(task, count, text), image, spec.schema, spec.schema_name,
+            spec.temperature, spec.max_tokens, count,
+        )
+        fields = {
+            'task': task, 'model': provider.model, 'prompt_version': spec.prompt_version,
+            'content_sha256': content_sha256,
+        }
+        result, generated = generate_once(key, fields, provider, request)
+        future.set_result(result)
+        return result, not generated
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            del _inflight[key]
+
+
+def lookup(key, task):
+    row = GeneratedContent.objects.filter(key=key, status='READY').values_list('pk', 'result', 'last_used_at').first()
+    if row is None:
+        return None
+    pk, result, last_used_at = row
+    if not matches_schema(result, stored_schema(task)):
+        # Cached before results were checked item by item; generate it again
+        GeneratedContent.objects.filter(pk=pk).delete()
+        return None
+    now = timezone.now()
+    if now - last_used_at > TOUCH_INTERVAL:
+        GeneratedContent.objects.filter(pk=pk).update(last_used_at=now)
+    return result
+
+
+def claim(key, fields, lease):
+    """Try to become the worker that generates ``key``"""
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            GeneratedContent.objects.create(key=key, claimed_until=now + lease, **fields)
+        return True
+    except IntegrityError:
+        # Take over from a worker that died or is hung
+        return GeneratedContent.objects.filter(
+            key=key, status='PENDING', claimed_until__lt=now,
+        ).update(claimed_until=now + lease) == 1
+
+
+def follower_wait():
+    """Seconds a request waits for another one generating the same result"""
+    generation_settings = get_generation_settings()
+    return min(generation_settings['FOLLOWER_WAIT'], generation_settings['TIMEOUT'])
+
+
+def generate_once(key, fields, provider, request):
+    """
+    Claim ``key`` and call the provider, or wait briefly for the worker
+    holding the claim. Returns ``(result, generated)``.
+    """
+    timeout = get_generation_settings()['TIMEOUT']
+    lease = timedelta(seconds=timeout + 10)
+    wait = follower_wait()
+    deadline = time.monotonic() + wait
+    delay = POLL_INTERVAL
+    while not claim(key, fields, lease):
+        result = lookup(key, request.task)
+        if result is not None:
+            return result, False
+        if time.monotonic() > deadline:
+            raise GenerationPending(wait)
+        time.sleep(delay)
+        delay = min(delay * 2, MAX_POLL_INTERVAL)
+
+    try:
+        result = unwrap(request.task, provider.generate(request))
+    except BaseException:
+        # Let the next request try again at once
+        GeneratedContent.objects.filter(key=key, status='PENDING').delete()
+        raise
+    size = len(json.dumps(result, separators=(',', ':')).encode())
+    GeneratedContent.objects.filter(key=key).update(
+        status='READY', result=result, size=size, claimed_until=None, last_used_at=timezone.now(),
+    )
+    evict(get_generation_settings()['CACHE_MAX_BYTES'])
+    return result, True
+
+
+def evict(max_bytes):
+    """Delete the least recently used results until they fit in ``max_bytes``; returns the count"""
+    total = GeneratedContent.objects.aggregate(total=Sum('size'))['total'] or 0
+    if total <= max_bytes:
+        return 0
+    excess = total - int(max_bytes * EVICTION_LOW_WATER)
+    evicted = []
+    oldest = GeneratedContent.objects.filter(status='READY').order_by('last_used_at', 'id')
+    for pk, size in oldest.values_list('pk', 'size').iterator():
+        evicted.append(pk)
+        excess -= size
+        if excess <= 0:
+            break
+    for start in range(0, len(evicted), 500):
+        GeneratedContent.objects.filter(pk__in=evicted[start:start + 500]).delete()
+    return len(evicted)
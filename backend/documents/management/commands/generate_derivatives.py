@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Min
+
+from documents.derivatives import DERIVATIVE_DOCUMENT_TYPES, DERIVATIVE_VERSION
+from documents.models import DocumentBlob
+from documents.processing import process_derivatives
+
+
+class Command(BaseCommand):
+    help = 'Generate thumbnails, previews and AI images for blobs that lack current derivatives'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Regenerate derivatives that are already up to date',
+        )
+
+    def handle(self, *args, **options):
+        blobs = DocumentBlob.objects.filter(documents__document_type__in=DERIVATIVE_DOCUMENT_TYPES)
+        if not options['force']:
+            blobs = blobs.exclude(derivatives_version=DERIVATIVE_VERSION)
+        # One document per blob records the outcome in its processing log
+        pending = blobs.values('pk').annotate(document_id=Min('documents__id')).order_by('pk')
+
+        generated = 0
+        for row in pending.iterator():
+            process_derivatives(row['document_id'], row['pk'])
+            generated += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Generated derivatives for {generated} blobs'))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from documents.models import Document
+from documents.processing import process_document
+
+
+class Command(BaseCommand):
+    help = 'Run text extraction for documents left in PROCESSING (e.g. after a restart)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--retry-failed',
+            action='store_true',
+            help='Also reprocess documents whose previous extraction failed',
+        )
+
+    def handle(self, *args, **options):
+        statuses = ['PROCESSING']
+        if options['retry_failed']:
+            statuses.append('FAILED')
+
+        documents = Document.objects.filter(status__in=statuses).only('id', 'file')
+        processed = 0
+        for document in documents.iterator():
+            process_document(document.pk, document.file.path, document.file_extension)
+            processed += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} documents'))
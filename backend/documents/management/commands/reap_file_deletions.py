@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from documents.processing import reap_file_deletions
+
+
+class Command(BaseCommand):
+    help = 'Remove the stored files queued for deletion (e.g. after a restart or failed attempts)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Queue rows removed per batch')
+        parser.add_argument('--loop', type=float, metavar='SECONDS',
+                            help='Keep running, looking for due rows every SECONDS')
+
+    def handle(self, *args, **options):
+        while True:
+            removed, failed = reap_file_deletions(options['batch_size'])
+            if removed or failed or not options['loop']:
+                style = self.style.WARNING if failed else self.style.SUCCESS
+                self.stdout.write(style(f'Removed {removed} stored files, {failed} failed and will be retried'))
+            if not options['loop']:
+                return
+            time.sleep(options['loop'])
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from documents.stats import rebuild_all_stats, rebuild_user_stats
+
+
+class Command(BaseCommand):
+    help = 'Recompute the per-user document statistics rollup from the documents table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='users',
+                            help='Only rebuild the stats of this user id (repeatable)')
+
+    def handle(self, *args, **options):
+        if options['users']:
+            for user_id in options['users']:
+                rebuild_user_stats(user_id)
+            count = len(options['users'])
+        else:
+            count = rebuild_all_stats()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt document stats for {count} users'))
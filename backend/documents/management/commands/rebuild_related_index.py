@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from documents.models import Document, decompress_text
+from documents.related import store_document_vector
+from documents.vectors import VECTOR_VERSION
+
+
+class Command(BaseCommand):
+    help = 'Compute the related-documents vectors of completed documents that lack a current one'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Documents read per query')
+        parser.add_argument('--force', action='store_true',
+                            help='Recompute every vector, not only missing or outdated ones')
+
+    def handle(self, *args, **options):
+        documents = Document.objects.filter(status='COMPLETED')
+        if not options['force']:
+            documents = documents.filter(Q(vector__isnull=True) | ~Q(vector__version=VECTOR_VERSION))
+
+        computed = 0
+        last_pk = 0
+        while True:
+            # Keyset batches so rows gaining a vector do not shift the next page
+            batch = documents.filter(pk__gt=last_pk).order_by('pk').values_list('pk', 'content__compressed_text')
+            batch = list(batch[:options['batch_size']])
+            if not batch:
+                break
+            for document_id, compressed_text in batch:
+                store_document_vector(document_id, decompress_text(compressed_text))
+            computed += len(batch)
+            last_pk = batch[-1][0]
+            if options['verbosity'] >= 2:
+                self.stdout.write(f'{computed} documents vectorized')
+
+        self.stdout.write(self.style.SUCCESS(f'Vectorized {computed} documents'))
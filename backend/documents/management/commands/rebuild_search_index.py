@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from documents.models import Document
+from documents.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the document full-text search index from the documents table'
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        count = backend.rebuild(
+            Document.objects.select_related('content').prefetch_related('tags').order_by('pk')
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {count} documents with {backend.__class__.__name__}'
+        ))
@@ -0,0 +1,64 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+
+from documents.models import DocumentBlob, PendingFileDeletion
+from documents.processing import reap_file_deletions
+from documents.reconcile import find_mismatches
+
+QUEUE_BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = 'Compare media storage with the database and report orphaned files and missing references'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-age', type=int, default=3600,
+                            help='Ignore files modified within this many seconds (default 3600)')
+        parser.add_argument('--delete-orphans', action='store_true',
+                            help='Queue orphaned files and directories for deletion and remove them')
+        parser.add_argument('--reset-missing-derivatives', action='store_true',
+                            help='Mark blobs whose derivatives are missing for regeneration by generate_derivatives')
+
+    def handle(self, *args, **options):
+        counts = Counter()
+        orphans = []
+        blobs_to_reset = []
+        for mismatch in find_mismatches(min_age=options['min_age']):
+            counts[mismatch.kind, mismatch.source] += 1
+            if options['verbosity'] >= 2:
+                reference = f' ({mismatch.source} {mismatch.object_id})' if mismatch.object_id else ''
+                self.stdout.write(f'{mismatch.kind}: {mismatch.name}{reference}')
+
+            if mismatch.kind == 'orphan' and options['delete_orphans']:
+                orphans.append(mismatch)
+                if len(orphans) >= QUEUE_BATCH_SIZE:
+                    self.queue(orphans)
+                    orphans = []
+            elif mismatch.source == 'derivatives' and options['reset_missing_derivatives']:
+                blobs_to_reset.append(mismatch.object_id)
+                if len(blobs_to_reset) >= QUEUE_BATCH_SIZE:
+                    self.reset(blobs_to_reset)
+                    blobs_to_reset = []
+        self.queue(orphans)
+        self.reset(blobs_to_reset)
+
+        orphaned = sum(count for (kind, _), count in counts.items() if kind == 'orphan')
+        missing = {source: count for (kind, source), count in counts.items() if kind == 'missing'}
+        summary = f'{orphaned} orphaned, missing: ' + (
+            ', '.join(f'{count} {source}' for source, count in sorted(missing.items())) or 'none'
+        )
+        self.stdout.write((self.style.WARNING if counts else self.style.SUCCESS)(summary))
+
+        if options['delete_orphans'] and orphaned:
+            removed, failed = reap_file_deletions()
+            self.stdout.write(f'Removed {removed} stored files, {failed} failed and will be retried')
+
+    def queue(self, orphans):
+        PendingFileDeletion.objects.enqueue(
+            [orphan.name for orphan in orphans if not orphan.is_directory],
+            [orphan.name for orphan in orphans if orphan.is_directory],
+        )
+
+    def reset(self, blob_ids):
+        DocumentBlob.objects.filter(pk__in=blob_ids).update(derivatives=[], derivatives_version=0)
@@ -0,0 +1,236 @@
+import hashlib
+import io
+import random
+
+from PIL import Image
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.authtoken.models import Token
+
+from documents.models import (
+    Document, DocumentBlob, DocumentContent, DocumentProcessingLog, DocumentShare, DocumentTag, DocumentTagging,
+    DocumentVector, Flashcard, Quiz,
+)
+from documents.processing import process_derivatives
+from documents.search import get_search_backend
+from documents.stats import rebuild_all_stats
+from documents.vectors import VECTOR_VERSION, to_bytes, vectorize
+
+User = get_user_model()
+
+BATCH_SIZE = 2000
+TOPICS = 50
+VOCABULARY_SIZE = 20000
+LOG_OPERATIONS = ('upload', 'text_extraction', 'derivatives')
+
+
+class Command(BaseCommand):
+    help = (
+        'Fill the database with a reproducible synthetic dataset (users, documents with extracted text, tags, '
+        'shares, processing logs, flashcards, quiz questions and API tokens) for load tests and benchmarks'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--documents', type=int, default=20, help='Documents per user')
+        parser.add_argument('--words', type=int, default=300, help='Average words of extracted text per document')
+        parser.add_argument('--tags', type=int, default=200, help='Distinct tags')
+        parser.add_argument('--tags-per-document', type=int, default=3)
+        parser.add_argument('--shares', type=int, default=5, help='Documents each user shares with others')
+        parser.add_argument('--logs', type=int, default=3, help='Processing log entries per document')
+        parser.add_argument('--flashcards', type=int, default=20, help='Flashcards per user')
+        parser.add_argument('--quizzes', type=int, default=10, help='Quiz questions per user')
+        parser.add_argument('--public', type=float, default=0.2, help='Fraction of public documents')
+        parser.add_argument('--files', action='store_true',
+                            help='Also write a stored file per document, with images and derivatives for some')
+        parser.add_argument('--images', type=float, default=0.1,
+                            help='Fraction of documents that are images when --files is given')
+        parser.add_argument('--password', default='synthetic-password',
+                            help='Password of every synthetic user (emails are user<N>@synthetic.test)')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--append', action='store_true', help='Allow seeding a database that has documents')
+
+    def handle(self, *args, **options):
+        if Document.objects.exists() and not options['append']:
+            raise CommandError('The database already has documents; pass --append to add to it')
+        self.rng = random.Random(options['seed'])
+        self.vocabulary = self.make_vocabulary()
+        # Each topic favours a few hundred words so documents cluster like real course material
+        self.topics = [self.rng.sample(self.vocabulary, 400) for _ in range(TOPICS)]
+
+        with transaction.atomic():
+            users = self.create_users(options)
+            tags = DocumentTag.objects.resolve(
+                [f'{word}-{i}' for i, word in enumerate(self.rng.sample(self.vocabulary, options['tags']))]
+            )
+            documents = self.create_documents(users, tags, options)
+            self.create_shares(users, documents, options)
+            self.create_study_items(users, documents, options)
+            rebuild_all_stats()
+        get_search_backend().rebuild(
+            Document.objects.select_related('content').prefetch_related('tags').order_by('pk')
+        )
+        if options['files']:
+            self.create_derivatives(documents)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {len(users)} users, {len(documents)} documents and {len(tags)} tags'
+        ))
+
+    def make_vocabulary(self):
+        letters = 'abcdefghijklmnopqrstuvwxyz'
+        words = set()
+        while len(words) < VOCABULARY_SIZE:
+            words.add(''.join(self.rng.choice(letters) for _ in range(self.rng.randint(3, 11))))
+        return sorted(words)
+
+    def make_text(self, topic, words):
+        """Sentences drawn mostly from the topic's words, the rest from anywhere"""
+        sentences = []
+        remaining = max(words, 10)
+        while remaining > 0:
+            length = self.rng.randint(6, 18)
+            sentence = [
+                self.rng.choice(topic) if self.rng.random() < 0.7 else self.rng.choice(self.vocabulary)
+                for _ in range(length)
+            ]
+            sentences.append(' '.join(sentence).capitalize() + '.')
+            remaining -= length
+        return ' '.join(sentences)
+
+    def create_users(self, options):
+        start = User.objects.count()
+        # Hashing once keeps seeding fast; every user gets the same password
+        password = make_password(options['password'])
+        users = User.objects.bulk_create([
+            User(
+                username=f'user{i}', email=f'user{i}@synthetic.test', password=password,
+                first_name='Synthetic', last_name=f'User {i}',
+            )
+            for i in range(start, start + options['users'])
+        ], batch_size=BATCH_SIZE)
+        Token.objects.bulk_create([Token(key=Token.generate_key(), user=user) for user in users], batch_size=BATCH_SIZE)
+        return users
+
+    def create_documents(self, users, tags, options):
+        documents = []
+        pending = []
+        for user in users:
+            for i in range(options['documents']):
+                topic_index = self.rng.randrange(TOPICS)
+                words = int(options['words'] * self.rng.uniform(0.5, 1.5))
+                text = self.make_text(self.topics[topic_index], words)
+                is_image = options['files'] and self.rng.random() < options['images']
+                title = ' '.join(self.rng.sample(self.topics[topic_index], 3)).title()
+                document = Document(
+                    user=user,
+                    title=title,
+                    description=text[:200],
+                    document_type='IMAGE' if is_image else 'TEXT',
+                    file_size=len(text),
+                    original_filename=f'{title}.{"png" if is_image else "txt"}',
+                    status='COMPLETED',
+                    is_public=self.rng.random() < options['public'],
+                    extracted_text='' if is_image else text,
+                )
+                if options['files']:
+                    self.attach_file(document, text, is_image)
+                else:
+                    document.file = f'blobs/synthetic/{user.pk}-{i}.txt'
+                # bulk_create skips save()
+                document._prepare_fields()
+                pending.append(document)
+                if len(pending) >= BATCH_SIZE:
+                    documents += self.flush_documents(pending, tags, options)
+                    pending = []
+        documents += self.flush_documents(pending, tags, options)
+        return documents
+
+    def attach_file(self, document, text, is_image):
+        if is_image:
+            image = Image.new('RGB', (640, 480), tuple(self.rng.randrange(256) for _ in range(3)))
+            buffer = io.BytesIO()
+            image.save(buffer, 'PNG')
+            content, name = buffer.getvalue(), 'image.png'
+        else:
+            content, name = text.encode(), 'text.txt'
+        sha256 = hashlib.sha256(content).hexdigest()
+        blob = DocumentBlob.objects.acquire(ContentFile(content, name=name), sha256, len(content))
+        document.blob = blob
+        document.file = blob.file.name
+        document.sha256 = sha256
+        document.file_size = len(content)
+
+    def flush_documents(self, pending, tags, options):
+        documents = Document.objects.bulk_create(pending, batch_size=BATCH_SIZE)
+        DocumentContent.objects.bulk_store(documents, batch_size=BATCH_SIZE)
+        DocumentTagging.objects.bulk_create([
+            DocumentTagging(document=document, tag=tag)
+            for document in documents
+            for tag in self.rng.sample(tags, min(options['tags_per_document'], len(tags)))
+        ], batch_size=BATCH_SIZE)
+        DocumentProcessingLog.objects.bulk_create([
+            DocumentProcessingLog(document=document, operation=LOG_OPERATIONS[i % len(LOG_OPERATIONS)],
+                                  status='COMPLETED', message='Synthetic entry')
+            for document in documents
+            for i in range(options['logs'])
+        ], batch_size=BATCH_SIZE)
+        vectors = []
+        for document in documents:
+            vector = vectorize(document.extracted_text)
+            if vector is not None:
+                vectors.append(DocumentVector(document=document, vector=to_bytes(vector), version=VECTOR_VERSION))
+        DocumentVector.objects.bulk_create(vectors, batch_size=BATCH_SIZE)
+        return documents
+
+    def create_shares(self, users, documents, options):
+        if len(users) < 2:
+            return
+        by_user = {}
+        for document in documents:
+            by_user.setdefault(document.user_id, []).append(document)
+        shares = []
+        for user in users:
+            owned = by_user.get(user.pk, [])
+            for document in self.rng.sample(owned, min(options['shares'], len(owned))):
+                recipient = self.rng.choice(users)
+                while recipient.pk == user.pk:
+                    recipient = self.rng.choice(users)
+                shares.append(DocumentShare(document=document, shared_by=user, shared_with=recipient,
+                                            message='Synthetic share'))
+        DocumentShare.objects.bulk_create(shares, batch_size=BATCH_SIZE, ignore_conflicts=True)
+
+    def create_study_items(self, users, documents, options):
+        by_user = {}
+        for document in documents:
+            by_user.setdefault(document.user_id, []).append(document)
+        cards, questions = [], []
+        for user in users:
+            owned = by_user.get(user.pk) or [None]
+            for i in range(options['flashcards']):
+                cards.append(Flashcard(
+                    user=user, document=self.rng.choice(owned), question=self.make_sentence(8) + '?',
+                    answer=self.make_sentence(12) + '.',
+                ))
+            for i in range(options['quizzes']):
+                questions.append(Quiz(
+                    user=user, document=self.rng.choice(owned), question=self.make_sentence(8) + '?',
+                    options=[self.make_sentence(4) for _ in range(4)], correct_answer=self.rng.randrange(4),
+                    explanation=self.make_sentence(12) + '.',
+                ))
+        Flashcard.objects.bulk_create(cards, batch_size=BATCH_SIZE)
+        Quiz.objects.bulk_create(questions, batch_size=BATCH_SIZE)
+
+    def make_sentence(self, words):
+        return ' '.join(self.rng.sample(self.vocabulary, words)).capitalize()
+
+    def create_derivatives(self, documents):
+        images = {}
+        for document in documents:
+            if document.document_type == 'IMAGE':
+                images.setdefault(document.blob_id, document.pk)
+        for blob_id, document_id in images.items():
+            process_derivatives(document_id, blob_id)
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.3 on 2026-10-16 23:34
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0007_document_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='document',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='document_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='document',
+            index=models.Index(fields=['is_public', 'status', '-created_at', '-id'], name='document_public_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='documentprocessinglog',
+            index=models.Index(fields=['document', '-created_at', '-id'], name='log_document_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='documentshare',
+            index=models.Index(fields=['shared_with', '-created_at', '-id'], name='share_received_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='documentshare',
+            index=models.Index(fields=['shared_by', '-created_at', '-id'], name='share_sent_created_idx'),
+        ),
+    ]
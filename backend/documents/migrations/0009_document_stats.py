@@ -0,0 +1,53 @@
+# Generated by Django 5.2.3 on 2026-10-16 23:36
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_stats(apps, schema_editor):
+    Document = apps.get_model('documents', 'Document')
+    DocumentStats = apps.get_model('documents', 'DocumentStats')
+    rows = (
+        Document.objects.order_by()
+        .values('user_id')
+        .annotate(
+            total_documents=Count('id'),
+            pdf_documents=Count('id', filter=Q(document_type='PDF')),
+            image_documents=Count('id', filter=Q(document_type='IMAGE')),
+            text_documents=Count('id', filter=Q(document_type='TEXT')),
+            public_documents=Count('id', filter=Q(is_public=True)),
+            total_bytes=Coalesce(Sum('file_size'), 0),
+        )
+    )
+    DocumentStats.objects.bulk_create([DocumentStats(**row) for row in rows], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0001_initial'),
+        ('documents', '0008_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='document_stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('total_documents', models.PositiveIntegerField(default=0)),
+                ('pdf_documents', models.PositiveIntegerField(default=0)),
+                ('image_documents', models.PositiveIntegerField(default=0)),
+                ('text_documents', models.PositiveIntegerField(default=0)),
+                ('public_documents', models.PositiveIntegerField(default=0)),
+                ('total_bytes', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'document stats',
+            },
+        ),
+        migrations.RunPython(backfill_stats, migrations.RunPython.noop),
+    ]
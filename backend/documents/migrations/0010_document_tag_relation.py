@@ -0,0 +1,99 @@
+# Generated by Django 5.2.3 on 2026-10-16 23:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+BACKFILL_BATCH_SIZE = 1000
+
+
+def split_tags(value):
+    names = []
+    for name in (value or '').split(','):
+        name = name.strip()[:50]
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+def backfill_taggings(apps, schema_editor):
+    """Turn each document's comma-separated tags into DocumentTag rows and taggings"""
+    Document = apps.get_model('documents', 'Document')
+    DocumentTag = apps.get_model('documents', 'DocumentTag')
+    DocumentTagging = apps.get_model('documents', 'DocumentTagging')
+
+    def flush(batch):
+        names = {name for _, document_names in batch for name in document_names}
+        DocumentTag.objects.bulk_create([DocumentTag(name=name) for name in names], ignore_conflicts=True)
+        tag_ids = dict(DocumentTag.objects.filter(name__in=names).values_list('name', 'id'))
+        DocumentTagging.objects.bulk_create(
+            [
+                DocumentTagging(document_id=document_id, tag_id=tag_ids[name])
+                for document_id, document_names in batch
+                for name in document_names
+            ],
+            ignore_conflicts=True,
+        )
+
+    rows = Document.objects.exclude(tags_csv='').order_by('pk').values_list('pk', 'tags_csv')
+    batch = []
+    for document_id, tags_csv in rows.iterator(chunk_size=BACKFILL_BATCH_SIZE):
+        names = split_tags(tags_csv)
+        if names:
+            batch.append((document_id, names))
+        if len(batch) >= BACKFILL_BATCH_SIZE:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+
+
+def restore_tags_csv(apps, schema_editor):
+    Document = apps.get_model('documents', 'Document')
+    DocumentTagging = apps.get_model('documents', 'DocumentTagging')
+    names = {}
+    for document_id, name in DocumentTagging.objects.order_by('pk').values_list('document_id', 'tag__name'):
+        names.setdefault(document_id, []).append(name)
+    for document_id, document_names in names.items():
+        Document.objects.filter(pk=document_id).update(tags_csv=','.join(document_names)[:500])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0009_document_stats'),
+    ]
+
+    operations = [
+        # The CSV column moves aside so the relation can take over the name
+        migrations.RenameField(
+            model_name='document',
+            old_name='tags',
+            new_name='tags_csv',
+        ),
+        migrations.CreateModel(
+            name='DocumentTagging',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='taggings', to='documents.document')),
+                ('tag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='taggings', to='documents.documenttag')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='documenttagging',
+            index=models.Index(fields=['tag', 'document'], name='tagging_tag_document_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='documenttagging',
+            constraint=models.UniqueConstraint(fields=('document', 'tag'), name='unique_document_tag'),
+        ),
+        migrations.RunPython(backfill_taggings, restore_tags_csv),
+        migrations.RemoveField(
+            model_name='document',
+            name='tags_csv',
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='tags',
+            field=models.ManyToManyField(blank=True, related_name='documents', through='documents.DocumentTagging', to='documents.documenttag'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.3 on 2026-10-16 23:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0010_document_tag_relation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentblob',
+            name='derivatives',
+            field=models.JSONField(blank=True, default=list, help_text='Derivative kinds generated on disk'),
+        ),
+        migrations.AddField(
+            model_name='documentblob',
+            name='derivatives_version',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+    ]
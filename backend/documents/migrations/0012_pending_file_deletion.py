@@ -0,0 +1,30 @@
+# Generated by Django 5.2.3 on 2026-10-17 00:15
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0011_document_blob_derivatives'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingFileDeletion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text='Storage name, or a glob of directories', max_length=255)),
+                ('is_pattern', models.BooleanField(default=False, help_text='Remove every directory matching the name')),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('not_before', models.DateTimeField(default=django.utils.timezone.now, help_text='Earliest time of the next attempt')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['not_before', 'id'], name='file_deletion_due_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.3 on 2026-10-17 00:39
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0013_related_document_vectors'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeneratedContent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(help_text='SHA-256 of the content hash, task, model and prompt', max_length=64, unique=True)),
+                ('task', models.CharField(max_length=20)),
+                ('model', models.CharField(max_length=100)),
+                ('prompt_version', models.PositiveSmallIntegerField()),
+                ('content_sha256', models.CharField(max_length=64)),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('READY', 'Ready')], default='PENDING', max_length=10)),
+                ('result', models.JSONField(blank=True, null=True)),
+                ('size', models.PositiveIntegerField(default=0, help_text='Size of the serialized result in bytes')),
+                ('claimed_until', models.DateTimeField(blank=True, help_text='A pending row is being generated by another worker until then', null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_used_at', models.DateTimeField(default=django.utils.timezone.now, help_text='Refreshed at most once a minute')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['last_used_at', 'id'], name='generated_content_lru_idx')],
+            },
+        ),
+    ]
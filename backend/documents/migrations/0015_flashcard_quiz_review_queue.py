@@ -0,0 +1,71 @@
+# Generated by Django 5.2.3 on 2026-10-17 00:42
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0014_generated_content'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Flashcard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('difficulty_level', models.CharField(choices=[('easy', 'Easy'), ('medium', 'Medium'), ('hard', 'Hard')], default='medium', max_length=10)),
+                ('category', models.CharField(blank=True, max_length=100)),
+                ('due_at', models.DateTimeField(default=django.utils.timezone.now, help_text='When the item is next due for review')),
+                ('interval', models.PositiveIntegerField(default=0, help_text='Days between the last review and the next')),
+                ('ease', models.FloatField(default=2.5, help_text='Factor the interval grows by after a successful review')),
+                ('repetitions', models.PositiveIntegerField(default=0, help_text='Successful reviews in a row')),
+                ('lapses', models.PositiveIntegerField(default=0, help_text='Times the item was forgotten')),
+                ('last_reviewed_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('question', models.TextField()),
+                ('answer', models.TextField()),
+                ('tags', models.JSONField(blank=True, default=list)),
+                ('document', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='flashcards', to='documents.document')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='flashcards', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'abstract': False,
+                'indexes': [models.Index(fields=['user', 'due_at', 'id'], name='flashcard_due_idx'), models.Index(fields=['user', '-created_at', '-id'], name='flashcard_user_created_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='Quiz',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('difficulty_level', models.CharField(choices=[('easy', 'Easy'), ('medium', 'Medium'), ('hard', 'Hard')], default='medium', max_length=10)),
+                ('category', models.CharField(blank=True, max_length=100)),
+                ('due_at', models.DateTimeField(default=django.utils.timezone.now, help_text='When the item is next due for review')),
+                ('interval', models.PositiveIntegerField(default=0, help_text='Days between the last review and the next')),
+                ('ease', models.FloatField(default=2.5, help_text='Factor the interval grows by after a successful review')),
+                ('repetitions', models.PositiveIntegerField(default=0, help_text='Successful reviews in a row')),
+                ('lapses', models.PositiveIntegerField(default=0, help_text='Times the item was forgotten')),
+                ('last_reviewed_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('question', models.TextField()),
+                ('options', models.JSONField(help_text='Array of 4 options')),
+                ('correct_answer', models.IntegerField(help_text='Index of correct answer (0-3)')),
+                ('explanation', models.TextField(blank=True)),
+                ('document', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='quizzes', to='documents.document')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='quizzes', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'quizzes',
+                'ordering': ['-created_at'],
+                'abstract': False,
+                'indexes': [models.Index(fields=['user', 'due_at', 'id'], name='quiz_due_idx'), models.Index(fields=['user', '-created_at', '-id'], name='quiz_user_created_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,83 @@
+# Generated by Django 5.2.3 on 2026-10-17 01:44
+
+import zlib
+
+import django.db.models.deletion
+from django.db import migrations, models, transaction
+
+MOVE_BATCH_SIZE = 500
+TEXT_COMPRESSION_LEVEL = 6
+
+
+def move_text_to_content(apps, schema_editor):
+    """
+    Copy each document's text into a compressed DocumentContent row. Every
+    batch commits on its own, so writers only ever wait for one batch, and a
+    run interrupted part way can simply be started again.
+    """
+    Document = apps.get_model('documents', 'Document')
+    DocumentContent = apps.get_model('documents', 'DocumentContent')
+    alias = schema_editor.connection.alias
+    documents = Document.objects.using(alias).exclude(extracted_text='').order_by('pk')
+
+    last_pk = 0
+    while True:
+        with transaction.atomic(using=alias):
+            batch = list(documents.filter(pk__gt=last_pk).values_list('pk', 'extracted_text')[:MOVE_BATCH_SIZE])
+            if not batch:
+                break
+            DocumentContent.objects.using(alias).bulk_create(
+                [
+                    DocumentContent(
+                        document_id=pk, compressed_text=zlib.compress(text.encode(), TEXT_COMPRESSION_LEVEL),
+                        text_length=len(text),
+                    )
+                    for pk, text in batch
+                ],
+                ignore_conflicts=True,
+            )
+        last_pk = batch[-1][0]
+
+
+def restore_extracted_text(apps, schema_editor):
+    Document = apps.get_model('documents', 'Document')
+    DocumentContent = apps.get_model('documents', 'DocumentContent')
+    alias = schema_editor.connection.alias
+    contents = DocumentContent.objects.using(alias).order_by('pk')
+
+    last_pk = 0
+    while True:
+        with transaction.atomic(using=alias):
+            batch = list(contents.filter(pk__gt=last_pk).values_list('pk', 'compressed_text')[:MOVE_BATCH_SIZE])
+            if not batch:
+                break
+            Document.objects.using(alias).bulk_update(
+                [Document(pk=pk, extracted_text=zlib.decompress(data).decode()) for pk, data in batch],
+                ['extracted_text'],
+            )
+        last_pk = batch[-1][0]
+
+
+class Migration(migrations.Migration):
+    # The copy commits batch by batch instead of holding one long transaction
+    atomic = False
+
+    dependencies = [
+        ('documents', '0015_flashcard_quiz_review_queue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentContent',
+            fields=[
+                ('document', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='content', serialize=False, to='documents.document')),
+                ('compressed_text', models.BinaryField()),
+                ('text_length', models.PositiveIntegerField(default=0, help_text='Length of the uncompressed text in characters')),
+            ],
+        ),
+        migrations.RunPython(move_text_to_content, restore_extracted_text),
+        migrations.RemoveField(
+            model_name='document',
+            name='extracted_text',
+        ),
+    ]
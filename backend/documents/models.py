@@ -1,17 +1,219 @@
 import os
-from django.db import models
+import zlib
+from collections import Counter
+from contextlib import contextmanager
+from datetime import timedelta
+from django.db import models, transaction, IntegrityError
+from django.db.models import Case, Count, F, OuterRef, Q, Subquery, Value, When
 from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
 from django.core.validators import FileExtensionValidator
+from django.utils import timezone
+
+from .derivatives import DERIVATIVE_VERSION, derivative_filename
+from .uploadhandlers import describe_upload
 
 User = get_user_model()
 
+TEXT_COMPRESSION_LEVEL = 6
+
 def upload_path(instance, filename):
-    """Generate upload path for documents"""
+    """Generate upload path for documents stored before the blob store"""
     # Get file extension
     ext = filename.split('.')[-1]
     # Create path: documents/user_id/filename
     return f'documents/{instance.user.id}/{filename}'
 
+def compress_text(text):
+    return zlib.compress(text.encode(), TEXT_COMPRESSION_LEVEL)
+
+def decompress_text(data):
+    return zlib.decompress(data).decode() if data else ''
+
+def blob_path(sha256, filename):
+    """Generate the content-addressed path for a blob: blobs/ab/cd/<sha256>.<ext>"""
+    ext = filename.split('.')[-1].lower() if '.' in filename else 'bin'
+    return f'blobs/{sha256[:2]}/{sha256[2:4]}/{sha256}.{ext}'
+
+def derivative_directory(sha256, version=DERIVATIVE_VERSION):
+    """Generate the directory holding a blob's derivatives: derivatives/v1/ab/cd/<sha256>"""
+    return f'derivatives/v{version}/{sha256[:2]}/{sha256[2:4]}/{sha256}'
+
+def blob_storage_names(sha256, name):
+    """
+    Return ``(files, directory patterns)`` to remove along with a blob: its
+    file and every version of its derivatives.
+    """
+    return [name], [derivative_directory(sha256, version='*')]
+
+@contextmanager
+def discard_stored_on_error(stored):
+    """
+    Delete the storage names collected in ``stored`` if the block raises.
+    Wrap a transaction that writes blob files with this: a rollback drops
+    the blob rows, and nothing else would remove their files.
+    """
+    try:
+        yield stored
+    except BaseException:
+        for name in stored:
+            default_storage.delete(name)
+        raise
+
+
+class DocumentBlobManager(models.Manager):
+    def acquire(self, file_obj, sha256, size, stored=None):
+        """
+        Return the blob holding these bytes with one more reference taken,
+        writing the file to storage only if no blob exists for the digest yet.
+        A written file's name is appended to ``stored``, for the caller to
+        discard should its transaction fail later.
+        """
+        stored = [] if stored is None else stored
+        with discard_stored_on_error(stored), transaction.atomic():
+            try:
+                with transaction.atomic():
+                    blob, created = self.get_or_create(
+                        sha256=sha256,
+                        defaults={'size': size, 'file': blob_path(sha256, file_obj.name)},
+                    )
+            except IntegrityError:
+                # Another upload of the same bytes created the row first
+                blob, created = self.get(sha256=sha256), False
+
+            if created:
+                # The bytes may have been released earlier with their files still queued for deletion
+                PendingFileDeletion.objects.cancel(*blob_storage_names(sha256, blob.file.name))
+            if created and not default_storage.exists(blob.file.name):
+                saved_name = default_storage.save(blob.file.name, file_obj)
+                stored.append(saved_name)
+                if saved_name != blob.file.name:
+                    self.filter(pk=blob.pk).update(file=saved_name)
+                    blob.file.name = saved_name
+
+            self.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+        return blob
+
+    def acquire_many(self, uploads, stored=None):
+        """
+        Batch form of :meth:`acquire` for ``(file_obj, sha256, size)``
+        triples, taking one reference per upload. Returns ``{sha256: blob}``.
+        """
+        stored = [] if stored is None else stored
+        first_upload = {}
+        references = Counter()
+        for file_obj, sha256, size in uploads:
+            first_upload.setdefault(sha256, (file_obj, size))
+            references[sha256] += 1
+        if not first_upload:
+            return {}
+
+        with discard_stored_on_error(stored), transaction.atomic():
+            blobs = {blob.sha256: blob for blob in self.filter(sha256__in=list(first_upload))}
+            missing = [sha256 for sha256 in first_upload if sha256 not in blobs]
+            if missing:
+                # Concurrent uploads of the same bytes may insert first; the unique digest settles it
+                self.bulk_create([
+                    self.model(sha256=sha256, size=first_upload[sha256][1],
+                               file=blob_path(sha256, first_upload[sha256][0].name))
+                    for sha256 in missing
+                ], ignore_conflicts=True)
+                created = list(self.filter(sha256__in=missing))
+                # As in acquire(), a re-created blob must not lose its files to an old deletion
+                names, patterns = [], []
+                for blob in created:
+                    blob_names, blob_patterns = blob_storage_names(blob.sha256, blob.file.name)
+                    names += blob_names
+                    patterns += blob_patterns
+                PendingFileDeletion.objects.cancel(names, patterns)
+                for blob in created:
+                    blobs[blob.sha256] = blob
+                    if not default_storage.exists(blob.file.name):
+                        saved_name = default_storage.save(blob.file.name, first_upload[blob.sha256][0])
+                        stored.append(saved_name)
+                        if saved_name != blob.file.name:
+                            self.filter(pk=blob.pk).update(file=saved_name)
+                            blob.file.name = saved_name
+
+            # One UPDATE adds every reference
+            self.filter(pk__in=[blob.pk for blob in blobs.values()]).update(ref_count=F('ref_count') + Case(
+                *(When(pk=blobs[sha256].pk, then=Value(count)) for sha256, count in references.items()),
+                default=Value(0),
+            ))
+        return blobs
+
+    def release(self, blob_id):
+        """
+        Drop one reference to a blob, deleting the blob row once nothing
+        points at it any more. Returns the deleted blob's ``(file name,
+        sha256)`` for the caller to remove from storage, or None.
+        """
+        with transaction.atomic():
+            self.filter(pk=blob_id).update(ref_count=F('ref_count') - 1)
+            blob = self.filter(pk=blob_id, ref_count__lte=0).first()
+            if blob is None:
+                return None
+            if blob.documents.exists():
+                # Never unlink bytes a document still points at
+                self.filter(pk=blob_id).update(ref_count=blob.documents.count())
+                return None
+            released = blob.file.name, blob.sha256
+            blob.delete()
+        return released
+
+    def release_many(self, references):
+        """
+        Batch form of :meth:`release` for a ``{blob_id: count}`` mapping,
+        called after the referring documents are deleted. The blobs left
+        unreferenced are deleted and returned as ``(file name, sha256)``
+        pairs; removing their files is up to the caller.
+        """
+        references = {blob_id: count for blob_id, count in references.items() if blob_id and count}
+        if not references:
+            return []
+        with transaction.atomic():
+            blobs = self.filter(pk__in=list(references))
+            blobs.update(ref_count=F('ref_count') - Case(
+                *(When(pk=blob_id, then=Value(count)) for blob_id, count in references.items()),
+                default=Value(0),
+            ))
+            # Never unlink bytes a document still points at
+            still_used = Document.objects.filter(blob_id=OuterRef('pk')).order_by().values('blob_id')
+            blobs.filter(ref_count__lte=0, documents__isnull=False).update(
+                ref_count=Subquery(still_used.annotate(count=Count('pk')).values('count')),
+            )
+            unreferenced = blobs.filter(ref_count__lte=0, documents__isnull=True)
+            released = list(unreferenced.values_list('file', 'sha256'))
+            unreferenced.delete()
+        return released
+
+
+class DocumentBlob(models.Model):
+    """Model for content-addressed file storage shared by identical uploads"""
+    sha256 = models.CharField(max_length=64, unique=True)
+    file = models.FileField(max_length=255)
+    size = models.BigIntegerField(help_text="File size in bytes")
+    ref_count = models.PositiveIntegerField(default=0, help_text="Number of documents using this blob")
+    derivatives = models.JSONField(default=list, blank=True, help_text="Derivative kinds generated on disk")
+    derivatives_version = models.PositiveSmallIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = DocumentBlobManager()
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.sha256[:12]} ({self.ref_count} refs)"
+
+    def has_derivative(self, kind):
+        return self.derivatives_version == DERIVATIVE_VERSION and kind in self.derivatives
+
+    def derivative_name(self, kind):
+        """Storage name of one derivative of this blob"""
+        return f'{derivative_directory(self.sha256)}/{derivative_filename(kind)}'
+
+
 class Document(models.Model):
     DOCUMENT_TYPES = [
         ('PDF', 'PDF Document'),
@@ -40,14 +242,20 @@ class Document(models.Model):
     document_type = models.CharField(max_length=10, choices=DOCUMENT_TYPES)
     file_size = models.IntegerField(help_text="File size in bytes")
     file_size_mb = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    sha256 = models.CharField(max_length=64, blank=True, db_index=True, help_text="SHA-256 of the file contents")
+    blob = models.ForeignKey(
+        DocumentBlob, on_delete=models.PROTECT, null=True, blank=True, related_name='documents'
+    )
+    original_filename = models.CharField(max_length=255, blank=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='UPLOADING')
     
     # Metadata
     is_public = models.BooleanField(default=False)
-    tags = models.CharField(max_length=500, blank=True, help_text="Comma-separated tags")
+    tags = models.ManyToManyField(
+        'DocumentTag', through='DocumentTagging', related_name='documents', blank=True
+    )
     
-    # Processing results
-    extracted_text = models.TextField(blank=True, help_text="Extracted text from document")
+    # Processing results; the extracted text lives in DocumentContent
     page_count = models.IntegerField(null=True, blank=True, help_text="Number of pages for PDF")
     
     created_at = models.DateTimeField(auto_now_add=True)
@@ -55,17 +263,75 @@ class Document(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination walks (created_at, id) newest first
+            models.Index(fields=['user', '-created_at', '-id'], name='document_user_created_idx'),
+            models.Index(fields=['is_public', 'status', '-created_at', '-id'], name='document_public_created_idx'),
+            # The related-documents index polls for recently changed documents
+            models.Index(fields=['updated_at'], name='document_updated_idx'),
+        ]
         
     def __str__(self):
         return f"{self.title} - {self.user.username}"
     
+    # Stored values remembered on load so saves can tell what changed
+    TRACKED_FIELDS = ('user_id', 'blob_id', 'document_type', 'is_public', 'file_size')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_state = instance.tracked_state()
+        return instance
+
+    def tracked_state(self):
+        """Return the tracked field values currently set on this instance"""
+        return {name: self.__dict__[name] for name in self.TRACKED_FIELDS if name in self.__dict__}
+
     def save(self, *args, **kwargs):
+        # Signal handlers keep derived tables (stats, search) in the same transaction
+        with discard_stored_on_error([]) as stored, transaction.atomic():
+            # A newly assigned upload goes into the content-addressed blob store
+            if self.file and not self.file._committed:
+                self._store_upload(stored)
+            else:
+                self._prepare_fields()
+            adding = self._state.adding
+            super().save(*args, **kwargs)
+            if '_extracted_text' in self.__dict__:
+                text = self.__dict__.pop('_extracted_text')
+                if text or not adding:
+                    self.content = DocumentContent.objects.store(self.pk, text)
+            elif adding:
+                # A new document has no text row, so reading its text needs no query
+                Document.content.related.set_cached_value(self, None)
+        self._loaded_state = self.tracked_state()
+
+    def _store_upload(self, stored):
+        # A replaced blob is released by the post_save handler
+        upload = self.file.file
+        file_size, sha256, document_type = describe_upload(upload)
+        blob = DocumentBlob.objects.acquire(upload, sha256, file_size, stored)
+        self.attach_blob(blob, upload, file_size, document_type)
+
+    def attach_blob(self, blob, upload, file_size, document_type):
+        """Point this document at the blob now holding ``upload``'s bytes"""
+        self.blob = blob
+        self.sha256 = blob.sha256
+        self.file_size = file_size
+        self.original_filename = os.path.basename(upload.name)
+        self.document_type = document_type
+        # Point the field at the shared blob instead of saving another copy
+        self.file.name = blob.file.name
+        self.file._committed = True
+        self._prepare_fields()
+
+    def _prepare_fields(self):
         # Calculate file size in MB
         if self.file and self.file_size:
             self.file_size_mb = self.file_size / (1024 * 1024)
         
-        # Determine document type based on file extension
-        if self.file:
+        # Fall back to the file extension when the upload was not sniffed
+        if self.file and not self.document_type:
             ext = self.file.name.split('.')[-1].lower()
             if ext == 'pdf':
                 self.document_type = 'PDF'
@@ -73,16 +339,43 @@ class Document(models.Model):
                 self.document_type = 'IMAGE'
             else:
                 self.document_type = 'TEXT'
-        
-        super().save(*args, **kwargs)
-    
-    def delete(self, *args, **kwargs):
-        # Delete file from storage when deleting the model
-        if self.file:
-            if os.path.isfile(self.file.path):
-                os.remove(self.file.path)
-        super().delete(*args, **kwargs)
     
+    def is_accessible_by(self, user_id):
+        """Whether the user may read this document: owner, public, or shared with them"""
+        if self.is_public or (user_id is not None and self.user_id == user_id):
+            return True
+        return user_id is not None and self.shares.filter(shared_with_id=user_id).exists()
+
+    async def ais_accessible_by(self, user_id):
+        """``is_accessible_by`` for async views"""
+        if self.is_public or (user_id is not None and self.user_id == user_id):
+            return True
+        return user_id is not None and await self.shares.filter(shared_with_id=user_id).aexists()
+
+    def set_tags(self, names):
+        """Replace this document's tags with the named ones, creating missing tags"""
+        self.tags.set(DocumentTag.objects.resolve(names))
+
+    @property
+    def extracted_text(self):
+        """
+        The extracted text, read from ``DocumentContent`` on first use. Use
+        ``select_related('content')`` when reading it for many documents.
+        Text assigned here is stored by ``save()``.
+        """
+        if '_extracted_text' in self.__dict__:
+            return self._extracted_text
+        if self.pk is None:
+            return ''
+        try:
+            return self.content.text
+        except DocumentContent.DoesNotExist:
+            return ''
+
+    @extracted_text.setter
+    def extracted_text(self, value):
+        self._extracted_text = value or ''
+
     @property
     def file_extension(self):
         """Get file extension"""
@@ -101,11 +394,134 @@ class Document(models.Model):
         return self.document_type == 'PDF'
 
 
+class DocumentContentManager(models.Manager):
+    def store(self, document_id, text):
+        """Save one document's text, replacing any stored before"""
+        content = self.model(document_id=document_id, text=text)
+        content.save()
+        return content
+
+    def bulk_store(self, documents, batch_size=None):
+        """Save the text assigned to documents written by ``bulk_create()``, which skips ``Document.save()``"""
+        contents = []
+        for document in documents:
+            text = document.__dict__.pop('_extracted_text', '')
+            if text:
+                document.content = self.model(text=text)
+                contents.append(document.content)
+            else:
+                Document.content.related.set_cached_value(document, None)
+        return self.bulk_create(contents, batch_size=batch_size)
+
+
+class DocumentContent(models.Model):
+    """
+    A document's extracted text, zlib-compressed in a table of its own so
+    queries over documents never read it
+    """
+    document = models.OneToOneField(Document, on_delete=models.CASCADE, primary_key=True, related_name='content')
+    compressed_text = models.BinaryField()
+    text_length = models.PositiveIntegerField(default=0, help_text="Length of the uncompressed text in characters")
+
+    objects = DocumentContentManager()
+
+    def __str__(self):
+        return f"Text of document {self.document_id} ({self.text_length} characters)"
+
+    @property
+    def text(self):
+        if '_text' not in self.__dict__:
+            self._text = decompress_text(self.compressed_text)
+        return self._text
+
+    @text.setter
+    def text(self, value):
+        self._text = value
+        self.compressed_text = compress_text(value)
+        self.text_length = len(value)
+
+
+class DocumentStats(models.Model):
+    """Per-user document counts and sizes, maintained as documents change"""
+    TYPE_FIELDS = {
+        'PDF': 'pdf_documents',
+        'IMAGE': 'image_documents',
+        'TEXT': 'text_documents',
+    }
+
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='document_stats')
+    total_documents = models.PositiveIntegerField(default=0)
+    pdf_documents = models.PositiveIntegerField(default=0)
+    image_documents = models.PositiveIntegerField(default=0)
+    text_documents = models.PositiveIntegerField(default=0)
+    public_documents = models.PositiveIntegerField(default=0)
+    total_bytes = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = 'document stats'
+
+    def __str__(self):
+        return f"Stats for user {self.user_id}"
+
+    @property
+    def private_documents(self):
+        return self.total_documents - self.public_documents
+
+    @property
+    def total_size_mb(self):
+        return round(self.total_bytes / (1024 * 1024), 2)
+
+    def as_dict(self):
+        """Return the counters in the shape used by the stats and dashboard endpoints"""
+        return {
+            'total_documents': self.total_documents,
+            'pdf_documents': self.pdf_documents,
+            'image_documents': self.image_documents,
+            'text_documents': self.text_documents,
+            'total_size_mb': self.total_size_mb,
+            'public_documents': self.public_documents,
+            'private_documents': self.private_documents,
+        }
+
+
+def parse_tag_names(value):
+    """
+    Normalize tags given as a comma-separated string or a list of names:
+    whitespace is stripped, blanks dropped and duplicates removed in order.
+    """
+    if isinstance(value, str):
+        value = value.split(',')
+    names = []
+    for name in value or ():
+        name = str(name).strip()
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+class DocumentTagManager(models.Manager):
+    def resolve(self, names):
+        """Return the tags with these names, creating any that do not exist yet"""
+        names = parse_tag_names(names)
+        if not names:
+            return []
+        existing = {tag.name: tag for tag in self.filter(name__in=names)}
+        missing = [name for name in names if name not in existing]
+        if missing:
+            # Concurrent requests may create the same tag; the unique name settles it
+            self.bulk_create([self.model(name=name) for name in missing], ignore_conflicts=True)
+            existing.update((tag.name, tag) for tag in self.filter(name__in=missing))
+        return [existing[name] for name in names]
+
+
 class DocumentTag(models.Model):
     """Model for document tags"""
     name = models.CharField(max_length=50, unique=True)
     color = models.CharField(max_length=7, default='#3B82F6', help_text="Hex color code")
     created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = DocumentTagManager()
     
     class Meta:
         ordering = ['name']
@@ -114,6 +530,25 @@ class DocumentTag(models.Model):
         return self.name
 
 
+class DocumentTagging(models.Model):
+    """Join table between documents and tags"""
+    document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='taggings')
+    tag = models.ForeignKey(DocumentTag, on_delete=models.CASCADE, related_name='taggings')
+
+    class Meta:
+        constraints = [
+            # Also serves lookups of a document's tags
+            models.UniqueConstraint(fields=['document', 'tag'], name='unique_document_tag'),
+        ]
+        indexes = [
+            # Tag filters and facet counts go from tag to documents
+            models.Index(fields=['tag', 'document'], name='tagging_tag_document_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.document_id} - {self.tag_id}"
+
+
 class DocumentShare(models.Model):
     """Model for sharing documents with other users"""
     document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='shares')
@@ -126,6 +561,10 @@ class DocumentShare(models.Model):
     class Meta:
         unique_together = ['document', 'shared_with']
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['shared_with', '-created_at', '-id'], name='share_received_created_idx'),
+            models.Index(fields=['shared_by', '-created_at', '-id'], name='share_sent_created_idx'),
+        ]
     
     def __str__(self):
         return f"{self.document.title} shared with {self.shared_with.username}"
@@ -145,6 +584,167 @@ class DocumentProcessingLog(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['document', '-created_at', '-id'], name='log_document_created_idx'),
+        ]
     
     def __str__(self):
         return f"{self.document.title} - {self.operation} - {self.status}"
+
+
+class DocumentVector(models.Model):
+    """Text vector of a document for related-document lookups (see documents.vectors)"""
+    document = models.OneToOneField(Document, on_delete=models.CASCADE, primary_key=True, related_name='vector')
+    vector = models.BinaryField(help_text="float16 components")
+    version = models.PositiveSmallIntegerField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Vector of {self.document_id}"
+
+
+class ScheduledItem(models.Model):
+    """Spaced-repetition state shared by flashcards and quiz questions (see documents.study)"""
+    DIFFICULTY_CHOICES = [
+        ('easy', 'Easy'),
+        ('medium', 'Medium'),
+        ('hard', 'Hard'),
+    ]
+
+    difficulty_level = models.CharField(max_length=10, choices=DIFFICULTY_CHOICES, default='medium')
+    category = models.CharField(max_length=100, blank=True)
+    due_at = models.DateTimeField(default=timezone.now, help_text="When the item is next due for review")
+    interval = models.PositiveIntegerField(default=0, help_text="Days between the last review and the next")
+    ease = models.FloatField(default=2.5, help_text="Factor the interval grows by after a successful review")
+    repetitions = models.PositiveIntegerField(default=0, help_text="Successful reviews in a row")
+    lapses = models.PositiveIntegerField(default=0, help_text="Times the item was forgotten")
+    last_reviewed_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        abstract = True
+        ordering = ['-created_at']
+        indexes = [
+            # The review queue: a user's items due before now, soonest first
+            models.Index(fields=['user', 'due_at', 'id'], name='%(class)s_due_idx'),
+            models.Index(fields=['user', '-created_at', '-id'], name='%(class)s_user_created_idx'),
+        ]
+
+
+class Flashcard(ScheduledItem):
+    """Question and answer card reviewed with spaced repetition"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='flashcards')
+    document = models.ForeignKey(
+        Document, on_delete=models.CASCADE, null=True, blank=True, related_name='flashcards'
+    )
+    question = models.TextField()
+    answer = models.TextField()
+    tags = models.JSONField(default=list, blank=True)
+
+    def __str__(self):
+        return self.question[:50]
+
+
+class Quiz(ScheduledItem):
+    """Multiple-choice question reviewed with spaced repetition"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='quizzes')
+    document = models.ForeignKey(
+        Document, on_delete=models.CASCADE, null=True, blank=True, related_name='quizzes'
+    )
+    question = models.TextField()
+    options = models.JSONField(help_text="Array of 4 options")
+    correct_answer = models.IntegerField(help_text="Index of correct answer (0-3)")
+    explanation = models.TextField(blank=True)
+
+    class Meta(ScheduledItem.Meta):
+        verbose_name_plural = 'quizzes'
+
+    def __str__(self):
+        return self.question[:50]
+
+
+class GeneratedContent(models.Model):
+    """
+    Cached output of an AI generation task (see documents.generation),
+    keyed by everything that determines it so any document with the same
+    content shares it.
+    """
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('READY', 'Ready'),
+    ]
+
+    key = models.CharField(max_length=64, unique=True, help_text="SHA-256 of the content hash, task, model and prompt")
+    task = models.CharField(max_length=20)
+    model = models.CharField(max_length=100)
+    prompt_version = models.PositiveSmallIntegerField()
+    content_sha256 = models.CharField(max_length=64)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    result = models.JSONField(null=True, blank=True)
+    size = models.PositiveIntegerField(default=0, help_text="Size of the serialized result in bytes")
+    claimed_until = models.DateTimeField(
+        null=True, blank=True, help_text="A pending row is being generated by another worker until then"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(default=timezone.now, help_text="Refreshed at most once a minute")
+
+    class Meta:
+        indexes = [
+            # Eviction drops the least recently used results first
+            models.Index(fields=['last_used_at', 'id'], name='generated_content_lru_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.task} of {self.content_sha256[:12]} ({self.model})"
+
+
+class PendingFileDeletionManager(models.Manager):
+    def enqueue(self, names=(), directory_patterns=()):
+        """
+        Record storage names to delete, and globs of directories to delete
+        with their contents. The rows commit or roll back with the caller's
+        transaction, so files are only removed once nothing refers to them.
+        """
+        return self.bulk_create(
+            [self.model(name=name) for name in names] +
+            [self.model(name=pattern, is_pattern=True) for pattern in directory_patterns]
+        )
+
+    def cancel(self, names=(), directory_patterns=()):
+        """Drop queued deletions of storage names that are in use again"""
+        return self.filter(
+            Q(name__in=list(names), is_pattern=False) | Q(name__in=list(directory_patterns), is_pattern=True)
+        ).delete()
+
+    def due(self):
+        return self.filter(not_before__lte=timezone.now())
+
+
+class PendingFileDeletion(models.Model):
+    """Durable queue of stored files waiting to be removed"""
+    RETRY_DELAY = timedelta(minutes=1)
+    MAX_RETRY_DELAY = timedelta(days=1)
+
+    name = models.CharField(max_length=255, help_text="Storage name, or a glob of directories")
+    is_pattern = models.BooleanField(default=False, help_text="Remove every directory matching the name")
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    not_before = models.DateTimeField(default=timezone.now, help_text="Earliest time of the next attempt")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = PendingFileDeletionManager()
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            # The reaper walks due rows in id order
+            models.Index(fields=['not_before', 'id'], name='file_deletion_due_idx'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+    def retry_delay(self):
+        """Exponential backoff after ``attempts`` failures"""
+        return min(self.RETRY_DELAY * 2 ** max(self.attempts - 1, 0), self.MAX_RETRY_DELAY)
@@ -0,0 +1,193 @@
+"""
+Keyset (cursor) pagination for the hand-written list views.
+
+Pages are addressed by the sort key of the last row already returned rather
+than by an offset, so fetching page 500 costs the same indexed range scan as
+page 1 and rows inserted while a client is paging never shift later pages.
+Clients that want every row ask for a streamed export instead (see
+``streaming.py``).
+"""
+import base64
+import json
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+from .streaming import ListExport, NDJSONRenderer, wants_export
+
+
+class KeysetPagination(BasePagination):
+    """
+    Paginate a queryset on its ordering, newest first by default.
+
+    The ordering is taken from ``queryset.order_by()`` when set, otherwise
+    ``(-created_at, -id)``; an ``id`` tie-breaker is always appended so the
+    key is unique. The cursor is an opaque base64 encoding of the key values
+    of the last row on the page.
+    """
+    page_size = api_settings.PAGE_SIZE or 20
+    max_page_size = 100
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    default_ordering = ('-created_at', '-id')
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.take_page(list(self.page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """``paginate_queryset`` for async views"""
+        return self.take_page([row async for row in self.page_queryset(queryset, request)])
+
+    def page_queryset(self, queryset, request):
+        self.request = request
+        self.ordering = self.get_ordering(queryset)
+        self.current_page_size = self.get_page_size(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            queryset = queryset.filter(self.cursor_filter(queryset, self.decode_cursor(cursor)))
+        # One extra row tells us whether another page exists without a COUNT
+        return queryset[:self.current_page_size + 1]
+
+    def take_page(self, rows):
+        self.has_next = len(rows) > self.current_page_size
+        rows = rows[:self.current_page_size]
+        self.next_position = self.position_of(rows[-1]) if self.has_next else None
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_ordering(self, queryset):
+        ordering = list(queryset.query.order_by) or list(self.default_ordering)
+        if not any(field.lstrip('-') in ('id', 'pk') for field in ordering):
+            # Break ties on the primary key in the same direction as the last field
+            ordering.append('-id' if ordering[-1].startswith('-') else 'id')
+        return tuple(ordering)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def position_of(self, row):
+        position = []
+        for field in self.ordering:
+            name = field.lstrip('-')
+            value = row[name] if isinstance(row, dict) else getattr(row, name)
+            position.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+        return position
+
+    def cursor_filter(self, queryset, position):
+        """Build ``(a, b, c) > (x, y, z)`` as nested Q objects, honouring each field's direction"""
+        condition = Q()
+        equal = Q()
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            value = self.to_python(queryset, name, value)
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def to_python(self, queryset, name, value):
+        """Convert a cursor value like its column would, so tampered cursors fail as 404s"""
+        try:
+            field = queryset.model._meta.get_field('id' if name == 'pk' else name)
+        except FieldDoesNotExist:
+            annotation = queryset.query.annotations.get(name)
+            if annotation is None:
+                return value
+            # Annotations such as search_rank convert with their output field
+            field = annotation.output_field
+        try:
+            return field.to_python(value)
+        except (TypeError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, position):
+        data = json.dumps(position, separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            position = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+
+class KeysetPaginationMixin:
+    """
+    Give an ``APIView`` keyset-paginated list responses, or with
+    ``?stream=true`` or ``?format=ndjson`` a streamed export of every row
+    """
+    pagination_class = KeysetPagination
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, NDJSONRenderer]
+
+    def paginated_response(self, queryset, serializer_class, **serializer_kwargs):
+        serializer = serializer_class(**serializer_kwargs)
+        if wants_export(self.request):
+            return self.export(queryset, serializer).response()
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(self.rows(queryset, serializer), self.request, view=self)
+        return paginator.get_paginated_response([serializer.to_representation(row) for row in page])
+
+    async def apaginated_response(self, queryset, serializer_class, **serializer_kwargs):
+        """``paginated_response`` for async views; the serializer must not query"""
+        serializer = serializer_class(**serializer_kwargs)
+        if wants_export(self.request):
+            return self.export(queryset, serializer).response(asynchronous=True)
+        paginator = self.pagination_class()
+        page = await paginator.apaginate_queryset(self.rows(queryset, serializer), self.request, view=self)
+        return paginator.get_paginated_response([serializer.to_representation(row) for row in page])
+
+    def rows(self, queryset, serializer):
+        """
+        What ``serializer`` reads: ``values()`` dicts when it can serialize
+        them, with the ordering columns the cursor is built from
+        """
+        if not hasattr(serializer, 'values_queryset'):
+            return queryset
+        ordering = self.pagination_class().get_ordering(queryset)
+        return serializer.values_queryset(queryset, extra=[field.lstrip('-') for field in ordering])
+
+    def export(self, queryset, serializer):
+        queryset = queryset.order_by(*self.pagination_class().get_ordering(queryset))
+        # Rows are read after the view returns, once its replica choice is reset
+        queryset = self.rows(queryset.using(queryset.db), serializer)
+        ndjson = self.request.accepted_renderer.format == NDJSONRenderer.format
+        return ListExport(queryset, serializer, ndjson=ndjson)
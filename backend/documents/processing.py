@@ -0,0 +1,363 @@
+"""
+Background document processing.
+
+Uploads are saved in the ``PROCESSING`` state and handed to a process pool
+that runs the extractors in :mod:`documents.extraction`. Results are written
+back from the parent process, one ``DocumentProcessingLog`` row per stage.
+
+Image and PDF uploads also get thumbnails, previews and an AI-sized image
+from :mod:`documents.derivatives`, generated once per blob in the same pool.
+Stored files nothing refers to any more are removed there too, from the
+durable ``PendingFileDeletion`` queue.
+"""
+import functools
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .cache import invalidate_document_ids
+from .cleanup import remove_stored_files
+from .derivatives import (
+    DERIVATIVE_DOCUMENT_TYPES, DERIVATIVE_VERSION, DerivativeUnavailable, generate_derivatives,
+)
+from .extraction import extract_document
+from .models import (
+    Document, DocumentBlob, DocumentContent, DocumentProcessingLog, PendingFileDeletion, derivative_directory,
+)
+from .related import store_document_vector
+from .search import get_search_backend
+
+logger = logging.getLogger(__name__)
+
+EXTRACT_OPERATION = 'extract_text'
+DERIVATIVES_OPERATION = 'derivatives'
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_processing_settings():
+    defaults = {'WORKERS': 2, 'EAGER': False}
+    defaults.update(getattr(settings, 'DOCUMENT_PROCESSING', {}))
+    return defaults
+
+
+def get_executor():
+    """Return the shared worker pool, creating it on first use"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # Spawned workers only import documents.extraction, never Django
+            _executor = ProcessPoolExecutor(
+                max_workers=get_processing_settings()['WORKERS'],
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _executor
+
+
+def shutdown_executor(wait=True):
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=wait)
+            _executor = None
+
+
+def submit(fn, *args):
+    try:
+        return get_executor().submit(fn, *args)
+    except BrokenProcessPool:
+        shutdown_executor(wait=False)
+        return get_executor().submit(fn, *args)
+
+
+def schedule_document_processing(document):
+    """Queue text extraction and derivatives for a document once the current transaction commits"""
+    schedule_documents_processing([document])
+
+
+def schedule_documents_processing(documents):
+    """Queue processing for several documents; their STARTED logs are written with one insert"""
+    jobs = [(document.pk, document.file.path, document.file_extension) for document in documents]
+    # Documents sharing a blob share its derivatives; the first one logs them
+    derivative_jobs = {
+        document.blob_id: document.pk for document in reversed(documents) if needs_derivatives(document)
+    }
+    transaction.on_commit(lambda: dispatch_documents(jobs, derivative_jobs))
+
+
+def dispatch_documents(jobs, derivative_jobs):
+    DocumentProcessingLog.objects.bulk_create([
+        DocumentProcessingLog(document_id=document_id, operation=EXTRACT_OPERATION, status='STARTED')
+        for document_id, _, _ in jobs
+    ])
+    for document_id, path, extension in jobs:
+        if get_processing_settings()['EAGER']:
+            process_document(document_id, path, extension)
+        else:
+            future = submit(extract_document, path, extension)
+            future.add_done_callback(functools.partial(_finish_from_future, document_id))
+    for blob_id, document_id in derivative_jobs.items():
+        dispatch_derivatives(document_id, blob_id)
+
+
+def schedule_file_removal(names=(), directory_patterns=()):
+    """
+    Queue storage names (and globs of directories) for deletion in the
+    current transaction, and remove them in the pool once it commits. Rows
+    the pool does not get to are left for ``manage.py reap_file_deletions``.
+    """
+    deletions = PendingFileDeletion.objects.enqueue(names, directory_patterns)
+    if deletions:
+        deletion_ids = [deletion.pk for deletion in deletions]
+        transaction.on_commit(lambda: dispatch_file_removal(deletion_ids))
+
+
+def unreferenced_deletions(deletions):
+    """
+    Return the queued deletions whose files nothing uses, dropping the rest
+    from the queue: identical bytes uploaded again get the same blob path.
+    """
+    names = [deletion.name for deletion in deletions if not deletion.is_pattern]
+    in_use = set(DocumentBlob.objects.filter(file__in=names).values_list('file', flat=True))
+    in_use.update(Document.objects.filter(file__in=names).values_list('file', flat=True))
+    # Derivative patterns end in the blob's digest
+    patterns = {deletion.name.rpartition('/')[2]: deletion.name for deletion in deletions if deletion.is_pattern}
+    in_use.update(
+        patterns[sha256] for sha256 in DocumentBlob.objects.filter(sha256__in=list(patterns))
+        .values_list('sha256', flat=True)
+    )
+    if not in_use:
+        return deletions
+    PendingFileDeletion.objects.filter(
+        pk__in=[deletion.pk for deletion in deletions if deletion.name in in_use],
+    ).delete()
+    return [deletion for deletion in deletions if deletion.name not in in_use]
+
+
+def dispatch_file_removal(deletion_ids):
+    deletions = unreferenced_deletions(list(PendingFileDeletion.objects.filter(pk__in=deletion_ids)))
+    if not deletions:
+        return
+    entries = [(default_storage.path(deletion.name), deletion.is_pattern) for deletion in deletions]
+    if get_processing_settings()['EAGER']:
+        record_file_removal(deletions, remove_stored_files(entries))
+        return
+    future = submit(remove_stored_files, entries)
+    future.add_done_callback(functools.partial(_finish_file_removal, deletions))
+
+
+def _finish_file_removal(deletions, future):
+    try:
+        try:
+            errors = future.result()
+        except Exception as exc:
+            if isinstance(exc, BrokenProcessPool):
+                shutdown_executor(wait=False)
+            errors = [str(exc) or exc.__class__.__name__] * len(deletions)
+        record_file_removal(deletions, errors)
+    except Exception:
+        logger.exception('Could not record removal of %s stored files', len(deletions))
+    finally:
+        close_old_connections()
+
+
+def record_file_removal(deletions, errors):
+    """Drop the queue rows that were removed; back off the ones that failed"""
+    done = [deletion.pk for deletion, error in zip(deletions, errors) if error is None]
+    PendingFileDeletion.objects.filter(pk__in=done).delete()
+    now = timezone.now()
+    for deletion, error in zip(deletions, errors):
+        if error is not None:
+            logger.warning('Could not remove stored file %s: %s', deletion.name, error)
+            deletion.attempts += 1
+            PendingFileDeletion.objects.filter(pk=deletion.pk).update(
+                attempts=deletion.attempts, last_error=error, not_before=now + deletion.retry_delay(),
+            )
+    return len(done)
+
+
+def reap_file_deletions(batch_size=500):
+    """
+    Remove every queued file that is due, ``batch_size`` rows at a time, in
+    the current process. Returns the numbers of entries removed and failed.
+    """
+    removed = failed = 0
+    last_id = 0
+    while True:
+        deletions = list(PendingFileDeletion.objects.due().filter(pk__gt=last_id).order_by('pk')[:batch_size])
+        if not deletions:
+            return removed, failed
+        last_id = deletions[-1].pk
+        deletions = unreferenced_deletions(deletions)
+        entries = [(default_storage.path(deletion.name), deletion.is_pattern) for deletion in deletions]
+        done = record_file_removal(deletions, remove_stored_files(entries))
+        removed += done
+        failed += len(deletions) - done
+
+
+def process_document(document_id, path, extension):
+    """Run extraction in the current process and record the outcome"""
+    try:
+        result = extract_document(path, extension)
+    except Exception as exc:
+        record_failure(document_id, exc)
+    else:
+        record_success(document_id, result)
+
+
+def _finish_from_future(document_id, future):
+    # Runs on the executor's management thread, which has its own connection
+    try:
+        try:
+            result = future.result()
+        except Exception as exc:
+            if isinstance(exc, BrokenProcessPool):
+                shutdown_executor(wait=False)
+            record_failure(document_id, exc)
+        else:
+            record_success(document_id, result)
+    except Exception:
+        logger.exception('Could not record processing result for document %s', document_id)
+    finally:
+        close_old_connections()
+
+
+def record_success(document_id, result):
+    text = result.get('text', '')
+    with transaction.atomic():
+        updated = Document.objects.filter(pk=document_id).update(
+            page_count=result.get('page_count'),
+            status='COMPLETED',
+            updated_at=timezone.now(),
+        )
+        if updated:
+            DocumentContent.objects.store(document_id, text)
+            # update() skips the post_save handlers, so refresh the index and cache here
+            get_search_backend().index(
+                Document.objects.filter(pk=document_id).select_related('content').prefetch_related('tags')
+            )
+            store_document_vector(document_id, text)
+            invalidate_document_ids([document_id])
+            DocumentProcessingLog.objects.create(
+                document_id=document_id,
+                operation=EXTRACT_OPERATION,
+                status='COMPLETED',
+                message=f'Extracted {len(text)} characters',
+            )
+
+
+def record_failure(document_id, exc):
+    logger.warning('Processing failed for document %s: %s', document_id, exc)
+    with transaction.atomic():
+        updated = Document.objects.filter(pk=document_id).update(
+            status='FAILED',
+            updated_at=timezone.now(),
+        )
+        if updated:
+            invalidate_document_ids([document_id])
+            DocumentProcessingLog.objects.create(
+                document_id=document_id,
+                operation=EXTRACT_OPERATION,
+                status='FAILED',
+                message=str(exc) or exc.__class__.__name__,
+            )
+
+
+def needs_derivatives(document):
+    """Whether the document's blob still lacks current derivatives"""
+    blob = document.blob
+    return (
+        document.document_type in DERIVATIVE_DOCUMENT_TYPES
+        and blob is not None
+        and blob.derivatives_version != DERIVATIVE_VERSION
+    )
+
+
+def dispatch_derivatives(document_id, blob_id):
+    """
+    Generate a blob's derivatives off the request path. ``document_id`` is
+    the document whose log records the outcome.
+    """
+    if get_processing_settings()['EAGER']:
+        process_derivatives(document_id, blob_id)
+        return
+    args = derivative_arguments(document_id, blob_id)
+    if args is None:
+        return
+    future = submit(generate_derivatives, *args)
+    future.add_done_callback(lambda f: _finish_derivatives_from_future(document_id, blob_id, f))
+
+
+def derivative_arguments(document_id, blob_id):
+    blob = DocumentBlob.objects.filter(pk=blob_id).first()
+    document = Document.objects.filter(pk=document_id).only('document_type').first()
+    if blob is None or document is None:
+        return None
+    return blob.file.path, document.document_type, default_storage.path(derivative_directory(blob.sha256))
+
+
+def process_derivatives(document_id, blob_id):
+    """Generate derivatives in the current process and record the outcome"""
+    args = derivative_arguments(document_id, blob_id)
+    if args is None:
+        return
+    try:
+        result = generate_derivatives(*args)
+    except Exception as exc:
+        record_derivatives_failure(document_id, exc)
+    else:
+        record_derivatives(document_id, blob_id, result)
+
+
+def _finish_derivatives_from_future(document_id, blob_id, future):
+    try:
+        try:
+            result = future.result()
+        except Exception as exc:
+            if isinstance(exc, BrokenProcessPool):
+                shutdown_executor(wait=False)
+            record_derivatives_failure(document_id, exc)
+        else:
+            record_derivatives(document_id, blob_id, result)
+    except Exception:
+        logger.exception('Could not record derivatives for document %s', document_id)
+    finally:
+        close_old_connections()
+
+
+def record_derivatives(document_id, blob_id, result):
+    with transaction.atomic():
+        DocumentBlob.objects.filter(pk=blob_id).update(
+            derivatives=result['kinds'],
+            derivatives_version=DERIVATIVE_VERSION,
+        )
+        # Every document sharing the blob gains thumbnail URLs
+        invalidate_document_ids(Document.objects.filter(blob_id=blob_id).values('pk'))
+        DocumentProcessingLog.objects.create(
+            document_id=document_id,
+            operation=DERIVATIVES_OPERATION,
+            status='COMPLETED',
+            message=f"Generated {', '.join(result['kinds'])} from {result['width']}x{result['height']}",
+        )
+
+
+def record_derivatives_failure(document_id, exc):
+    # Previews are optional: the document itself stays usable
+    if isinstance(exc, DerivativeUnavailable):
+        logger.info('Skipped derivatives for document %s: %s', document_id, exc)
+    else:
+        logger.warning('Derivatives failed for document %s: %s', document_id, exc)
+    DocumentProcessingLog.objects.create(
+        document_id=document_id,
+        operation=DERIVATIVES_OPERATION,
+        status='FAILED',
+        message=str(exc) or exc.__class__.__name__,
+    )
@@ -0,0 +1,124 @@
+"""
+Backends that turn a generation prompt into JSON for :mod:`documents.generation`.
+
+A provider gets a :class:`GenerationRequest` and returns the decoded JSON
+object matching ``request.schema``. ``OpenRouterProvider`` calls the
+OpenRouter chat completions API, which the frontend used to call directly;
+``FakeProvider`` fills the schema from the prompt's own words without any
+network access, for tests, development and load tests.
+"""
+import base64
+import hashlib
+import json
+import random
+import re
+import time
+import urllib.error
+import urllib.request
+from collections import namedtuple
+
+# image is JPEG bytes or None; count is how many items the task asks for, if any
+GenerationRequest = namedtuple(
+    'GenerationRequest', 'task model prompt image schema schema_name temperature max_tokens count'
+)
+
+
+class GenerationError(Exception):
+    """Raised when a provider fails or returns something unusable"""
+
+
+class ProviderUnavailable(GenerationError):
+    """Raised when a provider is not configured"""
+
+
+class BaseGenerationProvider:
+    """Interface for generation providers"""
+
+    def __init__(self, settings):
+        self.settings = settings
+
+    @property
+    def model(self):
+        """Name of the model results come from; part of the cache key"""
+        return self.settings['MODEL']
+
+    def generate(self, request):
+        """Return the JSON object generated for ``request``"""
+        raise NotImplementedError
+
+
+class OpenRouterProvider(BaseGenerationProvider):
+    """Structured output from the OpenRouter chat completions API"""
+
+    def generate(self, request):
+        if not self.settings['API_KEY']:
+            raise ProviderUnavailable('AI generation is not configured')
+        content = [{'type': 'text', 'text': request.prompt}]
+        if request.image is not None:
+            data = base64.b64encode(request.image).decode()
+            content.append({'type': 'image_url', 'image_url': {'url': f'data:image/jpeg;base64,{data}'}})
+        payload = {
+            'model': request.model,
+            'messages': [{'role': 'user', 'content': content}],
+            'temperature': request.temperature,
+            'max_tokens': request.max_tokens,
+            'response_format': {
+                'type': 'json_schema',
+                'json_schema': {'name': request.schema_name, 'strict': True, 'schema': request.schema},
+            },
+        }
+        http_request = urllib.request.Request(
+            self.settings['API_URL'],
+            data=json.dumps(payload).encode(),
+            headers={
+                'Content-Type': 'application/json',
+                'Authorization': f"Bearer {self.settings['API_KEY']}",
+                'X-Title': 'StudyMate AI - Advanced Study Companion',
+            },
+        )
+        try:
+            with urllib.request.urlopen(http_request, timeout=self.settings['TIMEOUT']) as response:
+                body = json.load(response)
+        except urllib.error.HTTPError as e:
+            raise GenerationError(f'Provider returned HTTP {e.code}') from e
+        except (OSError, ValueError) as e:
+            raise GenerationError(f'Provider request failed: {e}') from e
+
+        try:
+            return json.loads(body['choices'][0]['message']['content'])
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            raise GenerationError('Provider returned no usable JSON') from e
+
+
+class FakeProvider(BaseGenerationProvider):
+    """
+    Deterministic offline provider: every string in the schema is filled
+    with words from the prompt, and arrays get ``request.count`` items.
+    ``FAKE_DELAY`` seconds of sleep stand in for the model's latency.
+    """
+    WORDS_PER_STRING = 8
+
+    @property
+    def model(self):
+        return 'fake'
+
+    def generate(self, request):
+        if self.settings['FAKE_DELAY']:
+            time.sleep(self.settings['FAKE_DELAY'])
+        words = re.findall(r'\w+', request.prompt) or ['empty']
+        rng = random.Random(hashlib.sha256(request.prompt.encode()).digest())
+        return self.fill(request.schema, words, rng, request.count or 3)
+
+    def fill(self, schema, words, rng, count):
+        kind = schema.get('type')
+        if kind == 'object':
+            return {name: self.fill(value, words, rng, count) for name, value in schema['properties'].items()}
+        if kind == 'array':
+            items = schema.get('maxItems', count)
+            return [self.fill(schema['items'], words, rng, count) for _ in range(items)]
+        if 'enum' in schema:
+            return rng.choice(schema['enum'])
+        if kind in ('number', 'integer'):
+            return rng.randint(int(schema.get('minimum', 0)), int(schema.get('maximum', 10)))
+        start = rng.randrange(len(words))
+        return ' '.join(words[start:start + self.WORDS_PER_STRING]).capitalize()
@@ -0,0 +1,142 @@
+"""
+Streaming comparison of media storage with the database.
+
+Both sides are produced in the same order, storage by walking directories
+with each listing sorted and the database with ``ORDER BY`` on the stored
+name, and compared like a sort-merge join. Memory use is one directory
+listing and one fetch chunk per query, however many files there are.
+
+Files nothing refers to are orphans; references to files that are not
+stored are missing. Three areas are checked:
+
+* everything outside ``derivatives/`` and ``.incoming/`` against the blob
+  files, the files of documents stored before the blob store, and the names
+  already queued for deletion;
+* ``derivatives/v<N>/aa/bb/<sha256>`` directories against the blobs that
+  record current derivatives (directories of other versions are orphans);
+* ``.incoming/``, where only uploads that never finished are left behind.
+
+Anything modified within ``min_age`` seconds is skipped, since an upload or
+derivative may be on disk before the row referring to it is committed.
+"""
+import heapq
+import itertools
+import os
+import time
+from collections import namedtuple
+
+from django.core.files.storage import default_storage
+
+from .derivatives import DERIVATIVE_VERSION
+from .models import Document, DocumentBlob, PendingFileDeletion, derivative_directory
+from .uploadhandlers import INGEST_DIRECTORY
+
+DERIVATIVES_DIRECTORY = 'derivatives'
+CHUNK_SIZE = 2000
+
+# kind is 'orphan' or 'missing'; source names what refers (or failed to refer) to the name
+Mismatch = namedtuple('Mismatch', 'kind name is_directory source object_id')
+
+
+def storage_sort_key(entry):
+    # Sorting directories as "name/" makes the walk yield full paths in plain string order
+    return entry.name + '/' if entry.is_dir(follow_symlinks=False) else entry.name
+
+
+def walk_storage(root, relative='', depth=None, skip=()):
+    """
+    Yield ``(name, DirEntry)`` for the files under ``relative`` in sorted
+    order, or for the directories exactly ``depth`` levels below it.
+    """
+    try:
+        with os.scandir(os.path.join(root, relative)) as listing:
+            entries = sorted(listing, key=storage_sort_key)
+    except (FileNotFoundError, NotADirectoryError):
+        return
+    for entry in entries:
+        if not relative and entry.name in skip:
+            continue
+        name = f'{relative}/{entry.name}' if relative else entry.name
+        is_dir = entry.is_dir(follow_symlinks=False)
+        if depth is None:
+            if is_dir:
+                yield from walk_storage(root, name)
+            else:
+                yield name, entry
+        elif depth == 1:
+            yield name, entry
+        elif is_dir:
+            yield from walk_storage(root, name, depth - 1)
+
+
+def stream(queryset):
+    return queryset.iterator(chunk_size=CHUNK_SIZE)
+
+
+def referenced_files():
+    """Yield ``(name, [(source, id), ...])`` for every stored name the database refers to, sorted"""
+    blobs = DocumentBlob.objects.order_by('file').values_list('file', 'pk')
+    legacy = Document.objects.filter(blob__isnull=True).exclude(file='').order_by('file').values_list('file', 'pk')
+    pending = PendingFileDeletion.objects.filter(is_pattern=False).order_by('name').values_list('name', 'pk')
+    references = heapq.merge(
+        ((name, 'blob', pk) for name, pk in stream(blobs)),
+        ((name, 'document', pk) for name, pk in stream(legacy)),
+        ((name, 'pending', pk) for name, pk in stream(pending)),
+    )
+    for name, group in itertools.groupby(references, key=lambda reference: reference[0]):
+        yield name, [(source, pk) for _, source, pk in group]
+
+
+def referenced_derivatives():
+    blobs = DocumentBlob.objects.filter(derivatives_version=DERIVATIVE_VERSION).order_by('sha256')
+    for sha256, pk in stream(blobs.values_list('sha256', 'pk')):
+        yield derivative_directory(sha256), [('derivatives', pk)]
+
+
+def compare(stored, referenced, is_directory, is_old):
+    """Merge sorted ``(name, entry)`` and ``(name, references)`` streams into mismatches"""
+    stored_item = next(stored, None)
+    referenced_item = next(referenced, None)
+    while stored_item is not None or referenced_item is not None:
+        if referenced_item is None or (stored_item is not None and stored_item[0] < referenced_item[0]):
+            name, entry = stored_item
+            if is_old(entry):
+                yield Mismatch('orphan', name, is_directory, 'storage', None)
+            stored_item = next(stored, None)
+        elif stored_item is None or referenced_item[0] < stored_item[0]:
+            name, references = referenced_item
+            for source, pk in references:
+                # Queued names are expected to disappear
+                if source != 'pending':
+                    yield Mismatch('missing', name, is_directory, source, pk)
+            referenced_item = next(referenced, None)
+        else:
+            stored_item = next(stored, None)
+            referenced_item = next(referenced, None)
+
+
+def find_mismatches(min_age=3600, root=None):
+    """Yield a :class:`Mismatch` for every orphaned or missing file and derivative directory"""
+    root = root or default_storage.location
+    cutoff = time.time() - min_age
+
+    def is_old(entry):
+        try:
+            return entry.stat(follow_symlinks=False).st_mtime < cutoff
+        except FileNotFoundError:
+            return False
+
+    yield from compare(
+        walk_storage(root, skip=(DERIVATIVES_DIRECTORY, INGEST_DIRECTORY)), referenced_files(), False, is_old,
+    )
+
+    current = f'{DERIVATIVES_DIRECTORY}/v{DERIVATIVE_VERSION}'
+    for name, entry in walk_storage(root, DERIVATIVES_DIRECTORY, depth=1):
+        if name != current:
+            # Superseded versions are never served
+            yield Mismatch('orphan', name, entry.is_dir(follow_symlinks=False), 'storage', None)
+    yield from compare(walk_storage(root, current, depth=3), referenced_derivatives(), True, is_old)
+
+    for name, entry in walk_storage(root, INGEST_DIRECTORY):
+        if is_old(entry):
+            yield Mismatch('orphan', name, False, 'storage', None)
@@ -0,0 +1,202 @@
+"""
+Related documents from an in-memory matrix of document vectors.
+
+Every process keeps the vectors of all completed documents (see
+:mod:`documents.vectors`) in one float32 matrix, alongside each row's
+document id, owner and visibility. A lookup is a single matrix-vector
+product followed by a mask of the rows the user may read, so it costs a
+few milliseconds at 100k documents.
+
+The matrix is loaded on first use and kept current incrementally: at most
+once per ``REFRESH_INTERVAL`` seconds, documents whose ``updated_at`` moved
+past the last one seen are re-read, which covers new vectors, visibility
+changes and failed reprocessing. ``updated_at`` is set before the commit,
+so each poll reaches back ``REFRESH_OVERLAP`` to catch slow transactions.
+
+The matrix costs about 1 KB per row of capacity, which grows by doubling,
+in every server process, so the index is off unless ``ENABLED`` is set.
+Deleted documents are only noticed when they come up as candidates, so
+the candidates are always checked against the database before returning.
+"""
+import threading
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Q
+
+from .models import Document, DocumentShare, DocumentVector
+from .vectors import DIMENSIONS, VECTOR_VERSION, from_bytes, to_bytes, vectorize
+
+# Longer than any write transaction; rows changed within it are read again on every poll
+REFRESH_OVERLAP = timedelta(seconds=5)
+LOAD_CHUNK_SIZE = 2000
+# Extra candidates fetched for rows the database check may drop
+CANDIDATE_SLACK = 10
+
+
+def get_related_settings():
+    defaults = {'ENABLED': False, 'REFRESH_INTERVAL': 1.0, 'MIN_SIMILARITY': 0.05, 'MAX_RESULTS': 50}
+    defaults.update(getattr(settings, 'RELATED_DOCUMENTS', {}))
+    return defaults
+
+
+def store_document_vector(document_id, text):
+    """Vectorize a document's extracted text; documents without words get no vector"""
+    vector = vectorize(text)
+    if vector is None:
+        DocumentVector.objects.filter(document_id=document_id).delete()
+        return
+    DocumentVector.objects.update_or_create(
+        document_id=document_id, defaults={'vector': to_bytes(vector), 'version': VECTOR_VERSION},
+    )
+
+
+class RelatedIndex:
+    """Thread-safe in-process matrix of document vectors"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.size = 0
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.owners = np.zeros(0, dtype=np.int64)
+        self.public = np.zeros(0, dtype=bool)
+        # Rows of documents that lost their vector or stopped being COMPLETED stay, switched off
+        self.live = np.zeros(0, dtype=bool)
+        self.matrix = np.zeros((0, DIMENSIONS), dtype=np.float32)
+        self.rows = {}
+        self.watermark = None
+        self.refreshed_at = 0.0
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+
+    def refresh(self, force=False):
+        """Load the matrix on first use and apply changes made since the last refresh"""
+        now = time.monotonic()
+        if not force and self.watermark is not None and (
+            now - self.refreshed_at < get_related_settings()['REFRESH_INTERVAL']
+        ):
+            return
+        with self._lock:
+            self.refreshed_at = now
+            documents = Document.objects.order_by()
+            if self.watermark is not None:
+                documents = documents.filter(updated_at__gt=self.watermark - REFRESH_OVERLAP)
+            rows = documents.values_list(
+                'pk', 'user_id', 'is_public', 'status', 'updated_at', 'vector__vector', 'vector__version',
+            )
+            for chunk in self._chunks(rows.iterator(chunk_size=LOAD_CHUNK_SIZE)):
+                self._apply(chunk)
+
+    def _chunks(self, rows):
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= LOAD_CHUNK_SIZE:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def _apply(self, chunk):
+        for document_id, owner_id, is_public, status, updated_at, data, version in chunk:
+            if self.watermark is None or updated_at > self.watermark:
+                self.watermark = updated_at
+            row = self.rows.get(document_id)
+            usable = status == 'COMPLETED' and data is not None and version == VECTOR_VERSION
+            if row is None:
+                if not usable:
+                    continue
+                row = self._append(document_id)
+            self.owners[row] = owner_id
+            self.public[row] = is_public
+            self.live[row] = usable
+            if usable:
+                self.matrix[row] = from_bytes(data)
+
+    def _append(self, document_id):
+        if self.size == len(self.ids):
+            # Grow geometrically so loading n rows copies O(n) in total
+            capacity = max(1024, 2 * len(self.ids))
+            self.ids = np.resize(self.ids, capacity)
+            self.owners = np.resize(self.owners, capacity)
+            self.public = np.resize(self.public, capacity)
+            live = np.zeros(capacity, dtype=bool)
+            live[:self.size] = self.live[:self.size]
+            self.live = live
+            matrix = np.zeros((capacity, DIMENSIONS), dtype=np.float32)
+            matrix[:self.size] = self.matrix[:self.size]
+            self.matrix = matrix
+        row = self.size
+        self.ids[row] = document_id
+        self.rows[document_id] = row
+        self.size += 1
+        return row
+
+    def forget(self, document_ids):
+        with self._lock:
+            for document_id in document_ids:
+                row = self.rows.get(document_id)
+                if row is not None:
+                    self.live[row] = False
+
+    def vector_of(self, document_id):
+        with self._lock:
+            row = self.rows.get(document_id)
+            if row is not None and self.live[row]:
+                # A copy, since refreshes overwrite rows in place
+                return self.matrix[row].copy()
+        stored = DocumentVector.objects.filter(document_id=document_id, version=VECTOR_VERSION).first()
+        return from_bytes(stored.vector) if stored else None
+
+    def candidates(self, vector, user_id, shared_ids, exclude_id, count):
+        """Ids and similarities of the ``count`` closest rows the user may read, best first"""
+        min_similarity = get_related_settings()['MIN_SIMILARITY']
+        # Refreshes write rows in place and replace the arrays as they grow, so score under the lock
+        with self._lock:
+            size = self.size
+            shared_rows = [self.rows[document_id] for document_id in shared_ids if document_id in self.rows]
+            scores = self.matrix[:size] @ vector
+            readable = self.public[:size] | (self.owners[:size] == user_id)
+            readable[shared_rows] = True
+            readable &= self.live[:size] & (self.ids[:size] != exclude_id)
+            readable &= scores >= min_similarity
+            rows = np.flatnonzero(readable)
+            if len(rows) > count:
+                rows = rows[np.argpartition(-scores[rows], count - 1)[:count]]
+            rows = rows[np.argsort(-scores[rows], kind='stable')]
+            return [(int(self.ids[row]), float(scores[row])) for row in rows]
+
+    def related(self, document, user_id, limit):
+        """
+        Return up to ``limit`` ``(document, similarity)`` pairs for the
+        documents most similar to ``document`` that ``user_id`` may read.
+        """
+        self.refresh()
+        vector = self.vector_of(document.pk)
+        if vector is None:
+            return []
+        shared_ids = list(DocumentShare.objects.filter(shared_with_id=user_id).values_list('document_id', flat=True))
+        candidates = self.candidates(vector, user_id, shared_ids, document.pk, limit + CANDIDATE_SLACK)
+        if not candidates:
+            return []
+
+        # The matrix may lag behind deletes and visibility changes; the database has the final word
+        readable = Q(is_public=True) | Q(user_id=user_id) | Q(pk__in=shared_ids)
+        found = Document.objects.filter(readable, pk__in=[pk for pk, _ in candidates], status='COMPLETED')
+        found = {document.pk: document for document in found.select_related('blob')}
+        dropped = [pk for pk, _ in candidates if pk not in found]
+        if dropped:
+            # Only deleted documents leave the matrix; the rest wait for the next refresh
+            still_there = set(Document.objects.filter(pk__in=dropped).values_list('pk', flat=True))
+            self.forget([pk for pk in dropped if pk not in still_there])
+        return [(found[pk], similarity) for pk, similarity in candidates if pk in found][:limit]
+
+
+related_index = RelatedIndex()
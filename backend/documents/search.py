@@ -0,0 +1,182 @@
+"""
+Full-text search over documents.
+
+The SQLite backend keeps an FTS5 table (``documents_document_fts``) with one
+row per document, keyed by the document id, holding its title, description,
+tags and extracted text. Rows are written from the ``Document`` signal
+handlers and from the processing pipeline, so the index follows every change
+made through the ORM. Other databases fall back to ``icontains`` filters,
+which cannot see the compressed extracted text.
+
+Search snippets are HTML: ``snippet()`` marks the matches with private-use
+characters, and :func:`highlight_snippet` escapes the document text before
+turning those into ``<mark>`` tags, so uploaded text never reaches a client
+as markup.
+"""
+import html
+import re
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import CharField, FloatField, Q
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from .models import DocumentTagging
+
+FTS_TABLE = 'documents_document_fts'
+SNIPPET_TOKENS = 12
+SNIPPET_OPEN = '<mark>'
+SNIPPET_CLOSE = '</mark>'
+# What snippet() wraps matches in; html.escape() leaves them alone
+MATCH_START = '\ue000'
+MATCH_END = '\ue001'
+REBUILD_BATCH_SIZE = 500
+
+# Column weights for bm25(): title, description, tags, body
+RANK_WEIGHTS = (10.0, 3.0, 5.0, 1.0)
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def highlight_snippet(snippet):
+    """The HTML for a ``snippet()`` result: escaped text with the matches in ``<mark>``"""
+    return html.escape(snippet).replace(MATCH_START, SNIPPET_OPEN).replace(MATCH_END, SNIPPET_CLOSE)
+
+
+def build_match_query(text):
+    """
+    Turn free text typed by a user into an FTS5 MATCH expression.
+
+    Every word becomes a quoted prefix term so that partially typed words
+    match and FTS5 operators in the input are treated as plain text.
+    """
+    tokens = TOKEN_RE.findall(text or '')
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def document_index_values(document):
+    """
+    Return the (title, description, tags, body) tuple indexed for a document.
+    Select ``content`` and prefetch ``tags`` when indexing many documents at
+    once.
+    """
+    return (
+        document.title or '',
+        document.description or '',
+        ' '.join(tag.name for tag in document.tags.all()),
+        document.extracted_text or '',
+    )
+
+
+class BaseSearchBackend:
+    """Interface for document search backends"""
+
+    def index(self, documents):
+        """Add or refresh the index entries for the given documents"""
+
+    def remove(self, document_ids):
+        """Drop the index entries for the given document ids"""
+
+    def rebuild(self, queryset):
+        """Re-index every document in ``queryset`` from scratch; returns the count"""
+        return 0
+
+    def search(self, queryset, text):
+        """
+        Restrict ``queryset`` to documents matching ``text``.
+
+        Backends that can rank results order the queryset by relevance and
+        annotate each row with ``search_rank`` and ``search_snippet``.
+        """
+        raise NotImplementedError
+
+
+class DatabaseSearchBackend(BaseSearchBackend):
+    """
+    Unindexed fallback using case-insensitive substring matches on the title,
+    description and tags. The extracted text is stored compressed, so only
+    an index can search it.
+    """
+
+    def search(self, queryset, text):
+        # A subquery rather than a join so documents with several matching tags appear once
+        tagged = DocumentTagging.objects.filter(tag__name__icontains=text).values('document_id')
+        return queryset.filter(
+            Q(title__icontains=text) |
+            Q(description__icontains=text) |
+            Q(pk__in=tagged)
+        )
+
+
+class SQLiteFTSBackend(BaseSearchBackend):
+    """Ranked search backed by an SQLite FTS5 virtual table"""
+
+    def index(self, documents):
+        rows = [(document.pk,) + document_index_values(document) for document in documents]
+        if not rows:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [(row[0],) for row in rows])
+        self._insert(rows)
+
+    def _insert(self, rows):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABLE} (rowid, title, description, tags, body) VALUES (%s, %s, %s, %s, %s)',
+                rows,
+            )
+
+    def remove(self, document_ids):
+        document_ids = [(document_id,) for document_id in document_ids]
+        if not document_ids:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', document_ids)
+
+    def rebuild(self, queryset):
+        count = 0
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            batch = []
+            for document in queryset.iterator(chunk_size=REBUILD_BATCH_SIZE):
+                batch.append((document.pk,) + document_index_values(document))
+                if len(batch) >= REBUILD_BATCH_SIZE:
+                    self._insert(batch)
+                    count += len(batch)
+                    batch = []
+            if batch:
+                self._insert(batch)
+                count += len(batch)
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+        return count
+
+    def search(self, queryset, text):
+        match = build_match_query(text)
+        if not match:
+            return queryset
+        weights = ', '.join(str(weight) for weight in RANK_WEIGHTS)
+        # Annotations (rather than extra selects) so cursor pagination can filter on the rank
+        return queryset.extra(
+            tables=[FTS_TABLE],
+            where=[f'{FTS_TABLE}.rowid = documents_document.id', f'{FTS_TABLE} MATCH %s'],
+            params=[match],
+        ).annotate(
+            search_rank=RawSQL(f'bm25({FTS_TABLE}, {weights})', [], output_field=FloatField()),
+            search_snippet=RawSQL(
+                f"snippet({FTS_TABLE}, -1, %s, %s, '…', {SNIPPET_TOKENS})",
+                [MATCH_START, MATCH_END], output_field=CharField(),
+            ),
+        ).order_by('search_rank', '-id')
+
+
+def get_search_backend():
+    """Return the configured search backend, picking one from the database vendor by default"""
+    backend_path = getattr(settings, 'DOCUMENT_SEARCH_BACKEND', None)
+    if backend_path:
+        return import_string(backend_path)()
+    if connection.vendor == 'sqlite':
+        return SQLiteFTSBackend()
+    return DatabaseSearchBackend()
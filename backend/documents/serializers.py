@@ -1,5 +1,214 @@
-from rest_framework import serializers
-from .models import Document, DocumentTag, DocumentShare, DocumentProcessingLog
+import decimal
+from operator import itemgetter
+
+from django.db.models import BooleanField, ExpressionWrapper, Q
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.functional import cached_property
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+from .delivery import derivative_signer, sign_derivative_access
+from .derivatives import DERIVATIVE_SPECS, DERIVATIVE_VERSION
+from .models import Document, DocumentTag, DocumentShare, DocumentProcessingLog, Flashcard, Quiz, parse_tag_names
+from .search import highlight_snippet
+from .uploadhandlers import get_upload_settings, matches_extension, upload_head
+
+def derivative_url(document, kind, request):
+    """
+    Signed URL of one derivative image for the requesting user, or None until
+    it has been generated. ``v`` names the source content, so the URL changes
+    whenever the file does and responses can be cached indefinitely. Public
+    documents are signed for anyone, so every user gets the same URL.
+    """
+    blob = document.blob
+    if request is None or blob is None or not blob.has_derivative(kind):
+        return None
+    return signed_derivative_url(document.pk, document.is_public, blob.sha256, kind, request)
+
+def signed_derivative_url(pk, is_public, sha256, kind, request):
+    return derivative_url_builder(kind, request)(pk, is_public, sha256)
+
+def derivative_url_builder(kind, request):
+    """
+    ``signed_derivative_url`` for many rows: the URL is reversed, made
+    absolute and given a signer once, leaving only the signature per row
+    """
+    before, _, after = reverse('document_derivative', kwargs={'pk': 0, 'kind': kind}).rpartition('/0/')
+    base = request.build_absolute_uri(f'{before}/')
+    signer = derivative_signer()
+    user_id = request.user.pk
+
+    def build(pk, is_public, sha256):
+        signature = sign_derivative_access(pk, None if is_public else user_id, signer)
+        # Signatures are URL-safe base64 joined by ':', the only character urlencode() would escape
+        return f'{base}{pk}/{after}?v={sha256[:16]}&signature={signature.replace(":", "%3A")}'
+    return build
+
+def requested_fields(request):
+    """The field names in ``?fields=``, or None when every field is wanted"""
+    value = getattr(request, 'query_params', {}).get('fields')
+    if not value:
+        return None
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+def wants_field(request, name):
+    """Whether a response to ``request`` includes the field ``name``"""
+    names = requested_fields(request)
+    return names is None or name in names
+
+def datetime_representation(field):
+    """``field.to_representation`` for ISO 8601 output, with the time zone looked up once"""
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    tz = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+    if output_format is None or output_format.lower() != ISO_8601 or tz is None:
+        return field.to_representation
+
+    def to_representation(value):
+        if value.tzinfo is None:
+            return field.to_representation(value)
+        value = value.astimezone(tz).isoformat()
+        return value[:-6] + 'Z' if value.endswith('+00:00') else value
+    return to_representation
+
+def decimal_representation(field):
+    """``field.to_representation`` for plain string output, with the quantum computed once"""
+    coerce_to_string = getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+    if not coerce_to_string or field.localize or field.normalize_output or field.decimal_places is None:
+        return field.to_representation
+    context = decimal.getcontext().copy()
+    if field.max_digits is not None:
+        context.prec = field.max_digits
+    quantum = decimal.Decimal('.1') ** field.decimal_places
+
+    def to_representation(value):
+        if not isinstance(value, decimal.Decimal):
+            value = decimal.Decimal(str(value).strip())
+        return '{:f}'.format(value.quantize(quantum, rounding=field.rounding, context=context))
+    return to_representation
+
+class TagNamesField(serializers.Field):
+    """
+    Document tags as a comma-separated string of names. Writes also accept a
+    list of names; unknown tags are created on save.
+    """
+    default_error_messages = {
+        'invalid': 'Expected a comma-separated string or a list of tag names.',
+        'max_length': 'Tag names must be at most {max_length} characters.',
+    }
+
+    def to_representation(self, value):
+        # Uses the prefetch cache when the queryset prefetched tags
+        return ','.join(tag.name for tag in value.all())
+
+    def to_internal_value(self, data):
+        if not isinstance(data, (str, list)):
+            self.fail('invalid')
+        names = parse_tag_names(data)
+        max_length = DocumentTag._meta.get_field('name').max_length
+        if any(len(name) > max_length for name in names):
+            self.fail('max_length', max_length=max_length)
+        return names
+
+class SnippetField(serializers.Field):
+    """A search snippet as HTML: the document text escaped, the matches in ``<mark>``"""
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        return highlight_snippet(value)
+
+class TaggedDocumentSerializerMixin:
+    """Save the ``tags`` names through the tag relation"""
+
+    def create(self, validated_data):
+        names = validated_data.pop('tags', None)
+        document = super().create(validated_data)
+        if names is not None:
+            document.set_tags(names)
+        return document
+
+    def update(self, instance, validated_data):
+        names = validated_data.pop('tags', None)
+        document = super().update(instance, validated_data)
+        if names is not None:
+            document.set_tags(names)
+        return document
+
+class SparseFieldsetMixin:
+    """
+    Serialize only the fields named in ``?fields=``, a comma-separated list
+    such as ``?fields=id,title``. Unknown names are a validation error.
+    """
+    def get_fields(self):
+        fields = super().get_fields()
+        names = requested_fields(self.context.get('request'))
+        if names is None:
+            return fields
+        unknown = names - set(fields)
+        if unknown:
+            raise serializers.ValidationError({'fields': [f'Unknown field: {name}' for name in sorted(unknown)]})
+        return {name: field for name, field in fields.items() if name in names}
+
+class ValuesSerializerMixin(SparseFieldsetMixin):
+    """
+    Serialize the dicts of ``QuerySet.values()`` as well as model instances.
+
+    ``values_queryset()`` selects only the columns the fields read, and each
+    row becomes a dict directly: no model instance, no ``get_attribute()``
+    per field, and each field's conversion is chosen once per serializer.
+    A field computed in Python has a ``row_<name>(row)`` method reading the
+    columns listed in ``Meta.row_columns``; ``Meta.annotations`` computes
+    columns in SQL.
+    """
+    # Values these fields return unchanged from the database
+    PLAIN_FIELDS = (
+        serializers.BooleanField, serializers.CharField, serializers.ChoiceField,
+        serializers.FloatField, serializers.IntegerField,
+    )
+
+    def values_queryset(self, queryset, extra=()):
+        """``queryset.values()`` with the serializer's columns, plus ``extra`` ones"""
+        annotations = getattr(self.Meta, 'annotations', {})
+        available = {field.attname for field in queryset.model._meta.concrete_fields}
+        available.update(queryset.query.annotations, queryset.query.extra_select, annotations)
+
+        columns = {}
+        self.row_fields = []
+        for name, field in self.fields.items():
+            getter = getattr(self, f'row_{name}', None)
+            if getter is not None:
+                columns.update(dict.fromkeys(self.Meta.row_columns[name]))
+                self.row_fields.append((name, getter))
+            elif field.source in available:
+                columns[field.source] = None
+                self.row_fields.append((name, self.column_reader(field)))
+            # Like get_attribute(), leave out read-only fields the rows lack (search_snippet)
+        columns.update(dict.fromkeys(extra))
+        used = {name: expression for name, expression in annotations.items() if name in columns}
+        return queryset.annotate(**used).values(*columns)
+
+    def column_reader(self, field):
+        if isinstance(field, self.PLAIN_FIELDS):
+            return itemgetter(field.source)
+        if isinstance(field, serializers.DateTimeField):
+            to_representation = datetime_representation(field)
+        elif isinstance(field, serializers.DecimalField):
+            to_representation = decimal_representation(field)
+        else:
+            to_representation = field.to_representation
+        source = field.source
+
+        def read(row):
+            value = row[source]
+            return None if value is None else to_representation(value)
+        return read
+
+    def to_representation(self, instance):
+        if not isinstance(instance, dict):
+            return super().to_representation(instance)
+        return {name: read(instance) for name, read in self.row_fields}
 
 class DocumentTagSerializer(serializers.ModelSerializer):
     class Meta:
@@ -7,9 +216,17 @@ class DocumentTagSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'color', 'created_at']
         read_only_fields = ['id', 'created_at']
 
-class DocumentUploadSerializer(serializers.ModelSerializer):
+class DocumentTagFacetSerializer(serializers.ModelSerializer):
+    document_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = DocumentTag
+        fields = ['id', 'name', 'color', 'document_count']
+
+class DocumentUploadSerializer(TaggedDocumentSerializerMixin, serializers.ModelSerializer):
     file_size_mb = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
     file_extension = serializers.CharField(read_only=True)
+    tags = TagNamesField(required=False)
     
     class Meta:
         model = Document
@@ -17,53 +234,153 @@ class DocumentUploadSerializer(serializers.ModelSerializer):
                  'document_type', 'status', 'is_public', 'tags', 'file_extension']
         read_only_fields = ['id', 'document_type', 'status', 'file_size', 'file_size_mb', 'file_extension']
     
+    def validate_file(self, upload):
+        max_size = get_upload_settings()['MAX_SIZE']
+        if getattr(upload, 'too_large', False) or upload.size > max_size:
+            raise serializers.ValidationError(f'Files may be at most {max_size} bytes.')
+        if not matches_extension(upload.name, upload_head(upload)):
+            raise serializers.ValidationError('The file contents do not match its extension.')
+        return upload
+    
     def create(self, validated_data):
         validated_data['user'] = self.context['request'].user
-        
-        # Calculate file size
-        if 'file' in validated_data and validated_data['file']:
-            file_obj = validated_data['file']
-            # Get file size
-            file_obj.seek(0, 2)  # Seek to end
-            file_size = file_obj.tell()
-            file_obj.seek(0)  # Seek back to start
-            validated_data['file_size'] = file_size
-        
+        validated_data['status'] = 'PROCESSING'
+        # Size, digest and type come from the ingest pass when Document.save
+        # moves the upload into the blob store
         return super().create(validated_data)
 
-class DocumentSerializer(serializers.ModelSerializer):
+class DocumentBulkUploadSerializer(serializers.Serializer):
+    """Attributes shared by every document in a bulk upload"""
+    description = serializers.CharField(required=False, allow_blank=True, default='')
+    is_public = serializers.BooleanField(required=False, default=False)
+    tags = TagNamesField(required=False, default=list)
+
+class DocumentFilterSerializer(serializers.Serializer):
+    """The document list filters (``type``, ``status``, ``public``, ``tag``, ``search``) as an object"""
+    type = serializers.ChoiceField(choices=[choice for choice, _ in Document.DOCUMENT_TYPES], required=False)
+    status = serializers.ChoiceField(choices=[choice for choice, _ in Document.STATUS_CHOICES], required=False)
+    public = serializers.BooleanField(required=False)
+    tag = serializers.ListField(child=serializers.CharField(), required=False)
+    search = serializers.CharField(required=False)
+
+class DocumentBulkSelectionSerializer(serializers.Serializer):
+    """Documents picked by a list of ``ids`` or by a ``filter``; an empty filter picks all of them"""
+    MAX_IDS = 1000
+
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), required=False, allow_empty=False, max_length=MAX_IDS,
+    )
+    filter = DocumentFilterSerializer(required=False)
+
+    def validate(self, attrs):
+        if ('ids' in attrs) == ('filter' in attrs):
+            raise serializers.ValidationError('Provide either ids or filter.')
+        return attrs
+
+class DocumentBulkUpdateSerializer(DocumentBulkSelectionSerializer):
+    """Visibility and tag changes applied to every selected document"""
+    is_public = serializers.BooleanField(required=False)
+    tags = TagNamesField(required=False)
+    add_tags = TagNamesField(required=False)
+    remove_tags = TagNamesField(required=False)
+
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        if 'tags' in attrs and ('add_tags' in attrs or 'remove_tags' in attrs):
+            raise serializers.ValidationError('Use either tags or add_tags/remove_tags.')
+        if not any(name in attrs for name in ('is_public', 'tags', 'add_tags', 'remove_tags')):
+            raise serializers.ValidationError('Nothing to change.')
+        return attrs
+
+class DocumentSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     file_size_mb = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
     file_extension = serializers.CharField(read_only=True)
     is_image = serializers.BooleanField(read_only=True)
     is_pdf = serializers.BooleanField(read_only=True)
     user_name = serializers.CharField(source='user.get_full_name', read_only=True)
+    tags = TagNamesField(read_only=True)
+    # Read from DocumentContent; views select it when the field is wanted
+    extracted_text = serializers.CharField(read_only=True)
+    derivatives = serializers.SerializerMethodField()
     
     class Meta:
         model = Document
         fields = ['id', 'title', 'description', 'file', 'document_type', 
                  'file_size', 'file_size_mb', 'status', 'is_public', 'tags',
                  'extracted_text', 'page_count', 'file_extension', 'is_image', 
-                 'is_pdf', 'user_name', 'created_at', 'updated_at']
+                 'is_pdf', 'user_name', 'derivatives', 'created_at', 'updated_at']
         read_only_fields = ['id', 'file_size', 'file_size_mb', 'document_type', 
                            'status', 'extracted_text', 'page_count', 'file_extension',
                            'is_image', 'is_pdf', 'user_name', 'created_at', 'updated_at']
 
-class DocumentListSerializer(serializers.ModelSerializer):
+    def get_derivatives(self, document):
+        """URLs of the generated thumbnail, preview and AI-sized images"""
+        request = self.context.get('request')
+        urls = {kind: derivative_url(document, kind, request) for kind in DERIVATIVE_SPECS}
+        return {kind: url for kind, url in urls.items() if url}
+
+class DocumentListSerializer(ValuesSerializerMixin, serializers.ModelSerializer):
     file_size_mb = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
     file_extension = serializers.CharField(read_only=True)
     is_image = serializers.BooleanField(read_only=True)
     is_pdf = serializers.BooleanField(read_only=True)
+    # Only present on search results
+    search_snippet = SnippetField()
+    thumbnail_url = serializers.SerializerMethodField()
     
     class Meta:
         model = Document
         fields = ['id', 'title', 'document_type', 'file_size_mb', 'status', 
-                 'is_public', 'file_extension', 'is_image', 'is_pdf', 'created_at']
+                 'is_public', 'file_extension', 'is_image', 'is_pdf', 'thumbnail_url',
+                 'created_at', 'search_snippet']
+        row_columns = {
+            'file_extension': ['file'],
+            'thumbnail_url': ['id', 'is_public', 'blob__sha256', 'blob__derivatives', 'blob__derivatives_version'],
+        }
+        # values() rows get the flags from SQL; model instances use the properties
+        annotations = {
+            'is_image': ExpressionWrapper(Q(document_type='IMAGE'), output_field=BooleanField()),
+            'is_pdf': ExpressionWrapper(Q(document_type='PDF'), output_field=BooleanField()),
+        }
+
+    def get_thumbnail_url(self, document):
+        return derivative_url(document, 'thumbnail', self.context.get('request'))
+
+    def row_file_extension(self, row):
+        return row['file'].rpartition('.')[2].lower() if row['file'] else None
+
+    @cached_property
+    def thumbnail_url_builder(self):
+        request = self.context.get('request')
+        return derivative_url_builder('thumbnail', request) if request is not None else None
+
+    def row_thumbnail_url(self, row):
+        derivatives = row['blob__derivatives']
+        if not derivatives or 'thumbnail' not in derivatives or row['blob__derivatives_version'] != DERIVATIVE_VERSION:
+            return None
+        build = self.thumbnail_url_builder
+        if build is None:
+            return None
+        return build(row['id'], row['is_public'], row['blob__sha256'])
+
+class RelatedDocumentSerializer(DocumentListSerializer):
+    similarity = serializers.FloatField(read_only=True)
+
+    class Meta(DocumentListSerializer.Meta):
+        fields = DocumentListSerializer.Meta.fields + ['similarity']
+
+class DocumentUpdateSerializer(TaggedDocumentSerializerMixin, serializers.ModelSerializer):
+    tags = TagNamesField(required=False)
 
-class DocumentUpdateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Document
         fields = ['title', 'description', 'is_public', 'tags']
 
+class DocumentGenerationSerializer(serializers.Serializer):
+    count = serializers.IntegerField(required=False, min_value=1, max_value=50)
+    # Store generated flashcards or quiz questions for the user
+    save = serializers.BooleanField(default=False)
+
 class DocumentShareSerializer(serializers.ModelSerializer):
     document_title = serializers.CharField(source='document.title', read_only=True)
     shared_by_name = serializers.CharField(source='shared_by.get_full_name', read_only=True)
@@ -93,6 +410,44 @@ class DocumentShareSerializer(serializers.ModelSerializer):
         
         return super().create(validated_data)
 
+SCHEDULE_FIELDS = ['due_at', 'interval', 'ease', 'repetitions', 'lapses', 'last_reviewed_at']
+
+class FlashcardSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Flashcard
+        fields = ['id', 'document', 'question', 'answer', 'difficulty_level', 'category', 'tags',
+                  *SCHEDULE_FIELDS, 'created_at']
+        read_only_fields = fields
+
+class QuizSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Quiz
+        fields = ['id', 'document', 'question', 'options', 'correct_answer', 'difficulty_level', 'category',
+                  'explanation', *SCHEDULE_FIELDS, 'created_at']
+        read_only_fields = fields
+
+class ReviewSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    reviewed_at = serializers.DateTimeField(required=False)
+
+    def validate(self, attrs):
+        # Client clocks ahead of ours must not push items further out
+        now = timezone.now()
+        attrs['reviewed_at'] = min(attrs.get('reviewed_at', now), now)
+        return attrs
+
+class FlashcardReviewSerializer(ReviewSerializer):
+    grade = serializers.IntegerField(min_value=0, max_value=5, help_text="0 (forgotten) to 5 (perfect recall)")
+
+class QuizAnswerSerializer(ReviewSerializer):
+    answer = serializers.IntegerField(min_value=0, max_value=3)
+
+class FlashcardReviewBatchSerializer(serializers.Serializer):
+    reviews = serializers.ListField(child=FlashcardReviewSerializer(), min_length=1, max_length=500)
+
+class QuizAnswerBatchSerializer(serializers.Serializer):
+    reviews = serializers.ListField(child=QuizAnswerSerializer(), min_length=1, max_length=500)
+
 class DocumentProcessingLogSerializer(serializers.ModelSerializer):
     class Meta:
         model = DocumentProcessingLog
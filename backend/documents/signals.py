@@ -0,0 +1,162 @@
+import contextvars
+from contextlib import contextmanager
+
+from django.contrib.auth import get_user_model
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import stats
+from .cache import document_scopes, invalidate_document_ids, invalidate_scopes, user_scope
+from .models import Document, DocumentBlob, DocumentShare, DocumentTag, blob_storage_names
+from .processing import schedule_file_removal
+from .search import get_search_backend
+
+User = get_user_model()
+
+# Set while a batch operation applies the per-document handlers' work itself
+_batch_operation = contextvars.ContextVar('documents_batch_operation', default=False)
+
+
+@contextmanager
+def batch_operation():
+    """Skip the per-document delete handlers for the ORM calls made inside"""
+    token = _batch_operation.set(True)
+    try:
+        yield
+    finally:
+        _batch_operation.reset(token)
+
+
+def reindex_documents(document_ids):
+    if document_ids:
+        get_search_backend().index(
+            Document.objects.filter(pk__in=document_ids).select_related('content').prefetch_related('tags')
+        )
+
+
+@receiver(post_save, sender=Document)
+def index_document(sender, instance, **kwargs):
+    """Keep the search index in step with the saved document"""
+    get_search_backend().index([instance])
+
+
+@receiver(post_delete, sender=Document)
+def unindex_document(sender, instance, **kwargs):
+    if _batch_operation.get():
+        return
+    get_search_backend().remove([instance.pk])
+
+
+def documents_changed(document_ids):
+    """Refresh search and cached responses for documents whose tags changed"""
+    if document_ids:
+        reindex_documents(document_ids)
+        invalidate_document_ids(document_ids)
+
+
+@receiver(m2m_changed, sender=Document.tags.through)
+def index_document_tags(sender, instance, action, reverse, pk_set, **kwargs):
+    """Re-index documents whose tag set changed, from either side of the relation"""
+    if action == 'pre_clear' and reverse:
+        # The documents losing this tag are only known before the clear
+        instance._cleared_document_ids = list(instance.documents.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        if not reverse:
+            get_search_backend().index([instance])
+            invalidate_scopes(document_scopes(instance.user_id, instance.is_public))
+        elif action == 'post_clear':
+            documents_changed(getattr(instance, '_cleared_document_ids', None))
+        else:
+            documents_changed(pk_set)
+
+
+@receiver(post_save, sender=DocumentTag)
+def index_renamed_tag(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        documents_changed(list(instance.documents.values_list('pk', flat=True)))
+
+
+@receiver(pre_delete, sender=DocumentTag)
+def remember_tagged_documents(sender, instance, **kwargs):
+    instance._tagged_document_ids = list(instance.documents.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=DocumentTag)
+def index_deleted_tag(sender, instance, **kwargs):
+    # The taggings are gone by now, so the documents index without the tag
+    documents_changed(getattr(instance, '_tagged_document_ids', None))
+
+
+@receiver(post_save, sender=Document)
+def update_stats_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    stats.document_saved(instance, created)
+
+
+@receiver(post_delete, sender=Document)
+def update_stats_on_delete(sender, instance, **kwargs):
+    if _batch_operation.get():
+        return
+    stats.document_deleted(instance)
+
+
+@receiver(post_save, sender=Document)
+def invalidate_saved_document(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    scopes = document_scopes(instance.user_id, instance.is_public)
+    previous = getattr(instance, '_loaded_state', {})
+    if 'user_id' in previous:
+        # Also the owner and catalog the document may have just left
+        scopes += document_scopes(previous['user_id'], previous.get('is_public'))
+    invalidate_scopes(scopes)
+
+
+@receiver(post_delete, sender=Document)
+def invalidate_deleted_document(sender, instance, **kwargs):
+    if _batch_operation.get():
+        return
+    invalidate_scopes(document_scopes(instance.user_id, instance.is_public))
+
+
+def release_blob(blob_id):
+    released = DocumentBlob.objects.release(blob_id)
+    if released:
+        name, sha256 = released
+        schedule_file_removal(*blob_storage_names(sha256, name))
+
+
+@receiver(post_delete, sender=Document)
+def release_document_file(sender, instance, **kwargs):
+    """Release the file of every deleted document, however the delete happened (queryset, CASCADE)"""
+    if _batch_operation.get():
+        return
+    if instance.blob_id:
+        # Shared bytes are only unlinked when the last reference goes away
+        release_blob(instance.blob_id)
+    elif instance.file:
+        # Files stored before the blob store belong to this document alone
+        schedule_file_removal([instance.file.name])
+
+
+@receiver(post_save, sender=Document)
+def release_replaced_blob(sender, instance, created, raw=False, **kwargs):
+    previous_blob_id = getattr(instance, '_loaded_state', {}).get('blob_id')
+    if not created and not raw and previous_blob_id and previous_blob_id != instance.blob_id:
+        release_blob(previous_blob_id)
+
+
+@receiver(post_save, sender=DocumentShare)
+@receiver(post_delete, sender=DocumentShare)
+def invalidate_share(sender, instance, raw=False, **kwargs):
+    if not raw:
+        invalidate_scopes([user_scope(instance.shared_by_id), user_scope(instance.shared_with_id)])
+
+
+@receiver(post_save, sender=User)
+def invalidate_user(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    # Document details show the owner's name; logging in only touches last_login
+    if created or raw or (update_fields and set(update_fields) == {'last_login'}):
+        return
+    invalidate_scopes([user_scope(instance.pk)])
@@ -0,0 +1,149 @@
+"""
+Maintenance of the per-user ``DocumentStats`` rollup.
+
+Every document create, delete, type or visibility change applies a delta to
+the owner's row with ``F()`` expressions in the same transaction as the
+document write. When a delta cannot be applied (no row yet, or the previous
+values of the document are unknown) the row is recomputed from the documents
+table instead, so the rollup never drifts because of a missed case.
+"""
+from collections import Counter
+
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce
+
+from .models import Document, DocumentStats
+
+STATS_BATCH_SIZE = 1000
+
+
+def stats_aggregates():
+    """Aggregate expressions computing every DocumentStats counter"""
+    aggregates = {
+        'total_documents': Count('id'),
+        'public_documents': Count('id', filter=Q(is_public=True)),
+        'total_bytes': Coalesce(Sum('file_size'), 0),
+    }
+    for document_type, field in DocumentStats.TYPE_FIELDS.items():
+        aggregates[field] = Count('id', filter=Q(document_type=document_type))
+    return aggregates
+
+
+def rebuild_user_stats(user_id):
+    """Recompute one user's stats row from their documents (a single aggregate query)"""
+    values = Document.objects.filter(user_id=user_id).aggregate(**stats_aggregates())
+    DocumentStats.objects.update_or_create(user_id=user_id, defaults=values)
+
+
+def rebuild_all_stats():
+    """Recompute every stats row; returns the number of users written"""
+    written = 0
+    batch = []
+    rows = (
+        Document.objects.order_by()
+        .values('user_id')
+        .annotate(**stats_aggregates())
+        .order_by('user_id')
+    )
+    users_with_documents = set()
+    for row in rows.iterator(chunk_size=STATS_BATCH_SIZE):
+        users_with_documents.add(row['user_id'])
+        batch.append(DocumentStats(**row))
+        if len(batch) >= STATS_BATCH_SIZE:
+            written += _upsert(batch)
+            batch = []
+    written += _upsert(batch)
+
+    # Users whose documents are all gone keep a row of zeros
+    stale = DocumentStats.objects.exclude(user_id__in=users_with_documents)
+    written += stale.update(
+        total_documents=0, pdf_documents=0, image_documents=0, text_documents=0,
+        public_documents=0, total_bytes=0,
+    )
+    return written
+
+
+def _upsert(rows):
+    if not rows:
+        return 0
+    fields = list(stats_aggregates())
+    DocumentStats.objects.bulk_create(
+        rows, update_conflicts=True, unique_fields=['user'], update_fields=fields,
+    )
+    return len(rows)
+
+
+def apply_document_delta(user_id, document_type, is_public, file_size, sign, rebuild_missing=True):
+    """Add (sign=1) or remove (sign=-1) one document's contribution to its owner's stats"""
+    apply_documents_delta(user_id, [(document_type, is_public, file_size)], sign, rebuild_missing)
+
+
+def apply_documents_delta(user_id, documents, sign, rebuild_missing=True):
+    """
+    Add or remove the contribution of several ``(document_type, is_public,
+    file_size)`` tuples of one user in a single UPDATE.
+    """
+    totals = Counter()
+    for document_type, is_public, file_size in documents:
+        totals['total_documents'] += 1
+        totals['total_bytes'] += file_size or 0
+        type_field = DocumentStats.TYPE_FIELDS.get(document_type)
+        if type_field:
+            totals[type_field] += 1
+        if is_public:
+            totals['public_documents'] += 1
+    if not totals:
+        return
+    changes = {field: F(field) + sign * amount for field, amount in totals.items() if amount}
+
+    updated = DocumentStats.objects.filter(user_id=user_id).update(**changes)
+    if not updated and rebuild_missing:
+        rebuild_user_stats(user_id)
+
+
+def apply_visibility_change(user_id, made_public):
+    """Count ``made_public`` documents (negative when made private) as public in one UPDATE"""
+    if not made_public:
+        return
+    updated = DocumentStats.objects.filter(user_id=user_id).update(
+        public_documents=F('public_documents') + made_public,
+    )
+    if not updated:
+        rebuild_user_stats(user_id)
+
+
+def document_saved(document, created):
+    """Update stats after a document save, using the values it was loaded with"""
+    current = document.tracked_state()
+    if created:
+        apply_document_delta(
+            document.user_id, document.document_type, document.is_public, document.file_size, 1
+        )
+        return
+
+    previous = getattr(document, '_loaded_state', None)
+    fields = ('user_id', 'document_type', 'is_public', 'file_size')
+    if previous is None or any(name not in previous or name not in current for name in fields):
+        # Without the old values we cannot compute a delta; recompute instead
+        rebuild_user_stats(document.user_id)
+        if previous and previous.get('user_id') not in (None, document.user_id):
+            rebuild_user_stats(previous['user_id'])
+        return
+
+    if all(previous[name] == current[name] for name in fields):
+        return
+    apply_document_delta(
+        previous['user_id'], previous['document_type'], previous['is_public'], previous['file_size'], -1
+    )
+    apply_document_delta(
+        document.user_id, document.document_type, document.is_public, document.file_size, 1
+    )
+
+
+def document_deleted(document):
+    # A missing row is left alone: the owner may be mid-deletion (CASCADE), and
+    # the next write for a live user rebuilds it anyway
+    apply_document_delta(
+        document.user_id, document.document_type, document.is_public, document.file_size, -1,
+        rebuild_missing=False,
+    )
@@ -0,0 +1,109 @@
+"""
+Spaced-repetition scheduling of flashcards and quiz questions.
+
+Items are scheduled with SM-2: a review is graded 0-5, grades of 3 and up
+grow the interval (1 day, 6 days, then the previous interval times the
+item's ease) and anything lower sends the item back for relearning within
+minutes. The ease drifts with every grade and never drops below 1.3.
+
+Each item keeps its next ``due_at``, so "what is due now" is a range scan
+of the ``(user, due_at, id)`` index however many items a user has.
+Reviews are submitted in batches and written back with one bulk update.
+"""
+import math
+from collections import namedtuple
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .models import Flashcard, Quiz
+
+MIN_EASE = 1.3
+PASSING_GRADE = 3
+RELEARN_DELAY = timedelta(minutes=10)
+# Quiz answers are graded as a confident recall or a lapse
+CORRECT_ANSWER_GRADE = 4
+WRONG_ANSWER_GRADE = 1
+SCHEDULE_FIELDS = ['due_at', 'interval', 'ease', 'repetitions', 'lapses', 'last_reviewed_at', 'updated_at']
+BULK_BATCH_SIZE = 500
+
+Schedule = namedtuple('Schedule', 'due_at interval ease repetitions lapses')
+
+
+def next_schedule(item, grade, reviewed_at):
+    """Return the :class:`Schedule` after reviewing ``item`` with ``grade`` (0-5)"""
+    ease = max(MIN_EASE, item.ease + 0.1 - (5 - grade) * (0.08 + (5 - grade) * 0.02))
+    if grade < PASSING_GRADE:
+        return Schedule(reviewed_at + RELEARN_DELAY, 0, ease, 0, item.lapses + 1)
+    repetitions = item.repetitions + 1
+    if repetitions == 1:
+        interval = 1
+    elif repetitions == 2:
+        interval = 6
+    else:
+        interval = math.ceil(max(item.interval, 1) * item.ease)
+    return Schedule(reviewed_at + timedelta(days=interval), interval, ease, repetitions, item.lapses)
+
+
+def apply_reviews(items, reviews, grade_of):
+    """
+    Apply a batch of ``reviews`` (dicts with ``id`` and ``reviewed_at``) to
+    the matching rows of the ``items`` queryset, in ``reviewed_at`` order.
+    ``grade_of(item, review)`` returns the SM-2 grade. Reviews older than
+    an item's last review (e.g. replayed from an offline client) are
+    skipped. Returns ``(reviewed items, ids not found)``.
+    """
+    ids = {review['id'] for review in reviews}
+    found = {item.pk: item for item in items.filter(pk__in=ids).order_by()}
+    reviewed = {}
+    for review in sorted(reviews, key=lambda review: review['reviewed_at']):
+        item = found.get(review['id'])
+        if item is None or (item.last_reviewed_at and review['reviewed_at'] < item.last_reviewed_at):
+            continue
+        schedule = next_schedule(item, grade_of(item, review), review['reviewed_at'])
+        for field, value in schedule._asdict().items():
+            setattr(item, field, value)
+        item.last_reviewed_at = review['reviewed_at']
+        reviewed[item.pk] = item
+
+    if reviewed:
+        # bulk_update does not apply auto_now
+        now = timezone.now()
+        for item in reviewed.values():
+            item.updated_at = now
+        items.model.objects.bulk_update(list(reviewed.values()), SCHEDULE_FIELDS, batch_size=BULK_BATCH_SIZE)
+    return sorted(reviewed.values(), key=lambda item: item.pk), sorted(ids - found.keys())
+
+
+def quiz_grade(item, review):
+    return CORRECT_ANSWER_GRADE if review['answer'] == item.correct_answer else WRONG_ANSWER_GRADE
+
+
+def difficulty(value):
+    return value if value in dict(Flashcard.DIFFICULTY_CHOICES) else 'medium'
+
+
+def save_generated(user, document, task, result):
+    """Store a generated flashcard or quiz batch for ``user`` with one bulk insert; returns the rows"""
+    if task == 'flashcards':
+        model = Flashcard
+        rows = [
+            Flashcard(
+                user=user, document=document, question=card['question'], answer=card['answer'],
+                difficulty_level=difficulty(card.get('difficulty_level')),
+                category=(card.get('category') or '')[:100], tags=card.get('tags') or [],
+            )
+            for card in result
+        ]
+    else:
+        model = Quiz
+        rows = [
+            Quiz(
+                user=user, document=document, question=question['question'], options=question['options'],
+                correct_answer=int(question['correct_answer']),
+                difficulty_level=difficulty(question.get('difficulty_level')),
+                category=(question.get('category') or '')[:100], explanation=question.get('explanation') or '',
+            )
+            for question in result
+        ]
+    return model.objects.bulk_create(rows, batch_size=BULK_BATCH_SIZE)
@@ -1,3 +1,1964 @@
-from django.test import TestCase
+import base64
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+import zlib
+from concurrent.futures import Future
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from PIL import Image
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import cache
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.test import AsyncRequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from authentication.views import ProfileView
+from gpa_backend.db import ReplicaRouter, _read_alias
+from gpa_backend.metrics import registry
+from gpa_backend.testing import (
+    METRICS_SETTINGS, TEST_SETTINGS, QueryBudgetMixin, create_document, create_user,
+)
+
+from .derivatives import DERIVATIVE_VERSION, DerivativeUnavailable
+from .generation import cache_key, evict
+from .processing import reap_file_deletions, record_success
+from .models import (
+    Document, DocumentBlob, DocumentContent, DocumentProcessingLog, DocumentShare, DocumentStats, DocumentTag,
+    Flashcard, GeneratedContent, PendingFileDeletion, Quiz, blob_path, blob_storage_names, derivative_directory,
+)
+from .providers import FakeProvider, GenerationError
+from .reconcile import find_mismatches
+from .study import next_schedule
+from .related import related_index
+from .search import get_search_backend
+from .stats import stats_aggregates
+from .serializers import DocumentListSerializer
+from .uploadhandlers import INGEST_CHUNK_SIZE, IngestMultiPartParser, StreamingIngestUploadHandler, get_ingest_directory
+from .views import DocumentDetailView, DocumentDownloadView, DocumentFileView, DocumentListView, PublicDocumentListView
+
+User = get_user_model()
+
+def page(data):
+    return data['results']
+
+
+@override_settings(**TEST_SETTINGS)
+class DocumentQueryBudgetTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.user = create_user('owner')
+        self.other = create_user('other')
+        self.authenticate(self.user)
+        self.counter = 0
+
+    def add_documents(self, count, user=None, **kwargs):
+        documents = []
+        for _ in range(count):
+            self.counter += 1
+            documents.append(create_document(user or self.user, title=f'Needle {self.counter}', **kwargs))
+        return documents
+
+    def test_document_list(self):
+        self.assertQueryBudget('/api/documents/?page_size=100', self.add_documents, budget=1, results=page)
+
+    def test_document_list_search(self):
+        self.assertQueryBudget('/api/documents/?page_size=100&search=needle', self.add_documents,
+                               budget=1, results=page)
+
+    def test_document_list_tag_filter(self):
+        tag = DocumentTag.objects.create(name='exam')
+
+        def seed(count):
+            for document in self.add_documents(count):
+                document.tags.add(tag)
+        self.assertQueryBudget('/api/documents/?page_size=100&tag=exam', seed, budget=1, results=page)
+
+    def test_public_document_list(self):
+        self.client = APIClient()
+        self.assertQueryBudget(
+            '/api/public-documents/?page_size=100',
+            lambda count: self.add_documents(count, user=self.other, is_public=True),
+            budget=1, results=page,
+        )
+
+    def test_document_detail(self):
+        document = create_document(self.user)
+
+        def seed(count):
+            for _ in range(count):
+                self.counter += 1
+                document.tags.add(DocumentTag.objects.create(name=f'tag-{self.counter}'))
+        self.assertQueryBudget(f'/api/documents/{document.pk}/', seed, budget=2)
+
+    def test_document_stats(self):
+        self.assertQueryBudget('/api/documents/stats/', self.add_documents, budget=2)
+
+    def test_tag_list(self):
+        def seed(count):
+            for _ in range(count):
+                self.counter += 1
+                DocumentTag.objects.create(name=f'tag-{self.counter}')
+        self.assertQueryBudget('/api/tags/?page_size=100', seed, budget=1, results=page)
+
+    def test_tag_facets(self):
+        def seed(count):
+            for document in self.add_documents(count):
+                document.tags.add(DocumentTag.objects.create(name=f'tag-{document.pk}'))
+        self.assertQueryBudget('/api/tags/facets/', seed, budget=1, results=page)
+
+    def test_received_shares(self):
+        def seed(count):
+            for document in self.add_documents(count, user=self.other):
+                DocumentShare.objects.create(document=document, shared_by=self.other, shared_with=self.user)
+        self.assertQueryBudget('/api/shares/?page_size=100', seed, budget=1, results=page)
+
+    def test_sent_shares(self):
+        def seed(count):
+            for document in self.add_documents(count):
+                DocumentShare.objects.create(document=document, shared_by=self.user, shared_with=self.other)
+        self.assertQueryBudget('/api/shares/?type=sent&page_size=100', seed, budget=1, results=page)
+
+    def test_processing_logs(self):
+        document = create_document(self.user)
+
+        def seed(count):
+            DocumentProcessingLog.objects.bulk_create([
+                DocumentProcessingLog(document=document, operation='extract_text', status='COMPLETED')
+                for _ in range(count)
+            ])
+        self.assertQueryBudget(f'/api/documents/{document.pk}/logs/?page_size=100', seed, budget=2,
+                               results=page)
+
+    def test_shared_document_download(self):
+        document = create_document(self.other)
+        DocumentShare.objects.create(document=document, shared_by=self.other, shared_with=self.user)
+
+        def seed(count):
+            # Shares with other users must not change the access check
+            for _ in range(count):
+                self.counter += 1
+                DocumentShare.objects.create(
+                    document=document, shared_by=self.other, shared_with=create_user(f'reader{self.counter}'),
+                )
+        self.assertQueryBudget(f'/api/documents/{document.pk}/download/', seed, budget=2)
+
+
+def encode_cursor(position):
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode().rstrip('=')
+
+
+@override_settings(**TEST_SETTINGS)
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.owner = create_user('owner')
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def walk(self, url, between_pages=lambda: None):
+        """Follow ``next`` links from ``url``, returning the ids of every page in order"""
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, response.content)
+            pages.append([row['id'] for row in response.json()['results']])
+            url = response.json()['next']
+            between_pages()
+        return pages
+
+    def test_walk_returns_every_row_once_while_rows_are_inserted(self):
+        original = {create_document(self.owner, f'Week {i}').id for i in range(25)}
+        older = []
+
+        def insert():
+            # A newer row lands before the cursor, an older one after it
+            create_document(self.owner, 'Newer')
+            document = create_document(self.owner, 'Older')
+            Document.objects.filter(pk=document.pk).update(created_at=timezone.now() - timedelta(days=len(older) + 1))
+            older.append(document.id)
+
+        pages = self.walk('/api/documents/?page_size=10', insert)
+        seen = [document_id for ids in pages for document_id in ids]
+        self.assertEqual(len(seen), len(set(seen)))
+        # Older rows inserted before the last page are reached; newer ones never shift the walk
+        self.assertEqual(set(seen), original | set(older[:len(pages) - 1]))
+
+    def test_created_at_ties_are_broken_by_id(self):
+        documents = [create_document(self.owner, f'Week {i}') for i in range(5)]
+        Document.objects.filter(user=self.owner).update(created_at=timezone.now())
+        pages = self.walk('/api/documents/?page_size=2')
+        expected = sorted((document.id for document in documents), reverse=True)
+        self.assertEqual([document_id for ids in pages for document_id in ids], expected)
+        self.assertEqual([len(ids) for ids in pages], [2, 2, 1])
+
+    def test_invalid_cursor_is_not_found(self):
+        create_document(self.owner, 'Week 1')
+        create_document(self.owner, 'Week 2')
+        next_url = self.client.get('/api/documents/?page_size=1').json()['next']
+        created_at, document_id = json.loads(base64.urlsafe_b64decode(
+            next_url.split('cursor=')[1].split('&')[0] + '=='
+        ))
+        cursors = [
+            'garbage!!',
+            'e30',  # {}
+            base64.urlsafe_b64encode(b'\xff\xfe').decode(),
+            encode_cursor([created_at]),
+            encode_cursor([created_at, document_id, 1]),
+            encode_cursor(['not-a-date', document_id]),
+            encode_cursor([created_at, 'not-an-id']),
+            encode_cursor([123, document_id]),
+            encode_cursor([{'year': 2026}, document_id]),
+            encode_cursor([created_at, [document_id]]),
+        ]
+        for cursor in cursors:
+            with self.subTest(cursor=cursor):
+                response = self.client.get(f'/api/documents/?cursor={cursor}')
+                self.assertEqual(response.status_code, 404, response.content)
+        for cursor in (encode_cursor([{'rank': 1}, document_id]), encode_cursor(['high', document_id])):
+            with self.subTest(cursor=cursor):
+                response = self.client.get(f'/api/documents/?search=week&cursor={cursor}')
+                self.assertEqual(response.status_code, 404, response.content)
+
+
+@override_settings(**TEST_SETTINGS)
+class DocumentApiTests(TestCase):
+    def setUp(self):
+        self.user = create_user('owner')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_tags_round_trip_as_csv(self):
+        document = create_document(self.user)
+        response = self.client.patch(f'/api/documents/{document.pk}/', {'tags': 'bio, biochem,bio'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['tags'], 'bio,biochem')
+
+        response = self.client.get('/api/documents/?tag=bio')
+        self.assertEqual([row['id'] for row in response.json()['results']], [document.pk])
+
+    def test_tag_filter_matches_exact_names(self):
+        biology = create_document(self.user, title='Biology')
+        biology.set_tags([' bio ', 'exam', 'bio'])
+        biochem = create_document(self.user, title='Biochemistry')
+        biochem.set_tags(['biochem', 'Exam'])
+        self.assertEqual(biology.tags.count(), 2)
+
+        def titles(query):
+            return [row['title'] for row in self.client.get(f'/api/documents/?{query}').json()['results']]
+        # Whole names only: bio does not match biochem, as the old CSV substring filter did
+        self.assertEqual(titles('tag=bio'), ['Biology'])
+        self.assertEqual(titles('tag=%20bio%20'), ['Biology'])
+        self.assertEqual(titles('tag=bi'), [])
+        # Names are case-sensitive, like the tags themselves
+        self.assertEqual(titles('tag=Exam'), ['Biochemistry'])
+        # Repeating the filter requires every tag
+        self.assertEqual(titles('tag=bio&tag=exam'), ['Biology'])
+        self.assertEqual(titles('tag=bio&tag=biochem'), [])
+
+    def test_list_rows_match_the_model_serializer(self):
+        sha = 'cd' * 32
+        blob = DocumentBlob.objects.create(sha256=sha, file=f'blobs/cd/cd/{sha}.png', size=1, ref_count=1,
+                                           derivatives=['thumbnail'], derivatives_version=DERIVATIVE_VERSION)
+        create_document(self.user, title='Photo', file=blob.file.name, blob=blob, document_type='IMAGE')
+        create_document(self.user, title='Paper', file='documents/1/paper.v2.PDF', document_type='PDF')
+        create_document(self.user, title='Notes', document_type='TEXT', file_size=3 * 1024 * 1024 + 7)
+        documents = Document.objects.filter(user=self.user).select_related('blob').order_by('-created_at', '-id')
+
+        for url, queryset in [
+            ('/api/documents/?page_size=1', documents),
+            ('/api/documents/?search=paper', get_search_backend().search(documents, 'paper')),
+        ]:
+            with self.subTest(url=url):
+                rows = []
+                while url:
+                    data = self.client.get(url).json()
+                    rows.extend(data['results'])
+                    url = data['next']
+                request = Request(APIRequestFactory().get('/api/documents/'))
+                request.user = self.user
+                expected = DocumentListSerializer(queryset, many=True, context={'request': request}).data
+                self.assertEqual(rows, expected)
+        photo = self.client.get('/api/documents/?search=photo').json()['results'][0]
+        self.assertIn('/derivatives/thumbnail/', photo['thumbnail_url'])
+
+    def test_sparse_fieldsets(self):
+        document = create_document(self.user)
+        document.set_tags(['exam'])
+        rows = self.client.get('/api/documents/?fields=id,title').json()['results']
+        self.assertEqual(rows, [{'id': document.pk, 'title': 'Lecture notes'}])
+        detail = self.client.get(f'/api/documents/{document.pk}/?fields=id, tags').json()
+        self.assertEqual(detail, {'id': document.pk, 'tags': 'exam'})
+        lines = b''.join(self.client.get('/api/documents/?format=ndjson&fields=is_pdf').streaming_content)
+        self.assertEqual(json.loads(lines), {'is_pdf': False})
+
+        response = self.client.get('/api/documents/?fields=id,owner')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'fields': ['Unknown field: owner']})
+
+    def test_extracted_text_is_stored_compressed_apart_from_the_document(self):
+        text = 'Mitochondria are the powerhouse of the cell. ' * 100
+        document = create_document(self.user, extracted_text=text)
+        content = DocumentContent.objects.get(document=document)
+        self.assertEqual(content.text_length, len(text))
+        self.assertLess(len(content.compressed_text), len(text) // 10)
+        self.assertEqual(Document.objects.get(pk=document.pk).extracted_text, text)
+
+        with CaptureQueriesContext(connection) as queries:
+            rows = self.client.get('/api/documents/').json()['results']
+        self.assertEqual([row['id'] for row in rows], [document.pk])
+        self.assertFalse([query for query in queries.captured_queries if 'compressed_text' in query['sql']])
+
+        with CaptureQueriesContext(connection) as queries:
+            detail = self.client.get(f'/api/documents/{document.pk}/?fields=id,title').json()
+        self.assertEqual(detail, {'id': document.pk, 'title': 'Lecture notes'})
+        self.assertFalse([query for query in queries.captured_queries if 'compressed_text' in query['sql']])
+        self.assertEqual(self.client.get(f'/api/documents/{document.pk}/').json()['extracted_text'], text)
+
+        record_success(document.pk, {'text': 'Replaced text', 'page_count': 1})
+        self.assertEqual(Document.objects.get(pk=document.pk).extracted_text, 'Replaced text')
+        self.assertEqual(DocumentContent.objects.get(document=document).text_length, len('Replaced text'))
+
+    def test_share_serializer_names(self):
+        other = create_user('other')
+        document = create_document(other, title='Shared')
+        DocumentShare.objects.create(document=document, shared_by=other, shared_with=self.user)
+        row = self.client.get('/api/shares/').json()['results'][0]
+        self.assertEqual(row['document_title'], 'Shared')
+        self.assertEqual(row['shared_by_name'], 'Other Tester')
+        self.assertEqual(row['shared_with_name'], 'Owner Tester')
+
+
+def pdf_upload(name, pages):
+    """A PDF with one FlateDecode content stream per page, readable without pypdf"""
+    data = b'%PDF-1.4\n'
+    for number, text in enumerate(pages, start=2):
+        stream = zlib.compress(f'BT /F1 12 Tf 72 720 Td ({text}) Tj ET'.encode())
+        data += f'{number} 0 obj\n<< /Type /Page /Parent 1 0 R >>\nendobj\n'.encode()
+        data += f'{number + 100} 0 obj\n<< /Length {len(stream)} /Filter /FlateDecode >>\nstream\n'.encode()
+        data += stream + b'\nendstream\nendobj\n'
+    data += f'1 0 obj\n<< /Type /Pages /Count {len(pages)} >>\nendobj\n%%EOF\n'.encode()
+    return SimpleUploadedFile(name, data, content_type='application/pdf')
+
+
+def docx_upload(name, paragraphs, pages=None):
+    namespace = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+    body = ''.join(f'<w:p><w:r><w:t>{text}</w:t></w:r></w:p>' for text in paragraphs)
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as package:
+        package.writestr('word/document.xml', f'<w:document xmlns:w="{namespace}"><w:body>{body}</w:body></w:document>')
+        if pages is not None:
+            package.writestr(
+                'docProps/app.xml',
+                '<Properties xmlns="http://schemas.openxmlformats.org/officeDocument/2006/extended-properties">'
+                f'<Pages>{pages}</Pages></Properties>',
+            )
+    return SimpleUploadedFile(name, buffer.getvalue())
+
+
+@override_settings(**TEST_SETTINGS)
+class DocumentProcessingTests(TestCase):
+    def setUp(self):
+        self.owner = create_user('owner')
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def upload(self, file, process=True):
+        with self.captureOnCommitCallbacks(execute=process):
+            response = self.client.post('/api/documents/', {'title': 'Upload', 'file': file}, format='multipart')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.json()['status'], 'PROCESSING')
+        return Document.objects.get(pk=response.json()['id'])
+
+    def logs(self, document):
+        return list(document.processing_logs.exclude(operation='derivatives')
+                    .order_by('pk').values_list('operation', 'status'))
+
+    def test_pdf_docx_and_text_extraction(self):
+        cases = [
+            (pdf_upload('cells.pdf', ['Cells divide', 'by mitosis']), 'Cells divide\nby mitosis', 2),
+            (docx_upload('enzymes.docx', ['Enzymes', 'lower activation energy'], pages=3),
+             'Enzymes\nlower activation energy', 3),
+            (SimpleUploadedFile('notes.txt', 'Photosynthesis \u2013 light to sugar'.encode()),
+             'Photosynthesis \u2013 light to sugar', None),
+        ]
+        for file, text, page_count in cases:
+            with self.subTest(file=file.name):
+                document = self.upload(file)
+                self.assertEqual((document.status, document.extracted_text, document.page_count),
+                                 ('COMPLETED', text, page_count))
+                self.assertEqual(self.logs(document), [
+                    ('upload', 'COMPLETED'), ('extract_text', 'STARTED'), ('extract_text', 'COMPLETED'),
+                ])
+        found = self.client.get('/api/documents/?search=mitosis').json()['results']
+        self.assertEqual([row['title'] for row in found], ['Upload'])
+
+    def test_corrupt_docx_fails(self):
+        broken = docx_upload('broken.docx', ['Truncated'])
+        broken = SimpleUploadedFile('broken.docx', broken.read()[:40])
+        document = self.upload(broken)
+        self.assertEqual((document.status, document.extracted_text), ('FAILED', ''))
+        self.assertEqual(self.logs(document), [
+            ('upload', 'COMPLETED'), ('extract_text', 'STARTED'), ('extract_text', 'FAILED'),
+        ])
+        self.assertIn('Invalid DOCX file', document.processing_logs.get(status='FAILED').message)
+
+    def test_process_documents_command(self):
+        pending = self.upload(SimpleUploadedFile('pending.txt', b'Left behind by a restart'), process=False)
+        failed = self.upload(SimpleUploadedFile('failed.txt', b'Failed the first time'), process=False)
+        Document.objects.filter(pk=failed.pk).update(status='FAILED')
+
+        call_command('process_documents', stdout=io.StringIO())
+        pending.refresh_from_db()
+        failed.refresh_from_db()
+        self.assertEqual((pending.status, pending.extracted_text), ('COMPLETED', 'Left behind by a restart'))
+        self.assertEqual(failed.status, 'FAILED')
+
+        output = io.StringIO()
+        call_command('process_documents', retry_failed=True, stdout=output)
+        self.assertIn('Processed 1 documents', output.getvalue())
+        failed.refresh_from_db()
+        self.assertEqual((failed.status, failed.extracted_text), ('COMPLETED', 'Failed the first time'))
+
+
+@override_settings(**TEST_SETTINGS)
+class DocumentSearchTests(TestCase):
+    def setUp(self):
+        self.owner = create_user('owner')
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def search(self, text):
+        return self.client.get('/api/documents/', {'search': text}).json()['results']
+
+    def titles(self, text):
+        return [row['title'] for row in self.search(text)]
+
+    def test_snippets_escape_document_text(self):
+        create_document(self.owner, title='<img src=x onerror=alert(1)>',
+                        extracted_text='<script>alert("xss")</script> & mitochondria make energy')
+        snippet = self.search('mitochondria')[0]['search_snippet']
+        self.assertEqual(
+            snippet, '&lt;script&gt;alert(&quot;xss&quot;)&lt;/script&gt; &amp; <mark>mitochondria</mark> make energy',
+        )
+        snippet = self.search('onerror')[0]['search_snippet']
+        self.assertNotIn('<img', snippet)
+        self.assertIn('<mark>onerror</mark>', snippet)
+        export = self.client.get('/api/documents/?search=mitochondria&fields=search_snippet&format=ndjson')
+        self.assertIn('&lt;script&gt;', b''.join(export.streaming_content).decode())
+
+    def test_ranking_weights_every_column(self):
+        body = create_document(self.owner, title='Week one', extracted_text='osmosis across membranes')
+        description = create_document(self.owner, title='Week two', description='osmosis lab report')
+        tagged = create_document(self.owner, title='Week three')
+        tagged.set_tags(['osmosis'])
+        titled = create_document(self.owner, title='Osmosis')
+        # bm25 weights: title 10, tags 5, description 3, body 1
+        self.assertEqual([row['id'] for row in self.search('osmosis')],
+                         [titled.pk, tagged.pk, description.pk, body.pk])
+        self.assertEqual(self.titles('lab report'), ['Week two'])
+        self.assertEqual(self.titles('membranes'), ['Week one'])
+
+    def test_index_follows_edits_deletes_and_reprocessing(self):
+        document = create_document(self.owner, title='Glycolysis', extracted_text='pyruvate')
+        document.set_tags(['metabolism'])
+        self.assertEqual(self.titles('metabolism'), ['Glycolysis'])
+
+        self.client.patch(f'/api/documents/{document.pk}/', {'title': 'Krebs cycle', 'tags': 'citric'}, format='json')
+        self.assertEqual(self.titles('glycolysis'), [])
+        self.assertEqual(self.titles('metabolism'), [])
+        self.assertEqual(self.titles('krebs citric'), ['Krebs cycle'])
+        tag = DocumentTag.objects.get(name='citric')
+        tag.name = 'tricarboxylic'
+        tag.save()
+        self.assertEqual(self.titles('tricarboxylic'), ['Krebs cycle'])
+
+        record_success(document.pk, {'text': 'acetyl coenzyme', 'page_count': None})
+        self.assertEqual(self.titles('pyruvate'), [])
+        self.assertEqual(self.titles('acetyl'), ['Krebs cycle'])
+
+        self.client.delete(f'/api/documents/{document.pk}/')
+        self.assertEqual(self.titles('krebs'), [])
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT count(*) FROM documents_document_fts')
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+    def test_rebuild_search_index(self):
+        create_document(self.owner, title='Photosynthesis', extracted_text='chlorophyll')
+        create_document(self.owner, title='Respiration', description='chlorophyll free')
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM documents_document_fts')
+        self.assertEqual(self.titles('chlorophyll'), [])
+
+        output = io.StringIO()
+        call_command('rebuild_search_index', stdout=output)
+        self.assertIn('Indexed 2 documents with SQLiteFTSBackend', output.getvalue())
+        self.assertEqual(set(self.titles('chlorophyll')), {'Photosynthesis', 'Respiration'})
+
+
+@override_settings(**TEST_SETTINGS)
+class DocumentStatsTests(TestCase):
+    COUNTERS = list(stats_aggregates())
+
+    def setUp(self):
+        self.owner = create_user('owner')
+        self.other = create_user('other')
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def assertStatsFresh(self, *users):
+        """Each user's stats row must equal a fresh aggregate over their documents"""
+        for user in users:
+            expected = Document.objects.filter(user=user).aggregate(**stats_aggregates())
+            stats = DocumentStats.objects.filter(user=user).values(*self.COUNTERS).first()
+            self.assertEqual(stats, expected, f'Stats of {user.username}')
+
+    def test_deltas_match_a_fresh_aggregate_after_every_change(self):
+        pdf = create_document(self.owner, title='Paper', document_type='PDF', file_size=5000, is_public=True)
+        image = create_document(self.owner, title='Photo', document_type='IMAGE', file_size=700)
+        create_document(self.other, title='Theirs', document_type='TEXT', file_size=30)
+        self.assertStatsFresh(self.owner, self.other)
+
+        steps = [
+            ('type', lambda: setattr(image, 'document_type', 'TEXT')),
+            ('visibility', lambda: setattr(pdf, 'is_public', False)),
+            ('size', lambda: setattr(pdf, 'file_size', 12000)),
+            ('status', lambda: setattr(image, 'status', 'FAILED')),
+            ('owner', lambda: setattr(image, 'user', self.other)),
+            ('everything', lambda: (setattr(pdf, 'document_type', 'IMAGE'), setattr(pdf, 'is_public', True),
+                                    setattr(pdf, 'file_size', 1))),
+        ]
+        for name, change in steps:
+            with self.subTest(change=name):
+                change()
+                pdf.save()
+                image.save()
+                self.assertStatsFresh(self.owner, self.other)
+
+        # Saves of partially loaded documents cannot compute a delta and recompute instead
+        partial = Document.objects.only('id', 'user_id', 'is_public').get(pk=pdf.pk)
+        partial.is_public = False
+        partial.save(update_fields=['is_public'])
+        self.assertStatsFresh(self.owner, self.other)
+
+        record_success(image.pk, {'text': 'status only', 'page_count': 1})
+        self.assertStatsFresh(self.owner, self.other)
+
+    def test_api_writes_and_deletes(self):
+        documents = [create_document(self.owner, title=f'Notes {i}', file_size=100 * i) for i in range(4)]
+        self.client.patch(f'/api/documents/{documents[0].pk}/', {'is_public': True}, format='json')
+        self.assertStatsFresh(self.owner)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/documents/bulk/update/', {'ids': [d.pk for d in documents], 'is_public': True},
+                             format='json')
+        self.assertStatsFresh(self.owner)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/api/documents/{documents[0].pk}/')
+        self.assertStatsFresh(self.owner)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/documents/bulk/delete/', {'ids': [documents[1].pk]}, format='json')
+        self.assertStatsFresh(self.owner)
+        with self.captureOnCommitCallbacks(execute=True):
+            Document.objects.filter(user=self.owner).delete()
+        self.assertStatsFresh(self.owner)
+        self.assertEqual(DocumentStats.objects.get(user=self.owner).total_documents, 0)
+
+    def test_user_cascade(self):
+        create_document(self.owner, file_size=10)
+        create_document(self.other, file_size=20, is_public=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.other.delete()
+        self.assertFalse(DocumentStats.objects.filter(user_id=self.other.pk).exists())
+        self.assertStatsFresh(self.owner)
+
+    def test_rebuild_reconciles_drifted_rows(self):
+        create_document(self.owner, document_type='PDF', file_size=10, is_public=True)
+        create_document(self.other, document_type='IMAGE', file_size=20)
+        gone = create_user('gone')
+        create_document(gone, file_size=5)
+        Document.objects.filter(user=gone).update(user=self.other)
+        DocumentStats.objects.update(total_documents=99, pdf_documents=7, public_documents=3, total_bytes=-1)
+
+        output = io.StringIO()
+        call_command('rebuild_document_stats', '--user', str(self.owner.pk), stdout=output)
+        self.assertIn('Rebuilt document stats for 1 users', output.getvalue())
+        self.assertStatsFresh(self.owner)
+        self.assertEqual(DocumentStats.objects.get(user=self.other).total_documents, 99)
+
+        call_command('rebuild_document_stats', stdout=output)
+        self.assertStatsFresh(self.owner, self.other)
+        # Users without documents keep a row of zeros
+        self.assertEqual(DocumentStats.objects.filter(user=gone).values(*self.COUNTERS).get(),
+                         dict.fromkeys(self.COUNTERS, 0))
+
+
+@override_settings(**TEST_SETTINGS)
+class DocumentFileDeliveryTests(TestCase):
+    content = bytes(range(256)) * 40
+
+    def setUp(self):
+        self.owner = create_user('owner')
+        self.document = Document.objects.create(
+            user=self.owner, title='Slides', file=SimpleUploadedFile('slides.pdf', self.content),
+        )
+        self.url = f'/api/documents/{self.document.pk}/file/'
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def test_full_download(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['Content-Length'], str(len(self.content)))
+        self.assertEqual(response['ETag'], f'"{self.document.sha256}"')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+
+    def test_byte_ranges(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), self.content[100:200])
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(self.content)}')
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-10')
+        self.assertEqual(b''.join(response.streaming_content), self.content[-10:])
+
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.content)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.content)}')
+
+    def test_if_range_mismatch_sends_whole_file(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_conditional_requests(self):
+        first = self.client.get(self.url)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], first['ETag'])
+
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_access_is_checked(self):
+        stranger = APIClient()
+        stranger.force_authenticate(create_user('stranger'))
+        self.assertEqual(stranger.get(self.url).status_code, 403)
+        self.assertEqual(APIClient().get(self.url).status_code, 403)
+
+    def test_signed_download_link(self):
+        download_url = self.client.get(f'/api/documents/{self.document.pk}/download/').json()['download_url']
+        response = APIClient().get(download_url, HTTP_RANGE='bytes=0-3')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), self.content[:4])
+
+        other = create_document(create_user('other'), title='Other')
+        self.assertEqual(APIClient().get(download_url.replace(self.url, f'/api/documents/{other.pk}/file/')).status_code, 403)
+
+    @override_settings(DOCUMENT_DELIVERY={'MODE': 'x-accel-redirect', 'ACCEL_REDIRECT_PREFIX': '/protected/'})
+    def test_accel_redirect_handoff(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected/{self.document.file.name}')
+        self.assertEqual(response.content, b'')
+
+
+def image_upload(name='photo.png', size=(1200, 800)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, (200, 40, 40)).save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+@override_settings(**TEST_SETTINGS)
+class DocumentDerivativeTests(TestCase):
+    def setUp(self):
+        self.owner = create_user('owner')
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def upload(self, file):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/documents/', {'title': 'Upload', 'file': file}, format='multipart')
+        self.assertEqual(response.status_code, 201, response.content)
+        return Document.objects.select_related('blob').get(pk=response.json()['id'])
+
+    def test_image_derivatives(self):
+        document = self.upload(image_upload())
+        self.assertEqual(sorted(document.blob.derivatives), ['ai', 'preview', 'thumbnail'])
+
+        detail = self.client.get(f'/api/documents/{document.pk}/').json()
+        self.assertEqual(set(detail['derivatives']), {'ai', 'preview', 'thumbnail'})
+        thumbnail_url = self.client.get('/api/documents/').json()['results'][0]['thumbnail_url']
+        self.assertEqual(thumbnail_url, detail['derivatives']['thumbnail'])
+
+        # The signed URL works without credentials and may be cached for good
+        response = APIClient().get(thumbnail_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertIn('immutable', response['Cache-Control'])
+        image = Image.open(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(image.size, (320, 213))
+
+        response = APIClient().get(detail['derivatives']['ai'])
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+
+    def test_access_and_staleness(self):
+        document = self.upload(image_upload())
+        url = self.client.get(f'/api/documents/{document.pk}/').json()['derivatives']['thumbnail']
+        self.assertEqual(self.client.get(f'/api/documents/{document.pk}/derivatives/thumbnail/')['Cache-Control'],
+                         'private, no-cache')
+
+        stranger = APIClient()
+        stranger.force_authenticate(create_user('stranger'))
+        self.assertEqual(stranger.get(url).status_code, 403)
+        self.assertEqual(APIClient().get(url.replace('signature=', 'signature=x')).status_code, 403)
+        self.assertEqual(self.client.get(url.replace('v=', 'v=0')).status_code, 404)
+        self.assertEqual(self.client.get(f'/api/documents/{document.pk}/derivatives/original/').status_code, 404)
+
+    def test_identical_uploads_share_derivatives(self):
+        first = self.upload(image_upload())
+        second = self.upload(image_upload())
+        self.assertEqual(first.blob_id, second.blob_id)
+        operations = DocumentProcessingLog.objects.filter(operation='derivatives')
+        self.assertEqual(list(operations.values_list('document_id', flat=True)), [first.pk])
+
+    def test_pdf_without_renderer_is_skipped(self):
+        with mock.patch('documents.processing.generate_derivatives', side_effect=DerivativeUnavailable('none')):
+            document = self.upload(SimpleUploadedFile('notes.pdf', b'%PDF-1.4\n%%EOF\n'))
+        document.refresh_from_db()
+        self.assertEqual(document.status, 'COMPLETED')
+        log = document.processing_logs.get(operation='derivatives')
+        self.assertEqual(log.status, 'FAILED')
+        self.assertIsNone(self.client.get('/api/documents/').json()['results'][0]['thumbnail_url'])
+
+    def test_derivatives_removed_with_blob(self):
+        document = self.upload(image_upload())
+        directory = os.path.join(settings.MEDIA_ROOT, derivative_directory(document.blob.sha256))
+        self.assertTrue(os.path.isdir(directory))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/api/documents/{document.pk}/')
+        self.assertFalse(os.path.exists(directory))
+
+
+# One sample line of the text exposition format: name{labels} value
+SAMPLE_RE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{((?:[a-zA-Z_][a-zA-Z0-9_]*="(?:[^"\\]|\\.)*",?)*)\})? (\S+)$')
+
+
+def parse_exposition(body):
+    """``{name: [(labels, value)]}`` for every sample; fails on any line that is not valid"""
+    samples = {}
+    types = {}
+    for line in body.splitlines():
+        if line.startswith('# TYPE '):
+            _, _, name, kind = line.split(' ')
+            assert kind in ('counter', 'gauge', 'histogram'), line
+            types[name] = kind
+            continue
+        if line.startswith('# HELP '):
+            continue
+        match = SAMPLE_RE.match(line)
+        assert match, f'Invalid sample line: {line!r}'
+        name, labels, value = match.groups()
+        assert any(name == base or name.startswith(base + '_') for base in types), f'Untyped sample: {line!r}'
+        samples.setdefault(name, []).append((dict(re.findall(r'(\w+)="((?:[^"\\]|\\.)*)"', labels or '')), float(value)))
+    return samples
+
+
+@override_settings(**TEST_SETTINGS, METRICS=METRICS_SETTINGS)
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        self.owner = create_user('owner')
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+        registry.reset()
+
+    def scrape(self, **extra):
+        return APIClient().get('/internal/metrics/', **extra)
+
+    def test_requests_are_recorded_per_view_name(self):
+        create_document(self.owner)
+        sizes = []
+        queries = []
+        for _ in range(2):
+            with CaptureQueriesContext(connection) as captured:
+                response = self.client.get('/api/documents/')
+            sizes.append(len(response.content))
+            queries.append(len(captured))
+        self.assertEqual(self.client.get('/api/documents/999/').status_code, 404)
+        self.client.get('/no-such-page/')
+
+        snapshot = registry.snapshot()
+        listed = snapshot[('document_list', 'GET')]
+        self.assertEqual(listed.statuses, {200: 2})
+        self.assertEqual(listed.query_sum, sum(queries))
+        self.assertEqual(listed.size_sum, sum(sizes))
+        self.assertEqual(listed.latency_buckets[-1] + sum(listed.latency_buckets[:-1]), 2)
+        self.assertEqual(snapshot[('document_detail', 'GET')].statuses, {404: 1})
+        self.assertEqual(snapshot[('<unmatched>', 'GET')].statuses, {404: 1})
+
+    def test_scrape_is_valid_exposition_text(self):
+        self.client.get('/api/documents/')
+        self.client.get('/api/documents/')
+        response = self.scrape(HTTP_AUTHORIZATION='Bearer scrape-token')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        samples = parse_exposition(response.content.decode())
+
+        labels = {'endpoint': 'document_list', 'method': 'GET'}
+        self.assertIn(({**labels, 'status': '200'}, 2.0), samples['http_requests_total'])
+        for name in ('http_request_duration_seconds', 'http_request_db_queries', 'http_response_size_bytes'):
+            buckets = [(bucket.pop('le'), value) for bucket, value in samples[f'{name}_bucket'] if bucket == {
+                **labels, 'le': bucket.get('le')}]
+            counts = [value for _, value in buckets]
+            self.assertEqual(counts, sorted(counts), name)
+            self.assertEqual(buckets[-1], ('+Inf', 2.0))
+            self.assertIn((labels, 2.0), samples[f'{name}_count'])
+
+    def test_scrapes_need_an_allowed_address_and_the_token(self):
+        self.assertEqual(self.scrape(HTTP_AUTHORIZATION='Bearer scrape-token').status_code, 200)
+        # Every client of a proxy on the same host comes from 127.0.0.1
+        self.assertEqual(self.scrape().status_code, 404)
+        self.assertEqual(self.scrape(HTTP_AUTHORIZATION='Bearer wrong-token').status_code, 404)
+        self.assertEqual(self.scrape(HTTP_AUTHORIZATION='Token scrape-token').status_code, 404)
+        self.assertEqual(
+            self.scrape(HTTP_AUTHORIZATION='Bearer scrape-token', REMOTE_ADDR='203.0.113.7').status_code, 404,
+        )
+        with self.settings(METRICS={**METRICS_SETTINGS, 'TOKEN': ''}):
+            self.assertEqual(self.scrape(HTTP_AUTHORIZATION='Bearer ').status_code, 404)
+
+
+class DocumentTagMigrationTests(TransactionTestCase):
+    """The CSV tags become DocumentTagging rows in 0010; the column is dropped after"""
+    before = [('documents', '0009_document_stats')]
+    after = [('documents', '0010_document_tag_relation')]
+
+    def setUp(self):
+        self.addCleanup(self.migrate, MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def test_backfill_from_csv(self):
+        apps = self.migrate(self.before)
+        user = apps.get_model('authentication', 'User').objects.create(username='owner', email='owner@example.com')
+        Document = apps.get_model('documents', 'Document')
+        apps.get_model('documents', 'DocumentTag').objects.create(name='exam', color='#FF0000')
+        csv_tags = {
+            'spaces': ' bio , exam,,  ',
+            'duplicates': 'bio,bio, bio',
+            'mixed case': 'Bio,bio,EXAM',
+            'empty': '',
+            'blank': ' , ,',
+            'long': 'x' * 60,
+        }
+        ids = {}
+        for title, tags in csv_tags.items():
+            ids[title] = Document.objects.create(
+                user=user, title=title, file=f'blobs/test/{title}.txt', document_type='TEXT', file_size=1,
+                tags=tags,
+            ).pk
+
+        apps = self.migrate(self.after)
+        DocumentTag = apps.get_model('documents', 'DocumentTag')
+        DocumentTagging = apps.get_model('documents', 'DocumentTagging')
+        tags = {
+            title: sorted(DocumentTagging.objects.filter(document_id=pk).values_list('tag__name', flat=True))
+            for title, pk in ids.items()
+        }
+        self.assertEqual(tags, {
+            'spaces': ['bio', 'exam'],
+            'duplicates': ['bio'],
+            'mixed case': ['Bio', 'EXAM', 'bio'],
+            'empty': [],
+            'blank': [],
+            'long': ['x' * 50],
+        })
+        self.assertEqual(sorted(DocumentTag.objects.values_list('name', flat=True)),
+                         ['Bio', 'EXAM', 'bio', 'exam', 'x' * 50])
+        # Existing tags are reused with their colours
+        self.assertEqual(DocumentTag.objects.get(name='exam').color, '#FF0000')
+
+        apps = self.migrate(self.before)
+        restored = dict(apps.get_model('documents', 'Document').objects.values_list('title', 'tags'))
+        self.assertEqual(sorted(restored['spaces'].split(',')), ['bio', 'exam'])
+        self.assertEqual((restored['duplicates'], restored['empty'], restored['blank']), ('bio', '', ''))
+
+
+@override_settings(**{**TEST_SETTINGS, 'CACHES': {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+}})
+class DocumentResponseCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = create_user('owner')
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def test_repeat_requests_are_served_from_cache(self):
+        document = create_document(self.owner, title='Cached')
+        first = self.client.get('/api/documents/')
+        self.assertEqual(first['Cache-Control'], 'private, no-cache')
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/documents/')
+            not_modified = self.client.get('/api/documents/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified['ETag'], first['ETag'])
+
+        self.client.patch(f'/api/documents/{document.pk}/', {'title': 'Renamed'}, format='json')
+        response = self.client.get('/api/documents/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['title'], 'Renamed')
+
+    def test_users_do_not_share_responses(self):
+        create_document(self.owner, title='Mine')
+        other = APIClient()
+        other.force_authenticate(create_user('other'))
+        mine = self.client.get('/api/documents/')
+        theirs = other.get('/api/documents/', HTTP_IF_NONE_MATCH=mine['ETag'])
+        self.assertEqual(theirs.status_code, 200)
+        self.assertEqual(theirs.json()['results'], [])
+
+    def test_public_catalog_follows_visibility(self):
+        document = create_document(self.owner, title='Shared notes', is_public=True)
+        anonymous = APIClient()
+        first = anonymous.get('/api/public-documents/')
+        self.assertEqual(first['Cache-Control'], 'public, no-cache')
+        self.assertEqual(len(first.json()['results']), 1)
+
+        document.is_public = False
+        document.save()
+        response = anonymous.get('/api/public-documents/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'], [])
+
+    def test_tag_and_processing_changes_invalidate(self):
+        document = create_document(self.owner, status='PROCESSING')
+        document.tags.add(DocumentTag.objects.create(name='draft'))
+        url = f'/api/documents/{document.pk}/'
+        self.assertEqual(self.client.get(url).json()['tags'], 'draft')
+
+        tag = DocumentTag.objects.get(name='draft')
+        tag.name = 'final'
+        tag.save()
+        self.assertEqual(self.client.get(url).json()['tags'], 'final')
+
+        record_success(document.pk, {'text': 'body', 'page_count': 1})
+        self.assertEqual(self.client.get(url).json()['status'], 'COMPLETED')
+
+
+@override_settings(**{**TEST_SETTINGS, 'CACHES': {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+}}, LIST_EXPORT={'CHUNK_SIZE': 2})
+class ListExportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = create_user('owner')
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+        for index in range(5):
+            create_document(self.owner, title=f'Export {index}')
+
+    def read_pages(self, url):
+        rows = []
+        while url:
+            data = self.client.get(url).json()
+            rows.extend(data['results'])
+            url = data['next']
+        return rows
+
+    def test_stream_matches_the_pages(self):
+        expected = self.read_pages('/api/documents/?page_size=2')
+        response = self.client.get('/api/documents/?stream=true')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(json.loads(b''.join(response.streaming_content)), {'next': None, 'results': expected})
+
+    def test_ndjson_has_one_row_per_line(self):
+        expected = self.read_pages('/api/documents/?page_size=2')
+        response = self.client.get('/api/documents/?format=ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line) for line in lines], expected)
+
+        empty = self.client.get('/api/documents/?format=ndjson&search=missing')
+        self.assertEqual(b''.join(empty.streaming_content), b'')
+
+    def test_rows_are_read_in_chunks(self):
+        response = self.client.get('/api/documents/?stream=true')
+        with CaptureQueriesContext(connection) as queries:
+            chunks = list(response.streaming_content)
+        # Header, three chunks of at most two rows, footer
+        self.assertEqual(len(chunks), 5)
+        self.assertEqual(len(queries), 1)
+
+    def test_exports_are_revalidated_but_not_stored(self):
+        first = self.client.get('/api/documents/?stream=true')
+        b''.join(first.streaming_content)
+        not_modified = self.client.get('/api/documents/?stream=true', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        with CaptureQueriesContext(connection) as queries:
+            b''.join(self.client.get('/api/documents/?stream=true').streaming_content)
+        self.assertEqual(len(queries), 1)
+
+    def test_async_export(self):
+        token = Token.objects.create(user=self.owner)
+        request = AsyncRequestFactory().get(
+            '/api/documents/?format=ndjson', headers={'authorization': f'Token {token.key}'},
+        )
+        response = async_to_sync(DocumentListView.as_async_view())(request)
+        self.assertTrue(response.is_async)
+        lines = async_to_sync(read_streaming_content)(response).decode().splitlines()
+        self.assertEqual([json.loads(line)['title'] for line in lines], [f'Export {i}' for i in range(4, -1, -1)])
+
+
+class DisconnectingStream(io.BytesIO):
+    """A request body that breaks off after ``cutoff`` bytes, noting what was on disk at that moment"""
+
+    def __init__(self, body, cutoff, directory):
+        super().__init__(body)
+        self.cutoff = cutoff
+        self.directory = directory
+        self.files_at_break = None
+
+    def read(self, size=-1):
+        if self.tell() >= self.cutoff:
+            self.files_at_break = os.listdir(self.directory)
+            raise OSError('Connection reset by peer')
+        if size is None or size < 0:
+            size = self.cutoff - self.tell()
+        return super().read(min(size, self.cutoff - self.tell()))
+
+
+@override_settings(**TEST_SETTINGS)
+class UploadIngestTests(TestCase):
+    def setUp(self):
+        self.owner = create_user('owner')
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=self.media_root, DOCUMENT_UPLOAD={'MAX_SIZE': 100_000})
+        media.enable()
+        self.addCleanup(media.disable)
+        self.incoming = get_ingest_directory()
+
+    def upload(self, name, content):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/api/documents/', {'title': name, 'file': SimpleUploadedFile(name, content)},
+                                    format='multipart')
+
+    def test_digest_and_type_match_streamed_content(self):
+        # Several ingest chunks, with the magic bytes in the first one only
+        content = b'%PDF-1.4\n' + os.urandom(3 * INGEST_CHUNK_SIZE // 2)
+        handler = StreamingIngestUploadHandler()
+        handler.new_file('file', 'paper.pdf', 'application/pdf', None)
+        for start in range(0, len(content), INGEST_CHUNK_SIZE):
+            handler.receive_data_chunk(content[start:start + INGEST_CHUNK_SIZE], start)
+        upload = handler.file_complete(len(content))
+        self.assertEqual(upload.sha256, hashlib.sha256(content).hexdigest())
+        self.assertEqual((upload.detected_type, upload.size), ('PDF', len(content)))
+        self.assertEqual(upload.read(), content)
+        upload.close()
+
+        content = 'notes on photosynthesis\n'.encode() * 2000
+        response = self.upload('notes.txt', content)
+        self.assertEqual(response.status_code, 201, response.content)
+        document = Document.objects.get(pk=response.json()['id'])
+        self.assertEqual(document.sha256, hashlib.sha256(content).hexdigest())
+        self.assertEqual(document.document_type, 'TEXT')
+
+    def test_size_limit_is_enforced_mid_stream(self):
+        handler = StreamingIngestUploadHandler()
+        handler.new_file('file', 'big.txt', 'text/plain', None)
+        path = handler.file.temporary_file_path()
+        chunk = b'x' * INGEST_CHUNK_SIZE
+        handler.receive_data_chunk(chunk, 0)
+        self.assertTrue(os.path.exists(path))
+        # The chunk that crosses the limit deletes the partial file; later ones are dropped
+        handler.receive_data_chunk(chunk, INGEST_CHUNK_SIZE)
+        self.assertFalse(os.path.exists(path))
+        self.assertIsNone(handler.receive_data_chunk(chunk, 2 * INGEST_CHUNK_SIZE))
+        upload = handler.file_complete(3 * INGEST_CHUNK_SIZE)
+        self.assertTrue(upload.too_large)
+        self.assertIsNone(upload.sha256)
+
+        response = self.upload('big.txt', b'x' * 300_000)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['file'], ['Files may be at most 100000 bytes.'])
+        self.assertEqual(self.upload('fits.txt', b'x' * 100_000).status_code, 201)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/documents/bulk/', {'files': [
+                SimpleUploadedFile('small.txt', b'fits'), SimpleUploadedFile('huge.txt', b'x' * 300_000),
+            ]}, format='multipart')
+        self.assertEqual(response.status_code, 207, response.content)
+        self.assertEqual([row['status'] for row in response.json()['results']], ['created', 'failed'])
+        self.assertEqual(Document.objects.filter(user=self.owner).count(), 2)
+        self.assertEqual(os.listdir(self.incoming), [])
+
+    def test_contents_must_match_extension(self):
+        docx = docx_upload('essay.docx', ['Essay']).read()
+        mismatches = [
+            ('paper.pdf', docx),
+            ('notes.txt', b'%PDF-1.4\n%%EOF\n'),
+            ('photo.png', b'definitely not an image'),
+            ('essay.docx', b'%PDF-1.4\n%%EOF\n'),
+        ]
+        for name, content in mismatches:
+            with self.subTest(name=name):
+                response = self.upload(name, content)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json()['file'], ['The file contents do not match its extension.'])
+        self.assertFalse(Document.objects.exists())
+        self.assertEqual(self.upload('essay.docx', docx).status_code, 201)
+
+    def test_aborted_upload_leaves_no_temporary_file(self):
+        boundary = 'ingestboundary'
+        body = (
+            f'--{boundary}\r\nContent-Disposition: form-data; name="title"\r\n\r\nnotes\r\n'
+            f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="notes.txt"\r\n'
+            f'Content-Type: text/plain\r\n\r\n'
+        ).encode() + b'x' * 50_000 + f'\r\n--{boundary}--\r\n'.encode()
+        stream = DisconnectingStream(body, 30_000, self.incoming)
+        django_request = APIRequestFactory().generic(
+            'POST', '/api/documents/', body, content_type=f'multipart/form-data; boundary={boundary}',
+        )
+        django_request._stream = stream
+        request = Request(django_request, parsers=[IngestMultiPartParser()])
+        with self.assertRaises(OSError):
+            request.data
+        self.assertEqual(len(stream.files_at_break), 1)
+        self.assertEqual(os.listdir(self.incoming), [])
+
+
+@override_settings(**TEST_SETTINGS)
+class DocumentBulkUploadTests(TestCase):
+    def setUp(self):
+        self.owner = create_user('owner')
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def post(self, files, **data):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/api/documents/bulk/', {'files': files, **data}, format='multipart')
+
+    def text_files(self, count, prefix='notes'):
+        return [SimpleUploadedFile(f'{prefix}-{i}.txt', f'{prefix} body {i}'.encode()) for i in range(count)]
+
+    def test_partial_failure(self):
+        files = [
+            SimpleUploadedFile('week-1.txt', b'mitochondria'),
+            SimpleUploadedFile('virus.exe', b'MZ'),
+            SimpleUploadedFile('copy-of-week-1.txt', b'mitochondria'),
+            image_upload('diagram.png', size=(64, 64)),
+        ]
+        response = self.post(files, tags='biology, week1', is_public='true')
+        self.assertEqual(response.status_code, 207, response.content)
+        body = response.json()
+        self.assertEqual((body['created'], body['failed']), (3, 1))
+        self.assertEqual([row['status'] for row in body['results']], ['created', 'failed', 'created', 'created'])
+        self.assertIn('file', body['results'][1]['errors'])
+        self.assertEqual(body['results'][0]['document']['title'], 'week-1')
+
+        documents = Document.objects.filter(user=self.owner)
+        self.assertEqual(documents.count(), 3)
+        self.assertTrue(all(document.is_public for document in documents))
+        self.assertEqual(set(documents.values_list('tags__name', flat=True)), {'biology', 'week1'})
+        # Identical bytes share one blob holding both references
+        shared = DocumentBlob.objects.get(documents__title='week-1')
+        self.assertEqual(shared.ref_count, 2)
+        self.assertEqual(documents.filter(status='COMPLETED').count(), 3)
+
+        stats = DocumentStats.objects.get(user=self.owner)
+        self.assertEqual((stats.total_documents, stats.text_documents, stats.image_documents, stats.public_documents),
+                         (3, 2, 1, 3))
+        ids = {row['id'] for row in self.client.get('/api/documents/?search=mitochondria').json()['results']}
+        self.assertEqual(len(ids), 2)
+
+    def test_all_invalid(self):
+        response = self.post([SimpleUploadedFile('a.exe', b'MZ')])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Document.objects.count(), 0)
+        self.assertEqual(self.client.post('/api/documents/bulk/', {}, format='multipart').status_code, 400)
+
+    def test_queries_do_not_grow_with_file_count(self):
+        # The first upload also creates the stats row
+        self.post(self.text_files(1, 'first'))
+        counts = []
+        for count, prefix in ((2, 'small'), (20, 'large')):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post('/api/documents/bulk/', {'files': self.text_files(count, prefix)},
+                                            format='multipart')
+            self.assertEqual(response.status_code, 201)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+
+@override_settings(**TEST_SETTINGS)
+class DocumentBulkOperationTests(TestCase):
+    def setUp(self):
+        self.owner = create_user('owner')
+        self.other = create_user('other')
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def upload(self, count, prefix='notes', **data):
+        files = [SimpleUploadedFile(f'{prefix}-{i}.txt', f'{prefix} body {i}'.encode()) for i in range(count)]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/documents/bulk/', {'files': files, **data}, format='multipart')
+        self.assertEqual(response.status_code, 201, response.content)
+        ids = [row['document']['id'] for row in response.json()['results']]
+        return Document.objects.filter(pk__in=ids).order_by('pk')
+
+    def post(self, action, data):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(f'/api/documents/bulk/{action}/', data, format='json')
+
+    def test_delete_by_ids(self):
+        documents = list(self.upload(3))
+        # A second copy of the first file keeps its blob alive
+        kept = self.upload(1).get()
+        foreign = create_document(self.other, title='Not yours')
+        paths = [document.file.path for document in documents]
+
+        response = self.post('delete', {'ids': [document.pk for document in documents] + [foreign.pk, 999999]})
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json(), {'deleted': 3, 'not_found': sorted([foreign.pk, 999999])})
+
+        self.assertEqual(list(Document.objects.filter(user=self.owner)), [kept])
+        self.assertTrue(Document.objects.filter(pk=foreign.pk).exists())
+        self.assertEqual([os.path.exists(path) for path in paths], [True, False, False])
+        self.assertEqual(DocumentBlob.objects.get(pk=kept.blob_id).ref_count, 1)
+        stats = DocumentStats.objects.get(user=self.owner)
+        self.assertEqual((stats.total_documents, stats.text_documents), (1, 1))
+        results = self.client.get('/api/documents/?search=notes').json()['results']
+        self.assertEqual([row['id'] for row in results], [kept.pk])
+
+    def test_update_by_filter(self):
+        self.upload(2, 'draft', tags='draft, week1')
+        self.upload(1, 'final', tags='final')
+
+        response = self.post('update', {
+            'filter': {'tag': ['draft']}, 'is_public': True, 'add_tags': 'reviewed', 'remove_tags': ['week1'],
+        })
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json(), {'matched': 2, 'updated': 2, 'not_found': []})
+
+        drafts = Document.objects.filter(title__startswith='draft')
+        self.assertTrue(all(document.is_public for document in drafts))
+        self.assertEqual(set(drafts.values_list('tags__name', flat=True)), {'draft', 'reviewed'})
+        self.assertFalse(Document.objects.get(title__startswith='final').is_public)
+        self.assertEqual(DocumentStats.objects.get(user=self.owner).public_documents, 2)
+        results = self.client.get('/api/documents/?search=reviewed').json()['results']
+        self.assertEqual(len(results), 2)
+
+        # Repeating the change matches the same documents but changes none
+        response = self.post('update', {'filter': {'tag': ['draft']}, 'is_public': True, 'add_tags': 'reviewed'})
+        self.assertEqual(response.json()['updated'], 0)
+        response = self.post('update', {'filter': {}, 'tags': []})
+        self.assertEqual(response.json(), {'matched': 3, 'updated': 3, 'not_found': []})
+        self.assertFalse(Document.objects.filter(tags__isnull=False).exists())
+
+    def test_invalid_selection(self):
+        for data in ({}, {'ids': [1], 'filter': {}}, {'ids': []}, {'ids': [1], 'tags': 'a', 'add_tags': 'b'}):
+            self.assertEqual(self.post('update', {'is_public': True, **data}).status_code, 400, data)
+        self.assertEqual(self.post('update', {'ids': [1]}).status_code, 400)
+        self.assertEqual(self.post('delete', {'filter': {'type': 'VIDEO'}}).status_code, 400)
+
+    def test_queries_do_not_grow_with_document_count(self):
+        # Creating a tag costs extra queries the first time only
+        DocumentTag.objects.resolve(['old', 'new'])
+        counts = []
+        for count, prefix in ((2, 'small'), (20, 'large')):
+            ids = list(self.upload(count, prefix, tags='old').values_list('pk', flat=True))
+            with CaptureQueriesContext(connection) as queries:
+                self.post('update', {'ids': ids, 'is_public': True, 'tags': 'new'})
+                self.post('delete', {'ids': ids})
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+
+@override_settings(**TEST_SETTINGS)
+class DocumentBlobReferenceTests(TestCase):
+    def setUp(self):
+        self.owner = create_user('owner')
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def upload(self, name, content):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                '/api/documents/', {'title': name, 'file': SimpleUploadedFile(name, content)}, format='multipart',
+            )
+        self.assertEqual(response.status_code, 201, response.content)
+        return Document.objects.select_related('blob').get(pk=response.json()['id'])
+
+    def test_identical_uploads_share_a_blob_until_the_last_delete(self):
+        first = self.upload('first.txt', b'shared bytes')
+        second = self.upload('second.txt', b'shared bytes')
+        self.assertEqual(first.blob_id, second.blob_id)
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertEqual(DocumentBlob.objects.get().ref_count, 2)
+        self.assertEqual(second.original_filename, 'second.txt')
+        path = first.file.path
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/api/documents/{first.pk}/')
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(DocumentBlob.objects.get().ref_count, 1)
+        self.assertFalse(PendingFileDeletion.objects.exists())
+
+        # The file is queued for removal with the delete, and removed once it commits
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.client.delete(f'/api/documents/{second.pk}/')
+        self.assertFalse(DocumentBlob.objects.exists())
+        self.assertIn(second.file.name, PendingFileDeletion.objects.values_list('name', flat=True))
+        self.assertTrue(os.path.exists(path))
+        for callback in callbacks:
+            callback()
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(PendingFileDeletion.objects.exists())
+
+    def test_batch_release_counts_every_reference(self):
+        documents = [self.upload(f'copy-{i}.txt', b'three copies') for i in range(3)]
+        path = documents[0].file.path
+        with self.captureOnCommitCallbacks(execute=True):
+            Document.objects.filter(pk__in=[documents[0].pk, documents[1].pk]).delete()
+        self.assertEqual(DocumentBlob.objects.get().ref_count, 1)
+        self.assertTrue(os.path.exists(path))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Document.objects.filter(pk=documents[2].pk).delete()
+        self.assertFalse(DocumentBlob.objects.exists())
+        self.assertFalse(os.path.exists(path))
+
+    def test_release_never_unlinks_a_referenced_blob(self):
+        document = self.upload('notes.txt', b'still in use')
+        # A drifted count must not make the blob look unreferenced
+        DocumentBlob.objects.update(ref_count=1)
+        self.assertIsNone(DocumentBlob.objects.release(document.blob_id))
+        self.assertEqual(DocumentBlob.objects.get().ref_count, 1)
+        self.assertEqual(DocumentBlob.objects.release_many({document.blob_id: 1}), [])
+        self.assertTrue(os.path.exists(document.file.path))
+
+    def test_failed_upload_releases_its_reference(self):
+        kept = self.upload('kept.txt', b'shared bytes')
+        failing = mock.patch('documents.stats.document_saved', side_effect=DatabaseError('disk full'))
+        for name, content in (('copy.txt', b'shared bytes'), ('new.txt', b'never stored')):
+            with self.subTest(name=name), failing, self.assertRaises(DatabaseError):
+                self.client.post('/api/documents/', {'title': name, 'file': SimpleUploadedFile(name, content)},
+                                 format='multipart')
+        self.assertEqual(list(Document.objects.values_list('pk', flat=True)), [kept.pk])
+        self.assertEqual(list(DocumentBlob.objects.values_list('sha256', 'ref_count')), [(kept.sha256, 1)])
+        # The new bytes reached storage before the insert failed, and were removed again
+        self.assertFalse(default_storage.exists(blob_path(hashlib.sha256(b'never stored').hexdigest(), 'new.txt')))
+        self.assertTrue(default_storage.exists(kept.file.name))
+        orphans = {mismatch.name for mismatch in find_mismatches(min_age=0) if mismatch.kind == 'orphan'}
+        self.assertNotIn(kept.file.name, orphans)
+
+    def test_failed_bulk_upload_removes_new_files(self):
+        kept = self.upload('kept.txt', b'shared bytes')
+        failing = mock.patch('documents.stats.apply_documents_delta', side_effect=DatabaseError('disk full'))
+        files = [SimpleUploadedFile('copy.txt', b'shared bytes'), SimpleUploadedFile('new.txt', b'bulk never stored')]
+        with failing, self.assertRaises(DatabaseError):
+            self.client.post('/api/documents/bulk/', {'files': files}, format='multipart')
+        self.assertEqual(list(DocumentBlob.objects.values_list('sha256', 'ref_count')), [(kept.sha256, 1)])
+        self.assertFalse(default_storage.exists(blob_path(hashlib.sha256(b'bulk never stored').hexdigest(), 'new.txt')))
+        self.assertTrue(default_storage.exists(kept.file.name))
+
+
+@override_settings(**TEST_SETTINGS)
+class DeferredFileDeletionTests(TestCase):
+    def setUp(self):
+        self.owner = create_user('owner')
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def upload(self, name, content):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                '/api/documents/', {'title': name, 'file': SimpleUploadedFile(name, content)}, format='multipart',
+            )
+        self.assertEqual(response.status_code, 201, response.content)
+        return Document.objects.get(pk=response.json()['id'])
+
+    def test_queryset_and_cascade_deletes_remove_files(self):
+        first = self.upload('first.txt', b'queryset delete')
+        second = self.upload('second.txt', b'user delete')
+        with self.captureOnCommitCallbacks(execute=True):
+            Document.objects.filter(pk=first.pk).delete()
+        self.assertFalse(os.path.exists(first.file.path))
+        self.assertTrue(os.path.exists(second.file.path))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.owner.delete()
+        self.assertFalse(os.path.exists(second.file.path))
+        self.assertFalse(DocumentBlob.objects.exists())
+        self.assertFalse(PendingFileDeletion.objects.exists())
+
+    def test_failed_removals_are_retried(self):
+        document = self.upload('notes.txt', b'retry me')
+        failing = mock.patch('documents.processing.remove_stored_files',
+                             side_effect=lambda entries: ['busy'] * len(entries))
+        with failing, self.assertLogs('documents.processing', 'WARNING'):
+            with self.captureOnCommitCallbacks(execute=True):
+                document.delete()
+        self.assertTrue(os.path.exists(document.file.path))
+        deletions = PendingFileDeletion.objects.all()
+        self.assertEqual([(deletion.attempts, deletion.last_error) for deletion in deletions], [(1, 'busy')] * 2)
+        # Backing off: not due yet
+        self.assertEqual(reap_file_deletions(), (0, 0))
+
+        deletions.update(not_before=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(reap_file_deletions(batch_size=1), (2, 0))
+        self.assertFalse(os.path.exists(document.file.path))
+        self.assertFalse(PendingFileDeletion.objects.exists())
+
+    def test_reupload_before_removal_keeps_the_file(self):
+        document = self.upload('notes.txt', b'uploaded twice')
+        # The removal is queued but its on-commit dispatch never runs
+        document.delete()
+        self.assertEqual(PendingFileDeletion.objects.count(), 2)
+        again = self.upload('notes-again.txt', b'uploaded twice')
+        self.assertEqual(again.file.name, document.file.name)
+        self.assertFalse(PendingFileDeletion.objects.exists())
+
+        # Rows queued for a name that is in use again are dropped rather than removed
+        PendingFileDeletion.objects.enqueue(*blob_storage_names(again.sha256, again.file.name))
+        PendingFileDeletion.objects.update(not_before=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(reap_file_deletions(), (0, 0))
+        self.assertTrue(os.path.exists(again.file.path))
+        self.assertFalse(PendingFileDeletion.objects.exists())
+        with open(again.file.path, 'rb') as f:
+            self.assertEqual(f.read(), b'uploaded twice')
+
+
+@override_settings(**TEST_SETTINGS)
+class StorageReconciliationTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=self.media)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.owner = create_user('owner')
+
+    def store(self, name, age=7200):
+        path = os.path.join(self.media, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(b'x')
+        stamp = time.time() - age
+        os.utime(path, (stamp, stamp))
+        return path
+
+    def test_finds_orphans_and_missing_files(self):
+        sha = 'ab' * 32
+        blob = DocumentBlob.objects.create(sha256=sha, file=f'blobs/ab/ab/{sha}.txt', size=1, ref_count=1,
+                                           derivatives=['thumbnail'], derivatives_version=DERIVATIVE_VERSION)
+        create_document(self.owner, file=blob.file.name, blob=blob)
+        legacy = create_document(self.owner, title='Legacy', file='documents/1/missing.txt')
+        self.store(blob.file.name)
+        orphan = self.store('blobs/cd/cd/' + 'cd' * 32 + '.txt')
+        fresh = self.store('blobs/ef/ef/' + 'ef' * 32 + '.txt', age=0)
+        stale_upload = self.store('.incoming/tmp123.upload.txt')
+        old_version = self.store('derivatives/v0/ab/ab/' + sha + '/thumbnail.webp')
+
+        mismatches = {(m.kind, m.name, m.source, m.object_id) for m in find_mismatches(root=self.media)}
+        self.assertEqual(mismatches, {
+            ('orphan', os.path.relpath(orphan, self.media), 'storage', None),
+            ('orphan', '.incoming/tmp123.upload.txt', 'storage', None),
+            ('orphan', 'derivatives/v0', 'storage', None),
+            ('missing', 'documents/1/missing.txt', 'document', legacy.pk),
+            ('missing', derivative_directory(sha), 'derivatives', blob.pk),
+        })
+
+        call_command('reconcile_storage', '--delete-orphans', '--reset-missing-derivatives', stdout=io.StringIO())
+        self.assertFalse(any(os.path.exists(path) for path in (orphan, stale_upload, old_version)))
+        self.assertTrue(os.path.exists(fresh))
+        self.assertTrue(os.path.exists(os.path.join(self.media, blob.file.name)))
+        self.assertEqual(DocumentBlob.objects.get(pk=blob.pk).derivatives_version, 0)
+        self.assertFalse(PendingFileDeletion.objects.exists())
+
+
+@override_settings(**TEST_SETTINGS, RELATED_DOCUMENTS={'ENABLED': True, 'REFRESH_INTERVAL': 0})
+class RelatedDocumentTests(TestCase):
+    def setUp(self):
+        related_index.clear()
+        self.addCleanup(related_index.clear)
+        self.owner = create_user('owner')
+        self.other = create_user('other')
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def create(self, user, title, text, **kwargs):
+        return create_document(user, title=title, extracted_text=text, **kwargs)
+
+    def related(self, document):
+        response = self.client.get(f'/api/documents/{document.pk}/related/')
+        self.assertEqual(response.status_code, 200, response.content)
+        return [row['title'] for row in response.json()['results']]
+
+    def test_ranks_readable_documents_by_similarity(self):
+        source = self.create(self.owner, 'Source', 'photosynthesis chlorophyll sunlight glucose leaves plants')
+        self.create(self.owner, 'Close', 'photosynthesis chlorophyll sunlight glucose leaves')
+        self.create(self.owner, 'Partial', 'photosynthesis chlorophyll mitochondria enzymes')
+        self.create(self.owner, 'Unrelated', 'medieval castles knights armour')
+        self.create(self.other, 'Public', 'photosynthesis sunlight glucose', is_public=True)
+        shared = self.create(self.other, 'Shared', 'chlorophyll leaves plants')
+        DocumentShare.objects.create(document=shared, shared_with=self.owner, shared_by=self.other)
+        self.create(self.other, 'Private', 'photosynthesis chlorophyll sunlight glucose leaves plants')
+        self.create(self.owner, 'Failed', 'photosynthesis chlorophyll sunlight glucose leaves', status='FAILED')
+        call_command('rebuild_related_index', stdout=io.StringIO())
+
+        titles = self.related(source)
+        self.assertEqual(titles[0], 'Close')
+        self.assertEqual(set(titles), {'Close', 'Partial', 'Public', 'Shared'})
+
+    def test_deleted_and_inaccessible_documents(self):
+        source = self.create(self.owner, 'Source', 'algebra matrices vectors eigenvalues')
+        similar = self.create(self.owner, 'Similar', 'algebra matrices vectors')
+        private = self.create(self.other, 'Private', 'algebra matrices')
+        call_command('rebuild_related_index', stdout=io.StringIO())
+        self.assertEqual(self.related(source), ['Similar'])
+
+        # Deleted after the index was loaded
+        similar.delete()
+        self.assertEqual(self.related(source), [])
+        self.assertEqual(self.client.get(f'/api/documents/{private.pk}/related/').status_code, 403)
+
+    @override_settings(RELATED_DOCUMENTS={})
+    def test_disabled_by_default(self):
+        source = self.create(self.owner, 'Source', 'algebra matrices vectors eigenvalues')
+        self.assertEqual(self.client.get(f'/api/documents/{source.pk}/related/').status_code, 404)
+
+
+GENERATION_SETTINGS = {'PROVIDER': 'documents.providers.FakeProvider', 'TIMEOUT': 1, 'FOLLOWER_WAIT': 0.1}
+
+
+@override_settings(**TEST_SETTINGS, AI_GENERATION=GENERATION_SETTINGS)
+class DocumentGenerationTests(TestCase):
+    def setUp(self):
+        self.owner = create_user('owner')
+        self.other = create_user('other')
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+        self.document = create_document(self.owner, extracted_text='Cells divide by mitosis and meiosis.')
+
+    def generate(self, document, task, **data):
+        return self.client.post(f'/api/documents/{document.pk}/generate/{task}/', data, format='json')
+
+    def test_results_are_cached_by_content(self):
+        with mock.patch.object(FakeProvider, 'generate', autospec=True, side_effect=FakeProvider.generate) as provider:
+            first = self.generate(self.document, 'summary')
+            again = self.generate(self.document, 'summary')
+            # Another user's copy of the same text shares the result
+            copy = create_document(self.other, title='Copy', extracted_text=self.document.extracted_text,
+                                   is_public=True)
+            from_copy = self.generate(copy, 'summary')
+            cards = self.generate(self.document, 'flashcards', count=5)
+        self.assertEqual(first.status_code, 200, first.content)
+        self.assertEqual((first.json()['cached'], again.json()['cached'], from_copy.json()['cached']),
+                         (False, True, True))
+        self.assertEqual(first.json()['result'], from_copy.json()['result'])
+        self.assertIn('main_sections', first.json()['result'])
+        self.assertEqual(len(cards.json()['result']), 5)
+        self.assertEqual(provider.call_count, 2)
+
+    def test_errors(self):
+        processing = create_document(self.owner, title='Processing', status='PROCESSING')
+        private = create_document(self.other, title='Private', extracted_text='Secret')
+        self.assertEqual(self.generate(processing, 'summary').status_code, 409)
+        self.assertEqual(self.generate(private, 'summary').status_code, 403)
+        self.assertEqual(self.generate(self.document, 'essay').status_code, 404)
+        self.assertEqual(self.generate(self.document, 'quiz', count=0).status_code, 400)
+
+        failing = mock.patch.object(FakeProvider, 'generate', side_effect=GenerationError('down'))
+        with failing, self.assertLogs('documents.views', 'WARNING'):
+            self.assertEqual(self.generate(self.document, 'quiz').status_code, 502)
+        # The claim is released so the next request tries again
+        self.assertFalse(GeneratedContent.objects.exists())
+        self.assertEqual(self.generate(self.document, 'quiz').status_code, 200)
+
+    def test_malformed_items_are_rejected(self):
+        card = {'question': 'What divides?', 'answer': 'Cells', 'difficulty_level': 'easy', 'category': 'Biology'}
+        malformed = {'flashcards': [card, {'question': 'No answer', 'difficulty_level': 'easy', 'category': 'x'}]}
+        with mock.patch.object(FakeProvider, 'generate', return_value=malformed), \
+                self.assertLogs('documents.views', 'WARNING'):
+            self.assertEqual(self.generate(self.document, 'flashcards', count=2, save=True).status_code, 502)
+        self.assertFalse(GeneratedContent.objects.exists())
+        self.assertFalse(Flashcard.objects.exists())
+
+        # A malformed result cached earlier is generated again instead of being served
+        content_sha256 = hashlib.sha256(self.document.extracted_text.encode()).hexdigest()
+        GeneratedContent.objects.create(
+            key=cache_key(content_sha256, 'flashcards', 2, 'fake', 1), task='flashcards', model='fake',
+            prompt_version=1, content_sha256=content_sha256, status='READY', result=malformed['flashcards'],
+            size=100, last_used_at=timezone.now(),
+        )
+        response = self.generate(self.document, 'flashcards', count=2, save=True)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual((response.json()['cached'], response.json()['saved']), (False, 2))
+
+    def test_claims_held_by_other_workers(self):
+        content_sha256 = hashlib.sha256(self.document.extracted_text.encode()).hexdigest()
+        key = cache_key(content_sha256, 'summary', None, 'fake', 1)
+        claim = GeneratedContent.objects.create(
+            key=key, task='summary', model='fake', prompt_version=1, content_sha256=content_sha256,
+            claimed_until=timezone.now() + timedelta(minutes=5),
+        )
+        # The follower is told to come back rather than waiting out the whole generation
+        started = time.monotonic()
+        response = self.generate(self.document, 'summary')
+        self.assertEqual(response.status_code, 202, response.content)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(response.json(), {'status': 'pending', 'retry_after': 0.1})
+        self.assertLess(time.monotonic() - started, 1)
+
+        # So is a request waiting on an identical one in this process
+        future = Future()
+        with mock.patch.dict('documents.generation._inflight', {key: future}):
+            self.assertEqual(self.generate(self.document, 'summary').status_code, 202)
+
+        # An expired claim is taken over
+        GeneratedContent.objects.filter(pk=claim.pk).update(claimed_until=timezone.now() - timedelta(seconds=1))
+        response = self.generate(self.document, 'summary')
+        self.assertEqual(response.json()['cached'], False)
+        self.assertEqual(GeneratedContent.objects.get().status, 'READY')
+
+    def test_least_recently_used_results_are_evicted(self):
+        now = timezone.now()
+        for i in range(4):
+            GeneratedContent.objects.create(
+                key=str(i), task='summary', model='fake', prompt_version=1, content_sha256=str(i),
+                status='READY', result={}, size=100, last_used_at=now - timedelta(minutes=10 - i),
+            )
+        self.assertEqual(evict(max_bytes=300), 2)
+        self.assertEqual(sorted(GeneratedContent.objects.values_list('key', flat=True)), ['2', '3'])
+
+
+@override_settings(**TEST_SETTINGS, AI_GENERATION={**GENERATION_SETTINGS, 'FAKE_DELAY': 0.2, 'TIMEOUT': 5, 'FOLLOWER_WAIT': 5})
+class DocumentGenerationSingleFlightTests(TransactionTestCase):
+    def test_concurrent_identical_requests_call_the_provider_once(self):
+        owner = create_user('owner')
+        document = create_document(owner, extracted_text='Photosynthesis turns light into sugar.')
+        responses = []
+        # The in-memory test database fails rather than waits when a read meets a write,
+        # so the followers arrive while the leader is in the provider and it returns once
+        # they all wait on its result
+        generating = threading.Event()
+        gathered = threading.Barrier(4, timeout=5)
+        generate = FakeProvider.generate
+
+        def provider_call(*args):
+            generating.set()
+            gathered.wait()
+            return generate(*args)
+
+        class FollowedFuture(Future):
+            def result(self, timeout=None):
+                gathered.wait()
+                return super().result(timeout)
+
+        def request():
+            client = APIClient()
+            client.force_authenticate(owner)
+            responses.append(client.post(f'/api/documents/{document.pk}/generate/quiz/', {}, format='json'))
+            connection.close()
+
+        with mock.patch.object(FakeProvider, 'generate', autospec=True, side_effect=provider_call) as provider, \
+                mock.patch('documents.generation.Future', FollowedFuture):
+            threads = [threading.Thread(target=request) for _ in range(4)]
+            threads[0].start()
+            self.assertTrue(generating.wait(5))
+            for thread in threads[1:]:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(provider.call_count, 1)
+        self.assertEqual(sorted(response.status_code for response in responses), [200] * 4)
+        self.assertEqual(sorted(response.json()['cached'] for response in responses), [False, True, True, True])
+
+
+@override_settings(**TEST_SETTINGS, AI_GENERATION=GENERATION_SETTINGS)
+class StudyReviewQueueTests(TestCase):
+    def setUp(self):
+        self.owner = create_user('owner')
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+        self.document = create_document(self.owner, extracted_text='Enzymes lower activation energy.')
+
+    def due(self, kind):
+        response = self.client.get(f'/api/{kind}/due/')
+        self.assertEqual(response.status_code, 200, response.content)
+        return [row['id'] for row in response.json()['results']]
+
+    def test_sm2_intervals(self):
+        card = Flashcard(ease=2.5, interval=0, repetitions=0, lapses=0)
+        now = timezone.now()
+        intervals = []
+        for grade in (5, 5, 4, 1):
+            schedule = next_schedule(card, grade, now)
+            for field, value in schedule._asdict().items():
+                setattr(card, field, value)
+            intervals.append(card.interval)
+        self.assertEqual(intervals, [1, 6, 17, 0])
+        self.assertEqual((card.repetitions, card.lapses), (0, 1))
+        self.assertEqual(card.due_at, now + timedelta(minutes=10))
+        self.assertGreaterEqual(next_schedule(Flashcard(ease=1.3, interval=1, repetitions=3, lapses=0), 0, now).ease,
+                                1.3)
+
+    def test_generated_batches_are_saved_and_reviewed_in_batches(self):
+        response = self.client.post(f'/api/documents/{self.document.pk}/generate/flashcards/',
+                                    {'count': 3, 'save': True}, format='json')
+        self.assertEqual(response.json()['saved'], 3)
+        cards = list(Flashcard.objects.filter(user=self.owner).order_by('pk'))
+        self.assertEqual(self.due('flashcards'), [card.pk for card in cards])
+
+        stranger_card = Flashcard.objects.create(user=create_user('other'), question='Q', answer='A')
+        earlier = (timezone.now() - timedelta(hours=1)).isoformat()
+        # One read and one bulk update, inside a savepoint
+        with self.assertNumQueries(4):
+            response = self.client.post('/api/flashcards/reviews/', {'reviews': [
+                {'id': cards[0].pk, 'grade': 5},
+                {'id': cards[1].pk, 'grade': 1},
+                {'id': stranger_card.pk, 'grade': 5},
+            ]}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['not_found'], [stranger_card.pk])
+        self.assertEqual([row['interval'] for row in response.json()['reviewed']], [1, 0])
+        self.assertEqual(self.due('flashcards'), [cards[2].pk])
+
+        # A replayed review older than the last one is ignored
+        self.client.post('/api/flashcards/reviews/', {'reviews': [{'id': cards[0].pk, 'grade': 0,
+                                                                    'reviewed_at': earlier}]}, format='json')
+        cards[0].refresh_from_db()
+        self.assertEqual((cards[0].interval, cards[0].lapses), (1, 0))
+
+        # Wrong quiz answers send the question back for relearning
+        self.client.post(f'/api/documents/{self.document.pk}/generate/quiz/', {'count': 2, 'save': True},
+                         format='json')
+        right, wrong = Quiz.objects.order_by('pk')
+        self.client.post('/api/quizzes/reviews/', {'reviews': [
+            {'id': right.pk, 'answer': right.correct_answer},
+            {'id': wrong.pk, 'answer': (wrong.correct_answer + 1) % 4},
+        ]}, format='json')
+        right.refresh_from_db()
+        wrong.refresh_from_db()
+        self.assertEqual((right.repetitions, right.lapses, wrong.repetitions, wrong.lapses), (1, 0, 0, 1))
+        self.assertEqual(self.client.post('/api/quizzes/reviews/', {'reviews': []}, format='json').status_code, 400)
+
+    def test_due_query_uses_the_composite_index(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('Query plan check is written for SQLite')
+        due = Flashcard.objects.filter(user=self.owner, due_at__lte=timezone.now()).order_by('due_at', 'id')[:20]
+        sql, params = due.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            plan = ' '.join(str(row[-1]) for row in cursor.fetchall())
+        self.assertIn('flashcard_due_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+
+@override_settings(**TEST_SETTINGS)
+class SeedDatasetTests(TestCase):
+    def seed(self, *args):
+        call_command('seed_dataset', '--users', '3', '--documents', '4', '--tags', '10', '--flashcards', '2',
+                     '--quizzes', '1', *args, stdout=io.StringIO())
+
+    def test_seeds_a_consistent_reproducible_dataset(self):
+        options = ('--files', '--images', '0.5')
+        self.seed(*options)
+        self.assertEqual(User.objects.count(), 3)
+        self.assertEqual(Token.objects.count(), 3)
+        self.assertEqual(Document.objects.count(), 12)
+        self.assertEqual((Flashcard.objects.count(), Quiz.objects.count()), (6, 3))
+        self.assertTrue(DocumentShare.objects.exists())
+        self.assertEqual(DocumentProcessingLog.objects.filter(message='Synthetic entry').count(), 36)
+        # Every seeded file made it to storage
+        self.assertEqual(list(find_mismatches()), [])
+        stats = DocumentStats.objects.get(user=User.objects.first())
+        self.assertEqual(stats.total_documents, 4)
+        document = Document.objects.filter(document_type='TEXT').first()
+        client = APIClient()
+        client.force_authenticate(document.user)
+        word = document.extracted_text.split()[1]
+        response = client.get('/api/documents/', {'search': word})
+        self.assertIn(document.pk, [row['id'] for row in response.json()['results']])
+        self.assertTrue(client.login(email=document.user.email, password='synthetic-password'))
+        titles = list(Document.objects.order_by('pk').values_list('title', flat=True))
+
+        with self.assertRaises(CommandError):
+            self.seed(*options)
+        User.objects.all().delete()
+        self.seed(*options)
+        self.assertEqual(list(Document.objects.order_by('pk').values_list('title', flat=True)), titles)
+
+
+@override_settings(**{**TEST_SETTINGS, 'CACHES': {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+}}, DATABASE_REPLICAS={'ALIASES': ['replica1'], 'STICKY_SECONDS': 60}, RESPONSE_CACHE={'ENABLED': False})
+class ReplicaRoutingTests(TransactionTestCase):
+    # Test cases run inside a transaction, where every read goes to the primary
+    def setUp(self):
+        self.owner = create_user('owner')
+        self.reader = create_user('reader')
+        self.document = create_document(self.owner, is_public=True)
+        # Creating them pinned the owner and the public catalog
+        cache.clear()
+
+    def read_aliases(self, user, path):
+        """GET ``path`` as ``user``; returns the aliases its reads were routed to, all run on the primary"""
+        aliases = []
+        route = ReplicaRouter.db_for_read
+
+        def record(router, model, **hints):
+            aliases.append(route(router, model, **hints))
+            return 'default'
+
+        client = APIClient()
+        client.force_authenticate(user)
+        with mock.patch.object(ReplicaRouter, 'db_for_read', record):
+            self.assertEqual(client.get(path).status_code, 200)
+        return set(aliases)
+
+    def test_reads_use_replicas_until_the_data_is_written(self):
+        self.assertEqual(self.read_aliases(self.owner, '/api/documents/'), {'replica1'})
+        self.assertEqual(self.read_aliases(self.owner, f'/api/documents/{self.document.pk}/'), {'replica1'})
+        self.assertEqual(self.read_aliases(self.reader, '/api/public-documents/'), {'replica1'})
+
+        client = APIClient()
+        client.force_authenticate(self.owner)
+        response = client.patch(f'/api/documents/{self.document.pk}/', {'title': 'Renamed'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        # The writer and every reader of the public catalog wait out the replication lag
+        self.assertEqual(self.read_aliases(self.owner, '/api/documents/stats/'), {'default'})
+        self.assertEqual(self.read_aliases(self.reader, '/api/public-documents/'), {'default'})
+        self.assertEqual(self.read_aliases(self.reader, '/api/auth/dashboard/'), {'replica1'})
+
+        cache.clear()
+        self.assertEqual(self.read_aliases(self.owner, '/api/documents/'), {'replica1'})
+
+    def test_writes_and_transactions_switch_reads_to_the_primary(self):
+        token = _read_alias.set('replica1')
+        try:
+            self.assertEqual(Document.objects.all().db, 'replica1')
+            with transaction.atomic():
+                self.assertEqual(Document.objects.all().db, 'default')
+            DocumentTag.objects.create(name='written')
+            self.assertEqual(Document.objects.all().db, 'default')
+        finally:
+            _read_alias.reset(token)
+
+    def test_connections_are_tuned(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 20000)
+        self.assertEqual(connection.transaction_mode, 'IMMEDIATE')
+
+
+async def read_streaming_content(response):
+    return b''.join([part async for part in response.streaming_content])
+
+
+@override_settings(**TEST_SETTINGS)
+class AsyncReadViewTests(TestCase):
+    content = bytes(range(256)) * 40
+
+    def setUp(self):
+        self.owner = create_user('owner')
+        self.token = Token.objects.create(user=self.owner)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.document = Document.objects.create(
+            user=self.owner, title='Slides', file=SimpleUploadedFile('slides.pdf', self.content), is_public=True,
+        )
+        self.document.set_tags(['exam', 'week-1'])
+        self.shared = create_document(create_user('other'), title='Shared with owner')
+        DocumentShare.objects.create(document=self.shared, shared_by=self.shared.user, shared_with=self.owner)
+
+    def get_async(self, view_class, path, token=None, **kwargs):
+        """GET ``path`` from the async variant of ``view_class``"""
+        headers = {'authorization': f'Token {token}'} if token else {}
+        request = AsyncRequestFactory().get(path, headers=headers)
+        return async_to_sync(view_class.as_async_view())(request, **kwargs)
+
+    def test_responses_and_queries_match_the_sync_views(self):
+        endpoints = [
+            (DocumentListView, '/api/documents/?tag=exam', {}),
+            (DocumentListView, '/api/documents/?search=slides&page_size=1', {}),
+            (DocumentDetailView, f'/api/documents/{self.document.pk}/', {'pk': self.document.pk}),
+            (PublicDocumentListView, '/api/public-documents/', {}),
+            (ProfileView, '/api/auth/profile/', {}),
+            (DocumentDownloadView, f'/api/documents/{self.shared.pk}/download/', {'pk': self.shared.pk}),
+        ]
+        # Both paths find the token cached after this
+        self.client.get('/api/auth/profile/')
+        for view_class, path, kwargs in endpoints:
+            with self.subTest(path=path):
+                with CaptureQueriesContext(connection) as sync_queries:
+                    expected = self.client.get(path)
+                with CaptureQueriesContext(connection) as async_queries:
+                    response = self.get_async(view_class, path, self.token.key, **kwargs)
+                self.assertEqual(response.status_code, 200)
+                data = json.loads(response.content)
+                if 'download_url' in data:
+                    # Signatures carry a timestamp
+                    data['download_url'] = data['download_url'].split('?')[0]
+                    expected = {**expected.json(), 'download_url': expected.json()['download_url'].split('?')[0]}
+                else:
+                    expected = expected.json()
+                self.assertEqual(data, expected)
+                self.assertEqual(len(async_queries), len(sync_queries))
+
+    def test_authentication_and_permissions(self):
+        self.assertEqual(self.get_async(DocumentListView, '/api/documents/').status_code, 403)
+        self.assertEqual(self.get_async(DocumentListView, '/api/documents/', 'not-a-token').status_code, 403)
+
+        stranger = Token.objects.create(user=create_user('stranger')).key
+        url = f'/api/documents/{self.shared.pk}/'
+        self.assertEqual(self.get_async(DocumentDetailView, url, stranger, pk=self.shared.pk).status_code, 404)
+        response = self.get_async(DocumentDownloadView, f'{url}download/', stranger, pk=self.shared.pk)
+        self.assertEqual(response.status_code, 403)
+
+    def test_other_methods_run_the_sync_view(self):
+        request = AsyncRequestFactory().patch(
+            f'/api/documents/{self.document.pk}/', {'title': 'Renamed'}, content_type='application/json',
+            headers={'authorization': f'Token {self.token.key}'},
+        )
+        response = async_to_sync(DocumentDetailView.as_async_view())(request, pk=self.document.pk)
+        self.assertEqual(response.status_code, 200)
+        self.document.refresh_from_db()
+        self.assertEqual(self.document.title, 'Renamed')
+
+    def test_files_stream_asynchronously(self):
+        url = f'/api/documents/{self.document.pk}/file/'
+        request = AsyncRequestFactory().get(url, headers={
+            'authorization': f'Token {self.token.key}', 'range': 'bytes=100-5099',
+        })
+        response = async_to_sync(DocumentFileView.as_async_view())(request, pk=self.document.pk)
+        self.assertEqual(response.status_code, 206)
+        self.assertTrue(response.is_async)
+        self.assertEqual(response['Content-Length'], '5000')
+        self.assertEqual(async_to_sync(read_streaming_content)(response), self.content[100:5100])
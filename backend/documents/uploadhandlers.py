@@ -0,0 +1,177 @@
+"""
+Single-pass upload ingest.
+
+The handler streams each uploaded file to a temporary file inside
+``MEDIA_ROOT`` in fixed-size chunks, computing the byte count, SHA-256 digest
+and magic-byte document type as the chunks go by. Because the temporary file
+lives on the same filesystem as the storage, saving it is a rename rather
+than another copy, and nothing needs to seek back over the data.
+
+Files over ``DOCUMENT_UPLOAD['MAX_SIZE']`` are cut off as soon as the limit
+is crossed: the partial file is deleted, the rest of the stream is dropped
+and the upload is flagged so validation can reject it. Validation also
+rejects files whose leading bytes do not match their extension. If the
+request body breaks off mid-upload, :class:`IngestMultiPartParser` deletes
+the partial temporary file before re-raising.
+"""
+import hashlib
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from rest_framework.parsers import MultiPartParser
+
+INGEST_CHUNK_SIZE = 64 * 1024
+INGEST_DIRECTORY = '.incoming'
+SNIFF_LENGTH = 16
+
+# Leading bytes each extension's files must start with; other extensions must not look like any of them
+EXTENSION_MAGIC_NUMBERS = {
+    'pdf': (b'%PDF-',),
+    'png': (b'\x89PNG\r\n\x1a\n',),
+    'jpg': (b'\xff\xd8\xff',),
+    'jpeg': (b'\xff\xd8\xff',),
+    'gif': (b'GIF87a', b'GIF89a'),
+    'docx': (b'PK\x03\x04',),
+    'doc': (b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1',),
+}
+
+MAGIC_NUMBERS = [
+    (b'%PDF-', 'PDF'),
+    (b'\x89PNG\r\n\x1a\n', 'IMAGE'),
+    (b'\xff\xd8\xff', 'IMAGE'),
+    (b'GIF87a', 'IMAGE'),
+    (b'GIF89a', 'IMAGE'),
+]
+
+
+def sniff_document_type(head):
+    """Return the document type implied by the leading bytes of a file"""
+    for magic, document_type in MAGIC_NUMBERS:
+        if head.startswith(magic):
+            return document_type
+    return 'TEXT'
+
+
+def matches_extension(name, head):
+    """Whether the leading bytes of a file agree with the extension of its name"""
+    extension = os.path.splitext(name)[1].lstrip('.').lower()
+    expected = EXTENSION_MAGIC_NUMBERS.get(extension)
+    if expected is None:
+        return not any(head.startswith(magic) for magics in EXTENSION_MAGIC_NUMBERS.values() for magic in magics)
+    return head.startswith(expected)
+
+
+def get_upload_settings():
+    defaults = {'MAX_SIZE': 100 * 1024 * 1024}
+    defaults.update(getattr(settings, 'DOCUMENT_UPLOAD', {}))
+    return defaults
+
+
+def get_ingest_directory():
+    path = os.path.join(settings.MEDIA_ROOT, INGEST_DIRECTORY)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+class IngestedUploadedFile(TemporaryUploadedFile):
+    """A temporary upload that carries the digest and type computed while streaming"""
+
+    def __init__(self, name, content_type, size, charset, content_type_extra=None):
+        _, ext = os.path.splitext(name)
+        file = tempfile.NamedTemporaryFile(suffix='.upload' + ext, dir=get_ingest_directory())
+        super(TemporaryUploadedFile, self).__init__(
+            file, name, content_type, size, charset, content_type_extra
+        )
+        self.sha256 = None
+        self.detected_type = None
+        self.head = None
+        self.too_large = False
+
+
+class StreamingIngestUploadHandler(TemporaryFileUploadHandler):
+    """
+    Stream uploads to disk while hashing and sniffing them in the same pass
+    """
+    chunk_size = INGEST_CHUNK_SIZE
+
+    def new_file(self, *args, **kwargs):
+        super(TemporaryFileUploadHandler, self).new_file(*args, **kwargs)
+        self.file = IngestedUploadedFile(
+            self.file_name, self.content_type, 0, self.charset, self.content_type_extra
+        )
+        self.hasher = hashlib.sha256()
+        self.head = b''
+        self.max_size = get_upload_settings()['MAX_SIZE']
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.file.too_large:
+            return None
+        if start + len(raw_data) > self.max_size:
+            # Closing the temporary file deletes what was written so far
+            self.file.too_large = True
+            self.file.close()
+            return None
+        if len(self.head) < SNIFF_LENGTH:
+            self.head += raw_data[:SNIFF_LENGTH - len(self.head)]
+        self.hasher.update(raw_data)
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        self.file.size = file_size
+        if self.file.too_large:
+            return self.file
+        self.file.seek(0)
+        self.file.sha256 = self.hasher.hexdigest()
+        self.file.head = self.head
+        self.file.detected_type = sniff_document_type(self.head)
+        return self.file
+
+
+class IngestMultiPartParser(MultiPartParser):
+    """
+    DRF's multipart parser, cleaning up the in-progress upload when parsing fails
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return super().parse(stream, media_type, parser_context)
+        except Exception:
+            # Django only closes files that were completed; the one being streamed is ours to remove
+            for handler in parser_context['request'].upload_handlers:
+                handler.upload_interrupted()
+            raise
+
+
+def upload_head(file_obj):
+    """The first ``SNIFF_LENGTH`` bytes of an upload, read only if the ingest pass did not keep them"""
+    head = getattr(file_obj, 'head', None)
+    if head is None:
+        file_obj.seek(0)
+        head = file_obj.read(SNIFF_LENGTH)
+        file_obj.seek(0)
+    return head
+
+
+def describe_upload(file_obj):
+    """
+    Return ``(size, sha256, document_type)`` for an uploaded file.
+
+    Files that came through :class:`StreamingIngestUploadHandler` already
+    carry these values; anything else (e.g. in-memory uploads from other
+    handlers) is hashed with one read over its chunks.
+    """
+    sha256 = getattr(file_obj, 'sha256', None)
+    detected_type = getattr(file_obj, 'detected_type', None)
+    if sha256 and detected_type:
+        return file_obj.size, sha256, detected_type
+
+    hasher = hashlib.sha256()
+    head = b''
+    for chunk in file_obj.chunks(INGEST_CHUNK_SIZE):
+        if len(head) < SNIFF_LENGTH:
+            head += chunk[:SNIFF_LENGTH - len(head)]
+        hasher.update(chunk)
+    return file_obj.size, hasher.hexdigest(), sniff_document_type(head)
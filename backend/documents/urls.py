@@ -4,14 +4,23 @@ from . import views
 urlpatterns = [
     # Document management
     path('documents/', views.DocumentListView.as_view(), name='document_list'),
+    path('documents/bulk/', views.DocumentBulkUploadView.as_view(), name='document_bulk_upload'),
+    path('documents/bulk/delete/', views.DocumentBulkDeleteView.as_view(), name='document_bulk_delete'),
+    path('documents/bulk/update/', views.DocumentBulkUpdateView.as_view(), name='document_bulk_update'),
     path('documents/<int:pk>/', views.DocumentDetailView.as_view(), name='document_detail'),
     path('documents/<int:pk>/download/', views.DocumentDownloadView.as_view(), name='document_download'),
+    path('documents/<int:pk>/file/', views.DocumentFileView.as_view(), name='document_file'),
+    path('documents/<int:pk>/generate/<str:task>/', views.DocumentGenerationView.as_view(), name='document_generate'),
+    path('documents/<int:pk>/related/', views.DocumentRelatedView.as_view(), name='document_related'),
+    path('documents/<int:pk>/derivatives/<str:kind>/', views.DocumentDerivativeView.as_view(),
+         name='document_derivative'),
     
     # Document statistics
     path('documents/stats/', views.DocumentStatsView.as_view(), name='document_stats'),
     
     # Document tags
     path('tags/', views.DocumentTagListView.as_view(), name='document_tag_list'),
+    path('tags/facets/', views.DocumentTagFacetView.as_view(), name='document_tag_facets'),
     path('tags/<int:pk>/', views.DocumentTagDetailView.as_view(), name='document_tag_detail'),
     
     # Document sharing
@@ -21,6 +30,16 @@ urlpatterns = [
     # Document processing logs
     path('documents/<int:document_id>/logs/', views.DocumentProcessingLogView.as_view(), name='document_processing_log'),
     
+    # Flashcards and quiz questions with their spaced-repetition review queues
+    path('flashcards/', views.FlashcardListView.as_view(), name='flashcard_list'),
+    path('flashcards/due/', views.FlashcardDueView.as_view(), name='flashcard_due'),
+    path('flashcards/reviews/', views.FlashcardReviewView.as_view(), name='flashcard_reviews'),
+    path('flashcards/<int:pk>/', views.FlashcardDetailView.as_view(), name='flashcard_detail'),
+    path('quizzes/', views.QuizListView.as_view(), name='quiz_list'),
+    path('quizzes/due/', views.QuizDueView.as_view(), name='quiz_due'),
+    path('quizzes/reviews/', views.QuizReviewView.as_view(), name='quiz_reviews'),
+    path('quizzes/<int:pk>/', views.QuizDetailView.as_view(), name='quiz_detail'),
+    
     # Public documents
     path('public-documents/', views.PublicDocumentListView.as_view(), name='public_document_list'),
 ] 
\ No newline at end of file
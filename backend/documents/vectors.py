@@ -0,0 +1,81 @@
+"""
+Dense text vectors for finding related documents, computed locally.
+
+Words are hashed straight into a small dense vector: each word adds its
+sublinear term frequency to ``HASHES_PER_WORD`` positions with a sign taken
+from the same digest, which is a sparse random projection of the word
+counts. Cosine similarity between two vectors then approximates cosine
+similarity between the documents' word counts. There is no vocabulary to
+fit and nothing to download, so a vector depends only on its own text and
+documents can be added one at a time.
+
+Like :mod:`documents.extraction`, this module must stay free of Django
+imports.
+"""
+import functools
+import hashlib
+import math
+import re
+from collections import Counter
+
+import numpy as np
+
+# Bump when the tokenizer or hashing changes so stored vectors are rebuilt
+VECTOR_VERSION = 1
+DIMENSIONS = 256
+HASHES_PER_WORD = 4
+# Long documents are cut so vectorizing stays fast; the start is representative enough
+MAX_TEXT_LENGTH = 200_000
+MIN_WORD_LENGTH = 3
+
+WORD_RE = re.compile(r'[^\W\d_]+', re.UNICODE)
+
+STOP_WORDS = frozenset('''
+    about above after again against all also and any are because been before being below between both but
+    can could did does doing down during each few for from further had has have having her here hers herself
+    him himself his how into its itself just more most myself nor not now off once only other our ours
+    ourselves out over own same she should some such than that the their theirs them themselves then there
+    these they this those through too under until very was were what when where which while who whom why
+    will with would you your yours yourself yourselves
+'''.split())
+
+
+@functools.lru_cache(maxsize=100_000)
+def word_positions(word):
+    """The positions and signs a word contributes to, derived from one digest"""
+    digest = hashlib.blake2b(word.encode(), digest_size=3 * HASHES_PER_WORD).digest()
+    positions = []
+    for i in range(HASHES_PER_WORD):
+        value = int.from_bytes(digest[3 * i:3 * i + 3], 'little')
+        positions.append((value % DIMENSIONS, 1.0 if value & 0x800000 else -1.0))
+    return positions
+
+
+def tokenize(text):
+    words = WORD_RE.findall((text or '')[:MAX_TEXT_LENGTH].lower())
+    return [word for word in words if len(word) >= MIN_WORD_LENGTH and word not in STOP_WORDS]
+
+
+def vectorize(text):
+    """Return the unit-length float32 vector of ``text``, or None when it has no words"""
+    counts = Counter(tokenize(text))
+    if not counts:
+        return None
+    vector = np.zeros(DIMENSIONS, dtype=np.float32)
+    for word, count in counts.items():
+        weight = 1.0 + math.log(count)
+        for position, sign in word_positions(word):
+            vector[position] += sign * weight
+    norm = np.linalg.norm(vector)
+    if not norm:
+        return None
+    return vector / norm
+
+
+def to_bytes(vector):
+    """Half precision is plenty for similarity ranking and halves the storage"""
+    return vector.astype(np.float16).tobytes()
+
+
+def from_bytes(data):
+    return np.frombuffer(data, dtype=np.float16).astype(np.float32)
@@ -1,158 +1,309 @@
+import logging
+import math
+import os
+
+from asgiref.sync import sync_to_async
 from rest_framework import status, permissions
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.parsers import MultiPartParser, FormParser
-from django.shortcuts import get_object_or_404
-from django.db.models import Sum, Count, Q
-from .models import Document, DocumentTag, DocumentShare, DocumentProcessingLog
+from rest_framework.parsers import FormParser
+from django.http import Http404, QueryDict
+from django.shortcuts import aget_object_or_404, get_object_or_404
+from django.urls import reverse
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+from gpa_backend.asyncviews import AsyncReadMixin
+from gpa_backend.db import ReplicaReadMixin
+from .bulk import create_documents, delete_documents, update_documents
+from .cache import cache_response, public_scope, request_user_scope
+from .delivery import (
+    get_delivery_settings, read_derivative_access, read_file_access, serve_document_file, serve_file,
+    sign_file_access,
+)
+from .derivatives import DERIVATIVE_SPECS, derivative_filename
+from .generation import TASKS, GenerationNotReady, GenerationPending, generate
+from .models import Document, DocumentTag, DocumentShare, DocumentProcessingLog, DocumentStats, Flashcard, Quiz
+from .pagination import KeysetPaginationMixin
+from .processing import schedule_document_processing
+from .providers import GenerationError, ProviderUnavailable
+from .related import get_related_settings, related_index
+from .search import get_search_backend
+from .study import apply_reviews, quiz_grade, save_generated
 from .serializers import (
-    DocumentSerializer, DocumentUploadSerializer, DocumentListSerializer,
-    DocumentUpdateSerializer, DocumentTagSerializer, DocumentShareSerializer,
-    DocumentProcessingLogSerializer, DocumentStatsSerializer
+    DocumentSerializer, DocumentUploadSerializer, DocumentBulkUploadSerializer, DocumentBulkSelectionSerializer,
+    DocumentBulkUpdateSerializer, DocumentListSerializer, DocumentUpdateSerializer, DocumentTagSerializer,
+    DocumentTagFacetSerializer, DocumentShareSerializer, DocumentProcessingLogSerializer, DocumentStatsSerializer,
+    RelatedDocumentSerializer, DocumentGenerationSerializer, FlashcardSerializer, QuizSerializer,
+    FlashcardReviewBatchSerializer, QuizAnswerBatchSerializer, wants_field,
 )
+from .uploadhandlers import IngestMultiPartParser
+
+logger = logging.getLogger(__name__)
+
+def filter_documents(documents, query_params):
+    """Apply the ``type``, ``status``, ``public`` and ``tag`` list filters"""
+    document_type = query_params.get('type')
+    status_filter = query_params.get('status')
+    is_public = query_params.get('public')
+    
+    if document_type:
+        documents = documents.filter(document_type=document_type.upper())
+    if status_filter:
+        documents = documents.filter(status=status_filter.upper())
+    if is_public is not None:
+        documents = documents.filter(is_public=is_public.lower() == 'true')
+    # Exact tag names; repeating ?tag= requires every tag
+    for tag in query_params.getlist('tag'):
+        documents = documents.filter(tags__name=tag.strip())
+    return documents
+
 
-class DocumentListView(APIView):
+def select_documents(user, selection):
+    """Return the user's documents picked by a validated bulk selection"""
+    # Filtering on the owner is the ownership check, in the same query as the work
+    documents = Document.objects.filter(user=user)
+    if 'ids' in selection:
+        return documents.filter(pk__in=selection['ids'])
+
+    params = QueryDict(mutable=True)
+    for key, value in selection['filter'].items():
+        if isinstance(value, bool):
+            value = 'true' if value else 'false'
+        params.setlist(key, value if isinstance(value, list) else [value])
+    documents = filter_documents(documents, params)
+    if params.get('search'):
+        documents = get_search_backend().search(documents, params['search'])
+    return documents
+
+
+def missing_ids(selection, found):
+    """Requested ids that are not among the user's documents"""
+    return sorted(set(selection.get('ids', ())) - set(found))
+
+
+class DocumentListView(ReplicaReadMixin, AsyncReadMixin, KeysetPaginationMixin, APIView):
     """
     List all documents or upload a new document
     """
     permission_classes = [permissions.IsAuthenticated]
-    parser_classes = [MultiPartParser, FormParser]
+    parser_classes = [IngestMultiPartParser, FormParser]
     
-    def get(self, request):
-        """Get list of user's documents"""
-        documents = Document.objects.filter(user=request.user)
+    def get_queryset(self, request):
+        documents = filter_documents(
+            Document.objects.filter(user=request.user).select_related('blob'), request.query_params,
+        )
         
-        # Filter parameters
-        document_type = request.query_params.get('type')
-        status_filter = request.query_params.get('status')
-        is_public = request.query_params.get('public')
         search = request.query_params.get('search')
-        
-        if document_type:
-            documents = documents.filter(document_type=document_type.upper())
-        if status_filter:
-            documents = documents.filter(status=status_filter.upper())
-        if is_public is not None:
-            documents = documents.filter(is_public=is_public.lower() == 'true')
         if search:
-            documents = documents.filter(
-                Q(title__icontains=search) | 
-                Q(description__icontains=search) |
-                Q(tags__icontains=search)
-            )
-        
-        serializer = DocumentListSerializer(documents, many=True)
-        return Response(serializer.data)
+            documents = get_search_backend().search(documents, search)
+        return documents
+    
+    @cache_response(request_user_scope)
+    def get(self, request):
+        """Get list of user's documents"""
+        return self.paginated_response(
+            self.get_queryset(request), DocumentListSerializer, context={'request': request},
+        )
+    
+    @cache_response(request_user_scope)
+    async def aget(self, request):
+        return await self.apaginated_response(
+            self.get_queryset(request), DocumentListSerializer, context={'request': request},
+        )
     
     def post(self, request):
         """Upload a new document"""
         serializer = DocumentUploadSerializer(data=request.data, context={'request': request})
         if serializer.is_valid():
             document = serializer.save()
-            # Update status to completed after successful upload
-            document.status = 'COMPLETED'
-            document.save()
+            DocumentProcessingLog.objects.create(
+                document=document,
+                operation='upload',
+                status='COMPLETED',
+                message=f'Stored {document.file_size} bytes',
+            )
+            # Extraction runs in the worker pool; the document stays PROCESSING until it finishes
+            schedule_document_processing(document)
             
             return Response(
-                DocumentSerializer(document).data,
+                DocumentSerializer(document, context={'request': request}).data,
                 status=status.HTTP_201_CREATED
             )
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class DocumentDetailView(APIView):
+class DocumentBulkUploadView(APIView):
+    """
+    Upload many documents in one multipart request
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    parser_classes = [IngestMultiPartParser, FormParser]
+    
+    def post(self, request):
+        """Store every valid file in ``files`` and report the outcome of each"""
+        options = DocumentBulkUploadSerializer(data=request.data)
+        if not options.is_valid():
+            return Response(options.errors, status=status.HTTP_400_BAD_REQUEST)
+        files = request.FILES.getlist('files')
+        if not files:
+            return Response({'files': ['No files were submitted.']}, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Each file is validated like a single upload; invalid ones do not stop the rest
+        results = [None] * len(files)
+        uploads = []
+        positions = []
+        for index, upload in enumerate(files):
+            title = os.path.splitext(os.path.basename(upload.name))[0][:255] or upload.name
+            serializer = DocumentUploadSerializer(data={'title': title, 'file': upload})
+            if serializer.is_valid():
+                uploads.append((serializer.validated_data['title'], serializer.validated_data['file']))
+                positions.append(index)
+            else:
+                results[index] = {'filename': upload.name, 'status': 'failed', 'errors': serializer.errors}
+        
+        documents = create_documents(request.user, uploads, **options.validated_data)
+        rows = DocumentListSerializer(documents, many=True, context={'request': request}).data
+        for index, row in zip(positions, rows):
+            results[index] = {'filename': files[index].name, 'status': 'created', 'document': row}
+        
+        failed = len(files) - len(documents)
+        if not failed:
+            response_status = status.HTTP_201_CREATED
+        elif documents:
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_400_BAD_REQUEST
+        return Response(
+            {'created': len(documents), 'failed': failed, 'results': results},
+            status=response_status
+        )
+
+
+class DocumentBulkDeleteView(APIView):
+    """
+    Delete many documents by id or filter
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def post(self, request):
+        """Delete the selected documents; their files are removed in the background"""
+        serializer = DocumentBulkSelectionSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        selection = serializer.validated_data
+        deleted = delete_documents(select_documents(request.user, selection))
+        return Response({'deleted': len(deleted), 'not_found': missing_ids(selection, deleted)})
+
+
+class DocumentBulkUpdateView(APIView):
+    """
+    Change visibility or tags of many documents by id or filter
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def post(self, request):
+        """Apply ``is_public``, ``tags``, ``add_tags`` and ``remove_tags`` to the selected documents"""
+        serializer = DocumentBulkUpdateSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+        matched, updated = update_documents(
+            select_documents(request.user, data),
+            is_public=data.get('is_public'),
+            tags=data.get('tags'),
+            add_tags=data.get('add_tags', ()),
+            remove_tags=data.get('remove_tags', ()),
+        )
+        return Response({'matched': len(matched), 'updated': len(updated), 'not_found': missing_ids(data, matched)})
+
+
+class DocumentDetailView(ReplicaReadMixin, AsyncReadMixin, APIView):
     """
     Retrieve, update or delete a document
     """
     permission_classes = [permissions.IsAuthenticated]
     
-    def get_object(self, pk, user):
-        return get_object_or_404(Document, pk=pk, user=user)
+    def get_queryset(self, request):
+        # user_name and the derivative URLs are read on every response, the text only when it is wanted
+        documents = Document.objects.select_related('user', 'blob')
+        if wants_field(request, 'extracted_text'):
+            documents = documents.select_related('content')
+        return documents
+    
+    def get_object(self, pk, request):
+        return get_object_or_404(self.get_queryset(request), pk=pk, user=request.user)
     
+    @cache_response(request_user_scope)
     def get(self, request, pk):
         """Get document details"""
-        document = self.get_object(pk, request.user)
-        serializer = DocumentSerializer(document)
+        document = self.get_object(pk, request)
+        serializer = DocumentSerializer(document, context={'request': request})
+        return Response(serializer.data)
+    
+    @cache_response(request_user_scope)
+    async def aget(self, request, pk):
+        # Tags are prefetched too: the serializer cannot query from the event loop
+        document = await aget_object_or_404(
+            self.get_queryset(request).prefetch_related('tags'), pk=pk, user=request.user,
+        )
+        serializer = DocumentSerializer(document, context={'request': request})
         return Response(serializer.data)
     
     def put(self, request, pk):
         """Update document"""
-        document = self.get_object(pk, request.user)
+        document = self.get_object(pk, request)
         serializer = DocumentUpdateSerializer(document, data=request.data)
         if serializer.is_valid():
             serializer.save()
-            return Response(DocumentSerializer(document).data)
+            return Response(DocumentSerializer(document, context={'request': request}).data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
     def patch(self, request, pk):
         """Partially update document"""
-        document = self.get_object(pk, request.user)
+        document = self.get_object(pk, request)
         serializer = DocumentUpdateSerializer(document, data=request.data, partial=True)
         if serializer.is_valid():
             serializer.save()
-            return Response(DocumentSerializer(document).data)
+            return Response(DocumentSerializer(document, context={'request': request}).data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
     def delete(self, request, pk):
         """Delete document"""
-        document = self.get_object(pk, request.user)
+        document = self.get_object(pk, request)
         document.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class DocumentStatsView(APIView):
+class DocumentStatsView(ReplicaReadMixin, APIView):
     """
     Get document statistics for the user
     """
     permission_classes = [permissions.IsAuthenticated]
     
+    @cache_response(request_user_scope)
     def get(self, request):
         """Get user's document statistics"""
         user = request.user
-        documents = Document.objects.filter(user=user)
-        
-        # Basic counts
-        total_documents = documents.count()
-        pdf_documents = documents.filter(document_type='PDF').count()
-        image_documents = documents.filter(document_type='IMAGE').count()
-        text_documents = documents.filter(document_type='TEXT').count()
-        
-        # Size calculations
-        total_size_mb = documents.aggregate(
-            total_size=Sum('file_size_mb')
-        )['total_size'] or 0
-        
-        # Public/Private counts
-        public_documents = documents.filter(is_public=True).count()
-        private_documents = documents.filter(is_public=False).count()
-        
-        # Documents by type
-        documents_by_type = {
-            'PDF': pdf_documents,
-            'IMAGE': image_documents,
-            'TEXT': text_documents
+        # Counters come from the materialized per-user row, kept current on every write
+        document_stats = DocumentStats.objects.filter(user=user).first() or DocumentStats(user=user)
+        stats = document_stats.as_dict()
+        stats['documents_by_type'] = {
+            'PDF': document_stats.pdf_documents,
+            'IMAGE': document_stats.image_documents,
+            'TEXT': document_stats.text_documents,
         }
-        
+
         # Recent uploads (last 5)
-        recent_uploads = documents.order_by('-created_at')[:5]
-        recent_uploads_data = DocumentListSerializer(recent_uploads, many=True).data
-        
-        stats = {
-            'total_documents': total_documents,
-            'pdf_documents': pdf_documents,
-            'image_documents': image_documents,
-            'text_documents': text_documents,
-            'total_size_mb': round(total_size_mb, 2),
-            'public_documents': public_documents,
-            'private_documents': private_documents,
-            'documents_by_type': documents_by_type,
-            'recent_uploads': recent_uploads_data
-        }
-        
+        recent_uploads = Document.objects.filter(user=user).select_related('blob').order_by('-created_at', '-id')[:5]
+        stats['recent_uploads'] = DocumentListSerializer(
+            recent_uploads, many=True, context={'request': request},
+        ).data
+
         return Response(stats)
 
 
-class DocumentTagListView(APIView):
+class DocumentTagListView(KeysetPaginationMixin, APIView):
     """
     List all document tags or create a new tag
     """
@@ -160,9 +311,8 @@ class DocumentTagListView(APIView):
     
     def get(self, request):
         """Get all document tags"""
-        tags = DocumentTag.objects.all()
-        serializer = DocumentTagSerializer(tags, many=True)
-        return Response(serializer.data)
+        tags = DocumentTag.objects.order_by('name')
+        return self.paginated_response(tags, DocumentTagSerializer)
     
     def post(self, request):
         """Create a new document tag"""
@@ -173,6 +323,25 @@ class DocumentTagListView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class DocumentTagFacetView(APIView):
+    """
+    Per-tag document counts for the user's documents
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get(self, request):
+        """Count documents per tag, honouring the document list filters"""
+        documents = filter_documents(Document.objects.filter(user=request.user), request.query_params)
+        # One grouped query over the tag -> document index
+        tags = (
+            DocumentTag.objects
+            .filter(taggings__document__in=documents.values('pk'))
+            .annotate(document_count=Count('taggings'))
+            .order_by('-document_count', 'name')
+        )
+        return Response({'results': DocumentTagFacetSerializer(tags, many=True).data})
+
+
 class DocumentTagDetailView(APIView):
     """
     Retrieve, update or delete a document tag
@@ -225,7 +394,7 @@ class DocumentShareView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class DocumentShareListView(APIView):
+class DocumentShareListView(KeysetPaginationMixin, APIView):
     """
     List shared documents (sent and received)
     """
@@ -240,12 +409,208 @@ class DocumentShareListView(APIView):
             shares = DocumentShare.objects.filter(shared_by=user)
         else:  # received
             shares = DocumentShare.objects.filter(shared_with=user)
+        # The serializer reads the title and both users' names of every row
+        shares = shares.select_related('document', 'shared_by', 'shared_with')
         
-        serializer = DocumentShareSerializer(shares, many=True)
-        return Response(serializer.data)
+        return self.paginated_response(shares, DocumentShareSerializer)
+
+
+class DocumentRelatedView(APIView):
+    """
+    Documents with text similar to a document's
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get(self, request, pk):
+        """Get the most similar documents the user can read, best first"""
+        related_settings = get_related_settings()
+        if not related_settings['ENABLED']:
+            raise Http404('Related documents are disabled')
+        document = get_object_or_404(Document, pk=pk)
+        if not document.is_accessible_by(request.user.pk):
+            return Response(
+                {'error': 'You do not have permission to view this document'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        try:
+            limit = min(max(int(request.query_params.get('limit', 10)), 1), related_settings['MAX_RESULTS'])
+        except ValueError:
+            return Response({'limit': ['A valid integer is required.']}, status=status.HTTP_400_BAD_REQUEST)
+        
+        related = []
+        for related_document, similarity in related_index.related(document, request.user.pk, limit):
+            related_document.similarity = round(similarity, 4)
+            related.append(related_document)
+        serializer = RelatedDocumentSerializer(related, many=True, context={'request': request})
+        return Response({'results': serializer.data})
+
+
+class DocumentGenerationView(APIView):
+    """
+    Generate a study summary, flashcards or a quiz from a document
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def post(self, request, pk, task):
+        """Return the cached result for the document's content, generating it on first use"""
+        if task not in TASKS:
+            raise Http404('Unknown generation task')
+        document = get_object_or_404(Document.objects.select_related('blob', 'content'), pk=pk)
+        if not document.is_accessible_by(request.user.pk):
+            return Response(
+                {'error': 'You do not have permission to view this document'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        serializer = DocumentGenerationSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        
+        try:
+            result, cached = generate(document, task, serializer.validated_data.get('count'))
+        except GenerationNotReady as e:
+            return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+        except GenerationPending as e:
+            # Another request is generating this result; the client polls instead of holding a worker
+            return Response(
+                {'status': 'pending', 'retry_after': e.retry_after},
+                status=status.HTTP_202_ACCEPTED, headers={'Retry-After': str(math.ceil(e.retry_after))},
+            )
+        except ProviderUnavailable as e:
+            return Response({'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        except GenerationError as e:
+            logger.warning('Generating %s for document %s failed: %s', task, document.pk, e)
+            return Response({'error': 'AI generation failed, please try again'}, status=status.HTTP_502_BAD_GATEWAY)
+        data = {'task': task, 'cached': cached, 'result': result}
+        if serializer.validated_data['save'] and task in ('flashcards', 'quiz'):
+            data['saved'] = len(save_generated(request.user, document, task, result))
+        return Response(data)
 
 
-class DocumentProcessingLogView(APIView):
+class StudyItemListView(KeysetPaginationMixin, APIView):
+    """
+    List the user's flashcards or quiz questions, newest first
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    model = None
+    serializer_class = None
+    
+    def get(self, request):
+        """Get items, optionally only those generated from one document"""
+        items = self.model.objects.filter(user=request.user)
+        document_id = request.query_params.get('document')
+        if document_id:
+            if not document_id.isdigit():
+                return Response({'document': ['A valid integer is required.']}, status=status.HTTP_400_BAD_REQUEST)
+            items = items.filter(document_id=document_id)
+        return self.paginated_response(items, self.serializer_class)
+
+
+class StudyItemDueView(KeysetPaginationMixin, APIView):
+    """
+    The user's review queue: items due now, longest overdue first
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    model = None
+    serializer_class = None
+    
+    def get(self, request):
+        """Get due items; served by the (user, due_at, id) index"""
+        items = self.model.objects.filter(user=request.user, due_at__lte=timezone.now()).order_by('due_at')
+        return self.paginated_response(items, self.serializer_class)
+
+
+class StudyItemDetailView(APIView):
+    """
+    Retrieve or delete one flashcard or quiz question
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    model = None
+    serializer_class = None
+    
+    def get(self, request, pk):
+        item = get_object_or_404(self.model, pk=pk, user=request.user)
+        return Response(self.serializer_class(item).data)
+    
+    def delete(self, request, pk):
+        item = get_object_or_404(self.model, pk=pk, user=request.user)
+        item.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class StudyItemReviewView(APIView):
+    """
+    Record a batch of reviews and reschedule the reviewed items.
+
+    Subclasses set ``model`` and ``batch_serializer_class`` and define
+    ``grade(item, review)`` to return the SM-2 grade of one review.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    model = None
+    batch_serializer_class = None
+
+    def post(self, request):
+        """Apply up to 500 reviews with one read and one bulk update"""
+        serializer = self.batch_serializer_class(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            reviewed, not_found = apply_reviews(
+                self.model.objects.filter(user=request.user), serializer.validated_data['reviews'], self.grade,
+            )
+        return Response({
+            'reviewed': [
+                {'id': item.pk, 'due_at': item.due_at, 'interval': item.interval, 'ease': round(item.ease, 2)}
+                for item in reviewed
+            ],
+            'not_found': not_found,
+        })
+
+
+class FlashcardListView(StudyItemListView):
+    model = Flashcard
+    serializer_class = FlashcardSerializer
+
+
+class FlashcardDueView(StudyItemDueView):
+    model = Flashcard
+    serializer_class = FlashcardSerializer
+
+
+class FlashcardDetailView(StudyItemDetailView):
+    model = Flashcard
+    serializer_class = FlashcardSerializer
+
+
+class FlashcardReviewView(StudyItemReviewView):
+    model = Flashcard
+    batch_serializer_class = FlashcardReviewBatchSerializer
+    
+    def grade(self, item, review):
+        return review['grade']
+
+
+class QuizListView(StudyItemListView):
+    model = Quiz
+    serializer_class = QuizSerializer
+
+
+class QuizDueView(StudyItemDueView):
+    model = Quiz
+    serializer_class = QuizSerializer
+
+
+class QuizDetailView(StudyItemDetailView):
+    model = Quiz
+    serializer_class = QuizSerializer
+
+
+class QuizReviewView(StudyItemReviewView):
+    model = Quiz
+    batch_serializer_class = QuizAnswerBatchSerializer
+    
+    def grade(self, item, review):
+        return quiz_grade(item, review)
+
+
+class DocumentProcessingLogView(KeysetPaginationMixin, APIView):
     """
     Get processing logs for a document
     """
@@ -255,19 +620,20 @@ class DocumentProcessingLogView(APIView):
         """Get processing logs for a document"""
         document = get_object_or_404(Document, pk=document_id, user=request.user)
         logs = DocumentProcessingLog.objects.filter(document=document)
-        serializer = DocumentProcessingLogSerializer(logs, many=True)
-        return Response(serializer.data)
+        return self.paginated_response(logs, DocumentProcessingLogSerializer)
 
 
-class PublicDocumentListView(APIView):
+class PublicDocumentListView(ReplicaReadMixin, AsyncReadMixin, KeysetPaginationMixin, APIView):
     """
     List public documents (no authentication required)
     """
     permission_classes = [permissions.AllowAny]
     
-    def get(self, request):
-        """Get public documents"""
-        documents = Document.objects.filter(is_public=True, status='COMPLETED')
+    def replica_keys(self, request):
+        return [public_scope(request)]
+    
+    def get_queryset(self, request):
+        documents = Document.objects.filter(is_public=True, status='COMPLETED').select_related('blob')
         
         # Filter parameters
         document_type = request.query_params.get('type')
@@ -275,18 +641,27 @@ class PublicDocumentListView(APIView):
         
         if document_type:
             documents = documents.filter(document_type=document_type.upper())
+        for tag in request.query_params.getlist('tag'):
+            documents = documents.filter(tags__name=tag.strip())
         if search:
-            documents = documents.filter(
-                Q(title__icontains=search) | 
-                Q(description__icontains=search) |
-                Q(tags__icontains=search)
-            )
-        
-        serializer = DocumentListSerializer(documents, many=True)
-        return Response(serializer.data)
+            documents = get_search_backend().search(documents, search)
+        return documents
+    
+    @cache_response(public_scope)
+    def get(self, request):
+        """Get public documents"""
+        return self.paginated_response(
+            self.get_queryset(request), DocumentListSerializer, context={'request': request},
+        )
+    
+    @cache_response(public_scope)
+    async def aget(self, request):
+        return await self.apaginated_response(
+            self.get_queryset(request), DocumentListSerializer, context={'request': request},
+        )
 
 
-class DocumentDownloadView(APIView):
+class DocumentDownloadView(AsyncReadMixin, APIView):
     """
     Download a document file
     """
@@ -297,24 +672,30 @@ class DocumentDownloadView(APIView):
         document = get_object_or_404(Document, pk=pk)
         
         # Check if user has access to the document
-        if document.user != request.user and not document.is_public:
-            # Check if document is shared with user
-            shared = DocumentShare.objects.filter(
-                document=document,
-                shared_with=request.user
-            ).exists()
-            
-            if not shared:
-                return Response(
-                    {'error': 'You do not have permission to download this document'},
-                    status=status.HTTP_403_FORBIDDEN
-                )
-        
-        # Return file URL for download
+        if not document.is_accessible_by(request.user.pk):
+            return self.forbidden()
+        return self.download_response(request, document)
+    
+    async def aget(self, request, pk):
+        document = await aget_object_or_404(Document, pk=pk)
+        if not await document.ais_accessible_by(request.user.pk):
+            return self.forbidden()
+        return self.download_response(request, document)
+    
+    def forbidden(self):
+        return Response(
+            {'error': 'You do not have permission to download this document'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    
+    def download_response(self, request, document):
+        # Return a signed link to the file endpoint, usable without the API token
         if document.file:
+            file_url = reverse('document_file', kwargs={'pk': document.pk})
+            signature = sign_file_access(document.pk, request.user.pk)
             return Response({
-                'download_url': request.build_absolute_uri(document.file.url),
-                'filename': document.file.name.split('/')[-1],
+                'download_url': request.build_absolute_uri(f'{file_url}?signature={signature}'),
+                'filename': document.original_filename or document.file.name.split('/')[-1],
                 'file_size_mb': document.file_size_mb
             })
         else:
@@ -322,3 +703,89 @@ class DocumentDownloadView(APIView):
                 {'error': 'File not found'},
                 status=status.HTTP_404_NOT_FOUND
             )
+
+
+class DocumentFileView(AsyncReadMixin, APIView):
+    """
+    Serve a document's bytes, with Range and conditional request support
+    """
+    # Access is checked per document: API credentials or a signed download link
+    permission_classes = [permissions.AllowAny]
+    
+    def get(self, request, pk):
+        """Stream the document file"""
+        document = get_object_or_404(Document, pk=pk)
+        user_id = self.requesting_user_id(request, document)
+        
+        if not document.is_accessible_by(user_id):
+            return self.forbidden()
+        if not document.file:
+            raise Http404('File not found')
+        return serve_document_file(request, document, as_attachment=self.as_attachment(request))
+    
+    async def aget(self, request, pk):
+        document = await aget_object_or_404(Document, pk=pk)
+        user_id = self.requesting_user_id(request, document)
+        
+        if not await document.ais_accessible_by(user_id):
+            return self.forbidden()
+        if not document.file:
+            raise Http404('File not found')
+        # stat() and open() wait on the disk, so they run in a worker thread
+        return await sync_to_async(serve_document_file, thread_sensitive=False)(
+            request, document, as_attachment=self.as_attachment(request),
+        )
+    
+    def requesting_user_id(self, request, document):
+        if request.user.is_authenticated:
+            return request.user.pk
+        return read_file_access(request.query_params.get('signature'), document.pk)
+    
+    def as_attachment(self, request):
+        return request.query_params.get('download', '').lower() in ('1', 'true')
+    
+    def forbidden(self):
+        return Response(
+            {'error': 'You do not have permission to download this document'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+
+
+class DocumentDerivativeView(APIView):
+    """
+    Serve a document's thumbnail, first-page preview or AI-sized image
+    """
+    # Image tags cannot send the API token, so signed URLs are accepted too
+    permission_classes = [permissions.AllowAny]
+    
+    def get(self, request, pk, kind):
+        """Stream one derivative image"""
+        document = get_object_or_404(Document.objects.select_related('blob'), pk=pk)
+        if request.user.is_authenticated:
+            user_id = request.user.pk
+        else:
+            user_id = read_derivative_access(request.query_params.get('signature'), document.pk)
+        
+        if not document.is_accessible_by(user_id):
+            return Response(
+                {'error': 'You do not have permission to view this document'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        blob = document.blob
+        if kind not in DERIVATIVE_SPECS or blob is None or not blob.has_derivative(kind):
+            raise Http404('Derivative not available')
+        
+        version = request.query_params.get('v')
+        if version is None:
+            cache_control = 'private, no-cache'
+        elif version == blob.sha256[:16]:
+            # The URL names the content, so it can never go stale
+            max_age = get_delivery_settings()['DERIVATIVE_MAX_AGE']
+            cache_control = f'private, max-age={max_age}, immutable'
+        else:
+            # The source file changed since the URL was issued
+            raise Http404('Derivative not available')
+        
+        stem = os.path.splitext(document.original_filename or str(document.pk))[0]
+        filename = f'{stem}-{derivative_filename(kind)}'
+        return serve_file(request, blob.derivative_name(kind), filename, cache_control=cache_control)
@@ -0,0 +1,155 @@
+"""
+Async handlers for the hot read endpoints.
+
+DRF's ``APIView`` is synchronous, so under an ASGI server Django runs each of
+its requests in a worker thread through ``sync_to_async`` and the event loop
+buys nothing. A view that uses :class:`AsyncReadMixin` defines ``aget()``
+next to its sync ``get()``. When ``ASYNC_VIEWS`` is on (``asgi.py`` turns it
+on), ``as_view()`` returns an async view:
+
+* ``GET`` and ``HEAD`` run on the event loop. Authentication, the permission
+  checks, the response cache and the ORM are all awaited.
+* Every other method goes to the sync view in a thread, as before.
+
+Under WSGI an async view would cost a private event loop per request, so
+``as_view()`` returns the plain sync view there and ``aget()`` is unused.
+
+Django still runs every ORM query and every hook of its own middleware in a
+thread: the one the ASGI handler dedicates to each request, with its own
+database connection. The event loop stays free while they run, but under
+load every request in flight holds a thread and a connection.
+:class:`ConcurrencyLimitMiddleware` caps the requests in flight so the rest
+wait on the event loop, where waiting is cheap.
+"""
+import asyncio
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.http import HttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions
+
+ASYNC_METHODS = ('GET', 'HEAD')
+
+
+async def aauthenticate(request):
+    """
+    ``Request._authenticate`` for async views. Authenticators with an
+    ``aauthenticate`` method are awaited, others run in a thread.
+    """
+    for authenticator in request.authenticators:
+        authenticate = getattr(authenticator, 'aauthenticate', None)
+        if authenticate is None:
+            authenticate = sync_to_async(authenticator.authenticate)
+        try:
+            user_auth_tuple = await authenticate(request)
+        except exceptions.APIException:
+            request._not_authenticated()
+            raise
+
+        if user_auth_tuple is not None:
+            request._authenticator = authenticator
+            request.user, request.auth = user_auth_tuple
+            return
+
+    request._not_authenticated()
+
+
+def plain_response(response):
+    """
+    Render a DRF ``Response`` into a plain ``HttpResponse``. Django would
+    otherwise hop to the sync thread only to call its ``render()``.
+    """
+    if not hasattr(response, 'render'):
+        return response
+    response.render()
+    return HttpResponse(response.content, status=response.status_code, headers=response.headers)
+
+
+class AsyncReadMixin:
+    """
+    Serve an ``APIView``'s ``GET`` and ``HEAD`` requests with its async
+    ``aget()`` handler when ``ASYNC_VIEWS`` is on.
+    """
+    @classmethod
+    def as_view(cls, **initkwargs):
+        if getattr(settings, 'ASYNC_VIEWS', False):
+            return cls.as_async_view(**initkwargs)
+        return super().as_view(**initkwargs)
+
+    @classmethod
+    def as_async_view(cls, **initkwargs):
+        sync_view = sync_to_async(super().as_view(**initkwargs))
+
+        async def view(request, *args, **kwargs):
+            if request.method not in ASYNC_METHODS:
+                return await sync_view(request, *args, **kwargs)
+            self = cls(**initkwargs)
+            self.setup(request, *args, **kwargs)
+            return await self.adispatch(request, *args, **kwargs)
+
+        view.cls = cls
+        view.initkwargs = initkwargs
+        # Like APIView.as_view(): session authentication enforces CSRF itself
+        return csrf_exempt(view)
+
+    async def adispatch(self, request, *args, **kwargs):
+        """``APIView.dispatch`` with the initial checks and the handler awaited"""
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await self.ainitial(request, *args, **kwargs)
+            response = await self.aget(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return plain_response(self.response)
+
+    async def ainitial(self, request, *args, **kwargs):
+        """``APIView.initial`` with authentication awaited"""
+        self.format_kwarg = self.get_format_suffix(**kwargs)
+
+        neg = self.perform_content_negotiation(request)
+        request.accepted_renderer, request.accepted_media_type = neg
+
+        version, scheme = self.determine_version(request, *args, **kwargs)
+        request.version, request.versioning_scheme = version, scheme
+
+        await aauthenticate(request)
+        self.check_permissions(request)
+        self.check_throttles(request)
+
+
+class ConcurrencyLimitMiddleware:
+    """
+    Let at most ``ASGI_MAX_CONCURRENT_REQUESTS`` requests run at once under
+    ASGI. It must come first in ``MIDDLEWARE``: a request gets its thread at
+    the first middleware hook that runs. WSGI requests pass straight through,
+    since the server's worker count already bounds them.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+            limit = getattr(settings, 'ASGI_MAX_CONCURRENT_REQUESTS', 0)
+            self.semaphore = asyncio.Semaphore(limit) if limit else None
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        if self.semaphore is None:
+            return await self.get_response(request)
+        async with self.semaphore:
+            return await self.get_response(request)
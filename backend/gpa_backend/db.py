@@ -0,0 +1,188 @@
+"""
+SQLite connection tuning and read-replica routing.
+
+:func:`sqlite_options` builds the ``OPTIONS`` of a SQLite database so every
+new connection runs the configured PRAGMAs (WAL journal, ``busy_timeout``,
+``synchronous``, ``mmap_size``) and opens transactions with ``BEGIN
+IMMEDIATE``. A deferred transaction that reads and then writes cannot wait
+for a lock another writer holds and fails with "database is locked"
+straight away. An immediate one takes the write lock up front, so it waits
+up to ``busy_timeout``. In WAL mode readers never wait for the writer.
+
+``ReplicaRouter`` sends every write, and by default every read, to the
+primary. Views that use :class:`ReplicaReadMixin` serve ``GET`` and
+``HEAD`` from a randomly chosen alias in ``DATABASE_REPLICAS['ALIASES']``,
+unless the data they show was written recently. Writers pin keys to the
+primary for ``STICKY_SECONDS``, which should exceed the replication lag:
+- :class:`ReadYourWritesMiddleware` pins ``user:<id>`` after every write
+  request by that user.
+- The response cache pins the scopes it invalidates. These are
+  ``user:<id>`` and ``public``, so other readers of the public catalog are
+  pinned too.
+
+A request that writes, or reads inside a transaction, reads from the
+primary from then on.
+
+Pins live in the Django cache, which must be shared (Redis, Memcached, the
+database cache) when several processes serve requests. Without replicas
+nothing is pinned and the router costs one context variable lookup.
+"""
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_read_alias = ContextVar('replica_read_alias', default=None)
+
+
+def get_replica_settings():
+    defaults = {'ALIASES': [], 'STICKY_SECONDS': 5, 'CACHE': 'default', 'KEY_PREFIX': 'db'}
+    defaults.update(getattr(settings, 'DATABASE_REPLICAS', {}))
+    return defaults
+
+
+def sqlite_options(journal_mode='WAL', synchronous='NORMAL', busy_timeout=20000, mmap_size=0):
+    """``OPTIONS`` for a SQLite database; ``busy_timeout`` is in milliseconds"""
+    pragmas = {
+        'journal_mode': journal_mode,
+        'synchronous': synchronous,
+        'busy_timeout': busy_timeout,
+        'mmap_size': mmap_size,
+    }
+    return {
+        'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in pragmas.items()),
+        'transaction_mode': 'IMMEDIATE',
+        # The driver's own busy wait, in seconds, before the PRAGMA takes over
+        'timeout': busy_timeout / 1000,
+    }
+
+
+def user_pin(user_id):
+    return f'user:{user_id}'
+
+
+def pin_key(key):
+    return f"{get_replica_settings()['KEY_PREFIX']}:pinned:{key}"
+
+
+def pin_to_primary(keys):
+    """Serve reads of ``keys`` from the primary for the next ``STICKY_SECONDS``"""
+    replica_settings = get_replica_settings()
+    if not replica_settings['ALIASES']:
+        return
+    caches[replica_settings['CACHE']].set_many(
+        {pin_key(key): True for key in keys}, timeout=replica_settings['STICKY_SECONDS'],
+    )
+
+
+def choose_replica(keys):
+    """A replica alias to read ``keys`` from, or ``None`` if one of them is pinned"""
+    replica_settings = get_replica_settings()
+    if not replica_settings['ALIASES']:
+        return None
+    if caches[replica_settings['CACHE']].get_many([pin_key(key) for key in keys]):
+        return None
+    return random.choice(replica_settings['ALIASES'])
+
+
+async def achoose_replica(keys):
+    """``choose_replica`` for async views"""
+    replica_settings = get_replica_settings()
+    if not replica_settings['ALIASES']:
+        return None
+    if await caches[replica_settings['CACHE']].aget_many([pin_key(key) for key in keys]):
+        return None
+    return random.choice(replica_settings['ALIASES'])
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        alias = _read_alias.get()
+        # Reads inside a transaction must see its writes
+        if alias is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        if _read_alias.get() is not None:
+            # The rest of the request reads what it wrote
+            _read_alias.set(None)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+
+class ReplicaReadMixin:
+    """
+    Serve ``GET`` and ``HEAD`` requests from a read replica.
+
+    ``replica_keys(request)`` names the data the response shows, as the keys
+    writers pin; by default the requesting user's.
+    """
+    def replica_keys(self, request):
+        return [user_pin(request.user.pk)] if request.user.is_authenticated else []
+
+    def initial(self, request, *args, **kwargs):
+        # Authentication and permission checks still read the primary
+        super().initial(request, *args, **kwargs)
+        if request.method in ('GET', 'HEAD'):
+            alias = choose_replica(self.replica_keys(request))
+            if alias is not None:
+                self._replica_token = _read_alias.set(alias)
+
+    async def ainitial(self, request, *args, **kwargs):
+        # The same for async views; the ORM's worker thread inherits the alias
+        await super().ainitial(request, *args, **kwargs)
+        alias = await achoose_replica(self.replica_keys(request))
+        if alias is not None:
+            self._replica_token = _read_alias.set(alias)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, '_replica_token', None)
+        if token is not None:
+            _read_alias.reset(token)
+            self._replica_token = None
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+class ReadYourWritesMiddleware:
+    """Pin the user's data to the primary after each of their write requests"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        response = self.get_response(request)
+        if self.wrote(request):
+            self.pin_user(request)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        if self.wrote(request):
+            # The user may still be the session's lazy object, loaded by a query
+            await sync_to_async(self.pin_user)(request)
+        return response
+
+    def wrote(self, request):
+        return request.method not in SAFE_METHODS and bool(get_replica_settings()['ALIASES'])
+
+    def pin_user(self, request):
+        # API authentication runs in the view, which sets request.user for us
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            pin_to_primary([user_pin(user.pk)])
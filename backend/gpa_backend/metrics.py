@@ -0,0 +1,317 @@
+"""
+Per-endpoint request metrics in Prometheus text format.
+
+``MetricsMiddleware`` records, for every request, the latency, the number of
+database queries and the time spent in them, and the response size, keyed by
+the resolved URL name and HTTP method. ``metrics_view`` renders the totals for
+a Prometheus scrape.
+
+Recording is lock-free: each thread writes only to its own shard of
+counters, and shards are merged when the metrics are scraped. The only lock
+is taken once per thread, when its shard is registered. Queries are counted
+by an execute wrapper installed once per connection, which adds to totals
+held in a context variable for the current request. Counters live in the
+process, so with several server workers each one reports its own totals.
+
+A scrape must come from an address in ``METRICS['ALLOWED_IPS']`` and carry
+``Authorization: Bearer <METRICS['TOKEN']>``. Behind a reverse proxy on the
+same host every client arrives from the loopback address, so the address
+check alone would publish the metrics. Without a token the endpoint is off.
+
+Other modules add their own series to the scrape with
+:func:`register_collector`.
+"""
+import hmac
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import Http404, HttpResponse
+
+# Histogram bucket upper bounds; a final +Inf bucket is implied
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+UNMATCHED_ENDPOINT = '<unmatched>'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def get_metrics_settings():
+    defaults = {'ENABLED': True, 'ALLOWED_IPS': ('127.0.0.1', '::1'), 'TOKEN': ''}
+    defaults.update(getattr(settings, 'METRICS', {}))
+    return defaults
+
+
+class EndpointStats:
+    """Counters for one (endpoint, method) pair in one thread's shard"""
+    __slots__ = (
+        'statuses', 'latency_buckets', 'latency_sum', 'query_buckets', 'query_sum',
+        'db_seconds', 'size_buckets', 'size_sum',
+    )
+
+    def __init__(self):
+        self.statuses = {}
+        self.latency_buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latency_sum = 0.0
+        self.query_buckets = [0] * (len(QUERY_BUCKETS) + 1)
+        self.query_sum = 0
+        self.db_seconds = 0.0
+        self.size_buckets = [0] * (len(SIZE_BUCKETS) + 1)
+        self.size_sum = 0
+
+    def observe(self, status_code, seconds, queries, db_seconds, size):
+        self.statuses[status_code] = self.statuses.get(status_code, 0) + 1
+        self.latency_buckets[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.latency_sum += seconds
+        self.query_buckets[bisect_left(QUERY_BUCKETS, queries)] += 1
+        self.query_sum += queries
+        self.db_seconds += db_seconds
+        if size is not None:
+            self.size_buckets[bisect_left(SIZE_BUCKETS, size)] += 1
+            self.size_sum += size
+
+    def merge(self, other):
+        for status_code, count in other.statuses.items():
+            self.statuses[status_code] = self.statuses.get(status_code, 0) + count
+        for i, count in enumerate(other.latency_buckets):
+            self.latency_buckets[i] += count
+        for i, count in enumerate(other.query_buckets):
+            self.query_buckets[i] += count
+        for i, count in enumerate(other.size_buckets):
+            self.size_buckets[i] += count
+        self.latency_sum += other.latency_sum
+        self.query_sum += other.query_sum
+        self.db_seconds += other.db_seconds
+        self.size_sum += other.size_sum
+
+    @property
+    def requests(self):
+        return sum(self.statuses.values())
+
+
+class MetricsRegistry:
+    """Thread-sharded store of ``EndpointStats``"""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = []
+        self._lock = threading.Lock()
+
+    def _shard(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append(shard)
+            return shard
+
+    def observe(self, endpoint, method, status_code, seconds, queries, db_seconds, size):
+        shard = self._shard()
+        key = (endpoint, method)
+        stats = shard.get(key)
+        if stats is None:
+            stats = shard[key] = EndpointStats()
+        stats.observe(status_code, seconds, queries, db_seconds, size)
+
+    def snapshot(self):
+        """Merge every shard into one ``{(endpoint, method): EndpointStats}`` dict"""
+        with self._lock:
+            shards = list(self._shards)
+        merged = {}
+        for shard in shards:
+            # Another thread may add keys while we read; copy the items first
+            for key, stats in list(shard.items()):
+                total = merged.get(key)
+                if total is None:
+                    total = merged[key] = EndpointStats()
+                total.merge(stats)
+        return merged
+
+    def reset(self):
+        with self._lock:
+            for shard in self._shards:
+                shard.clear()
+
+
+registry = MetricsRegistry()
+
+# Callables returning extra exposition text, appended to every scrape
+_collectors = []
+
+
+def register_collector(collector):
+    if collector not in _collectors:
+        _collectors.append(collector)
+
+
+# [queries, seconds] for the request being handled in this context
+_query_totals = ContextVar('request_query_totals', default=None)
+
+
+def count_queries(execute, sql, params, many, context):
+    """
+    Execute wrapper installed once on every connection. Queries run outside a
+    metered request pass straight through.
+    """
+    totals = _query_totals.get()
+    if totals is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        totals[1] += time.perf_counter() - started
+        totals[0] += 1
+
+
+@receiver(connection_created)
+def install_query_counter(sender, connection, **kwargs):
+    if count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_queries)
+
+
+def response_size(response):
+    if not response.streaming:
+        return len(response.content)
+    length = response.get('Content-Length')
+    return int(length) if length and length.isdigit() else None
+
+
+class MetricsMiddleware:
+    """
+    Record latency, query count, database time and response size per endpoint.
+
+    Place it first in ``MIDDLEWARE`` so the latency covers the whole stack.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = get_metrics_settings()['ENABLED']
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        # Connections opened before this module was imported missed the signal
+        for connection in connections.all(initialized_only=True):
+            install_query_counter(sender=None, connection=connection)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not self.enabled:
+            return self.get_response(request)
+
+        totals = [0, 0.0]
+        token = _query_totals.set(totals)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _query_totals.reset(token)
+        self.observe(request, response, time.perf_counter() - started, totals)
+        return response
+
+    async def __acall__(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+
+        # The ORM's worker thread inherits the context, and so these totals
+        totals = [0, 0.0]
+        token = _query_totals.set(totals)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _query_totals.reset(token)
+        self.observe(request, response, time.perf_counter() - started, totals)
+        return response
+
+    def observe(self, request, response, elapsed, totals):
+        match = request.resolver_match
+        registry.observe(
+            match.view_name if match and match.view_name else UNMATCHED_ENDPOINT,
+            request.method,
+            response.status_code,
+            elapsed,
+            totals[0],
+            totals[1],
+            response_size(response),
+        )
+
+
+def _labels(**labels):
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return ','.join(f'{name}="{escape(value)}"' for name, value in labels.items())
+
+
+def _histogram(lines, name, labels, bounds, buckets, total):
+    cumulative = 0
+    for bound, count in zip(bounds + ('+Inf',), buckets):
+        cumulative += count
+        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+    lines.append(f'{name}_sum{{{labels}}} {total}')
+    lines.append(f'{name}_count{{{labels}}} {cumulative}')
+
+
+def render_metrics(snapshot):
+    """Render a registry snapshot in the Prometheus text exposition format"""
+    rows = sorted(snapshot.items())
+    lines = [
+        '# HELP http_requests_total Requests handled, by endpoint, method and status.',
+        '# TYPE http_requests_total counter',
+    ]
+    for (endpoint, method), stats in rows:
+        for status_code, count in sorted(stats.statuses.items()):
+            labels = _labels(endpoint=endpoint, method=method, status=status_code)
+            lines.append(f'http_requests_total{{{labels}}} {count}')
+
+    histograms = (
+        ('http_request_duration_seconds', 'Request latency in seconds.',
+         LATENCY_BUCKETS, 'latency_buckets', 'latency_sum'),
+        ('http_request_db_queries', 'Database queries run per request.',
+         QUERY_BUCKETS, 'query_buckets', 'query_sum'),
+        ('http_response_size_bytes', 'Response body size in bytes.',
+         SIZE_BUCKETS, 'size_buckets', 'size_sum'),
+    )
+    for name, help_text, bounds, buckets_attr, sum_attr in histograms:
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} histogram')
+        for (endpoint, method), stats in rows:
+            labels = _labels(endpoint=endpoint, method=method)
+            _histogram(lines, name, labels, bounds, getattr(stats, buckets_attr), getattr(stats, sum_attr))
+
+    lines.append('# HELP http_request_db_seconds_total Time spent in database queries.')
+    lines.append('# TYPE http_request_db_seconds_total counter')
+    for (endpoint, method), stats in rows:
+        labels = _labels(endpoint=endpoint, method=method)
+        lines.append(f'http_request_db_seconds_total{{{labels}}} {stats.db_seconds}')
+    return '\n'.join(lines) + '\n'
+
+
+def is_scrape_allowed(request, metrics_settings):
+    """Whether the request comes from an allowed address with the scrape token"""
+    token = metrics_settings['TOKEN']
+    if not token or request.META.get('REMOTE_ADDR') not in metrics_settings['ALLOWED_IPS']:
+        return False
+    scheme, _, credentials = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+    return scheme.lower() == 'bearer' and hmac.compare_digest(credentials.strip().encode(), token.encode())
+
+
+def metrics_view(request):
+    """Serve the metrics to scrapers from ``METRICS['ALLOWED_IPS']`` holding ``METRICS['TOKEN']``"""
+    metrics_settings = get_metrics_settings()
+    if not metrics_settings['ENABLED'] or not is_scrape_allowed(request, metrics_settings):
+        raise Http404
+    body = render_metrics(registry.snapshot()) + ''.join(collector() for collector in _collectors)
+    return HttpResponse(body, content_type=CONTENT_TYPE)
@@ -13,6 +13,8 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 from pathlib import Path
 from decouple import config
 
+from gpa_backend.db import sqlite_options
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -46,12 +48,17 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Before anything else runs, so requests over the limit hold no thread
+    'gpa_backend.asyncviews.ConcurrencyLimitMiddleware',
+    # Next, so request latency covers the rest of the stack
+    'gpa_backend.metrics.MetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'gpa_backend.db.ReadYourWritesMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -79,14 +86,44 @@ WSGI_APPLICATION = 'gpa_backend.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# SQLite connections use WAL and immediate transactions, with these PRAGMAs (see gpa_backend/db.py)
+SQLITE_OPTIONS = sqlite_options(
+    journal_mode=config('SQLITE_JOURNAL_MODE', default='WAL'),
+    synchronous=config('SQLITE_SYNCHRONOUS', default='NORMAL'),
+    busy_timeout=config('SQLITE_BUSY_TIMEOUT', default=20000, cast=int),
+    mmap_size=config('SQLITE_MMAP_SIZE', default=256 * 1024 * 1024, cast=int),
+)
+
 # Temporary SQLite database for testing
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': SQLITE_OPTIONS,
     }
 }
 
+# Read replicas
+# Comma-separated SQLite files kept in step with the primary by replication. List, detail and stats
+# reads go to a random replica unless the data was written in the last STICKY_SECONDS
+DATABASE_REPLICA_FILES = [
+    name.strip() for name in config('DATABASE_REPLICA_FILES', default='').split(',') if name.strip()
+]
+for index, name in enumerate(DATABASE_REPLICA_FILES, 1):
+    DATABASES[f'replica{index}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': name,
+        'OPTIONS': SQLITE_OPTIONS,
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['gpa_backend.db.ReplicaRouter']
+
+DATABASE_REPLICAS = {
+    'ALIASES': [f'replica{index}' for index in range(1, len(DATABASE_REPLICA_FILES) + 1)],
+    'STICKY_SECONDS': config('DATABASE_REPLICA_STICKY_SECONDS', default=5, cast=float),
+}
+
 # Original MySQL configuration - uncomment when MySQL is set up
 # DATABASES = {
 #     'default': {
@@ -144,6 +181,99 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = 'media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Uploads are streamed to MEDIA_ROOT in fixed-size chunks and hashed in the same pass
+FILE_UPLOAD_HANDLERS = [
+    'documents.uploadhandlers.StreamingIngestUploadHandler',
+]
+
+# Larger uploads are cut off while streaming and rejected
+DOCUMENT_UPLOAD = {
+    'MAX_SIZE': config('DOCUMENT_UPLOAD_MAX_SIZE', default=100 * 1024 * 1024, cast=int),
+}
+
+# Document processing
+# Text extraction runs in a process pool so uploads return before parsing finishes
+DOCUMENT_PROCESSING = {
+    'WORKERS': config('DOCUMENT_PROCESSING_WORKERS', default=2, cast=int),
+    'EAGER': config('DOCUMENT_PROCESSING_EAGER', default=False, cast=bool),
+}
+
+# Document file delivery
+# standalone: Django answers Range/conditional requests and the WSGI server sends the file
+# x-accel-redirect (nginx) / x-sendfile (Apache, lighttpd): the front proxy sends the file
+DOCUMENT_DELIVERY = {
+    'MODE': config('DOCUMENT_DELIVERY_MODE', default='standalone'),
+    'ACCEL_REDIRECT_PREFIX': config('DOCUMENT_ACCEL_REDIRECT_PREFIX', default='/protected-media/'),
+    'SIGNED_URL_MAX_AGE': config('DOCUMENT_SIGNED_URL_MAX_AGE', default=3600, cast=int),
+}
+
+# Caches
+# Use a backend shared by all workers (Redis, Memcached, database) when running more than one
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default=''),
+    }
+}
+
+# Document API response cache
+# Responses are keyed on per-user and public generation counters bumped by every write
+RESPONSE_CACHE = {
+    'ENABLED': config('RESPONSE_CACHE_ENABLED', default=True, cast=bool),
+    'TIMEOUT': config('RESPONSE_CACHE_TIMEOUT', default=300, cast=int),
+}
+
+# API token cache
+# Token lookups are cached per process; revocations reach other workers through the shared cache
+TOKEN_AUTH_CACHE = {
+    'ENABLED': config('TOKEN_AUTH_CACHE_ENABLED', default=True, cast=bool),
+    'MAX_SIZE': config('TOKEN_AUTH_CACHE_MAX_SIZE', default=10000, cast=int),
+    'TTL': config('TOKEN_AUTH_CACHE_TTL', default=60, cast=int),
+    'EPOCH_CHECK_INTERVAL': config('TOKEN_AUTH_CACHE_EPOCH_CHECK_INTERVAL', default=1.0, cast=float),
+}
+
+# Related documents
+# Each process keeps every document vector in memory and polls for changes every REFRESH_INTERVAL seconds.
+# That is about 1 KB x capacity (up to twice the documents) x worker processes, so it is opt-in
+RELATED_DOCUMENTS = {
+    'ENABLED': config('RELATED_DOCUMENTS_ENABLED', default=False, cast=bool),
+    'REFRESH_INTERVAL': config('RELATED_DOCUMENTS_REFRESH_INTERVAL', default=1.0, cast=float),
+    'MIN_SIMILARITY': config('RELATED_DOCUMENTS_MIN_SIMILARITY', default=0.05, cast=float),
+}
+
+# AI generation
+# Summaries, flashcards and quizzes are generated server-side and cached by document content
+AI_GENERATION = {
+    'PROVIDER': config('AI_GENERATION_PROVIDER', default='documents.providers.OpenRouterProvider'),
+    'MODEL': config('AI_GENERATION_MODEL', default='openrouter/auto'),
+    'API_KEY': config('OPENROUTER_API_KEY', default=''),
+    'TIMEOUT': config('AI_GENERATION_TIMEOUT', default=120, cast=int),
+    # Identical requests wait this long for the one generating, then get a 202 to retry
+    'FOLLOWER_WAIT': config('AI_GENERATION_FOLLOWER_WAIT', default=2, cast=float),
+    'CACHE_MAX_BYTES': config('AI_GENERATION_CACHE_MAX_BYTES', default=256 * 1024 * 1024, cast=int),
+}
+
+# List exports
+# ?stream=true and ?format=ndjson stream every row of a list, serialized CHUNK_SIZE rows at a time
+LIST_EXPORT = {
+    'CHUNK_SIZE': config('LIST_EXPORT_CHUNK_SIZE', default=500, cast=int),
+}
+
+# Request metrics
+# Per-endpoint latency, query counts and response sizes, scraped from /internal/metrics/
+METRICS = {
+    'ENABLED': config('METRICS_ENABLED', default=True, cast=bool),
+    'ALLOWED_IPS': config('METRICS_ALLOWED_IPS', default='127.0.0.1,::1').split(','),
+    # Scrapers send it as a bearer token; the endpoint answers nobody while it is empty
+    'TOKEN': config('METRICS_TOKEN', default=''),
+}
+
+# Async views
+# Under ASGI (asgi.py turns this on) the hot read endpoints answer GET on the event loop
+ASYNC_VIEWS = config('ASYNC_VIEWS', default=False, cast=bool)
+# Requests an ASGI process runs at once, each on its own thread and connection (0: no limit)
+ASGI_MAX_CONCURRENT_REQUESTS = config('ASGI_MAX_CONCURRENT_REQUESTS', default=16, cast=int)
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -152,13 +282,13 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Django REST Framework
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.SessionAuthentication',
-        'rest_framework.authentication.TokenAuthentication',
+        'authentication.session.SessionAuthentication',
+        'authentication.tokencache.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'documents.pagination.KeysetPagination',
     'PAGE_SIZE': 20
 }
 
@@ -0,0 +1,84 @@
+"""
+Settings, factories and assertions shared by the apps' test suites.
+"""
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from documents.models import Document
+
+User = get_user_model()
+
+# Uploads from every suite land here; the directory is removed when the
+# test run's interpreter exits
+MEDIA_ROOT = tempfile.TemporaryDirectory(prefix='gpa-test-media-')
+
+# Row counts each endpoint is exercised with; the query count must not change
+SEED_SIZES = (1, 10, 100)
+
+TEST_SETTINGS = {
+    'MEDIA_ROOT': MEDIA_ROOT.name,
+    'DOCUMENT_PROCESSING': {'EAGER': True},
+    # Hashing real passwords would dominate the run time
+    'PASSWORD_HASHERS': ['django.contrib.auth.hashers.MD5PasswordHasher'],
+    # Row ids repeat across tests, so responses cached by one could leak into the next
+    'CACHES': {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}},
+}
+
+METRICS_SETTINGS = {'ENABLED': True, 'ALLOWED_IPS': ['127.0.0.1'], 'TOKEN': 'scrape-token'}
+
+
+def create_user(name):
+    return User.objects.create_user(
+        email=f'{name}@example.com', username=name, password='test-password',
+        first_name=name.title(), last_name='Tester',
+    )
+
+
+def create_document(user, title='Lecture notes', **kwargs):
+    kwargs.setdefault('file', f'blobs/test/{title}.txt')
+    kwargs.setdefault('file_size', 1024)
+    kwargs.setdefault('status', 'COMPLETED')
+    return Document.objects.create(user=user, title=title, **kwargs)
+
+
+class QueryBudgetMixin:
+    """
+    Assert that an endpoint runs a constant number of queries as the number
+    of rows it returns grows through ``SEED_SIZES``.
+    """
+
+    def authenticate(self, user):
+        token = Token.objects.create(user=user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    def assertQueryBudget(self, url, seed, budget, results=None):
+        """
+        Call ``seed(count)`` to add rows until each size in ``SEED_SIZES`` is
+        reached and request ``url`` after each step. ``results`` extracts the
+        rows from the response so their count can be checked too.
+        """
+        # Warm the token cache so only the endpoint's own queries are counted
+        self.client.get(url)
+        counts = []
+        seeded = 0
+        for size in SEED_SIZES:
+            seed(size - seeded)
+            seeded = size
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, response.content)
+            if results is not None:
+                self.assertEqual(len(results(response.json())), size)
+            counts.append(len(queries))
+        self.assertEqual(
+            len(set(counts)), 1,
+            f'{url} ran {counts} queries for {SEED_SIZES} rows:\n' +
+            '\n'.join(query['sql'] for query in queries.captured_queries),
+        )
+        self.assertLessEqual(counts[0], budget, f'{url} ran {counts[0]} queries, budget is {budget}')
@@ -32,7 +32,7 @@ import {
   Layers
 } from 'lucide-react';
 import { useAuth } from '@/contexts/AuthContext';
-import { apiClient } from '@/services/api';
+import { apiClient, isReadyForGeneration } from '@/services/api';
 import { openRouterService, type StudySummary, type FlashcardData, type QuizQuestion } from '@/services/openrouter';
 
 interface StudyMateInterfaceProps {
@@ -71,6 +71,7 @@ const StudyMateInterface: React.FC<StudyMateInterfaceProps> = ({
   const [isGeneratingQuiz, setIsGeneratingQuiz] = useState(false);
   const [error, setError] = useState('');
   const [currentStudySummary, setCurrentStudySummary] = useState<StudySummary | null>(null);
+  const [currentDocumentId, setCurrentDocumentId] = useState<number | null>(null);
   
   const messagesEndRef = useRef<HTMLDivElement>(null);
   const fileInputRef = useRef<HTMLInputElement>(null);
@@ -185,11 +186,26 @@ const StudyMateInterface: React.FC<StudyMateInterfaceProps> = ({
       const formData = new FormData();
       formData.append('file', selectedFile);
       formData.append('title', selectedFile.name);
-      await apiClient.uploadDocument(formData);
-
-      // Analyze document
-      const summary = await openRouterService.analyzeDocument(selectedFile);
+      const uploaded = await apiClient.uploadDocument(formData);
+
+      // Analyze document on the server once its text (or, for images, its AI image) is ready
+      const processed = await apiClient.waitForProcessing(uploaded.id);
+      if (!isReadyForGeneration(processed)) {
+        const notReadyMessage: ChatMessage = {
+          id: (Date.now() + 2).toString(),
+          role: 'assistant',
+          content: processed.status === 'FAILED'
+            ? 'I couldn\'t read this document. Please check the file and try uploading it again.'
+            : 'This document is taking longer than usual to process. Please try again in a few minutes.',
+          timestamp: new Date(),
+          type: 'text'
+        };
+        setMessages(prev => [...prev, notReadyMessage]);
+        return;
+      }
+      const { result: summary } = await apiClient.generateStudyContent<StudySummary>(uploaded.id, 'summary');
       setCurrentStudySummary(summary);
+      setCurrentDocumentId(uploaded.id);
       
       // Create formatted response
       const analysisResponse = formatStudySummaryForChat(summary);
@@ -298,7 +314,7 @@ const StudyMateInterface: React.FC<StudyMateInterfaceProps> = ({
   };
 
   const handleGenerateFlashcards = async () => {
-    if (!currentStudySummary) {
+    if (!currentDocumentId) {
       setError('Please analyze a document first');
       return;
     }
@@ -307,8 +323,9 @@ const StudyMateInterface: React.FC<StudyMateInterfaceProps> = ({
     setError('');
 
     try {
-      const documentContent = formatStudySummaryForGeneration(currentStudySummary);
-      const flashcards = await openRouterService.generateFlashcards(documentContent, 15);
+      const { result: flashcards } = await apiClient.generateStudyContent<FlashcardData[]>(
+        currentDocumentId, 'flashcards', 15, true
+      );
       
       if (onFlashcardsGenerated) {
         onFlashcardsGenerated(flashcards);
@@ -333,7 +350,7 @@ const StudyMateInterface: React.FC<StudyMateInterfaceProps> = ({
   };
 
   const handleGenerateQuiz = async () => {
-    if (!currentStudySummary) {
+    if (!currentDocumentId) {
       setError('Please analyze a document first');
       return;
     }
@@ -342,8 +359,9 @@ const StudyMateInterface: React.FC<StudyMateInterfaceProps> = ({
     setError('');
 
     try {
-      const documentContent = formatStudySummaryForGeneration(currentStudySummary);
-      const quiz = await openRouterService.generateQuiz(documentContent, 10);
+      const { result: quiz } = await apiClient.generateStudyContent<QuizQuestion[]>(
+        currentDocumentId, 'quiz', 10, true
+      );
       
       if (onQuizGenerated) {
         onQuizGenerated(quiz);
@@ -367,37 +385,6 @@ const StudyMateInterface: React.FC<StudyMateInterfaceProps> = ({
     }
   };
 
-  const formatStudySummaryForGeneration = (summary: StudySummary): string => {
-    return `
-Title: ${summary.title}
-Overview: ${summary.overview}
-
-Main Sections:
-${summary.main_sections.map(section => `
-${section.heading}:
-- ${section.bullet_points.join('\n- ')}
-Key Concepts: ${section.key_concepts.join(', ')}
-${section.subsections ? section.subsections.map(sub => `
-  ${sub.subheading}:
-  - ${sub.points.join('\n  - ')}
-`).join('') : ''}
-`).join('\n')}
-
-Key Takeaways:
-- ${summary.key_takeaways.join('\n- ')}
-
-${summary.definitions ? `
-Definitions:
-${summary.definitions.map(def => `${def.term}: ${def.definition}`).join('\n')}
-` : ''}
-
-${summary.important_formulas ? `
-Important Formulas:
-- ${summary.important_formulas.join('\n- ')}
-` : ''}
-    `.trim();
-  };
-
   const downloadChatAsPDF = () => {
     const doc = new jsPDF();
     let yPosition = 20;
@@ -24,7 +24,7 @@ const Dashboard = () => {
     const loadDocuments = async () => {
       try {
         const userDocuments = await apiClient.getDocuments();
-        setDocuments(userDocuments);
+        setDocuments(userDocuments.results);
       } catch (error) {
         console.error('Failed to load documents:', error);
       }
@@ -96,7 +96,7 @@ const Dashboard = () => {
 
       // Refresh documents list
       const updatedDocuments = await apiClient.getDocuments();
-      setDocuments(updatedDocuments);
+      setDocuments(updatedDocuments.results);
       
       // Clear form
       setSelectedFile(null);
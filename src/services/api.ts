@@ -36,10 +36,111 @@ export interface Document {
   is_image: boolean;
   is_pdf: boolean;
   user_name?: string;
+  // Escaped HTML with the matched words in <mark>
+  search_snippet?: string;
+  // Signed image URLs, present once the derivatives have been generated
+  thumbnail_url?: string | null;
+  derivatives?: Partial<Record<'thumbnail' | 'preview' | 'ai', string>>;
   created_at: string;
   updated_at: string;
 }
 
+// List endpoints are cursor paginated: follow `next` until it is null
+export interface PaginatedResponse<T> {
+  next: string | null;
+  results: T[];
+}
+
+export interface BulkUploadResult {
+  filename: string;
+  status: 'created' | 'failed';
+  document?: Document;
+  errors?: Record<string, string[]>;
+}
+
+export interface BulkUploadResponse {
+  created: number;
+  failed: number;
+  results: BulkUploadResult[];
+}
+
+export interface BulkSelection {
+  ids?: number[];
+  filter?: {
+    type?: 'PDF' | 'IMAGE' | 'TEXT';
+    status?: Document['status'];
+    public?: boolean;
+    tag?: string[];
+    search?: string;
+  };
+}
+
+export interface RelatedDocument extends Document {
+  similarity: number;
+}
+
+export type GenerationTask = 'summary' | 'flashcards' | 'quiz';
+
+export interface GenerationResponse<T> {
+  task: GenerationTask;
+  cached: boolean;
+  result: T;
+  saved?: number;
+}
+
+export interface GenerationPending {
+  status: 'pending';
+  retry_after: number;
+}
+
+export interface ReviewSchedule {
+  due_at: string;
+  interval: number;
+  ease: number;
+  repetitions: number;
+  lapses: number;
+  last_reviewed_at: string | null;
+}
+
+export interface StoredFlashcard extends ReviewSchedule {
+  id: number;
+  document: number | null;
+  question: string;
+  answer: string;
+  difficulty_level: 'easy' | 'medium' | 'hard';
+  category: string;
+  tags: string[];
+  created_at: string;
+}
+
+export interface StoredQuiz extends ReviewSchedule {
+  id: number;
+  document: number | null;
+  question: string;
+  options: string[];
+  correct_answer: number;
+  difficulty_level: 'easy' | 'medium' | 'hard';
+  category: string;
+  explanation: string;
+  created_at: string;
+}
+
+export interface ReviewResponse {
+  reviewed: Array<{ id: number; due_at: string; interval: number; ease: number }>;
+  not_found: number[];
+}
+
+export interface BulkUpdateResponse {
+  matched: number;
+  updated: number;
+  not_found: number[];
+}
+
+export interface BulkDeleteResponse {
+  deleted: number;
+  not_found: number[];
+}
+
 export interface DocumentTag {
   id: number;
   name: string;
@@ -47,6 +148,13 @@ export interface DocumentTag {
   created_at: string;
 }
 
+export interface TagFacet {
+  id: number;
+  name: string;
+  color: string;
+  document_count: number;
+}
+
 export interface DocumentShare {
   id: number;
   document: number;
@@ -82,6 +190,23 @@ export interface DashboardStats {
   private_documents: number;
 }
 
+// Text has been extracted; images also need their AI-sized derivative, which generation reads instead of
+// text and which is made in a separate job
+export function isReadyForGeneration(document: Document): boolean {
+  return document.status === 'COMPLETED' && (document.document_type !== 'IMAGE' || !!document.derivatives?.ai);
+}
+
+// Error thrown for a non-2xx response, carrying its HTTP status
+export class ApiError extends Error {
+  status: number;
+
+  constructor(message: string, status: number) {
+    super(message);
+    this.name = 'ApiError';
+    this.status = status;
+  }
+}
+
 // API Client class
 class APIClient {
   private baseURL: string;
@@ -146,7 +271,7 @@ class APIClient {
           throw new Error(errorMessage.trim());
         }
         
-        throw new Error(errorData.message || `HTTP error! status: ${response.status}`);
+        throw new ApiError(errorData.message || `HTTP error! status: ${response.status}`, response.status);
       }
 
       return await response.json();
@@ -240,15 +365,67 @@ class APIClient {
     status?: string;
     public?: boolean;
     search?: string;
-  }): Promise<Document[]> {
+    tags?: string[];
+    cursor?: string;
+    // Sparse fieldset: only these fields are returned
+    fields?: Array<keyof Document>;
+  }): Promise<PaginatedResponse<Document>> {
     const queryParams = new URLSearchParams();
     if (params?.type) queryParams.append('type', params.type);
     if (params?.status) queryParams.append('status', params.status);
     if (params?.public !== undefined) queryParams.append('public', params.public.toString());
     if (params?.search) queryParams.append('search', params.search);
+    params?.tags?.forEach(tag => queryParams.append('tag', tag));
+    if (params?.cursor) queryParams.append('cursor', params.cursor);
+    if (params?.fields?.length) queryParams.append('fields', params.fields.join(','));
     
     const queryString = queryParams.toString();
-    return this.request<Document[]>(`/documents/${queryString ? `?${queryString}` : ''}`);
+    return this.request<PaginatedResponse<Document>>(`/documents/${queryString ? `?${queryString}` : ''}`);
+  }
+
+  // Every matching document, streamed as NDJSON; onDocument runs as each one arrives
+  async exportDocuments(
+    onDocument: (document: Document) => void,
+    params?: {
+      type?: string;
+      status?: string;
+      public?: boolean;
+      search?: string;
+      tags?: string[];
+      fields?: Array<keyof Document>;
+    }
+  ): Promise<number> {
+    const queryParams = new URLSearchParams({ format: 'ndjson' });
+    if (params?.type) queryParams.append('type', params.type);
+    if (params?.status) queryParams.append('status', params.status);
+    if (params?.public !== undefined) queryParams.append('public', params.public.toString());
+    if (params?.search) queryParams.append('search', params.search);
+    params?.tags?.forEach(tag => queryParams.append('tag', tag));
+    if (params?.fields?.length) queryParams.append('fields', params.fields.join(','));
+
+    const response = await fetch(`${this.baseURL}/documents/?${queryParams}`, {
+      headers: this.getHeaders(),
+    });
+    if (!response.ok || !response.body) {
+      throw new Error(`HTTP error! status: ${response.status}`);
+    }
+
+    const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+    let buffered = '';
+    let count = 0;
+    for (;;) {
+      const { done, value } = await reader.read();
+      if (done) break;
+      const lines = (buffered + value).split('\n');
+      buffered = lines.pop() ?? '';
+      for (const line of lines) {
+        if (line) {
+          onDocument(JSON.parse(line));
+          count += 1;
+        }
+      }
+    }
+    return count;
   }
 
   async uploadDocument(formData: FormData): Promise<Document> {
@@ -266,6 +443,33 @@ class APIClient {
     return response.json();
   }
 
+  // Uploads many files in one request; invalid files are reported without failing the rest
+  async uploadDocuments(files: File[], options?: {
+    description?: string;
+    is_public?: boolean;
+    tags?: string;
+  }): Promise<BulkUploadResponse> {
+    const formData = new FormData();
+    files.forEach(file => formData.append('files', file));
+    if (options?.description) formData.append('description', options.description);
+    if (options?.is_public !== undefined) formData.append('is_public', options.is_public.toString());
+    if (options?.tags) formData.append('tags', options.tags);
+
+    const response = await fetch(`${this.baseURL}/documents/bulk/`, {
+      method: 'POST',
+      headers: this.getFileHeaders(),
+      body: formData,
+    });
+
+    // 207 (some files rejected) and 400 (all rejected) still carry per-file results
+    const data = await response.json().catch(() => ({}));
+    if (!data.results) {
+      throw new Error(data.message || 'Failed to upload documents');
+    }
+
+    return data;
+  }
+
   async getDocument(id: number): Promise<Document> {
     return this.request<Document>(`/documents/${id}/`);
   }
@@ -288,6 +492,25 @@ class APIClient {
     });
   }
 
+  async updateDocuments(selection: BulkSelection, changes: {
+    is_public?: boolean;
+    tags?: string | string[];
+    add_tags?: string | string[];
+    remove_tags?: string | string[];
+  }): Promise<BulkUpdateResponse> {
+    return this.request('/documents/bulk/update/', {
+      method: 'POST',
+      body: JSON.stringify({ ...selection, ...changes }),
+    });
+  }
+
+  async deleteDocuments(selection: BulkSelection): Promise<BulkDeleteResponse> {
+    return this.request('/documents/bulk/delete/', {
+      method: 'POST',
+      body: JSON.stringify(selection),
+    });
+  }
+
   async downloadDocument(id: number): Promise<{
     download_url: string;
     filename: string;
@@ -296,14 +519,117 @@ class APIClient {
     return this.request(`/documents/${id}/download/`);
   }
 
+  // Poll until the document can be generated from (see isReadyForGeneration) or processing failed
+  async waitForProcessing(id: number, intervalMs: number = 1000, timeoutMs: number = 120000): Promise<Document> {
+    const deadline = Date.now() + timeoutMs;
+    for (;;) {
+      const document = await this.getDocument(id);
+      if (isReadyForGeneration(document) || document.status === 'FAILED' || Date.now() > deadline) {
+        return document;
+      }
+      await new Promise(resolve => setTimeout(resolve, intervalMs));
+    }
+  }
+
+  // Summary, flashcards or quiz for a processed document; results are cached server-side per content
+  // save stores generated flashcards or quiz questions in the user's review queue
+  // While an identical request is generating, the server answers 202 with retry_after; poll until it is done.
+  // 409 means the document's text or image is not ready yet, e.g. a PDF whose AI image is still being made
+  async generateStudyContent<T>(
+    id: number, task: GenerationTask, count?: number, save: boolean = false, timeoutMs: number = 180000
+  ): Promise<GenerationResponse<T>> {
+    const deadline = Date.now() + timeoutMs;
+    for (;;) {
+      let retryAfter: number;
+      try {
+        const response = await this.request<GenerationResponse<T> | GenerationPending>(
+          `/documents/${id}/generate/${task}/`,
+          { method: 'POST', body: JSON.stringify(count ? { count, save } : { save }) }
+        );
+        if (!('status' in response)) {
+          return response;
+        }
+        retryAfter = response.retry_after;
+      } catch (error) {
+        if (!(error instanceof ApiError) || error.status !== 409) {
+          throw error;
+        }
+        retryAfter = 2;
+      }
+      if (Date.now() > deadline) {
+        throw new Error('AI generation is taking too long, please try again');
+      }
+      await new Promise(resolve => setTimeout(resolve, retryAfter * 1000));
+    }
+  }
+
+  // Flashcards and quiz questions (spaced repetition)
+  async getFlashcards(params?: { document?: number; cursor?: string }): Promise<PaginatedResponse<StoredFlashcard>> {
+    const searchParams = new URLSearchParams();
+    if (params?.document) searchParams.append('document', params.document.toString());
+    if (params?.cursor) searchParams.append('cursor', params.cursor);
+    const queryString = searchParams.toString();
+    return this.request<PaginatedResponse<StoredFlashcard>>(`/flashcards/${queryString ? `?${queryString}` : ''}`);
+  }
+
+  async getDueFlashcards(pageSize: number = 20): Promise<PaginatedResponse<StoredFlashcard>> {
+    return this.request<PaginatedResponse<StoredFlashcard>>(`/flashcards/due/?page_size=${pageSize}`);
+  }
+
+  // grade: 0 (forgotten) to 5 (perfect recall); up to 500 reviews per call
+  async reviewFlashcards(reviews: Array<{ id: number; grade: number; reviewed_at?: string }>): Promise<ReviewResponse> {
+    return this.request('/flashcards/reviews/', {
+      method: 'POST',
+      body: JSON.stringify({ reviews }),
+    });
+  }
+
+  async deleteFlashcard(id: number): Promise<void> {
+    await this.request(`/flashcards/${id}/`, { method: 'DELETE' });
+  }
+
+  async getDueQuizzes(pageSize: number = 20): Promise<PaginatedResponse<StoredQuiz>> {
+    return this.request<PaginatedResponse<StoredQuiz>>(`/quizzes/due/?page_size=${pageSize}`);
+  }
+
+  async answerQuizzes(reviews: Array<{ id: number; answer: number; reviewed_at?: string }>): Promise<ReviewResponse> {
+    return this.request('/quizzes/reviews/', {
+      method: 'POST',
+      body: JSON.stringify({ reviews }),
+    });
+  }
+
+  // Readable documents with similar text, most similar first
+  async getRelatedDocuments(id: number, limit?: number): Promise<{ results: RelatedDocument[] }> {
+    const query = limit ? `?limit=${limit}` : '';
+    return this.request(`/documents/${id}/related/${query}`);
+  }
+
   // Document statistics
   async getDocumentStats(): Promise<DocumentStats> {
     return this.request<DocumentStats>('/documents/stats/');
   }
 
   // Document tags
-  async getDocumentTags(): Promise<DocumentTag[]> {
-    return this.request<DocumentTag[]>('/tags/');
+  async getDocumentTags(): Promise<PaginatedResponse<DocumentTag>> {
+    return this.request<PaginatedResponse<DocumentTag>>('/tags/');
+  }
+
+  // Document counts per tag, narrowed by the same filters as getDocuments
+  async getTagFacets(params?: {
+    type?: string;
+    status?: string;
+    public?: boolean;
+    tags?: string[];
+  }): Promise<{ results: TagFacet[] }> {
+    const queryParams = new URLSearchParams();
+    if (params?.type) queryParams.append('type', params.type);
+    if (params?.status) queryParams.append('status', params.status);
+    if (params?.public !== undefined) queryParams.append('public', params.public.toString());
+    params?.tags?.forEach(tag => queryParams.append('tag', tag));
+
+    const queryString = queryParams.toString();
+    return this.request<{ results: TagFacet[] }>(`/tags/facets/${queryString ? `?${queryString}` : ''}`);
   }
 
   async createDocumentTag(tagData: {
@@ -344,21 +670,25 @@ class APIClient {
     });
   }
 
-  async getDocumentShares(type: 'sent' | 'received' = 'received'): Promise<DocumentShare[]> {
-    return this.request<DocumentShare[]>(`/shares/?type=${type}`);
+  async getDocumentShares(type: 'sent' | 'received' = 'received'): Promise<PaginatedResponse<DocumentShare>> {
+    return this.request<PaginatedResponse<DocumentShare>>(`/shares/?type=${type}`);
   }
 
   // Public documents
   async getPublicDocuments(params?: {
     type?: string;
     search?: string;
-  }): Promise<Document[]> {
+    cursor?: string;
+    fields?: Array<keyof Document>;
+  }): Promise<PaginatedResponse<Document>> {
     const queryParams = new URLSearchParams();
     if (params?.type) queryParams.append('type', params.type);
     if (params?.search) queryParams.append('search', params.search);
+    if (params?.cursor) queryParams.append('cursor', params.cursor);
+    if (params?.fields?.length) queryParams.append('fields', params.fields.join(','));
     
     const queryString = queryParams.toString();
-    return this.request<Document[]>(`/public-documents/${queryString ? `?${queryString}` : ''}`);
+    return this.request<PaginatedResponse<Document>>(`/public-documents/${queryString ? `?${queryString}` : ''}`);
   }
 
   // Utility methods